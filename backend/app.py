@@ -1,36 +1,168 @@
+"""
+JoeyAI Flask application.
+
+create_app() builds the app: it imports and registers the blueprints listed
+in BLUEPRINTS (only those enabled by FLASK_BLUEPRINTS), makes sure the
+database schemas exist, and starts the background services. Nothing heavy
+happens when this module is imported; ``backend.app:app`` (gunicorn, flask
+run) builds the app on first access. Stage timings are logged and kept in
+app.config['STARTUP'] (see services/startup_benchmark.py).
+"""
 # Import path setup first to enable absolute imports
-from utils.path_setup import setup_project_path
+try:
+    from backend.utils.path_setup import setup_project_path
+except ImportError:  # run as backend/app.py: backend/ is on sys.path, the project root is not
+    from utils.path_setup import setup_project_path
 setup_project_path()
 
 from dotenv import load_dotenv
 load_dotenv()
 
+import importlib
+import logging
 import os
+import time
+from typing import Dict, Optional
+
 from flask import Flask
 from flask_cors import CORS
 
-app = Flask(__name__)
-CORS(app)
+from backend.config import FlaskConfig
+
+logger = logging.getLogger(__name__)
+
+# Registered name -> (module, blueprint attribute, url_prefix). Modules are
+# imported by create_app, and only for the blueprints it registers. Several
+# modules reuse a blueprint name, so each is registered under its key here.
+BLUEPRINTS: Dict[str, tuple] = {
+    "health": ("backend.routes.health", "health_bp", "/api"),
+    "system": ("backend.routes.system", "system_bp", "/api/system"),
+    "models": ("backend.routes.models", "models_bp", "/api"),
+    "chats": ("backend.routes.chats", "chats_bp", "/api/chats"),
+    "chat": ("backend.routes.chat_routes", "chat_bp", "/api"),
+    "conversations": ("backend.routes.conversation_routes", "conversations_bp", None),
+    "memory": ("backend.routes.memory_routes", "memory_bp", None),
+    "query": ("backend.routes.query_routes", "query_bp", None),
+    "settings": ("backend.routes.settings_routes", "settings_bp", None),
+    "presets": ("backend.routes.preset_routes", "preset_bp", None),
+    "dashboard": ("backend.routes.system_routes", "system_bp", None),
+    "status": ("backend.routes.health_routes", "health_bp", None),
+    "gateway": ("backend.routes.llm_gateway", "llm_bp", None),
+    "gateway_models": ("backend.routes.models_routes", "models_bp", None),
+}
+
+
+def _ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 1)
+
+
+def _start_services() -> None:
+    """Start the per-worker background services."""
+    # Storage maintenance runs in idle windows between requests
+    from backend.services.storage_maintenance import get_maintenance_scheduler
+    get_maintenance_scheduler()
+
+    # Map the cross-worker metrics segment at boot (resets it on a new server start)
+    from backend.services.shared_metrics import get_shared_metrics
+    get_shared_metrics()
+
+    # Start sampling at boot so telemetry history has no gaps before the first dashboard request
+    from backend.services.telemetry import get_telemetry_sampler
+    get_telemetry_sampler()
+
+    # The thermal governor follows the sampler and limits generations while hot
+    from backend.services.thermal_governor import get_thermal_governor
+    get_thermal_governor()
+
+    # The memory guard sheds caches, load and idle models under RAM pressure
+    from backend.services.memory_guard import get_memory_guard
+    get_memory_guard()
+
+    # Health endpoints answer from the background prober's cached state
+    from backend.services.health_prober import get_health_prober
+    get_health_prober()
+
+    # The model catalog refreshes in the background so model lists never wait on a busy Ollama
+    from backend.services.model_catalog import get_model_catalog
+    get_model_catalog()
+
+
+def create_app(blueprints: Optional[frozenset] = None, background_services: Optional[bool] = None) -> Flask:
+    """
+    Build the Flask application.
+
+    Args:
+        blueprints: Names from BLUEPRINTS to register (default FlaskConfig.BLUEPRINTS, empty for all)
+        background_services: Start the background services (default FlaskConfig.BACKGROUND_SERVICES)
+
+    Returns:
+        Flask: The configured app
+    """
+    start = time.perf_counter()
+    blueprints = blueprints if blueprints is not None else FlaskConfig.BLUEPRINTS
+    if background_services is None:
+        background_services = FlaskConfig.BACKGROUND_SERVICES
+    unknown = set(blueprints) - set(BLUEPRINTS)
+    if unknown:
+        raise ValueError(f"Unknown blueprints: {', '.join(sorted(unknown))}")
+
+    app = Flask(__name__)
+    CORS(app)
+
+    # Config
+    app.config['ACTIVE_MODEL'] = os.getenv('ACTIVE_MODEL', 'phi3:mini')
+    app.config['OLLAMA_HOST'] = os.getenv('OLLAMA_HOST', 'http://127.0.0.1:11434')
+    app.config['CHAT_DIR'] = os.getenv('CHAT_DIR', 'chat_history')
+    startup = {"blueprints": {}}
+
+    # Under gunicorn the master has already done this (gunicorn.conf.py) and it is skipped
+    step = time.perf_counter()
+    from backend.services.db_migrations import run_migrations
+    startup["migrations"] = dict(run_migrations(), ms=_ms(step))
+
+    for name, (module, attribute, url_prefix) in BLUEPRINTS.items():
+        if blueprints and name not in blueprints:
+            continue
+        step = time.perf_counter()
+        blueprint = getattr(importlib.import_module(module), attribute)
+        app.register_blueprint(blueprint, url_prefix=url_prefix, name=name)
+        startup["blueprints"][name] = _ms(step)
+
+    # Request activity feeds the idle-window check of the storage maintenance scheduler
+    from backend.services.storage_maintenance import request_started, request_finished
+    app.before_request(request_started)
+    app.teardown_request(lambda exc: request_finished())
+
+    step = time.perf_counter()
+    if background_services:
+        _start_services()
+    startup["services"] = _ms(step) if background_services else None
+
+    startup["total"] = _ms(start)
+    app.config['STARTUP'] = startup
+    slowest = sorted(startup["blueprints"].items(), key=lambda item: item[1], reverse=True)[:3]
+    logger.info(f"[STARTUP] App ready in {startup['total']} ms ({len(startup['blueprints'])} blueprints, "
+                f"migrations {startup['migrations']['ms']} ms, services {startup['services']} ms; slowest: "
+                + ", ".join(f"{name} {ms} ms" for name, ms in slowest) + ")")
+    return app
+
+
+_app: Optional[Flask] = None
 
-# Config
-app.config['ACTIVE_MODEL'] = os.getenv('ACTIVE_MODEL', 'phi3:mini')
-app.config['OLLAMA_HOST'] = os.getenv('OLLAMA_HOST', 'http://127.0.0.1:11434')
-app.config['CHAT_DIR'] = os.getenv('CHAT_DIR', 'chat_history')
 
-# Import and register blueprints
-from routes.health import health_bp
-from routes.system import system_bp
-from routes.models import models_bp
-from routes.chats import chats_bp
+def __getattr__(name):
+    # ``backend.app:app`` builds the app on first access, so importing the module stays cheap
+    global _app
+    if name == "app":
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-app.register_blueprint(health_bp, url_prefix='/api')
-app.register_blueprint(system_bp, url_prefix='/api/system')
-app.register_blueprint(models_bp, url_prefix='/api')
-app.register_blueprint(chats_bp, url_prefix='/api/chats')
 
 def main():
     """Main entry point for the Flask application."""
-    app.run(
+    create_app().run(
         host="0.0.0.0",
         port=5000,
         debug=False,
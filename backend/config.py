@@ -1,6 +1,7 @@
 """Configuration settings for Joey_AI application."""
+import json
 import os
-from typing import Optional
+from typing import Dict, List, Optional
 
 
 class OllamaConfig:
@@ -12,6 +13,25 @@ class OllamaConfig:
     TIMEOUT: int = int(os.getenv('OLLAMA_TIMEOUT', '60'))
     MAX_RETRIES: int = int(os.getenv('OLLAMA_MAX_RETRIES', '3'))
     RETRY_DELAY: float = float(os.getenv('OLLAMA_RETRY_DELAY', '1.0'))
+    # Backoff before retry n is uniform in [0, min(RETRY_MAX_DELAY, RETRY_DELAY * 2**(n-1))]
+    RETRY_MAX_DELAY: float = float(os.getenv('OLLAMA_RETRY_MAX_DELAY', '8.0'))
+    # Retries allowed per worker: RETRY_BUDGET_RATIO of the requests in the last
+    # RETRY_BUDGET_WINDOW seconds, plus RETRY_BUDGET_MIN
+    RETRY_BUDGET_RATIO: float = float(os.getenv('OLLAMA_RETRY_BUDGET_RATIO', '0.2'))
+    RETRY_BUDGET_MIN: int = int(os.getenv('OLLAMA_RETRY_BUDGET_MIN', '3'))
+    RETRY_BUDGET_WINDOW: float = float(os.getenv('OLLAMA_RETRY_BUDGET_WINDOW', '10'))
+    # Seconds a request may spend on Ollama in total (all attempts and backoff);
+    # clients can send a shorter one in DEADLINE_HEADER
+    DEADLINE: float = float(os.getenv('OLLAMA_DEADLINE', '120'))
+    ROUTE_DEADLINES: Dict[str, float] = {
+        route.strip(): float(seconds)
+        for route, _, seconds in (
+            item.partition('=') for item in os.getenv(
+                'OLLAMA_ROUTE_DEADLINES', 'title=30,health=10,query=120,query_advanced=180,conversation=120'
+            ).split(',') if '=' in item
+        )
+    }
+    DEADLINE_HEADER: str = os.getenv('OLLAMA_DEADLINE_HEADER', 'X-Request-Timeout')
     
     @classmethod
     def get_api_url(cls) -> str:
@@ -46,9 +66,316 @@ class FlaskConfig:
     HOST: str = os.getenv('FLASK_HOST', '0.0.0.0')
     PORT: int = int(os.getenv('FLASK_PORT', '5000'))
     LOG_LEVEL: str = os.getenv('LOG_LEVEL', 'INFO')
+    # Blueprints create_app() registers (names from app.BLUEPRINTS); empty means all
+    BLUEPRINTS: frozenset = frozenset(
+        b.strip() for b in os.getenv('FLASK_BLUEPRINTS', '').split(',') if b.strip()
+    )
+    # Start the background services (sampler, governor, guard, prober, catalog, maintenance)
+    BACKGROUND_SERVICES: bool = os.getenv('FLASK_BACKGROUND_SERVICES', 'True').lower() == 'true'
 
 
 class JoeyAIConfig:
     """General Joey_AI settings."""
     
     AUTO_SAVE_CHATS: bool = os.getenv('AUTO_SAVE_CHATS', 'True').lower() == 'true'
+
+
+class MemoryRetrievalConfig:
+    """Settings for injecting memory notes into prompts before generation."""
+    
+    ENABLED: bool = os.getenv('MEMORY_RETRIEVAL_ENABLED', 'False').lower() == 'true'
+    BUDGET_MS: float = float(os.getenv('MEMORY_RETRIEVAL_BUDGET_MS', '15'))
+    TOP_K: int = int(os.getenv('MEMORY_RETRIEVAL_TOP_K', '3'))
+    TOKEN_CAP: int = int(os.getenv('MEMORY_RETRIEVAL_TOKEN_CAP', '256'))
+    CACHE_SIZE: int = int(os.getenv('MEMORY_RETRIEVAL_CACHE_SIZE', '256'))
+    CACHE_TTL: float = float(os.getenv('MEMORY_RETRIEVAL_CACHE_TTL', '60'))
+
+
+class MemoryWriteBehindConfig:
+    """Settings for the background writer that persists auto-saved notes."""
+    
+    ENABLED: bool = os.getenv('MEMORY_WRITE_BEHIND', 'True').lower() == 'true'
+    MAX_QUEUE: int = int(os.getenv('MEMORY_QUEUE_MAX', '1000'))
+    BATCH_SIZE: int = int(os.getenv('MEMORY_FLUSH_BATCH', '200'))
+    FLUSH_INTERVAL: float = float(os.getenv('MEMORY_FLUSH_INTERVAL', '1.0'))
+    # What to do when the queue is full: 'spill' to disk or 'drop'
+    OVERFLOW: str = os.getenv('MEMORY_QUEUE_OVERFLOW', 'spill')
+    SPILL_DIR: str = os.getenv('MEMORY_SPILL_DIR', os.path.dirname(os.path.abspath(os.getenv('MEMORY_DB_PATH', 'memory.db'))))
+
+
+class MemoryDedupConfig:
+    """Near-duplicate detection for memory notes."""
+    
+    # 'off', 'skip' (drop the new note) or 'merge' (keep the newer text, union the tags)
+    MODE: str = os.getenv('MEMORY_DEDUP_MODE', 'merge')
+    # Maximum SimHash Hamming distance (out of 64 bits) treated as a duplicate
+    MAX_DISTANCE: int = int(os.getenv('MEMORY_DEDUP_MAX_DISTANCE', '3'))
+    KINDS: list = [k.strip() for k in os.getenv('MEMORY_DEDUP_KINDS', 'chat').split(',') if k.strip()]
+    
+    @classmethod
+    def validate_config(cls) -> Optional[str]:
+        """Validate configuration and return error message if invalid."""
+        if cls.MODE not in ('off', 'skip', 'merge'):
+            return "MEMORY_DEDUP_MODE must be 'off', 'skip' or 'merge'"
+        # The banded index only guarantees a shared band up to BANDS - 1 (4 bands of 16 bits)
+        if not 0 <= cls.MAX_DISTANCE <= 3:
+            return "MEMORY_DEDUP_MAX_DISTANCE must be between 0 and 3"
+        return None
+
+
+def _parse_kind_map(value: str) -> dict:
+    """Parse 'chat=90,scratch=7' into {'chat': 90, 'scratch': 7}."""
+    result = {}
+    for item in value.split(','):
+        kind, sep, amount = item.partition('=')
+        if sep and kind.strip() and amount.strip():
+            result[kind.strip()] = int(amount)
+    return result
+
+
+class StorageMaintenanceConfig:
+    """Retention rules and idle-time maintenance for the SQLite databases."""
+    
+    ENABLED: bool = os.getenv('STORAGE_MAINTENANCE_ENABLED', 'True').lower() == 'true'
+    # Seconds between scheduler checks (each check also records a size sample)
+    CHECK_INTERVAL: float = float(os.getenv('STORAGE_MAINTENANCE_CHECK_INTERVAL', '300'))
+    # Minimum seconds between maintenance runs, shared by all workers
+    MIN_INTERVAL: float = float(os.getenv('STORAGE_MAINTENANCE_INTERVAL', '3600'))
+    # A window is idle when no request has been seen for IDLE_SECONDS and the
+    # 1-minute load average per CPU is below IDLE_LOAD
+    IDLE_SECONDS: float = float(os.getenv('STORAGE_MAINTENANCE_IDLE_SECONDS', '120'))
+    IDLE_LOAD: float = float(os.getenv('STORAGE_MAINTENANCE_IDLE_LOAD', '0.5'))
+    # Full FTS optimize at most this often; other runs do a bounded merge
+    FTS_OPTIMIZE_INTERVAL: float = float(os.getenv('STORAGE_FTS_OPTIMIZE_INTERVAL', '86400'))
+    FTS_MERGE_PAGES: int = int(os.getenv('STORAGE_FTS_MERGE_PAGES', '500'))
+    ANALYSIS_LIMIT: int = int(os.getenv('STORAGE_ANALYSIS_LIMIT', '1000'))
+    # Pages released per run by PRAGMA incremental_vacuum
+    VACUUM_PAGES: int = int(os.getenv('STORAGE_VACUUM_PAGES', '2000'))
+    # Switch databases to auto_vacuum=INCREMENTAL (one full VACUUM, in an idle window)
+    VACUUM_CONVERT: bool = os.getenv('STORAGE_VACUUM_CONVERT', 'True').lower() == 'true'
+    WAL_AUTOCHECKPOINT: int = int(os.getenv('STORAGE_WAL_AUTOCHECKPOINT', '1000'))
+    JOURNAL_SIZE_LIMIT: int = int(os.getenv('STORAGE_JOURNAL_SIZE_LIMIT', str(64 * 1024 * 1024)))
+    HISTORY_MAX_ROWS: int = int(os.getenv('STORAGE_HISTORY_MAX_ROWS', '5000'))
+    # Rows deleted per transaction by retention so writers are not blocked
+    DELETE_BATCH: int = int(os.getenv('STORAGE_DELETE_BATCH', '1000'))
+    # Per-kind note retention, e.g. 'chat=90,scratch=7'; '*' applies to other kinds
+    NOTE_TTL_DAYS: dict = _parse_kind_map(os.getenv('MEMORY_RETENTION_DAYS', ''))
+    NOTE_MAX_PER_KIND: dict = _parse_kind_map(os.getenv('MEMORY_RETENTION_MAX', ''))
+    # Archived conversations older than this are deleted (0 keeps them forever)
+    ARCHIVED_CONVERSATION_TTL_DAYS: int = int(os.getenv('ARCHIVED_CONVERSATION_TTL_DAYS', '0'))
+
+
+class InferenceLedgerConfig:
+    """Persistent per-model / per-route record of Ollama timings."""
+    
+    ENABLED: bool = os.getenv('INFERENCE_LEDGER_ENABLED', 'True').lower() == 'true'
+    RETENTION_DAYS: int = int(os.getenv('INFERENCE_LEDGER_RETENTION_DAYS', '30'))
+    # Context window used to report context usage (tokens)
+    CONTEXT_WINDOW: int = int(os.getenv('OLLAMA_NUM_CTX', '4096'))
+
+
+class SensorConfig:
+    """Hardware sensor discovery."""
+    
+    # Root under which sysfs paths are resolved; point at a fake tree for testing
+    ROOT: str = os.getenv('SENSORS_ROOT', '/')
+
+
+class TelemetryConfig:
+    """Background hardware telemetry sampler."""
+    
+    # Seconds between snapshots (psutil and sysfs reads)
+    SAMPLE_INTERVAL: float = float(os.getenv('TELEMETRY_SAMPLE_INTERVAL', '1.0'))
+    # Interval passed to the long-running tegrastats / nvidia-smi process
+    STREAM_INTERVAL_MS: int = int(os.getenv('TELEMETRY_STREAM_INTERVAL_MS', '1000'))
+    STREAM_ENABLED: bool = os.getenv('TELEMETRY_STREAM_ENABLED', 'True').lower() == 'true'
+    # Stream readings older than this are treated as missing
+    STALE_AFTER: float = float(os.getenv('TELEMETRY_STALE_AFTER', '5.0'))
+    # Memory-mapped multi-resolution history (see services/telemetry_history.py)
+    HISTORY_ENABLED: bool = os.getenv('TELEMETRY_HISTORY_ENABLED', 'True').lower() == 'true'
+    HISTORY_PATH: str = os.getenv('TELEMETRY_HISTORY_PATH', 'telemetry_history.bin')
+    # Memory-mapped metrics shared by all workers (see services/shared_metrics.py)
+    METRICS_PATH: str = os.getenv('TELEMETRY_METRICS_PATH', 'shared_metrics.bin')
+    # Server-sent telemetry stream (see services/telemetry_stream.py)
+    STREAM_DEFAULT_INTERVAL: float = float(os.getenv('TELEMETRY_STREAM_DEFAULT_INTERVAL', '2.0'))
+    STREAM_MIN_INTERVAL: float = float(os.getenv('TELEMETRY_STREAM_MIN_INTERVAL', '0.5'))
+    STREAM_MAX_SUBSCRIBERS: int = int(os.getenv('TELEMETRY_STREAM_MAX_SUBSCRIBERS', '16'))
+    # Events buffered per subscriber before it is treated as slow and dropped
+    STREAM_QUEUE_SIZE: int = int(os.getenv('TELEMETRY_STREAM_QUEUE_SIZE', '8'))
+    STREAM_HEARTBEAT: float = float(os.getenv('TELEMETRY_STREAM_HEARTBEAT', '15'))
+    # Streams are closed after this long; EventSource reconnects after STREAM_RETRY_MS
+    STREAM_MAX_DURATION: float = float(os.getenv('TELEMETRY_STREAM_MAX_DURATION', '3600'))
+    STREAM_RETRY_MS: int = int(os.getenv('TELEMETRY_STREAM_RETRY_MS', '3000'))
+
+
+class ThermalGovernorConfig:
+    """Thermal-aware admission and generation limits (see services/thermal_governor.py)."""
+    
+    ENABLED: bool = os.getenv('THERMAL_GOVERNOR_ENABLED', 'True').lower() == 'true'
+    # Hottest of CPU/GPU temperature (Celsius) that enters each state
+    HOT_C: float = float(os.getenv('THERMAL_HOT_C', '80'))
+    CRITICAL_C: float = float(os.getenv('THERMAL_CRITICAL_C', '90'))
+    # Degrees below a threshold required before stepping back down
+    HYSTERESIS_C: float = float(os.getenv('THERMAL_HYSTERESIS_C', '5'))
+    # Seconds a state is held before the governor may relax it
+    MIN_DWELL: float = float(os.getenv('THERMAL_MIN_DWELL', '30'))
+    # Concurrent generations admitted across all workers, per state
+    MAX_CONCURRENCY: int = int(os.getenv('THERMAL_MAX_CONCURRENCY', '4'))
+    HOT_CONCURRENCY: int = int(os.getenv('THERMAL_HOT_CONCURRENCY', '2'))
+    CRITICAL_CONCURRENCY: int = int(os.getenv('THERMAL_CRITICAL_CONCURRENCY', '1'))
+    # Seconds a request waits for a slot before it is refused
+    ADMIT_TIMEOUT: float = float(os.getenv('THERMAL_ADMIT_TIMEOUT', '30'))
+    # num_predict cap for background generations while hot
+    BACKGROUND_NUM_PREDICT: int = int(os.getenv('THERMAL_BACKGROUND_NUM_PREDICT', '32'))
+    # num_thread while hot / critical (0 leaves Ollama's default)
+    HOT_NUM_THREAD: int = int(os.getenv('THERMAL_HOT_NUM_THREAD', str(max(1, (os.cpu_count() or 2) // 2))))
+    CRITICAL_NUM_THREAD: int = int(os.getenv('THERMAL_CRITICAL_NUM_THREAD', str(max(1, (os.cpu_count() or 4) // 4))))
+    # Ledger routes treated as background work
+    BACKGROUND_ROUTES: frozenset = frozenset(
+        r.strip() for r in os.getenv('THERMAL_BACKGROUND_ROUTES', 'title,summary,benchmark').split(',') if r.strip()
+    )
+    # Directory for the cross-worker admission slot lock files
+    LOCK_DIR: str = os.getenv('THERMAL_LOCK_DIR', os.path.dirname(os.path.abspath(TelemetryConfig.METRICS_PATH)))
+
+
+class MemoryGuardConfig:
+    """Memory-pressure controller (see services/memory_guard.py)."""
+    
+    ENABLED: bool = os.getenv('MEMORY_GUARD_ENABLED', 'True').lower() == 'true'
+    # RAM used (percent) that enters high / critical pressure, and the level to recover below
+    HIGH_PCT: float = float(os.getenv('MEMORY_GUARD_HIGH_PCT', '90'))
+    CRITICAL_PCT: float = float(os.getenv('MEMORY_GUARD_CRITICAL_PCT', '96'))
+    LOW_PCT: float = float(os.getenv('MEMORY_GUARD_LOW_PCT', '85'))
+    # PSI avg10 thresholds from /proc/pressure/memory ("some" for high, "full" for critical)
+    PSI_SOME_HIGH: float = float(os.getenv('MEMORY_GUARD_PSI_SOME_HIGH', '10'))
+    PSI_FULL_CRITICAL: float = float(os.getenv('MEMORY_GUARD_PSI_FULL_CRITICAL', '10'))
+    # Seconds under pressure before the guard may relax
+    MIN_DWELL: float = float(os.getenv('MEMORY_GUARD_MIN_DWELL', '10'))
+    # Concurrent generations while under high pressure (critical refuses new ones)
+    HIGH_CONCURRENCY: int = int(os.getenv('MEMORY_GUARD_HIGH_CONCURRENCY', '1'))
+    # Loaded models unused for this long are unloaded under pressure
+    UNLOAD_IDLE_SECONDS: float = float(os.getenv('MEMORY_GUARD_UNLOAD_IDLE_SECONDS', '120'))
+    UNLOAD_COOLDOWN: float = float(os.getenv('MEMORY_GUARD_UNLOAD_COOLDOWN', '60'))
+
+
+class ModelCatalogConfig:
+    """Cached Ollama model catalog (see services/model_catalog.py)."""
+    
+    # Comma-separated Ollama base URLs whose catalogs are merged
+    HOSTS: List[str] = [
+        h.strip().rstrip('/') for h in os.getenv('OLLAMA_HOSTS', OllamaConfig.BASE_URL).split(',') if h.strip()
+    ]
+    # Seconds between background refreshes; older snapshots are served while revalidating
+    REFRESH_INTERVAL: float = float(os.getenv('MODEL_CATALOG_REFRESH_INTERVAL', '30'))
+    # Snapshots older than this are flagged stale in responses
+    STALE_AFTER: float = float(os.getenv('MODEL_CATALOG_STALE_AFTER', '120'))
+    TIMEOUT: float = float(os.getenv('MODEL_CATALOG_TIMEOUT', '2'))
+
+
+class ModelPullConfig:
+    """Background model pull jobs (see services/pull_manager.py)."""
+    
+    # Job state files shared by all workers (progress, cancel markers, host locks)
+    DIR: str = os.getenv('MODEL_PULL_DIR', os.path.join(ThermalGovernorConfig.LOCK_DIR, 'pulls'))
+    # Seconds without a progress line from Ollama before a pull is failed (it can be resumed)
+    READ_TIMEOUT: float = float(os.getenv('MODEL_PULL_READ_TIMEOUT', '60'))
+    # Minimum seconds between progress writes to the job file
+    PROGRESS_INTERVAL: float = float(os.getenv('MODEL_PULL_PROGRESS_INTERVAL', '0.25'))
+    # Finished jobs are listed for this long
+    KEEP_SECONDS: float = float(os.getenv('MODEL_PULL_KEEP_SECONDS', '86400'))
+    STREAM_HEARTBEAT: float = float(os.getenv('MODEL_PULL_STREAM_HEARTBEAT', '15'))
+
+
+class HealthProbeConfig:
+    """Background Ollama health prober (see services/health_prober.py)."""
+    
+    # Cheap probes (/api/version, /api/ps) every INTERVAL seconds
+    INTERVAL: float = float(os.getenv('HEALTH_PROBE_INTERVAL', '5'))
+    TIMEOUT: float = float(os.getenv('HEALTH_PROBE_TIMEOUT', '1'))
+    # Consecutive failures before Ollama is reported down, successes before it is up again
+    FAIL_THRESHOLD: int = int(os.getenv('HEALTH_PROBE_FAIL_THRESHOLD', '3'))
+    RISE_THRESHOLD: int = int(os.getenv('HEALTH_PROBE_RISE_THRESHOLD', '2'))
+    # Seconds between one-token generation probes (0 disables them)
+    DEEP_INTERVAL: float = float(os.getenv('HEALTH_PROBE_DEEP_INTERVAL', '600'))
+    DEEP_TIMEOUT: float = float(os.getenv('HEALTH_PROBE_DEEP_TIMEOUT', '60'))
+    # Cached state older than this is reported stale (the probing worker has stopped)
+    STALE_AFTER: float = float(os.getenv('HEALTH_PROBE_STALE_AFTER', '30'))
+
+
+class BenchmarkConfig:
+    """Model benchmark suite (see services/benchmark.py)."""
+    
+    # Unload each model first so the first request measures a cold load
+    COLD_LOAD: bool = os.getenv('BENCHMARK_COLD_LOAD', 'True').lower() == 'true'
+    # Approximate prompt tokens for the long-context case
+    LONG_CONTEXT_TOKENS: int = int(os.getenv('BENCHMARK_LONG_CONTEXT_TOKENS', '2000'))
+    # Seconds allowed per benchmark request (cold loads on a Jetson can take minutes)
+    TIMEOUT: float = float(os.getenv('BENCHMARK_TIMEOUT', '600'))
+    # Seconds between RAM/RSS/power samples during a model's run
+    SAMPLE_INTERVAL: float = float(os.getenv('BENCHMARK_SAMPLE_INTERVAL', '0.25'))
+    # Percent change against the previous run that counts as a regression
+    REGRESSION_PCT: float = float(os.getenv('BENCHMARK_REGRESSION_PCT', '10'))
+
+
+class ModelRoutingConfig:
+    """Task-based model routing (see services/model_router.py)."""
+    
+    # Task -> {"model", "options"}; a null model means OLLAMA_MODEL. Small
+    # auxiliary tasks default to a small model so they do not queue behind the
+    # big one. MODEL_ROUTES (JSON) is merged over these, and the "model_routes"
+    # user setting over that.
+    ROUTES: Dict[str, Dict] = {
+        "chat": {"model": None, "options": {}},
+        "code": {"model": "qwen2.5-coder:7b", "options": {"temperature": 0.2}},
+        "title": {"model": "qwen2.5:1.5b-instruct", "options": {"num_predict": 20, "temperature": 0.3}},
+        "summary": {"model": "qwen2.5:1.5b-instruct", "options": {"num_predict": 256, "temperature": 0.3}},
+        "memory_tagging": {"model": "qwen2.5:1.5b-instruct", "options": {"num_predict": 64, "temperature": 0}},
+        "health_probe": {"model": "qwen2.5:1.5b-instruct", "options": {"num_predict": 1}},
+    }
+    ROUTES.update(json.loads(os.getenv('MODEL_ROUTES', '{}')))
+    # Ledger route labels -> task
+    ROUTE_TASKS: Dict[str, str] = {
+        "conversation": "chat",
+        "query": "chat",
+        "query_advanced": "chat",
+        "chats_send": "chat",
+        "chats_stream": "chat",
+        "gateway": "chat",
+        "title": "title",
+        "summary": "summary",
+        "health": "health_probe",
+    }
+
+
+class SettingsConfig:
+    """User settings store (see services/settings_store.py)."""
+    
+    PATH: str = os.getenv('SETTINGS_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'settings.json'))
+    # Seconds between mtime checks that pick up edits made outside the API
+    CHECK_INTERVAL: float = float(os.getenv('SETTINGS_CHECK_INTERVAL', '1.0'))
+
+
+class ModelSwitchConfig:
+    """Zero-downtime active model switch (see services/model_switch.py)."""
+    
+    # Seconds allowed for loading the new model and for its warm-up generation
+    LOAD_TIMEOUT: float = float(os.getenv('MODEL_SWITCH_LOAD_TIMEOUT', '600'))
+    # Seconds a model that is not installed may take to pull (0 fails the switch instead)
+    PULL_TIMEOUT: float = float(os.getenv('MODEL_SWITCH_PULL_TIMEOUT', '3600'))
+    # Seconds after the flip before the previous model is unloaded (negative keeps it loaded)
+    UNLOAD_PREVIOUS_AFTER: float = float(os.getenv('MODEL_SWITCH_UNLOAD_PREVIOUS_AFTER', '30'))
+    # Prompt for the one-token warm-up generation
+    WARM_PROMPT: str = os.getenv('MODEL_SWITCH_WARM_PROMPT', 'Hello')
+
+
+class PromptConfig:
+    """Prefix-stable prompt assembly (see services/prompt_builder.py)."""
+    
+    # System prompt that leads every assembled prompt (empty for none)
+    SYSTEM_PROMPT: str = os.getenv('PROMPT_SYSTEM_PROMPT', '')
+    PRESETS_PATH: str = os.getenv('PROMPT_PRESETS_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'presets.json'))
+    # Prompts remembered per worker for the expected shared-prefix estimate
+    SESSIONS: int = int(os.getenv('PROMPT_SESSIONS', '256'))
+    # Earlier conversation messages sent with single-string prompts; the window
+    # advances in steps of half this, so the prefix stays stable between steps
+    HISTORY_MESSAGES: int = int(os.getenv('PROMPT_HISTORY_MESSAGES', '20'))
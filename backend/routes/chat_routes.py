@@ -1,8 +1,10 @@
 from flask import Blueprint, request, jsonify
+from backend.config import PromptConfig
 from backend.services.conversation_service import (
-    get_messages, add_message, search_messages, rename_conversation
+    get_messages, count_messages, add_message, search_messages, rename_conversation
 )
 from backend.services.ollama_service import send_prompt
+from backend.services.prompt_builder import get_prompt_builder, window_start
 
 chat_bp = Blueprint('chat_bp', __name__)
 
@@ -17,11 +19,17 @@ def get_conversation_messages(conv_id):
 def post_message(conv_id):
     data = request.get_json(force=True)
     content = data.get('content')
+    # Earlier turns lead the prompt, so each turn reuses the previous one's cached prefix.
+    # Only the tail the prompt window keeps is read, from the same aligned start.
+    start = window_start(count_messages(conv_id), PromptConfig.HISTORY_MESSAGES)
+    history = get_messages(conv_id, limit=max(0, PromptConfig.HISTORY_MESSAGES), offset=start)
     # 1) Add user message
     user_msg = add_message(conv_id, 'user', content)
     # 2) Run model
     try:
-        model_reply = send_prompt(content)
+        built = get_prompt_builder().build_prompt(content, data.get('presets'), data.get('use_memory'),
+                                                  session=f"conversation:{conv_id}", history=history)
+        model_reply = send_prompt(built.text, route="conversation", built=built)
     except Exception:
         model_reply = "Model offline"
     # 3) Add assistant reply
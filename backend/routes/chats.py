@@ -1,6 +1,11 @@
 from flask import Blueprint, jsonify, request, Response, current_app
-from services.file_store import list_chats as fs_list_chats, create_chat as fs_create_chat, delete_chat as fs_delete_chat, get_chat, save_chat
-from services.ollama_client import chat_stream
+from backend.services.file_store import list_chats as fs_list_chats, create_chat as fs_create_chat, delete_chat as fs_delete_chat, get_chat, save_chat
+from backend.services.ollama_client import chat_stream
+from backend.services.prompt_builder import get_prompt_builder
+from backend.services.inference_ledger import record_inference
+from backend.services.thermal_governor import AdmissionTimeout, get_thermal_governor
+from backend.services.model_switch import get_active_model
+import time
 import uuid
 import requests
 
@@ -38,23 +43,43 @@ def send_message(chat_id):
     history.append({"role": "user", "content": user_msg})
 
     # Get model
-    model = current_app.config['ACTIVE_MODEL']
+    model = get_active_model()
+
+    # Retrieve memory before generation; injected notes are not saved to history
+    built = get_prompt_builder().build_messages(history, data.get('presets'), data.get('use_memory'),
+                                                session=f"chat:{chat_id}")
+    messages = built.messages
+
+    # Wait for a generation slot; the thermal governor lowers the limit while hot
+    governor = get_thermal_governor()
+    try:
+        slot = governor.admit()
+    except AdmissionTimeout as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
 
     # Streaming response
     def generate():
         try:
-            stream = chat_stream(model, history)
+            start = time.perf_counter()
+            ttft_ms = None
+            stream = chat_stream(model, messages, governor.apply_options(None) or None)
             response_text = ""
             for chunk in stream:
                 if 'message' in chunk and 'content' in chunk['message']:
                     content = chunk['message']['content']
+                    if content and ttft_ms is None:
+                        ttft_ms = (time.perf_counter() - start) * 1000
                     yield content
                     response_text += content
+                if 'done' in chunk and chunk['done']:
+                    record_inference("chats_stream", model, chunk, ttft_ms=ttft_ms, stream=True, prompt=built)
             # Append assistant message after streaming
             history.append({"role": "assistant", "content": response_text})
             save_chat(chat_id, history)
         except Exception as e:
             yield f"Error: {str(e)}"
+        finally:
+            slot.release()
 
     return Response(generate(), mimetype='text/plain')
 
@@ -70,23 +95,38 @@ def send_chat():
         return jsonify({"error": "Message cannot be empty"}), 400
 
     ollama_host = current_app.config.get("OLLAMA_HOST", "http://127.0.0.1:11434")
-    model_name = current_app.config.get("ACTIVE_MODEL", "phi3:mini")
+    model_name = get_active_model()
+
+    built = get_prompt_builder().build_prompt(user_message, data.get("presets"), data.get("use_memory"))
+    memory_info = built.memory
 
+    governor = get_thermal_governor()
     try:
-        response = requests.post(
-            f"{ollama_host}/api/generate",
-            json={
-                "model": model_name,
-                "prompt": user_message,
-                "stream": False
-            },
-            timeout=60
-        )
+        slot = governor.admit()
+    except AdmissionTimeout as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
+
+    try:
+        payload = {
+            "model": model_name,
+            "prompt": built.text,
+            "stream": False
+        }
+        options = governor.apply_options(None)
+        if options:
+            payload["options"] = options
+        with slot:
+            response = requests.post(
+                f"{ollama_host}/api/generate",
+                json=payload,
+                timeout=60
+            )
 
         if response.status_code != 200:
             return jsonify({"error": "Ollama returned error"}), 500
 
         ollama_data = response.json()
+        record_inference("chats_send", model_name, ollama_data, prompt=built)
 
         reply = (
             ollama_data.get("response")
@@ -119,6 +159,10 @@ def send_chat():
         
         # Add model name
         metrics["model"] = ollama_data.get("model", model_name)
+
+        if memory_info is not None:
+            metrics["memory_notes"] = memory_info["notes"]
+            metrics["memory_retrieval_ms"] = memory_info["retrieval_ms"]
         
         # Context usage (if available)
         if ollama_data.get("context") and isinstance(ollama_data["context"], list):
@@ -265,16 +265,11 @@ User message: {user_message[:500]}
 
 Reply with ONLY the title, no extra words or punctuation."""
         
-        # Call Ollama service with 5-second timeout
+        # Call Ollama service
         try:
             ollama_service = get_ollama_service()
-            title = ollama_service.send_prompt_with_retry(
-                prompt,
-                options={
-                    "num_predict": 20,  # Limit response length
-                    "temperature": 0.3  # Lower temperature for more focused titles
-                }
-            )
+            # The "title" route picks a small model and short, focused options
+            title = ollama_service.send_prompt_with_retry(prompt, route="title")
             
             # Clean up the title
             title = title.strip()
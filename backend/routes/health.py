@@ -1,12 +1,14 @@
-from flask import Blueprint, jsonify, current_app
-from services.ollama_client import is_ollama_reachable
+from flask import Blueprint, jsonify
+from backend.services.health_prober import get_health_prober
+from backend.services.model_switch import get_active_model
 
 health_bp = Blueprint('health_bp', __name__)
 
 @health_bp.route('/health', methods=['GET'])
 def health():
+    reachable = get_health_prober().is_up()
     return jsonify({
-        "status": "ok" if is_ollama_reachable() else "Ollama unreachable",
-        "active_model": current_app.config['ACTIVE_MODEL'],
-        "reaches_ollama": is_ollama_reachable()
+        "status": "ok" if reachable else "Ollama unreachable",
+        "active_model": get_active_model(),
+        "reaches_ollama": reachable
     })
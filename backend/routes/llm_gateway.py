@@ -7,15 +7,18 @@ from flask import Blueprint, request, jsonify, Response, stream_template, curren
 from typing import Dict, Any, Generator
 from dotenv import find_dotenv
 
+from backend.services.inference_ledger import build_usage, record_inference
+from backend.services.model_router import get_model_router
+from backend.services.prompt_builder import Prompt, get_prompt_builder
+from backend.services.shared_metrics import get_shared_metrics
+from backend.services.thermal_governor import AdmissionTimeout, get_thermal_governor
+
 logger = logging.getLogger(__name__)
 llm_bp = Blueprint('llm_bp', __name__)
 
 # Environment variables
 ANTHROPIC_API_KEY = os.getenv('ANTHROPIC_API_KEY')
 
-# Store last request body for debug endpoint
-last_request_body = None
-last_resolved_info = None
 
 def resolve_ollama_base():
     """Resolve OLLAMA_BASE_URL with proper precedence: ENV > config > default"""
@@ -47,35 +50,44 @@ def debug_env():
 @llm_bp.route('/v1/debug/echo', methods=['GET'])
 def debug_echo():
     """Debug endpoint to return last POST body and resolved info"""
-    global last_request_body, last_resolved_info
-    
+    # Kept in the shared metrics segment so any worker can answer
+    metrics = get_shared_metrics()
     return jsonify({
-        "last_body": last_request_body,
-        "resolved": last_resolved_info or {"base": "unknown", "source": "unknown"}
+        "last_body": metrics.get_json("last_request_body"),
+        "resolved": metrics.get_json("last_resolved") or {"base": "unknown", "source": "unknown"}
     })
 
 @llm_bp.route('/v1/chat/completions', methods=['POST'])
 def chat_completions():
     """OpenAI-compatible chat completions endpoint that proxies to Ollama or Anthropic"""
-    global last_request_body, last_resolved_info
-    
     try:
         data = request.get_json(force=True)
         
         # Store request body for debug endpoint
-        last_request_body = data
+        get_shared_metrics().set_json("last_request_body", data)
         
         # Extract parameters with defaults
-        model = data.get('model', 'qwen2.5-coder:7b')
+        model = data.get('model')
         messages = data.get('messages', [])
-        temperature = data.get('temperature', 0.2)
+        temperature = data.get('temperature')
         stream = data.get('stream', False)
         provider = data.get('provider', 'ollama')
+        task = data.get('task')
+        
+        if provider != 'anthropic' and task:
+            # An explicit task routes the request; without a model its route picks one (e.g. task=code)
+            routing = get_model_router().resolve(task, model)
+            model = routing.model
+            if temperature is None:
+                temperature = routing.options.get('temperature', 0.2)
+        else:
+            model = model or 'qwen2.5-coder:7b'
+            temperature = 0.2 if temperature is None else temperature
         
         # Log precise gateway info
         remote_addr = request.remote_addr or 'unknown'
         json_length = len(json.dumps(data))
-        logger.info(f"[LLM IN] ip={remote_addr} provider={provider} model={model} stream={stream} temp={temperature} len={json_length}")
+        logger.info(f"[LLM IN] ip={remote_addr} provider={provider} task={task} model={model} stream={stream} temp={temperature} len={json_length}")
         
         if not messages:
             return jsonify({'error': 'messages field is required'}), 400
@@ -83,19 +95,19 @@ def chat_completions():
         if provider == 'anthropic':
             return handle_anthropic_request(model, messages, temperature, stream)
         else:
-            return handle_ollama_request(model, messages, temperature, stream)
+            # Canonical order (system, presets, history) keeps Ollama's prompt cache warm; no memory injection here
+            built = get_prompt_builder().build_messages(messages, data.get('presets'), use_memory=False)
+            return handle_ollama_request(model, built.messages, temperature, stream, built)
             
     except Exception as e:
         logger.error(f"[LLM ERR] status=502 msg={str(e)}")
         return jsonify({'error': f'Request processing failed: {str(e)}'}), 502
 
-def handle_ollama_request(model: str, messages: list, temperature: float, stream: bool):
+def handle_ollama_request(model: str, messages: list, temperature: float, stream: bool, built: Prompt = None):
     """Handle request to Ollama"""
-    global last_resolved_info
-    
     # Resolve base URL and store for debug endpoint
     base, source = resolve_ollama_base()
-    last_resolved_info = {"base": base, "source": source}
+    get_shared_metrics().set_json("last_resolved", {"base": base, "source": source})
     
     provider = "ollama"
     
@@ -105,19 +117,26 @@ def handle_ollama_request(model: str, messages: list, temperature: float, stream
     # Get num_gpu from environment or use 0 for CPU-only mode
     num_gpu = int(os.getenv('OLLAMA_NUM_GPU', '0'))
     
+    governor = get_thermal_governor()
     ollama_payload = {
         'model': model,
         'messages': messages,
         'stream': stream,
-        'options': {
+        'options': governor.apply_options({
             'temperature': temperature,
             'num_gpu': num_gpu
-        }
+        })
     }
     
     # Log the complete payload being sent to Ollama
     logger.info(f"[OLLAMA PAYLOAD] {json.dumps(ollama_payload, indent=2)}")
     
+    try:
+        slot = governor.admit()
+    except AdmissionTimeout as e:
+        logger.warning(f"[LLM ERR] status=503 msg={str(e)}")
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '5'}
+    
     try:
         # Increased timeout to 120s for CPU mode inference
         response = requests.post(
@@ -129,19 +148,21 @@ def handle_ollama_request(model: str, messages: list, temperature: float, stream
         response.raise_for_status()
         
         if stream:
-            # For streaming, we can't easily count tokens, so log success without token count
+            # Token counts arrive with the final chunk and are logged by the ledger
             logger.info(f"[LLM OK] provider={provider} tokens=?")
+            # The stream releases the slot when it finishes
+            streaming, slot = slot, None
             return Response(
-                stream_ollama_response(response),
+                stream_ollama_response(response, model, streaming, built),
                 mimetype='text/plain',
                 headers={'Cache-Control': 'no-cache'}
             )
         else:
             ollama_response = response.json()
             content = ollama_response.get('message', {}).get('content', '')
+            record_inference("gateway", model, ollama_response, prompt=built)
             
-            # Log success with content length as token approximation
-            logger.info(f"[LLM OK] provider={provider} tokens={len(content)}")
+            logger.info(f"[LLM OK] provider={provider} tokens={ollama_response.get('eval_count', '?')}")
             
             # Convert Ollama response to OpenAI format
             openai_response = {
@@ -155,14 +176,22 @@ def handle_ollama_request(model: str, messages: list, temperature: float, stream
                 'model': model,
                 'object': 'chat.completion'
             }
+            usage = build_usage(ollama_response)
+            if usage:
+                openai_response['usage'] = usage
             return jsonify(openai_response)
             
     except Exception as e:
         logger.error(f"[LLM ERR] status=502 msg={str(e)}")
         return jsonify({'error': 'Ollama request failed', 'base': base}), 502
+    finally:
+        if slot:
+            slot.release()
 
-def stream_ollama_response(response) -> Generator[str, None, None]:
+def stream_ollama_response(response, model: str = None, slot=None, built: Prompt = None) -> Generator[str, None, None]:
     """Convert Ollama streaming response to OpenAI SSE format"""
+    start = time.perf_counter()
+    ttft_ms = None
     try:
         # Check if response is valid before trying to iterate
         if not hasattr(response, 'iter_lines') or response.status_code != 200:
@@ -175,6 +204,8 @@ def stream_ollama_response(response) -> Generator[str, None, None]:
                     content = ollama_chunk.get('message', {}).get('content', '')
                     
                     if content:
+                        if ttft_ms is None:
+                            ttft_ms = (time.perf_counter() - start) * 1000
                         # OpenAI-style streaming chunk
                         openai_chunk = {
                             'object': 'chat.completion.chunk',
@@ -197,6 +228,10 @@ def stream_ollama_response(response) -> Generator[str, None, None]:
                                 'finish_reason': 'stop'
                             }]
                         }
+                        usage = build_usage(ollama_chunk)
+                        if usage:
+                            final_chunk['usage'] = usage
+                        record_inference("gateway_stream", model, ollama_chunk, ttft_ms=ttft_ms, stream=True, prompt=built)
                         yield f"data: {json.dumps(final_chunk)}\n\n"
                         yield "data: [DONE]\n\n"
                         break
@@ -216,6 +251,9 @@ def stream_ollama_response(response) -> Generator[str, None, None]:
         }
         yield f"data: {json.dumps(error_chunk)}\n\n"
         yield "data: [DONE]\n\n"
+    finally:
+        if slot:
+            slot.release()
 
 def handle_anthropic_request(model: str, messages: list, temperature: float, stream: bool):
     """Handle request to Anthropic Claude API"""
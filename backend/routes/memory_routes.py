@@ -1,8 +1,15 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+import json
+import logging
 from backend.services.memory_service import (
-    add_note, update_note, delete_note, stats, export_notes, import_notes, recent_notes, search_notes
+    add_note, update_note, delete_note, stats, export_notes, recent_notes, search_notes,
+    iter_notes_payload, iter_import_progress, list_tags, encode_cursor, dedup_notes
 )
+from backend.services.memory_retrieval import get_retrieval_stats
+from backend.services.memory_writer import get_queue_stats
+from backend.services.storage_maintenance import get_maintenance_scheduler, get_history, run_maintenance
 
+logger = logging.getLogger(__name__)
 memory_bp = Blueprint('memory_bp', __name__)
 
 @memory_bp.route('/memory/update', methods=['PATCH'])
@@ -32,8 +39,34 @@ def export_memory_notes():
 
 @memory_bp.route('/memory/import', methods=['POST'])
 def import_memory_notes():
-    notes = request.get_json(force=True)
-    return jsonify(import_notes(notes))
+    """
+    Stream-import notes from a JSON array or NDJSON body.
+
+    With ?progress=1 the response is NDJSON with one progress object per
+    committed chunk; otherwise only the final summary is returned.
+    """
+    notes = iter_notes_payload(request.stream)
+    progress = iter_import_progress(notes)
+
+    if request.args.get('progress', '').lower() in ('1', 'true'):
+        def generate():
+            try:
+                for update in progress:
+                    yield json.dumps(update) + "\n"
+            except ValueError as e:
+                yield json.dumps({'error': str(e), 'done': True}) + "\n"
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    try:
+        result = {}
+        for result in progress:
+            if not result['done']:
+                logger.info(f"[MEMORY_IMPORT] {result['imported']} notes, {result['notes_per_sec']}/s")
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    logger.info(f"[MEMORY_IMPORT] Done: {result['imported']} imported, {result['skipped']} skipped "
+                f"in {result['elapsed_ms']}ms")
+    return jsonify(result)
 
 @memory_bp.route('/memory/add', methods=['POST'])
 def add_memory_note():
@@ -43,15 +76,83 @@ def add_memory_note():
     tags = data.get('tags')
     return jsonify(add_note(kind, text, tags))
 
+def _page_response(notes, page_size):
+    """JSON list of notes with the keyset cursor for the next page in X-Next-Cursor."""
+    response = jsonify(notes)
+    if len(notes) == page_size:
+        response.headers['X-Next-Cursor'] = encode_cursor(notes[-1])
+    return response
+
 @memory_bp.route('/memory/recent', methods=['GET'])
 def get_recent_notes():
     page = request.args.get('page', default=1, type=int)
-    return jsonify(recent_notes(page))
+    page_size = min(max(request.args.get('page_size', default=25, type=int), 1), 200)
+    cursor = request.args.get('cursor', default=None, type=str)
+    try:
+        notes = recent_notes(page, page_size, cursor)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return _page_response(notes, page_size)
 
 @memory_bp.route('/memory/search', methods=['GET'])
 def search_memory_notes():
     q = request.args.get('q', default='', type=str)
     kind = request.args.get('kind', default=None, type=str)
     tags = request.args.get('tags', default=None, type=str)
+    tag_mode = request.args.get('tag_mode', default='all', type=str)
     page = request.args.get('page', default=1, type=int)
-    return jsonify(search_notes(q, kind, tags, page))
+    page_size = min(max(request.args.get('page_size', default=25, type=int), 1), 200)
+    cursor = request.args.get('cursor', default=None, type=str)
+    try:
+        notes = search_notes(q, kind, tags, page, page_size, tag_mode, cursor)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return _page_response(notes, page_size)
+
+@memory_bp.route('/memory/tags', methods=['GET'])
+def get_memory_tags():
+    limit = min(max(request.args.get('limit', default=100, type=int), 1), 1000)
+    prefix = request.args.get('prefix', default=None, type=str)
+    return jsonify(list_tags(limit, prefix))
+
+@memory_bp.route('/memory/retrieval/stats', methods=['GET'])
+def get_memory_retrieval_stats():
+    return jsonify(get_retrieval_stats())
+
+@memory_bp.route('/memory/queue', methods=['GET'])
+def get_memory_queue_stats():
+    return jsonify(get_queue_stats())
+
+@memory_bp.route('/memory/dedup', methods=['POST'])
+def dedup_memory_notes():
+    data = request.get_json(silent=True) or {}
+    try:
+        result = dedup_notes(
+            dry_run=bool(data.get('dry_run', False)),
+            vacuum=bool(data.get('vacuum', False)),
+            kinds=data.get('kinds'),
+            max_distance=data.get('max_distance'),
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    logger.info(f"[MEMORY_DEDUP] {result['duplicates']} duplicates of {result['scanned']} notes, "
+                f"{result['bytes_reclaimed']} bytes (dry_run={result['dry_run']})")
+    return jsonify(result)
+
+@memory_bp.route('/memory/maintenance', methods=['GET'])
+def get_memory_maintenance():
+    status = get_maintenance_scheduler().get_status()
+    status['history'] = get_history(
+        db=request.args.get('db'),
+        event=request.args.get('event'),
+        limit=min(max(request.args.get('limit', default=288, type=int), 1), 5000),
+    )
+    return jsonify(status)
+
+@memory_bp.route('/memory/maintenance', methods=['POST'])
+def run_memory_maintenance():
+    data = request.get_json(silent=True) or {}
+    result = run_maintenance(tasks=data.get('tasks'), force=bool(data.get('force', True)))
+    if 'skipped' in result:
+        return jsonify(result), 409
+    return jsonify(result)
@@ -1,6 +1,9 @@
-from flask import Blueprint, jsonify, request, current_app
-from services.ollama_client import get_installed_models
-import os
+from flask import Blueprint, jsonify, request
+from backend.services.ollama_client import get_installed_models, delete_model
+from backend.services.benchmark import CASES, compare, get_run, list_runs, start_benchmark
+from backend.services.model_catalog import get_model_catalog
+from backend.services.model_router import get_model_router
+from backend.services.model_switch import SwitchInProgress, get_model_switcher
 
 models_bp = Blueprint('models_bp', __name__)
 
@@ -9,28 +12,73 @@ def models():
     models_list = get_installed_models()
     return jsonify({"models": models_list})
 
+@models_bp.route('/models/catalog', methods=['GET'])
+def models_catalog():
+    catalog = get_model_catalog()
+    return jsonify(dict(catalog.snapshot(), stats=catalog.get_stats()))
+
+@models_bp.route('/models/routing', methods=['GET'])
+def models_routing():
+    router = get_model_router()
+    return jsonify({"routes": router.table(), "stats": router.get_stats(), "settings": router.store.get_stats()})
+
+@models_bp.route('/benchmarks', methods=['GET'])
+def benchmarks():
+    return jsonify({"runs": list_runs(request.args.get('limit', default=20, type=int)), "cases": list(CASES)})
+
+@models_bp.route('/benchmarks', methods=['POST'])
+def run_benchmarks():
+    data = request.get_json(silent=True) or {}
+    cases = data.get('cases')
+    unknown = [c for c in cases or [] if c not in CASES]
+    if unknown:
+        return jsonify({"error": f"Unknown cases: {', '.join(unknown)}"}), 400
+    run_id = start_benchmark(data.get('models'), cases)
+    if run_id is None:
+        return jsonify({"error": "A benchmark is already running"}), 409
+    return jsonify({"success": True, "run_id": run_id}), 202
+
+@models_bp.route('/benchmarks/compare', methods=['GET'])
+def benchmark_comparison():
+    return jsonify({"comparison": compare()})
+
+@models_bp.route('/benchmarks/<int:run_id>', methods=['GET'])
+def benchmark_run(run_id):
+    run = get_run(run_id)
+    if run is None:
+        return jsonify({"error": "Unknown benchmark run"}), 404
+    return jsonify(run)
+
+@models_bp.route('/models/<path:model>', methods=['DELETE'])
+def remove_model(model):
+    success = delete_model(model)
+    return jsonify({"success": success}), 200 if success else 500
+
+@models_bp.route('/models/switch', methods=['GET'])
+def models_switch_status():
+    return jsonify(get_model_switcher().status())
+
+@models_bp.route('/models/switch', methods=['POST'])
+def models_switch():
+    data = request.get_json(silent=True) or {}
+    model = data.get('model')
+    if not model:
+        return jsonify({"error": "model required"}), 400
+    try:
+        switch = get_model_switcher().start(model)
+    except SwitchInProgress as e:
+        return jsonify({"error": str(e), **get_model_switcher().status()}), 409
+    return jsonify(switch), 202
+
 @models_bp.route('/set_model', methods=['POST'])
 def set_model():
+    # The old model keeps serving until the new one is loaded and warm, then every worker flips
     data = request.get_json()
     model = data.get('model')
     if not model:
         return jsonify({"error": "model required"}), 400
-
-    current_app.config['ACTIVE_MODEL'] = model
-
-    # Persist to .env
-    env_file = os.path.join(os.path.dirname(__file__), '..', '.env')
-    lines = []
-    if os.path.exists(env_file):
-        with open(env_file, 'r') as f:
-            lines = f.readlines()
-    for i, line in enumerate(lines):
-        if line.startswith('ACTIVE_MODEL='):
-            lines[i] = f'ACTIVE_MODEL={model}\n'
-            break
-    else:
-        lines.append(f'ACTIVE_MODEL={model}\n')
-    with open(env_file, 'w') as f:
-        f.writelines(lines)
-
-    return jsonify({"success": True})
+    try:
+        switch = get_model_switcher().start(model)
+    except SwitchInProgress as e:
+        return jsonify({"success": False, "error": str(e)}), 409
+    return jsonify({"success": True, "switch": switch}), 202
@@ -5,6 +5,9 @@ import logging
 from flask import Blueprint, request, jsonify, current_app
 from typing import Dict, Any, List
 
+from backend.config import ModelCatalogConfig
+from backend.services.model_catalog import get_model_catalog
+
 logger = logging.getLogger(__name__)
 models_bp = Blueprint('models_bp', __name__)
 
@@ -18,35 +21,18 @@ def resolve_ollama_base():
         return "http://127.0.0.1:11434", "default"
 
 def get_ollama_models() -> List[Dict[str, Any]]:
-    """Fetch models from Ollama API with 2s timeout"""
-    try:
-        base, source = resolve_ollama_base()
-        logger.info(f"Fetching Ollama models from {base} (source: {source})")
-        
-        response = requests.get(
-            f'{base}/api/tags',
-            timeout=2
-        )
-        response.raise_for_status()
-        
-        data = response.json()
-        models = []
-        
-        # Map tags.models[*] to required fields
-        for model in data.get('models', []):
-            models.append({
-                'name': model.get('name', ''),
-                'family': model.get('details', {}).get('family', ''),
-                'size': model.get('size', 0),
-                'modified_at': model.get('modified_at', '')
-            })
-        
-        logger.info(f"Successfully fetched {len(models)} Ollama models")
-        return models
-        
-    except Exception as e:
-        logger.error(f"Failed to fetch Ollama models: {str(e)}")
-        return []
+    """Ollama models from the cached catalog (merged across OLLAMA_HOSTS)"""
+    snapshot = get_model_catalog().snapshot(wait=ModelCatalogConfig.TIMEOUT)
+    return [
+        {
+            'name': model['name'],
+            'family': model['family'],
+            'size': model['size'],
+            'modified_at': model['modified_at'],
+            'hosts': model['hosts']
+        }
+        for model in snapshot['models']
+    ]
 
 def get_anthropic_models() -> List[Dict[str, Any]]:
     """Return Anthropic preset models"""
@@ -112,13 +98,14 @@ def get_models():
         
         # Fetch Ollama models if requested or no filter
         if not provider_filter or provider_filter == 'ollama':
-            ollama_models = get_ollama_models()
-            result['ollama'] = ollama_models
+            snapshot = get_model_catalog().snapshot(wait=ModelCatalogConfig.TIMEOUT)
+            result['ollama'] = get_ollama_models()
+            result['catalog'] = {'age': snapshot['age'], 'stale': snapshot['stale']}
             
-            # Add error info if Ollama fetch failed
-            if not ollama_models:
-                base, _ = resolve_ollama_base()
-                result['ollama_error'] = f"Failed to fetch from {base}"
+            # Add error info for hosts that failed their last refresh
+            errors = [f"Failed to fetch from {h['base']}: {h['error']}" for h in snapshot['hosts'] if not h['ok']]
+            if errors:
+                result['ollama_error'] = '; '.join(errors)
         
         # Add Anthropic models if requested or no filter
         if not provider_filter or provider_filter == 'anthropic':
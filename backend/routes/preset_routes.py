@@ -1,12 +1,9 @@
 from flask import Blueprint, jsonify
-import json
-import os
+from backend.services.prompt_builder import get_prompt_builder
 
 preset_bp = Blueprint('preset_bp', __name__)
 
 @preset_bp.route('/presets', methods=['GET'])
 def get_presets():
-    presets_path = os.path.join(os.path.dirname(__file__), '../presets.json')
-    with open(presets_path, 'r') as f:
-        data = json.load(f)
-    return jsonify(data.get('presets', []))
+    # Served from the prompt builder's copy, re-read only when presets.json changes
+    return jsonify(get_prompt_builder().presets())
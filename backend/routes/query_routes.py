@@ -2,8 +2,10 @@ from flask import Blueprint, request, jsonify
 from backend.services.ollama_service import send_prompt
 import time
 import logging
-from backend.config import JoeyAIConfig
-from backend.services import memory_service as mem
+from backend.config import JoeyAIConfig, ModelCatalogConfig
+from backend.services.model_catalog import get_model_catalog
+from backend.services.prompt_builder import get_prompt_builder
+from backend.services.memory_writer import enqueue_note
 
 logger = logging.getLogger(__name__)
 query_bp = Blueprint('query_bp', __name__)
@@ -16,21 +18,26 @@ def query():
     if not prompt:
         return jsonify({"error": "No prompt provided"}), 400
     start_time = time.time()
-    response = send_prompt(prompt)
+    built = get_prompt_builder().build_prompt(prompt, data.get('presets'), data.get('use_memory'))
+    memory_info = built.memory
+    response = send_prompt(built.text, route="query", built=built)
     response_time = time.time() - start_time
     # Auto-save chat to memory
     if getattr(JoeyAIConfig, 'AUTO_SAVE_CHATS', True):
         try:
             model_name = getattr(__import__('backend.config').OllamaConfig, 'MODEL', 'unknown')
             transcript = f"""[CHAT]\nuser:\n{prompt}\n\nassistant:\n{response}\n\nmeta:\nmodel={model_name}, route=/query"""
-            mem.add_note(kind="chat", text=transcript)
+            enqueue_note(kind="chat", text=transcript)
         except Exception as e:
             logger.warning(f"Memory save failed: {e}")
-    return jsonify({
+    result = {
         "response": response,
         "response_time": round(response_time, 2),
         "timestamp": int(time.time())
-    })
+    }
+    if memory_info is not None:
+        result["memory"] = memory_info
+    return jsonify(result)
 
 @query_bp.route('/query/advanced', methods=['POST'])
 def advanced_query():
@@ -53,17 +60,19 @@ def advanced_query():
         kwargs['options'] = kwargs.get('options', {})
         kwargs['options']['top_p'] = top_p
     start_time = time.time()
-    response = send_prompt(prompt, **kwargs)
+    built = get_prompt_builder().build_prompt(prompt, data.get('presets'), data.get('use_memory'))
+    memory_info = built.memory
+    response = send_prompt(built.text, route="query_advanced", built=built, **kwargs)
     response_time = time.time() - start_time
     # Auto-save chat to memory
     if getattr(JoeyAIConfig, 'AUTO_SAVE_CHATS', True):
         try:
             model_name = getattr(__import__('backend.config').OllamaConfig, 'MODEL', 'unknown')
             transcript = f"""[CHAT]\nuser:\n{prompt}\n\nassistant:\n{response}\n\nmeta:\nmodel={model_name}, route=/query/advanced"""
-            mem.add_note(kind="chat", text=transcript)
+            enqueue_note(kind="chat", text=transcript)
         except Exception as e:
             logger.warning(f"Memory save failed: {e}")
-    return jsonify({
+    result = {
         "response": response,
         "response_time": round(response_time, 2),
         "timestamp": int(time.time()),
@@ -72,26 +81,24 @@ def advanced_query():
             "max_tokens": max_tokens,
             "top_p": top_p
         }
-    })
+    }
+    if memory_info is not None:
+        result["memory"] = memory_info
+    return jsonify(result)
 
 @query_bp.route('/models', methods=['GET'])
 def get_available_models():
     """Get list of available models from Ollama."""
-    from backend.services.ollama_service import get_ollama_service
-    
     try:
-        service = get_ollama_service()
-        # Make a request to Ollama's /api/tags endpoint to get available models
-        response = service.session.get(
-            f"{service.session.headers.get('base_url', 'http://localhost:11434')}/api/tags",
-            timeout=5
-        )
-        response.raise_for_status()
-        models_data = response.json()
+        snapshot = get_model_catalog().snapshot(wait=ModelCatalogConfig.TIMEOUT)
+        if not any(host['ok'] for host in snapshot['hosts']) and not snapshot['models']:
+            raise RuntimeError("no Ollama host reachable")
+        names = [model['name'] for model in snapshot['models']]
         
         return jsonify({
-            "models": [model['name'] for model in models_data.get('models', [])],
-            "count": len(models_data.get('models', []))
+            "models": names,
+            "count": len(names),
+            "stale": snapshot['stale']
         })
     except Exception as e:
         logger.error(f"Failed to fetch models: {str(e)}")
@@ -3,64 +3,36 @@ User settings management routes.
 Allows users to configure and save system-wide options.
 """
 from flask import Blueprint, jsonify, request
-import json
-import os
 import logging
-from pathlib import Path
+
+from backend.services.settings_store import DEFAULT_SETTINGS, get_settings_store
 
 logger = logging.getLogger(__name__)
 
 settings_bp = Blueprint('settings', __name__)
 
-# Default settings
-DEFAULT_SETTINGS = {
-    "model": "qwen2.5:7b-instruct",
-    "temperature": 0.7,
-    "auto_save": True,
-    "theme": "dark",
-    "memory_limit": 10,
-    "last_active_conversation_id": None
-}
-
-# Settings file path
-SETTINGS_FILE = Path(__file__).resolve().parent.parent / "settings.json"
-
 
 def load_settings():
     """
-    Load settings from file or return defaults if file doesn't exist.
+    Current settings, from the in-memory store (defaults for missing keys).
     
     Returns:
         dict: Current settings
     """
-    try:
-        if SETTINGS_FILE.exists():
-            with open(SETTINGS_FILE, 'r') as f:
-                settings = json.load(f)
-                logger.info("[USER_SETTINGS] Loaded settings from file")
-                return settings
-        else:
-            logger.info("[USER_SETTINGS] Loaded defaults")
-            save_settings(DEFAULT_SETTINGS)
-            return DEFAULT_SETTINGS.copy()
-    except Exception as e:
-        logger.error(f"[USER_SETTINGS] Error loading settings: {e}")
-        return DEFAULT_SETTINGS.copy()
+    return get_settings_store().all()
 
 
 def save_settings(settings):
     """
-    Save settings to file.
+    Replace the saved settings (atomic write, seen by every worker).
     
     Args:
         settings (dict): Settings to save
+        
+    Returns:
+        dict: The saved settings
     """
-    try:
-        with open(SETTINGS_FILE, 'w') as f:
-            json.dump(settings, f, indent=2)
-        logger.info("[USER_SETTINGS] Saved settings to file")
-    except Exception as e:
-        logger.error(f"[USER_SETTINGS] Error saving settings: {e}")
+    return get_settings_store().replace(settings)
 
 
 def validate_settings(settings):
@@ -106,6 +78,24 @@ def validate_settings(settings):
         if not isinstance(settings["model"], str):
             return False, "model must be a string"
     
+    # Validate model_routes ({task: {"model": str, "options": dict}})
+    if "model_routes" in settings:
+        routes = settings["model_routes"]
+        if not isinstance(routes, dict):
+            return False, "model_routes must be an object"
+        for task, entry in routes.items():
+            if not isinstance(entry, dict):
+                return False, f"model_routes.{task} must be an object"
+            if entry.get("model") is not None and not isinstance(entry["model"], str):
+                return False, f"model_routes.{task}.model must be a string"
+            if not isinstance(entry.get("options", {}), dict):
+                return False, f"model_routes.{task}.options must be an object"
+    
+    # The active model only changes through a switch, after the new model is warm
+    # (update_settings drops an unchanged value before validating)
+    if "active_model" in settings:
+        return False, "active_model is changed with POST /api/models/switch"
+    
     # Validate last_active_conversation_id
     if "last_active_conversation_id" in settings:
         if settings["last_active_conversation_id"] is not None:
@@ -145,31 +135,30 @@ def update_settings():
         JSON: Updated full settings object
     """
     try:
-        # Get current settings
-        current_settings = load_settings()
-        
         # Get updates from request
         updates = request.get_json()
         
         if not updates:
             return jsonify({"error": "No settings provided"}), 400
         
+        # A GET result posted back carries the current active model; only a different one is refused
+        if isinstance(updates, dict) and "active_model" in updates \
+                and updates["active_model"] == load_settings().get("active_model"):
+            updates = {key: value for key, value in updates.items() if key != "active_model"}
+        
         # Validate updates
         is_valid, error_msg = validate_settings(updates)
         if not is_valid:
             return jsonify({"error": error_msg}), 400
         
-        # Merge updates with current settings
+        # Merge into the latest saved settings and persist
+        current_settings = load_settings()
+        updated_settings = get_settings_store().update(updates)
         for key, value in updates.items():
             if key in DEFAULT_SETTINGS:
-                old_value = current_settings.get(key)
-                current_settings[key] = value
-                logger.info(f"[USER_SETTINGS] Updated: {key} → {value} (was: {old_value})")
-        
-        # Save updated settings
-        save_settings(current_settings)
+                logger.info(f"[USER_SETTINGS] Updated: {key} → {value} (was: {current_settings.get(key)})")
         
-        return jsonify(current_settings), 200
+        return jsonify(updated_settings), 200
     
     except Exception as e:
         logger.error(f"[USER_SETTINGS] Error updating settings: {e}")
@@ -186,8 +175,8 @@ def reset_settings():
     """
     try:
         logger.info("[USER_SETTINGS] Reset to defaults")
-        save_settings(DEFAULT_SETTINGS)
-        return jsonify(DEFAULT_SETTINGS), 200
+        # Resetting preferences does not switch the served model; every other key reverts to its default
+        return jsonify(save_settings({"active_model": load_settings().get("active_model")})), 200
     except Exception as e:
         logger.error(f"[USER_SETTINGS] Error resetting settings: {e}")
         return jsonify({"error": str(e)}), 500
@@ -1,6 +1,7 @@
-from flask import Blueprint, jsonify, request, current_app
-from services.system_info import get_cpu_load, get_ram_info, get_gpu_load, get_gpu_mode, get_temps, get_power_mode, set_power_mode
-from services.ollama_client import pull_model
+from flask import Blueprint, jsonify, request, Response
+from backend.services.system_info import get_cpu_load, get_ram_info, get_gpu_load, get_gpu_mode, get_temps, get_power_mode, set_power_mode
+from backend.services.pull_manager import PullError, get_pull_manager
+from backend.services.model_switch import get_active_model
 
 system_bp = Blueprint('system_bp', __name__)
 
@@ -29,11 +30,16 @@ def set_mode():
     success = set_power_mode(mode)
     return jsonify({"success": success}), 200 if success else 500
 
+def _start_pull(model, host=None):
+    try:
+        job = get_pull_manager().start(model, host)
+    except PullError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    return jsonify({"success": True, "job": job}), 202
+
 @system_bp.route('/reload_models', methods=['POST'])
 def reload_models():
-    model = current_app.config['ACTIVE_MODEL']
-    success = pull_model(model)
-    return jsonify({"success": success}), 200 if success else 500
+    return _start_pull(get_active_model())
 
 @system_bp.route('/restart_backend', methods=['POST'])
 def restart_backend():
@@ -42,6 +48,43 @@ def restart_backend():
 
 @system_bp.route('/reload_ollama', methods=['POST'])
 def reload_ollama():
-    model = current_app.config['ACTIVE_MODEL']
-    success = pull_model(model)
-    return jsonify({"success": success}), 200 if success else 500
+    return _start_pull(get_active_model())
+
+@system_bp.route('/pulls', methods=['GET'])
+def list_pulls():
+    return jsonify({"jobs": get_pull_manager().list()})
+
+@system_bp.route('/pulls', methods=['POST'])
+def create_pull():
+    data = request.get_json() or {}
+    model = data.get('model') or get_active_model()
+    return _start_pull(model, data.get('host'))
+
+@system_bp.route('/pulls/<job_id>', methods=['GET'])
+def get_pull(job_id):
+    job = get_pull_manager().get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown pull job"}), 404
+    return jsonify(job)
+
+@system_bp.route('/pulls/<job_id>/events', methods=['GET'])
+def stream_pull(job_id):
+    return Response(
+        get_pull_manager().events(job_id),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+@system_bp.route('/pulls/<job_id>/cancel', methods=['POST'])
+def cancel_pull(job_id):
+    try:
+        return jsonify({"success": True, "job": get_pull_manager().cancel(job_id)})
+    except PullError as e:
+        return jsonify({"success": False, "error": str(e)}), 404
+
+@system_bp.route('/pulls/<job_id>/resume', methods=['POST'])
+def resume_pull(job_id):
+    try:
+        return jsonify({"success": True, "job": get_pull_manager().resume(job_id)}), 202
+    except PullError as e:
+        return jsonify({"success": False, "error": str(e)}), 404
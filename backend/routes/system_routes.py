@@ -1,455 +1,86 @@
 """
 System performance and status monitoring routes.
 """
-from flask import Blueprint, jsonify, current_app
-import psutil
-import subprocess
-import time
+from flask import Blueprint, jsonify, request, Response
 import os
-import re
-import random
-import glob
+import time
 import logging
-from pathlib import Path
+
+from backend.config import InferenceLedgerConfig, TelemetryConfig
+from backend.services.deadline import get_retry_budget
+from backend.services.inference_ledger import session_tokens, summarize
+from backend.services.memory_guard import get_memory_guard
+from backend.services.shared_metrics import RING_SIZE, get_shared_metrics
+from backend.services.prompt_builder import get_prompt_builder
+from backend.services.sensors import get_sensor_map, rescan_sensors
+from backend.services.telemetry import get_snapshot, get_telemetry_sampler
+from backend.services.telemetry_stream import get_telemetry_broadcaster
+from backend.services.thermal_governor import ThermalGovernor, get_thermal_governor
+from backend.services.telemetry_history import METRICS, get_telemetry_history, parse_duration
 
 logger = logging.getLogger(__name__)
 
 system_bp = Blueprint('system', __name__)
 
-# Track last response time and tokens
-_last_response_time = None
-_last_model_name = None
-_last_tokens_per_sec = None
-_context_used = "0/4096"
-
-
-def get_cpu_temperature():
-    """Get CPU temperature in Celsius by averaging all CPU thermal zones."""
-    cpu_temps = []
-    
-    try:
-        # Read all thermal zones
-        thermal_zones = list(Path('/sys/class/thermal').glob('thermal_zone*'))
-        for zone in thermal_zones:
-            try:
-                # Read zone type to check if it's CPU-related
-                type_file = zone / 'type'
-                temp_file = zone / 'temp'
-                
-                if type_file.exists() and temp_file.exists():
-                    zone_type = type_file.read_text().strip().lower()
-                    # Include CPU-specific zones (cpu-thermal, MCPU, BCPU, etc.)
-                    if 'cpu' in zone_type:
-                        temp = int(temp_file.read_text().strip()) / 1000.0
-                        if 0 < temp < 150:  # Sanity check
-                            cpu_temps.append(temp)
-            except (IOError, ValueError):
-                continue
-        
-        # Return average if we found any CPU temps
-        if cpu_temps:
-            return sum(cpu_temps) / len(cpu_temps)
-            
-    except Exception:
-        pass
-    
-    # Fallback: Try psutil sensors
-    try:
-        temps = psutil.sensors_temperatures()
-        if temps:
-            for name, entries in temps.items():
-                if 'cpu' in name.lower() or 'coretemp' in name.lower():
-                    for entry in entries:
-                        if 0 < entry.current < 150:
-                            cpu_temps.append(entry.current)
-            
-            if cpu_temps:
-                return sum(cpu_temps) / len(cpu_temps)
-    except (AttributeError, Exception):
-        pass
-    
-    return None
-
-
-def get_gpu_stats():
-    """
-    Get GPU usage, temperature, and power draw for Jetson or NVIDIA GPUs.
-    Returns dict with usage, temp, and power or None values.
-    Optimized for Jetson Orin Nano.
-    """
-    stats = {'usage': None, 'temp': None, 'power': None}
-    
-    # Try NVIDIA GPU first (discrete GPUs)
-    try:
-        result = subprocess.run(
-            ['nvidia-smi', '--query-gpu=utilization.gpu,temperature.gpu,power.draw',
-             '--format=csv,noheader,nounits'],
-            capture_output=True,
-            text=True,
-            timeout=0.5
-        )
-        if result.returncode == 0:
-            parts = result.stdout.strip().split(',')
-            if len(parts) >= 3:
-                stats['usage'] = float(parts[0].strip())
-                stats['temp'] = float(parts[1].strip())
-                stats['power'] = float(parts[2].strip())
-                return stats
-    except (subprocess.TimeoutExpired, subprocess.CalledProcessError, FileNotFoundError, ValueError):
-        pass
-    
-    # Jetson-specific detection
-    # 1. Try GPU temperature from sysfs (multiple possible locations)
-    gpu_temp_paths = [
-        '/sys/devices/virtual/thermal/thermal_zone0/temp',  # Common Jetson location
-        '/sys/devices/gpu.0/temp',
-        '/sys/class/thermal/thermal_zone0/temp',
-    ]
-    
-    for temp_path in gpu_temp_paths:
-        try:
-            temp_file = Path(temp_path)
-            if temp_file.exists():
-                temp = int(temp_file.read_text().strip()) / 1000.0
-                if 0 < temp < 150:
-                    stats['temp'] = temp
-                    break
-        except (IOError, ValueError):
-            continue
-    
-    # 2. Try tegrastats for GPU usage and power (optimized single call)
-    try:
-        result = subprocess.run(
-            ['tegrastats', '--interval', '1000'],  # 1000ms = 1 second
-            capture_output=True,
-            timeout=1.5  # Increased timeout to ensure we get output
-        )
-        if result.returncode == 0 or result.stdout:  # Accept output even if not finished
-            output = result.stdout.decode('utf-8') if isinstance(result.stdout, bytes) else result.stdout
-            
-            # Parse GPU utilization: GR3D_FREQ 13%@... or GR3D 13%
-            gpu_patterns = [
-                r'GR3D_FREQ\s+(\d+(?:\.\d+)?)%',  # Match decimals too
-                r'GR3D\s+(\d+(?:\.\d+)?)%',
-            ]
-            for pattern in gpu_patterns:
-                gpu_match = re.search(pattern, output)
-                if gpu_match:
-                    stats['usage'] = float(gpu_match.group(1))
-                    break
-            
-            # Parse GPU temperature if not found in sysfs: gpu@51C or gpu@51.5C
-            if stats['temp'] is None:
-                temp_match = re.search(r'gpu@([\d.]+)C', output, re.IGNORECASE)
-                if temp_match:
-                    stats['temp'] = float(temp_match.group(1))
-            
-            # Parse power: VDD_IN 4816mW/4816mW or VDD_GPU_CV
-            power_patterns = [
-                r'VDD_GPU_CV\s+(\d+)mW',
-                r'VDD_IN\s+(\d+)mW',
-                r'POM_5V_GPU\s+(\d+)/\d+',
-                r'POM_5V_IN\s+(\d+)/\d+',
-                r'VDD_CPU_GPU_CV\s+(\d+)mW',
-            ]
-            for pattern in power_patterns:
-                power_match = re.search(pattern, output)
-                if power_match:
-                    # Convert mW to W
-                    stats['power'] = float(power_match.group(1)) / 1000.0
-                    break
-                    
-    except (subprocess.TimeoutExpired, subprocess.CalledProcessError, FileNotFoundError, ValueError) as e:
-        # Timeout is expected - use partial output if available
-        if hasattr(e, 'stdout') and e.stdout:
-            output = e.stdout.decode('utf-8') if isinstance(e.stdout, bytes) else e.stdout
-            # Try parsing from partial output
-            gpu_match = re.search(r'GR3D_FREQ\s+(\d+(?:\.\d+)?)%', output)
-            if gpu_match:
-                stats['usage'] = float(gpu_match.group(1))
-    
-    
-    # 3. Fallback: Try reading GPU freq to estimate usage
-    if stats['usage'] is None:
-        try:
-            freq_file = Path('/sys/devices/gpu.0/devfreq/17000000.ga10b/cur_freq')
-            max_freq_file = Path('/sys/devices/gpu.0/devfreq/17000000.ga10b/max_freq')
-            
-            if freq_file.exists() and max_freq_file.exists():
-                cur_freq = int(freq_file.read_text().strip())
-                max_freq = int(max_freq_file.read_text().strip())
-                if max_freq > 0:
-                    stats['usage'] = (cur_freq / max_freq) * 100
-        except (IOError, ValueError, ZeroDivisionError):
-            pass
-    
-    return stats
-
-
-def get_gpu_usage():
-    """
-    Attempt to get GPU usage percentage.
-    Returns None if GPU is not available or detection fails.
-    """
-    stats = get_gpu_stats()
-    return stats['usage']
-
-
-def get_vram_usage():
-    """
-    Get system RAM usage in MB for Jetson.
-    Returns rounded integer MB or None if unavailable.
-    """
-    try:
-        # Try tegrastats for RAM info (all common patterns)
-        result = subprocess.run(
-            ['tegrastats', '--interval', '1000'],
-            capture_output=True,
-            timeout=0.3
-        )
-        if result.stdout:
-            output = result.stdout.decode('utf-8') if isinstance(result.stdout, bytes) else result.stdout
-            # Parse: RAM 2220/7620MB or RAM 2220/7620MiB
-            ram_match = re.search(r'RAM\s+(\d+)/(\d+)(?:MB|MiB)', output)
-            if ram_match:
-                used_mb = int(ram_match.group(1))
-                return used_mb
-    except (subprocess.TimeoutExpired, subprocess.CalledProcessError, FileNotFoundError, ValueError):
-        pass
-    
-    # Fallback to psutil
-    try:
-        memory = psutil.virtual_memory()
-        used_mb = round(memory.used / 1e6)  # Convert bytes to MB
-        return used_mb
-    except Exception as e:
-        logger.warning(f"[TELEMETRY] VRAM fallback failed: {e}")
-    
-    return None
-
-
-def get_fan_speed():
-    """
-    Get fan speed percentage (0-100%) for Jetson.
-    Returns None if fan not available or not controllable.
-    """
-    try:
-        # Use glob to find fan PWM paths dynamically
-        pwm_patterns = [
-            '/sys/devices/gpu.0/fan_pwm_target',
-            '/sys/devices/platform/pwm-fan/hwmon/hwmon*/pwm1',
-            '/sys/devices/platform/7000d000.pwm-fan/target_pwm',
-            '/sys/devices/pwm-fan/target_pwm',
-            '/sys/devices/platform/pwm-fan/target_pwm',
-            '/sys/class/hwmon/hwmon*/pwm1',
-        ]
-        
-        for pattern in pwm_patterns:
-            matches = glob.glob(pattern)
-            for pwm_path in matches:
-                try:
-                    pwm_file = Path(pwm_path)
-                    if pwm_file.exists():
-                        pwm_value = int(pwm_file.read_text().strip())
-                        # Convert 0-255 PWM to 0-100 percentage
-                        fan_pct = (pwm_value / 255.0) * 100
-                        logger.info(f"[TELEMETRY] Fan speed found at {pwm_path}: {fan_pct:.1f}%")
-                        return fan_pct
-                except (IOError, ValueError) as e:
-                    continue
-        
-        logger.info("[TELEMETRY] Fan speed path not found")
-    except Exception as e:
-        logger.warning(f"[TELEMETRY] Fan speed detection failed: {e}")
-    
-    return None
-
-
-def get_power_draw():
-    """
-    Get total system power draw in Watts for Jetson.
-    Detects INA3221 or hwmon sensors and sums all valid readings.
-    Returns float in Watts or None if unavailable.
-    """
-    total_power_w = 0.0
-    found_sensors = False
-    
-    try:
-        # Try hwmon power sensors
-        power_patterns = [
-            '/sys/class/hwmon/hwmon*/power*_input',
-            '/sys/bus/i2c/drivers/ina3221x/*/iio_device/in_power*_input',
-            '/sys/devices/*/power/power*_input',
-        ]
-        
-        for pattern in power_patterns:
-            matches = glob.glob(pattern)
-            for power_path in matches:
-                try:
-                    power_file = Path(power_path)
-                    if power_file.exists():
-                        # Read power in µW (microwatts)
-                        power_uw = int(power_file.read_text().strip())
-                        # Convert µW to W
-                        power_w = power_uw / 1e6
-                        if 0 < power_w < 100:  # Sanity check (< 100W)
-                            total_power_w += power_w
-                            found_sensors = True
-                            logger.debug(f"[TELEMETRY] Power sensor at {power_path}: {power_w:.2f}W")
-                except (IOError, ValueError):
-                    continue
-        
-        if found_sensors:
-            logger.info(f"[TELEMETRY] Total power draw: {total_power_w:.2f}W")
-            return total_power_w
-        
-        logger.info("[TELEMETRY] Power draw sensors not found")
-            
-    except Exception as e:
-        logger.warning(f"[TELEMETRY] Power draw detection failed: {e}")
-    
-    return None
-
-
-def get_thermal_throttle_status():
-    """
-    Detect if system is thermally throttled.
-    Returns boolean True if throttled, False otherwise.
-    """
-    try:
-        # Check throttle count files
-        throttle_paths = [
-            '/sys/devices/gpu.0/throttle_count',
-            '/sys/kernel/debug/bpmp/debug/clk/gpu/throttle_count',
-        ]
-        
-        for throttle_path in throttle_paths:
-            throttle_file = Path(throttle_path)
-            if throttle_file.exists():
-                try:
-                    count = int(throttle_file.read_text().strip())
-                    if count > 0:
-                        return True
-                except (IOError, ValueError):
-                    continue
-        
-        # Alternative: Check if any CPU is below max frequency (basic throttle detection)
-        try:
-            result = subprocess.run(
-                ['tegrastats', '--interval', '1000'],
-                capture_output=True,
-                timeout=0.3
-            )
-            if result.stdout:
-                output = result.stdout.decode('utf-8') if isinstance(result.stdout, bytes) else result.stdout
-                # Check if any CPU core is throttled (running below max freq)
-                # CPU [0%@729,3%@729,2%@729,4%@1036,0%@729,0%@729]
-                # If all cores at low freq like 729MHz it might indicate throttling
-                cpu_match = re.search(r'CPU \[(.*?)\]', output)
-                if cpu_match:
-                    cpu_data = cpu_match.group(1)
-                    # Extract frequencies
-                    freqs = re.findall(r'@(\d+)', cpu_data)
-                    if freqs:
-                        avg_freq = sum(int(f) for f in freqs) / len(freqs)
-                        # If average frequency < 1000 MHz, might be throttled
-                        if avg_freq < 1000:
-                            return True
-        except (subprocess.TimeoutExpired, subprocess.CalledProcessError, FileNotFoundError, ValueError):
-            pass
-            
-    except Exception:
-        pass
-    
-    return False
-
-
 @system_bp.route('/api/system_stats', methods=['GET'])
 def get_system_stats():
     """
     Get current system performance statistics.
-    Optimized for Jetson Orin Nano with sub-300ms response time.
+    Reads the latest snapshot from the background telemetry sampler, so the
+    request never spawns processes or waits on sensors.
     
     Returns:
         JSON with CPU, memory, GPU usage, temperatures, power, model info, and connection status
     """
-    global _last_response_time, _last_model_name, _last_tokens_per_sec, _context_used
-    
-    start_time = time.time()
+    start_time = time.perf_counter()
     
     try:
-        # Get CPU usage (shorter interval for faster response)
-        cpu_percent = psutil.cpu_percent(interval=0.05)
+        # Hardware readings and Ollama status come from the background sampler
+        snapshot = get_snapshot()
         
-        # Get memory usage (no delay)
-        memory = psutil.virtual_memory()
-        memory_percent = memory.percent
+        # Generation metrics come from the shared segment, the same in every worker
+        shared = get_shared_metrics().read(recent=1)
+        last = shared["recent"][-1] if shared["recent"] else {}
         
-        # Get CPU temperature
-        cpu_temp = get_cpu_temperature()
+        model_name = shared["last_model"] or "qwen2.5:7b-instruct"
         
-        # Get GPU stats (usage, temp, power) - optimized for Jetson
-        gpu_stats = get_gpu_stats()
-        
-        # Get additional Jetson telemetry
-        vram_used = get_vram_usage()
-        fan_speed = get_fan_speed()
-        is_throttled = get_thermal_throttle_status()
-        
-        # Try dedicated power draw function if GPU stats doesn't have it
-        power_draw = gpu_stats['power']
-        if power_draw is None:
-            power_draw = get_power_draw()
-        
-        # Try to determine current model from Ollama (no blocking)
-        model_name = _last_model_name or "qwen2.5:7b-instruct"
-        
-        # Check Ollama connection status (reduced timeout)
-        status = "online"
-        try:
-            ollama_base = current_app.config.get("OLLAMA_BASE", "http://10.0.0.32:11434")
-            import requests
-            response = requests.get(f"{ollama_base}/api/tags", timeout=0.5)
-            status = "online" if response.status_code == 200 else "offline"
-        except Exception:
-            status = "offline"
-        
-        # Calculate latency (time since last response)
-        latency = _last_response_time if _last_response_time else 0.0
+        # Calculate latency (last response time, else the reported response time)
+        if last.get("total_ms"):
+            latency = last["total_ms"] / 1000
+        else:
+            latency = shared["last_response_time"] or 0.0
         
         # Calculate response time
-        response_time = (time.time() - start_time) * 1000  # Convert to ms
+        response_time = (time.perf_counter() - start_time) * 1000  # Convert to ms
         
-        # Generate mock tokens_per_sec if not available (until LLM tracking is integrated)
-        tokens_value = _last_tokens_per_sec
-        if tokens_value is None:
-            # Simulate realistic token generation rates (6-10 tokens/sec)
-            tokens_value = round(random.uniform(6.0, 10.0), 1)
-        
-        # Generate mock context_used if default (until LLM tracking is integrated)
-        context_value = _context_used
-        if context_value == "0/4096":
-            # Simulate realistic context usage
-            used = random.randint(600, 1100)
-            context_value = f"{used}/4096"
+        tokens_value = last.get("tokens_per_sec")
+        context_used = (last.get("prompt_tokens") or 0) + (last.get("completion_tokens") or 0)
+        context_value = f"{context_used}/{InferenceLedgerConfig.CONTEXT_WINDOW}"
         
         # Prepare response
+        def rounded(key):
+            value = snapshot.get(key)
+            return round(value, 1) if value is not None else None
+        
         result = {
-            "cpu": round(cpu_percent, 1),
-            "memory": round(memory_percent, 1),
-            "gpu": round(gpu_stats['usage'], 1) if gpu_stats['usage'] is not None else None,
-            "cpu_temp": round(cpu_temp, 1) if cpu_temp is not None else None,
-            "gpu_temp": round(gpu_stats['temp'], 1) if gpu_stats['temp'] is not None else None,
-            "power_draw": round(power_draw, 1) if power_draw is not None else None,
-            "vram_used_mb": vram_used,
-            "fan_speed_pct": round(fan_speed, 1) if fan_speed is not None else None,
-            "thermal_throttled": is_throttled,
+            "cpu": rounded("cpu") or 0.0,
+            "memory": rounded("memory") or 0.0,
+            "gpu": rounded("gpu"),
+            "cpu_temp": rounded("cpu_temp"),
+            "gpu_temp": rounded("gpu_temp"),
+            "power_draw": rounded("power_draw"),
+            "vram_used_mb": snapshot.get("vram_used_mb"),
+            "fan_speed_pct": rounded("fan_speed_pct"),
+            "thermal_throttled": snapshot.get("thermal_throttled", False),
+            "thermal_state": get_thermal_governor().state,
+            "memory_pressure": get_memory_guard().level,
             "tokens_per_sec": tokens_value,
             "context_used": context_value,
             "model": model_name,
             "latency": round(latency, 2),
-            "status": status,
-            "response_time_ms": round(response_time, 1)  # For debugging
+            "status": snapshot.get("status", "offline"),
+            "sampled_at": snapshot.get("sampled_at"),
+            "response_time_ms": round(response_time, 3)  # For debugging
         }
         
         return jsonify(result)
@@ -467,7 +98,7 @@ def get_system_stats():
             "fan_speed_pct": None,
             "thermal_throttled": False,
             "tokens_per_sec": None,
-            "context_used": "0/4096",
+            "context_used": f"0/{InferenceLedgerConfig.CONTEXT_WINDOW}",
             "status": "error",
             "latency": 0,
             "model": "unknown",
@@ -484,40 +115,9 @@ def update_response_metrics(response_time, model_name):
         response_time: Time taken for the response in seconds
         model_name: Name of the model that generated the response
     """
-    global _last_response_time, _last_model_name
-    _last_response_time = response_time
-    _last_model_name = model_name
-
-
-# Dashboard tracking variables
-_app_start_time = time.time()
-_session_token_count = 0
-_latency_history = []  # Store last 5 latencies
-_tokens_sec_history = []  # Store last 5 tokens/sec readings
-
-def update_dashboard_metrics(tokens_count=0, latency_ms=0, tokens_per_sec=0):
-    """
-    Update dashboard metrics for analytics.
-    
-    Args:
-        tokens_count: Number of tokens generated in this response
-        latency_ms: Latency in milliseconds
-        tokens_per_sec: Tokens per second rate
-    """
-    global _session_token_count, _latency_history, _tokens_sec_history
-    
-    _session_token_count += tokens_count
-    
-    # Keep rolling window of last 5 readings
-    if latency_ms > 0:
-        _latency_history.append(latency_ms)
-        if len(_latency_history) > 5:
-            _latency_history.pop(0)
-    
-    if tokens_per_sec > 0:
-        _tokens_sec_history.append(tokens_per_sec)
-        if len(_tokens_sec_history) > 5:
-            _tokens_sec_history.pop(0)
+    metrics = get_shared_metrics()
+    metrics.set_gauge("last_response_time", response_time)
+    metrics.set_text("last_model", model_name)
 
 
 @system_bp.route('/api/dashboard/summary', methods=['GET'])
@@ -529,32 +129,33 @@ def get_dashboard_summary():
         JSON with active/archived chat counts, averages, uptime, and session metrics
     """
     try:
-        from backend.services.conversation_service import list_conversations
+        from backend.services.conversation_service import get_dashboard_stats
         
-        # Get conversation counts
-        all_convs = list_conversations(limit=1000, include_archived=True)
-        active_chats = len([c for c in all_convs if not c.get('archived', False)])
-        archived_chats = len([c for c in all_convs if c.get('archived', False)])
+        # Counts and last conversation come from the trigger-maintained aggregates
+        stats = get_dashboard_stats()
+        active_chats = stats["active"]
+        archived_chats = stats["archived"]
         
-        # Get last conversation title
         last_title = "None"
-        if all_convs:
-            # Get most recent non-archived conversation
-            active_convs = [c for c in all_convs if not c.get('archived', False)]
-            if active_convs:
-                last_title = active_convs[0].get('title', 'Untitled') or 'Untitled'
+        if stats["last_conversation_id"] is not None:
+            last_title = stats["last_title"] or 'Untitled'
+        
+        # Averages over the last 5 recorded generations (all workers)
+        shared = get_shared_metrics().read(recent=5)
+        recent = shared["recent"]
+        latency_history = [e["total_ms"] for e in recent if e["total_ms"]]
+        tokens_history = [e["tokens_per_sec"] for e in recent if e["tokens_per_sec"]]
         
-        # Calculate averages
         avg_tokens_sec = 0.0
-        if _tokens_sec_history:
-            avg_tokens_sec = sum(_tokens_sec_history) / len(_tokens_sec_history)
+        if tokens_history:
+            avg_tokens_sec = sum(tokens_history) / len(tokens_history)
         
         avg_latency_ms = 0.0
-        if _latency_history:
-            avg_latency_ms = sum(_latency_history) / len(_latency_history)
+        if latency_history:
+            avg_latency_ms = sum(latency_history) / len(latency_history)
         
         # Calculate uptime in hours
-        uptime_seconds = time.time() - _app_start_time
+        uptime_seconds = time.time() - shared["started_at"]
         uptime_hours = uptime_seconds / 3600.0
         
         result = {
@@ -564,9 +165,13 @@ def get_dashboard_summary():
             "avg_tokens_sec": round(avg_tokens_sec, 1),
             "avg_latency_ms": round(avg_latency_ms, 0),
             "uptime_h": round(uptime_hours, 1),
-            "session_tokens": _session_token_count,
-            "latency_history": _latency_history[-5:],  # Last 5 for charting
-            "tokens_history": _tokens_sec_history[-5:],  # Last 5 for charting
+            "session_tokens": shared["completion_tokens"],
+            "latency_history": latency_history,  # Last 5 for charting
+            "tokens_history": tokens_history,  # Last 5 for charting
+            "total_messages": stats["messages"],
+            "total_tokens_est": stats["tokens"],
+            "last_active_at": stats["last_active_at"],
+            "today": stats["today"],
         }
         
         logger.info(f"[DASHBOARD] Summary: {active_chats} active, {archived_chats} archived, uptime: {uptime_hours:.1f}h")
@@ -586,3 +191,205 @@ def get_dashboard_summary():
             "latency_history": [],
             "tokens_history": [],
         }), 500
+
+
+@system_bp.route('/api/dashboard/timeseries', methods=['GET'])
+def get_dashboard_timeseries():
+    """
+    Get daily conversation activity for charts.
+    
+    Query params:
+        range: Lookback such as 7d or 90d, rounded up to whole days (default: 30d)
+    
+    Returns:
+        JSON with days and one entry per day (conversations, messages,
+        user_messages, assistant_messages, estimated tokens)
+    """
+    try:
+        days = -(-parse_duration(request.args.get('range', '30d')) // 86400)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    from backend.services.conversation_service import get_activity_timeseries
+    days = min(days, 366)
+    return jsonify({"days": days, "series": get_activity_timeseries(days)})
+
+
+@system_bp.route('/api/system/history', methods=['GET'])
+def get_system_history():
+    """
+    Get telemetry history from the multi-resolution ring buffers.
+    
+    Query params:
+        metric: Metric name, or a comma-separated list (default: cpu)
+        range: Lookback such as 600, 10m, 24h or 30d (default: 10m)
+        step: Output resolution such as 1, 10s or 5m (default: fits 600 points)
+    
+    Returns:
+        JSON with step, tier_step, timestamps and one value list per metric
+    """
+    metrics = [m.strip() for m in request.args.get('metric', 'cpu').split(',') if m.strip()]
+    unknown = [m for m in metrics if m not in METRICS]
+    if not metrics or unknown:
+        return jsonify({"error": f"Unknown metric: {', '.join(unknown)}", "metrics": list(METRICS)}), 400
+    try:
+        range_s = parse_duration(request.args.get('range', '10m'))
+        step = request.args.get('step')
+        step_s = parse_duration(step) if step else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    history = get_telemetry_history()
+    end = time.time()
+    result = None
+    for metric in metrics:
+        data = history.query(metric, range_s, step_s, end)
+        if result is None:
+            result = {key: data[key] for key in ("range", "step", "tier_step", "timestamps")}
+            result["series"] = {}
+        result["series"][metric] = data["values"]
+    return jsonify(result)
+
+
+@system_bp.route('/api/inference/stats', methods=['GET'])
+def get_inference_stats():
+    """
+    Get per-model, per-route inference statistics from the ledger.
+    
+    Query params:
+        window: Lookback such as 3600, 1h or 7d (default: 1h)
+        model: Only this model
+        route: Only this route (e.g. gateway, chats_stream, query)
+    
+    Returns:
+        JSON with the window and groups carrying request/token counts and
+        p50/p95 of TTFT, tokens/sec, prompt eval rate and total time
+    """
+    try:
+        window_s = parse_duration(request.args.get('window', '1h'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    result = summarize(window_s, request.args.get('model'), request.args.get('route'))
+    result["session_tokens"] = session_tokens()
+    return jsonify(result)
+
+
+@system_bp.route('/api/system/stream', methods=['GET'])
+def stream_system_stats():
+    """
+    Push telemetry to the client as server-sent events.
+    
+    The first event is a full "snapshot"; later "delta" events carry only
+    the fields that changed. Every subscriber, on every worker, shares the
+    one sampling worker's snapshots.
+    
+    Query params:
+        interval: Seconds between events (clamped to TELEMETRY_STREAM_MIN_INTERVAL)
+        fields: Optional comma-separated list of snapshot fields
+    
+    Returns:
+        text/event-stream response, or 503 when the subscriber limit is reached
+    """
+    interval = request.args.get('interval', default=TelemetryConfig.STREAM_DEFAULT_INTERVAL, type=float)
+    fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()] or None
+    
+    get_telemetry_sampler()  # Make sure snapshots are being produced
+    broadcaster = get_telemetry_broadcaster()
+    subscriber = broadcaster.subscribe(interval, fields)
+    if subscriber is None:
+        return jsonify({"error": "Too many telemetry subscribers"}), 503
+    
+    return Response(
+        broadcaster.stream(subscriber),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+@system_bp.route('/api/system/stream/stats', methods=['GET'])
+def get_stream_stats():
+    """Get subscriber counts for the telemetry stream and which worker samples for it."""
+    sampler = get_telemetry_sampler()
+    return jsonify(dict(get_telemetry_broadcaster().get_stats(), worker_pid=os.getpid(),
+                        sampler_pid=sampler.snapshot().get("sampler_pid"), sampler_leader=sampler.is_leader))
+
+
+@system_bp.route('/api/system/metrics', methods=['GET'])
+def get_shared_metrics_view():
+    """
+    Get the cross-worker metrics segment.
+    
+    Returns:
+        JSON with request/token/retry counters, last model, recent
+        generations, prompt prefix-cache reuse, and the pid and retry budget of
+        the worker that answered (everything else is the same in all)
+    """
+    recent = min(max(request.args.get('recent', default=20, type=int), 0), RING_SIZE)
+    result = get_shared_metrics().read(recent=recent)
+    result["worker_pid"] = os.getpid()
+    result["retry_budget"] = get_retry_budget().get_status()
+    result["prompt_prefix"] = get_prompt_builder().get_stats()
+    return jsonify(result)
+
+
+@system_bp.route('/api/system/thermal', methods=['GET'])
+def get_thermal_status():
+    """
+    Get the thermal governor's state, current limits and recent decisions.
+    
+    Returns:
+        JSON with state, temperature, policy (max_concurrency, num_thread,
+        background_num_predict, defer_background), busy slots and decisions
+    """
+    return jsonify(get_thermal_governor().get_status())
+
+
+@system_bp.route('/api/system/thermal/simulate', methods=['POST'])
+def simulate_thermal():
+    """
+    Replay a synthetic temperature trace through the governor's state machine.
+    
+    Body:
+        trace: List of [timestamp, temperature, throttled] readings
+    
+    Returns:
+        JSON with the state and max_concurrency after each reading
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        trace = [(float(t[0]), None if t[1] is None else float(t[1]), bool(t[2]) if len(t) > 2 else False)
+                 for t in data.get('trace', [])]
+    except (TypeError, ValueError, IndexError):
+        return jsonify({"error": "trace must be a list of [timestamp, temperature, throttled]"}), 400
+    return jsonify({"states": ThermalGovernor.simulate(trace)})
+
+
+@system_bp.route('/api/system/memory_pressure', methods=['GET'])
+def get_memory_pressure():
+    """
+    Get the memory-pressure guard's level, latest reading and recorded episodes.
+    
+    Query params:
+        limit: Number of recorded episodes to return (default: 20)
+    
+    Returns:
+        JSON with level, reading (mem_pct, psi_some, psi_full), watermarks,
+        the open episode if any, and past episodes with before/during latency
+    """
+    guard = get_memory_guard()
+    result = guard.get_status()
+    result["events"] = guard.get_events(min(max(request.args.get('limit', default=20, type=int), 1), 500))
+    return jsonify(result)
+
+
+@system_bp.route('/api/system/sensors', methods=['GET'])
+def get_sensors():
+    """Get the sensor map discovered at startup."""
+    return jsonify(get_sensor_map().describe())
+
+
+@system_bp.route('/api/system/sensors/rescan', methods=['POST'])
+def rescan_system_sensors():
+    """Rediscover hardware sensors (e.g. after a fan or power monitor appears)."""
+    sensors = rescan_sensors()
+    logger.info("[SENSORS] Rescan requested")
+    return jsonify(sensors.describe())
@@ -0,0 +1,485 @@
+"""
+Model benchmark suite.
+
+Runs a fixed prompt set (short chat, long context, code, title generation)
+against each installed model and records, per model and case, cold-load
+time, time to first token, prompt-eval and generation tokens/sec, peak RAM,
+peak Ollama RSS and (when the sampler reports it) power draw. Runs are kept
+in the memory database with the Ollama version, so compare() can show each
+model's latest numbers next to its previous run and flag regressions after
+an Ollama or model upgrade.
+
+Usable from the API (one run at a time across workers) or the command line:
+
+    python -m backend.services.benchmark --models phi3:mini,qwen2.5:7b-instruct
+"""
+import argparse
+import fcntl
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+import psutil
+import requests
+
+from backend.config import BenchmarkConfig, InferenceLedgerConfig, OllamaConfig, ThermalGovernorConfig
+from backend.services import memory_service as mem
+from backend.services.inference_ledger import inference_entry
+from backend.services.shared_metrics import use_private_segment
+
+logger = logging.getLogger(__name__)
+
+_FILLER = ("The Jetson dashboard records CPU load, GPU load, temperatures and power draw every second, "
+           "and keeps conversation history, memory notes and inference timings in SQLite. ")
+
+CASES = {
+    "short_chat": {
+        "messages": [{"role": "user", "content": "Hi! In one sentence, what can you help me with?"}],
+        "num_predict": 64,
+    },
+    "long_context": {
+        "messages": [{"role": "user", "content": (
+            _FILLER * max(1, BenchmarkConfig.LONG_CONTEXT_TOKENS // 40)
+            + "\n\nSummarise the text above in two sentences."
+        )}],
+        "num_predict": 96,
+    },
+    "code": {
+        "messages": [{"role": "user", "content": (
+            "Write a Python function that returns the n-th Fibonacci number iteratively, with a docstring."
+        )}],
+        "num_predict": 192,
+    },
+    "title": {
+        "messages": [{"role": "user", "content": (
+            "Generate a short title (max 6 words) for a conversation that starts with: "
+            "'How do I keep my Jetson Orin from throttling during long LLM runs?' Reply with the title only."
+        )}],
+        "num_predict": 16,
+    },
+}
+
+METRICS = ("cold_load_ms", "ttft_ms", "prompt_tokens_per_sec", "tokens_per_sec", "peak_ram_mb", "peak_rss_mb",
+           "peak_power_w")
+# Metrics where a higher value is better (the rest regress when they grow)
+_HIGHER_IS_BETTER = {"prompt_tokens_per_sec", "tokens_per_sec"}
+
+_schema_ready = set()
+
+
+def _conn() -> sqlite3.Connection:
+    conn = sqlite3.connect(mem.DB_PATH, timeout=5)
+    if mem.DB_PATH not in _schema_ready:
+        conn.execute('''CREATE TABLE IF NOT EXISTS benchmark_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            started_at REAL,
+            finished_at REAL,
+            status TEXT,
+            host TEXT,
+            ollama_version TEXT,
+            models TEXT,
+            cases TEXT,
+            error TEXT
+        )''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS benchmark_results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_id INTEGER REFERENCES benchmark_runs(id) ON DELETE CASCADE,
+            model TEXT,
+            case_name TEXT,
+            cold_load_ms REAL,
+            ttft_ms REAL,
+            prompt_tokens INTEGER,
+            completion_tokens INTEGER,
+            prompt_tokens_per_sec REAL,
+            tokens_per_sec REAL,
+            total_ms REAL,
+            peak_ram_mb REAL,
+            peak_rss_mb REAL,
+            avg_power_w REAL,
+            peak_power_w REAL,
+            error TEXT
+        )''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_benchmark_results_model ON benchmark_results(model, case_name)")
+        conn.commit()
+        _schema_ready.add(mem.DB_PATH)
+    return conn
+
+
+class ResourceSampler:
+    """Samples system RAM, Ollama process RSS and power draw in the background."""
+
+    def __init__(self, interval: float = BenchmarkConfig.SAMPLE_INTERVAL):
+        self.interval = interval
+        self.peak_ram_mb = 0.0
+        self.peak_rss_mb = 0.0
+        self.power: List[float] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _ollama_rss_mb() -> float:
+        total = 0
+        for proc in psutil.process_iter(["name", "memory_info"]):
+            if (proc.info.get("name") or "").startswith("ollama") and proc.info.get("memory_info"):
+                total += proc.info["memory_info"].rss
+        return total / 1e6
+
+    def sample(self) -> None:
+        from backend.services.telemetry import get_snapshot
+
+        self.peak_ram_mb = max(self.peak_ram_mb, psutil.virtual_memory().used / 1e6)
+        self.peak_rss_mb = max(self.peak_rss_mb, self._ollama_rss_mb())
+        power = get_snapshot().get("power_draw")
+        if power is not None:
+            self.power.append(power)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                logger.debug(f"[BENCHMARK] Resource sample failed: {e}")
+
+    def __enter__(self):
+        self.sample()
+        self._thread = threading.Thread(target=self._run, name="benchmark-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+
+    def result(self) -> Dict:
+        return {
+            "peak_ram_mb": round(self.peak_ram_mb, 1),
+            "peak_rss_mb": round(self.peak_rss_mb, 1) or None,
+            "avg_power_w": round(sum(self.power) / len(self.power), 2) if self.power else None,
+            "peak_power_w": round(max(self.power), 2) if self.power else None,
+        }
+
+
+class BenchmarkRunner:
+    """Runs the prompt set against models on one Ollama host."""
+
+    def __init__(self, base_url: Optional[str] = None, timeout: float = BenchmarkConfig.TIMEOUT):
+        self.base_url = (base_url or OllamaConfig.BASE_URL).rstrip("/")
+        self.timeout = timeout
+
+    def installed_models(self) -> List[str]:
+        response = requests.get(f"{self.base_url}/api/tags", timeout=10)
+        response.raise_for_status()
+        return sorted(m["name"] for m in response.json().get("models", []))
+
+    def ollama_version(self) -> Optional[str]:
+        try:
+            return requests.get(f"{self.base_url}/api/version", timeout=5).json().get("version")
+        except Exception:
+            return None
+
+    def loaded_models(self) -> Optional[List[str]]:
+        """Models Ollama has in memory (/api/ps), or None if it cannot tell."""
+        try:
+            response = requests.get(f"{self.base_url}/api/ps", timeout=5)
+            response.raise_for_status()
+            return [m.get("name") for m in response.json().get("models", [])]
+        except Exception:
+            return None
+
+    def unload_refusal(self, model: str) -> Optional[str]:
+        """Why unloading the model now would hurt live traffic, or None if it is safe."""
+        from backend.services.model_switch import get_active_model
+        from backend.services.thermal_governor import get_thermal_governor
+
+        busy = get_thermal_governor().busy_slots()
+        if not busy:
+            return None
+        if model == get_active_model():
+            return f"{model} is the active model and {busy} generation(s) are in flight"
+        loaded = self.loaded_models()
+        if loaded is None or model in loaded:
+            return f"{model} may be serving one of {busy} generation(s) in flight"
+        return None
+
+    def cold_load(self, model: str) -> Optional[float]:
+        """
+        Unload the model, then time a load-only request (no prompt).
+
+        Returns None without unloading when the server is busy with the model.
+        """
+        refusal = self.unload_refusal(model)
+        if refusal:
+            logger.warning(f"[BENCHMARK] Skipping cold load: {refusal}")
+            return None
+        requests.post(f"{self.base_url}/api/generate", json={"model": model, "keep_alive": 0},
+                      timeout=self.timeout).raise_for_status()
+        start = time.perf_counter()
+        response = requests.post(f"{self.base_url}/api/generate", json={"model": model},
+                                 timeout=self.timeout)
+        response.raise_for_status()
+        load = response.json().get("load_duration")
+        return round(load / 1e6, 1) if load else round((time.perf_counter() - start) * 1000, 1)
+
+    def run_case(self, model: str, name: str) -> Dict:
+        """Stream one case and measure TTFT and Ollama's own eval timings."""
+        from backend.services.thermal_governor import get_thermal_governor
+
+        case = CASES[name]
+        payload = {
+            "model": model,
+            "messages": case["messages"],
+            "stream": True,
+            "options": {"num_predict": case["num_predict"], "temperature": 0, "seed": 42,
+                        "num_ctx": InferenceLedgerConfig.CONTEXT_WINDOW},
+        }
+        with get_thermal_governor().admit(background=True):
+            start = time.perf_counter()
+            ttft_ms, final = None, {}
+            with requests.post(f"{self.base_url}/api/chat", json=payload, stream=True,
+                               timeout=self.timeout) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get("error"):
+                        raise RuntimeError(chunk["error"])
+                    if ttft_ms is None and chunk.get("message", {}).get("content"):
+                        ttft_ms = (time.perf_counter() - start) * 1000
+                    if chunk.get("done"):
+                        final = chunk
+        # Measured only: benchmark generations stay out of the live counters, history and ledger
+        entry = inference_entry("benchmark", model, final, ttft_ms=ttft_ms, stream=True) or {}
+        return {
+            "ttft_ms": entry.get("ttft_ms"),
+            "prompt_tokens": entry.get("prompt_tokens"),
+            "completion_tokens": entry.get("completion_tokens"),
+            "prompt_tokens_per_sec": entry.get("prompt_tokens_per_sec"),
+            "tokens_per_sec": entry.get("tokens_per_sec"),
+            "total_ms": entry.get("total_ms"),
+        }
+
+    def run_model(self, model: str, cases: List[str], cold: bool = BenchmarkConfig.COLD_LOAD) -> List[Dict]:
+        results = []
+        with ResourceSampler() as sampler:
+            try:
+                cold_load_ms = self.cold_load(model) if cold else None
+            except Exception as e:
+                logger.warning(f"[BENCHMARK] {model}: cold load failed: {e}")
+                cold_load_ms = None
+            for name in cases:
+                result = {"model": model, "case_name": name, "cold_load_ms": cold_load_ms, "error": None}
+                try:
+                    result.update(self.run_case(model, name))
+                except Exception as e:
+                    logger.warning(f"[BENCHMARK] {model}/{name} failed: {e}")
+                    result["error"] = str(e)
+                results.append(result)
+                logger.info(f"[BENCHMARK] {model}/{name}: ttft={result.get('ttft_ms')}ms "
+                            f"tok/s={result.get('tokens_per_sec')}")
+        # RAM/RSS/power peaks cover the model's whole run (load included)
+        for result in results:
+            result.update(sampler.result())
+        return results
+
+
+def run_benchmark(models: Optional[List[str]] = None, cases: Optional[List[str]] = None,
+                  base_url: Optional[str] = None, run_id: Optional[int] = None) -> Dict:
+    """
+    Benchmark models and store the results.
+
+    Args:
+        models: Models to run (default: every installed model)
+        cases: Case names from CASES (default: all)
+        base_url: Ollama host (default OLLAMA_BASE_URL)
+        run_id: Existing run row to fill in (created by start_benchmark)
+
+    Returns:
+        dict: The stored run with its results
+    """
+    runner = BenchmarkRunner(base_url)
+    cases = cases or list(CASES)
+    unknown = [c for c in cases if c not in CASES]
+    if unknown:
+        raise ValueError(f"Unknown benchmark cases: {', '.join(unknown)}")
+    conn = _conn()
+    if run_id is None:
+        run_id = _create_run(conn, runner.base_url, models, cases)
+    try:
+        models = models or runner.installed_models()
+        conn.execute("UPDATE benchmark_runs SET models = ?, ollama_version = ? WHERE id = ?",
+                     (json.dumps(models), runner.ollama_version(), run_id))
+        conn.commit()
+        for model in models:
+            for result in runner.run_model(model, cases):
+                columns = ["run_id"] + list(result)
+                conn.execute(f"INSERT INTO benchmark_results ({', '.join(columns)}) "
+                             f"VALUES ({', '.join('?' * len(columns))})", [run_id] + list(result.values()))
+            conn.commit()
+        conn.execute("UPDATE benchmark_runs SET status = 'done', finished_at = ? WHERE id = ?", (time.time(), run_id))
+    except Exception as e:
+        logger.error(f"[BENCHMARK] Run {run_id} failed: {e}")
+        conn.execute("UPDATE benchmark_runs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                     (str(e), time.time(), run_id))
+    conn.commit()
+    conn.close()
+    return get_run(run_id)
+
+
+def _create_run(conn: sqlite3.Connection, host: str, models: Optional[List[str]], cases: List[str]) -> int:
+    run_id = conn.execute(
+        "INSERT INTO benchmark_runs (started_at, status, host, models, cases) VALUES (?, 'running', ?, ?, ?)",
+        (time.time(), host, json.dumps(models), json.dumps(cases)),
+    ).lastrowid
+    conn.commit()
+    return run_id
+
+
+def start_benchmark(models: Optional[List[str]] = None, cases: Optional[List[str]] = None) -> Optional[int]:
+    """
+    Start a benchmark run in a background thread.
+
+    Returns:
+        int: The run id, or None when another worker is already benchmarking
+    """
+    lock_path = os.path.join(ThermalGovernorConfig.LOCK_DIR, ".benchmark.lock")
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    conn = _conn()
+    run_id = _create_run(conn, OllamaConfig.BASE_URL.rstrip("/"), models, cases or list(CASES))
+    conn.close()
+
+    def run():
+        try:
+            run_benchmark(models, cases, run_id=run_id)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    threading.Thread(target=run, name="benchmark", daemon=True).start()
+    return run_id
+
+
+def get_run(run_id: int) -> Optional[Dict]:
+    conn = _conn()
+    conn.row_factory = sqlite3.Row
+    run = conn.execute("SELECT * FROM benchmark_runs WHERE id = ?", (run_id,)).fetchone()
+    if run is None:
+        conn.close()
+        return None
+    results = conn.execute("SELECT * FROM benchmark_results WHERE run_id = ? ORDER BY id", (run_id,)).fetchall()
+    conn.close()
+    run = dict(run)
+    run["models"] = json.loads(run["models"]) if run["models"] else None
+    run["cases"] = json.loads(run["cases"]) if run["cases"] else None
+    run["results"] = [dict(r) for r in results]
+    return run
+
+
+def list_runs(limit: int = 20) -> List[Dict]:
+    """Benchmark runs, newest first (without results)."""
+    conn = _conn()
+    conn.row_factory = sqlite3.Row
+    rows = conn.execute("SELECT * FROM benchmark_runs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+    conn.close()
+    return [dict(r, models=json.loads(r["models"]) if r["models"] else None,
+                 cases=json.loads(r["cases"]) if r["cases"] else None) for r in rows]
+
+
+def compare(regression_pct: float = BenchmarkConfig.REGRESSION_PCT) -> List[Dict]:
+    """
+    The latest result per model and case next to the previous one.
+
+    Returns:
+        list: One row per (model, case) with each metric's latest and
+        previous value, percent change, the Ollama versions involved and the
+        metrics that regressed by more than regression_pct
+    """
+    conn = _conn()
+    conn.row_factory = sqlite3.Row
+    rows = conn.execute(
+        "SELECT r.*, b.ollama_version, b.started_at FROM benchmark_results r "
+        "JOIN benchmark_runs b ON b.id = r.run_id WHERE r.error IS NULL ORDER BY r.id DESC"
+    ).fetchall()
+    conn.close()
+    history: Dict = {}
+    for row in rows:
+        runs = history.setdefault((row["model"], row["case_name"]), [])
+        if len(runs) < 2:
+            runs.append(row)
+    table = []
+    for (model, case_name), runs in sorted(history.items()):
+        latest, previous = runs[0], runs[1] if len(runs) > 1 else None
+        entry = {
+            "model": model,
+            "case": case_name,
+            "run_id": latest["run_id"],
+            "ollama_version": latest["ollama_version"],
+            "previous_run_id": previous["run_id"] if previous else None,
+            "previous_ollama_version": previous["ollama_version"] if previous else None,
+            "metrics": {},
+            "regressions": [],
+        }
+        for metric in METRICS:
+            value = latest[metric]
+            before = previous[metric] if previous else None
+            change = round(100 * (value - before) / before, 1) if value is not None and before else None
+            entry["metrics"][metric] = {"value": value, "previous": before, "change_pct": change}
+            if change is not None:
+                worse = -change if metric in _HIGHER_IS_BETTER else change
+                if worse > regression_pct:
+                    entry["regressions"].append(metric)
+        table.append(entry)
+    return table
+
+
+def _format_table(rows: List[Dict]) -> str:
+    header = ["model", "case", "cold_load_ms", "ttft_ms", "prompt_tok/s", "tok/s", "peak_rss_mb", "power_w", "regressed"]
+    lines = [header]
+    for row in rows:
+        m = row["metrics"]
+        lines.append([row["model"], row["case"]] + [
+            "" if m[k]["value"] is None else f"{m[k]['value']:g}"
+            for k in ("cold_load_ms", "ttft_ms", "prompt_tokens_per_sec", "tokens_per_sec", "peak_rss_mb", "peak_power_w")
+        ] + [",".join(row["regressions"])])
+    widths = [max(len(str(line[i])) for line in lines) for i in range(len(header))]
+    return "\n".join("  ".join(str(v).ljust(w) for v, w in zip(line, widths)) for line in lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark Ollama models and compare with previous runs.")
+    parser.add_argument("--models", help="Comma-separated models (default: all installed)")
+    parser.add_argument("--cases", help=f"Comma-separated cases (default: {','.join(CASES)})")
+    parser.add_argument("--host", help="Ollama base URL (default: OLLAMA_BASE_URL)")
+    parser.add_argument("--compare-only", action="store_true", help="Print the comparison table without running")
+    parser.add_argument("--json", action="store_true", help="Print JSON instead of a table")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    # Anything this process records maps a throwaway segment, never the running server's
+    use_private_segment()
+
+    def split(value: Optional[str]) -> Optional[List[str]]:
+        return [v.strip() for v in value.split(",") if v.strip()] if value else None
+
+    if not args.compare_only:
+        run = run_benchmark(split(args.models), split(args.cases), args.host)
+        if run["status"] != "done":
+            print(f"Benchmark failed: {run['error']}", file=sys.stderr)
+            return 1
+    rows = compare()
+    print(json.dumps(rows, indent=2) if args.json else _format_table(rows))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
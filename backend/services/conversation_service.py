@@ -1,12 +1,17 @@
 import sqlite3
 import os
 from typing import List, Dict, Optional, Any
-from datetime import datetime
+from datetime import datetime, timedelta
+
+from backend.config import StorageMaintenanceConfig
 
 # Get the project root directory (parent of backend)
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 STORAGE_DIR = os.path.join(PROJECT_ROOT, 'storage')
 DB_PATH = os.path.join(STORAGE_DIR, 'memory.db')
+# Schema version, kept in conversation_schema (PRAGMA user_version belongs to
+# memory_service, which may share this database file)
+SCHEMA_VERSION = 1
 
 def get_conn():
     # Ensure storage directory exists
@@ -14,6 +19,9 @@ def get_conn():
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     conn.execute('PRAGMA journal_mode=WAL;')
+    # Keep the WAL bounded between idle-time TRUNCATE checkpoints
+    conn.execute(f'PRAGMA wal_autocheckpoint={StorageMaintenanceConfig.WAL_AUTOCHECKPOINT};')
+    conn.execute(f'PRAGMA journal_size_limit={StorageMaintenanceConfig.JOURNAL_SIZE_LIMIT};')
     return conn
 
 def init_db():
@@ -43,20 +51,224 @@ def init_db():
         ts DATETIME DEFAULT CURRENT_TIMESTAMP,
         FOREIGN KEY(conversation_id) REFERENCES conversations(id) ON DELETE CASCADE
     )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS conversation_schema (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    )''')
+    row = c.execute("SELECT version FROM conversation_schema WHERE id = 1").fetchone()
+    version = row[0] if row else 0
     # FTS5 for messages
     c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(content, content='messages', content_rowid='id')''')
+    # The first update/delete triggers wrote to the external-content table directly,
+    # which leaves stale terms behind and corrupts the index
+    if version < 1:
+        c.execute("DROP TRIGGER IF EXISTS messages_au")
+        c.execute("DROP TRIGGER IF EXISTS messages_ad")
     # Triggers for FTS
     c.execute('''CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
         INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
     END''')
     c.execute('''CREATE TRIGGER IF NOT EXISTS messages_au AFTER UPDATE ON messages BEGIN
-        UPDATE messages_fts SET content = new.content WHERE rowid = new.id;
+        INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
     END''')
     c.execute('''CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN
-        DELETE FROM messages_fts WHERE rowid = old.id;
+        INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
     END''')
+    if version < 1:
+        # Drop whatever the old triggers left in the index
+        c.execute("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+    if version < SCHEMA_VERSION:
+        c.execute("INSERT OR REPLACE INTO conversation_schema (id, version) VALUES (1, ?)", (SCHEMA_VERSION,))
     conn.commit()
+    _init_stats(conn)
+    conn.close()
+
+# Estimated tokens per message, matching memory_retrieval's chars-per-token heuristic
+_TOKENS_SQL = "((length({0}.content) + 3) / 4)"
+_NOT_ARCHIVED_SQL = "(COALESCE({0}.archived, 0) = 0)"
+_ARCHIVED_SQL = "(COALESCE({0}.archived, 0) != 0)"
+
+_STATS_TRIGGERS = [
+    f'''CREATE TRIGGER IF NOT EXISTS conversations_stats_ai AFTER INSERT ON conversations BEGIN
+        UPDATE conversation_stats SET
+            active = active + {_NOT_ARCHIVED_SQL.format('new')},
+            archived = archived + {_ARCHIVED_SQL.format('new')}
+        WHERE id = 1;
+        UPDATE conversation_stats SET last_conversation_id = new.id, last_active_at = new.updated_at
+        WHERE id = 1 AND {_NOT_ARCHIVED_SQL.format('new')};
+        INSERT INTO activity_daily (day, conversations) VALUES (date(new.created_at), 1)
+        ON CONFLICT(day) DO UPDATE SET conversations = conversations + 1;
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS conversations_stats_au AFTER UPDATE OF archived, updated_at ON conversations BEGIN
+        UPDATE conversation_stats SET
+            active = active - {_NOT_ARCHIVED_SQL.format('old')} + {_NOT_ARCHIVED_SQL.format('new')},
+            archived = archived - {_ARCHIVED_SQL.format('old')} + {_ARCHIVED_SQL.format('new')}
+        WHERE id = 1;
+        UPDATE conversation_stats SET last_conversation_id = new.id, last_active_at = new.updated_at
+        WHERE id = 1 AND {_NOT_ARCHIVED_SQL.format('new')}
+            AND (last_active_at IS NULL OR new.updated_at >= last_active_at);
+        UPDATE conversation_stats SET (last_conversation_id, last_active_at) = (
+            SELECT id, updated_at FROM conversations WHERE {_NOT_ARCHIVED_SQL.format('conversations')}
+            ORDER BY updated_at DESC LIMIT 1)
+        WHERE id = 1 AND last_conversation_id = new.id AND {_ARCHIVED_SQL.format('new')};
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS conversations_stats_ad AFTER DELETE ON conversations BEGIN
+        UPDATE conversation_stats SET
+            active = active - {_NOT_ARCHIVED_SQL.format('old')},
+            archived = archived - {_ARCHIVED_SQL.format('old')}
+        WHERE id = 1;
+        UPDATE conversation_stats SET (last_conversation_id, last_active_at) = (
+            SELECT id, updated_at FROM conversations WHERE {_NOT_ARCHIVED_SQL.format('conversations')}
+            ORDER BY updated_at DESC LIMIT 1)
+        WHERE id = 1 AND last_conversation_id = old.id;
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS messages_stats_ai AFTER INSERT ON messages BEGIN
+        UPDATE conversation_stats SET messages = messages + 1, tokens = tokens + {_TOKENS_SQL.format('new')}
+        WHERE id = 1;
+        INSERT INTO activity_daily (day, messages, user_messages, assistant_messages, tokens)
+        VALUES (date(new.ts), 1, new.role = 'user', new.role = 'assistant', {_TOKENS_SQL.format('new')})
+        ON CONFLICT(day) DO UPDATE SET
+            messages = messages + 1,
+            user_messages = user_messages + excluded.user_messages,
+            assistant_messages = assistant_messages + excluded.assistant_messages,
+            tokens = tokens + excluded.tokens;
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS messages_stats_ad AFTER DELETE ON messages BEGIN
+        UPDATE conversation_stats SET messages = messages - 1, tokens = tokens - {_TOKENS_SQL.format('old')}
+        WHERE id = 1;
+    END''',
+]
+
+
+def _init_stats(conn: sqlite3.Connection) -> None:
+    """
+    Create the materialised dashboard aggregates and their triggers.
+
+    conversation_stats is a single row of running totals and activity_daily
+    one row per day; both are maintained by triggers on every write, so
+    dashboard reads never scan conversations or messages. Existing data is
+    backfilled once, in the same transaction that creates the triggers.
+    Daily activity is a log: deleting messages later does not rewrite it.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute('''CREATE TABLE IF NOT EXISTS conversation_stats (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            active INTEGER NOT NULL DEFAULT 0,
+            archived INTEGER NOT NULL DEFAULT 0,
+            messages INTEGER NOT NULL DEFAULT 0,
+            tokens INTEGER NOT NULL DEFAULT 0,
+            last_conversation_id INTEGER,
+            last_active_at DATETIME
+        )''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS activity_daily (
+            day TEXT PRIMARY KEY,
+            conversations INTEGER NOT NULL DEFAULT 0,
+            messages INTEGER NOT NULL DEFAULT 0,
+            user_messages INTEGER NOT NULL DEFAULT 0,
+            assistant_messages INTEGER NOT NULL DEFAULT 0,
+            tokens INTEGER NOT NULL DEFAULT 0
+        )''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_conversations_updated ON conversations(updated_at)")
+        for trigger in _STATS_TRIGGERS:
+            conn.execute(trigger)
+        if conn.execute("SELECT 1 FROM conversation_stats WHERE id = 1").fetchone() is None:
+            _backfill_stats(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def _backfill_stats(conn: sqlite3.Connection) -> None:
+    """Recompute the aggregates from the base tables (caller holds the write lock)."""
+    conn.execute("DELETE FROM conversation_stats")
+    conn.execute("DELETE FROM activity_daily")
+    conn.execute(f'''INSERT INTO conversation_stats (id, active, archived, messages, tokens)
+        SELECT 1,
+            (SELECT COUNT(*) FROM conversations c WHERE {_NOT_ARCHIVED_SQL.format('c')}),
+            (SELECT COUNT(*) FROM conversations c WHERE {_ARCHIVED_SQL.format('c')}),
+            (SELECT COUNT(*) FROM messages),
+            (SELECT COALESCE(SUM({_TOKENS_SQL.format('m')}), 0) FROM messages m)''')
+    conn.execute(f'''UPDATE conversation_stats SET (last_conversation_id, last_active_at) = (
+        SELECT id, updated_at FROM conversations WHERE {_NOT_ARCHIVED_SQL.format('conversations')}
+        ORDER BY updated_at DESC LIMIT 1) WHERE id = 1''')
+    conn.execute(f'''INSERT INTO activity_daily (day, messages, user_messages, assistant_messages, tokens)
+        SELECT date(ts), COUNT(*), SUM(role = 'user'), SUM(role = 'assistant'),
+            SUM({_TOKENS_SQL.format('messages')})
+        FROM messages GROUP BY date(ts)''')
+    conn.execute('''INSERT INTO activity_daily (day, conversations)
+        SELECT date(created_at), COUNT(*) FROM conversations WHERE true GROUP BY date(created_at)
+        ON CONFLICT(day) DO UPDATE SET conversations = excluded.conversations''')
+
+
+def rebuild_dashboard_stats() -> Dict:
+    """Recompute the dashboard aggregates from scratch (repair tool)."""
+    conn = get_conn()
+    conn.isolation_level = None
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        _backfill_stats(conn)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    return get_dashboard_stats()
+
+
+def get_dashboard_stats() -> Dict:
+    """
+    Read the materialised conversation aggregates.
+
+    Returns:
+        dict: active/archived conversation counts, total messages and
+        estimated tokens, last active conversation and today's activity
+    """
+    conn = get_conn()
+    c = conn.cursor()
+    c.execute("""
+        SELECT s.active, s.archived, s.messages, s.tokens, s.last_conversation_id,
+               s.last_active_at, c.title AS last_title
+        FROM conversation_stats s LEFT JOIN conversations c ON c.id = s.last_conversation_id
+        WHERE s.id = 1
+    """)
+    row = c.fetchone()
+    c.execute("SELECT * FROM activity_daily WHERE day = date('now')")
+    today = c.fetchone()
+    conn.close()
+    stats = dict(row) if row else {"active": 0, "archived": 0, "messages": 0, "tokens": 0,
+                                   "last_conversation_id": None, "last_active_at": None, "last_title": None}
+    stats["today"] = dict(today) if today else None
+    return stats
+
+
+def get_activity_timeseries(days: int = 30) -> List[Dict]:
+    """
+    Daily activity for the last N days (oldest first, missing days as zeros).
+
+    Args:
+        days: Number of days including today
+
+    Returns:
+        list: One dict per day with conversations, messages, user_messages,
+        assistant_messages and tokens
+    """
+    conn = get_conn()
+    c = conn.cursor()
+    c.execute("SELECT date('now', ?)", (f"-{int(days) - 1} days",))
+    first = datetime.strptime(c.fetchone()[0], "%Y-%m-%d").date()
+    c.execute("SELECT * FROM activity_daily WHERE day >= ? ORDER BY day", (first.isoformat(),))
+    rows = {row["day"]: dict(row) for row in c.fetchall()}
     conn.close()
+    empty = {"conversations": 0, "messages": 0, "user_messages": 0, "assistant_messages": 0, "tokens": 0}
+    series = []
+    for offset in range(int(days)):
+        day = (first + timedelta(days=offset)).isoformat()
+        series.append(rows.get(day) or dict(empty, day=day))
+    return series
 
 def create_conversation(title: Optional[str] = None) -> Dict:
     conn = get_conn()
@@ -165,15 +377,57 @@ def delete_conversation(conv_id: int) -> Dict:
     conn.close()
     return {"ok": True}
 
-def get_messages(conversation_id: int, limit: int = 200, asc: bool = True) -> List[Dict]:
+def expire_conversations(archived_ttl_days: int = 0, batch_size: int = 1000) -> Dict:
+    """
+    Delete archived conversations older than archived_ttl_days, and messages
+    whose conversation no longer exists (foreign keys are not enforced).
+
+    Returns:
+        dict: Number of conversations and messages removed
+    """
+    conn = get_conn()
+    conversations = 0
+    if archived_ttl_days and archived_ttl_days > 0:
+        while True:
+            ids = [(row[0],) for row in conn.execute(
+                "SELECT id FROM conversations WHERE archived AND updated_at < datetime('now', ?) LIMIT ?",
+                (f"-{int(archived_ttl_days)} days", batch_size))]
+            if not ids:
+                break
+            conn.executemany("DELETE FROM messages WHERE conversation_id = ?", ids)
+            conn.executemany("DELETE FROM conversations WHERE id = ?", ids)
+            conn.commit()
+            conversations += len(ids)
+    messages = 0
+    while True:
+        ids = [(row[0],) for row in conn.execute(
+            "SELECT m.id FROM messages m LEFT JOIN conversations c ON c.id = m.conversation_id "
+            "WHERE c.id IS NULL LIMIT ?", (batch_size,))]
+        if not ids:
+            break
+        conn.executemany("DELETE FROM messages WHERE id = ?", ids)
+        conn.commit()
+        messages += len(ids)
+    conn.close()
+    return {"conversations": conversations, "orphaned_messages": messages}
+
+def get_messages(conversation_id: int, limit: int = 200, asc: bool = True, offset: int = 0) -> List[Dict]:
     conn = get_conn()
     c = conn.cursor()
     order = "ASC" if asc else "DESC"
-    c.execute(f"SELECT * FROM messages WHERE conversation_id = ? ORDER BY ts {order} LIMIT ?", (conversation_id, limit))
+    # id breaks ties between messages written in the same second, so pages don't overlap
+    c.execute(f"SELECT * FROM messages WHERE conversation_id = ? ORDER BY ts {order}, id {order} LIMIT ? OFFSET ?",
+              (conversation_id, limit, offset))
     rows = c.fetchall()
     conn.close()
     return [dict(row) for row in rows]
 
+def count_messages(conversation_id: int) -> int:
+    conn = get_conn()
+    count = conn.execute("SELECT COUNT(*) FROM messages WHERE conversation_id = ?", (conversation_id,)).fetchone()[0]
+    conn.close()
+    return count
+
 def add_message(conversation_id: int, role: str, content: str) -> Dict:
     conn = get_conn()
     c = conn.cursor()
@@ -201,5 +455,3 @@ def search_messages(q: str, limit: int = 100) -> List[Dict]:
     rows = c.fetchall()
     conn.close()
     return [dict(row) for row in rows]
-
-init_db()
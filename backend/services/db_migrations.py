@@ -0,0 +1,83 @@
+"""
+One-time schema setup for the SQLite databases.
+
+memory_service and conversation_service used to run their init_db() (DDL,
+FTS tables, triggers and data migrations) at import, so every gunicorn
+worker repeated it on boot while contending for the same database locks.
+Now run_migrations() does it once per server start: the gunicorn master
+calls it before forking (see gunicorn.conf.py), and create_app() calls it
+as a fallback for the dev server and the Flask CLI. An flock serialises
+callers and a stamp file records the server (the same owner the shared
+metrics segment uses), so workers booting later find it done and skip it.
+"""
+import fcntl
+import json
+import logging
+import os
+import time
+from typing import Dict, Optional
+
+from backend.config import ThermalGovernorConfig
+from backend.services.shared_metrics import owner_pid
+
+logger = logging.getLogger(__name__)
+
+
+def _databases() -> Dict:
+    """Name -> (module, database path); imported here so callers stay cheap to import."""
+    from backend.services import conversation_service, memory_service
+    return {
+        "memory": (memory_service, os.path.abspath(memory_service.DB_PATH)),
+        "conversations": (conversation_service, os.path.abspath(conversation_service.DB_PATH)),
+    }
+
+
+def run_migrations(force: bool = False, owner: Optional[int] = None,
+                   lock_dir: str = ThermalGovernorConfig.LOCK_DIR) -> Dict:
+    """
+    Create or migrate every database schema, once per server start.
+
+    Args:
+        force: Run even if this server already has
+        owner: Server pid to stamp; the gunicorn master passes its own, since
+            owner_pid() there would name the master's parent
+        lock_dir: Directory for the lock and stamp files
+
+    Returns:
+        dict: owner, at, per-database path and ms, and ``ran`` (False when skipped)
+    """
+    owner = owner or owner_pid()
+    os.makedirs(lock_dir, exist_ok=True)
+    stamp_path = os.path.join(lock_dir, ".db_migrations.json")
+    fd = os.open(os.path.join(lock_dir, ".db_migrations.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        databases = _databases()
+        try:
+            with open(stamp_path) as f:
+                stamp = json.load(f)
+        except (OSError, ValueError):
+            stamp = {}
+        done = (
+            stamp.get("owner") == owner
+            and {name: db["path"] for name, db in stamp.get("databases", {}).items()}
+            == {name: path for name, (_, path) in databases.items()}
+            and all(os.path.exists(path) for _, path in databases.values())
+        )
+        if done and not force:
+            return dict(stamp, ran=False)
+
+        stamp = {"owner": owner, "at": time.time(), "databases": {}}
+        for name, (module, path) in databases.items():
+            start = time.perf_counter()
+            module.init_db()
+            stamp["databases"][name] = {"path": path, "ms": round((time.perf_counter() - start) * 1000, 1)}
+        tmp = f"{stamp_path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(stamp, f)
+        os.replace(tmp, stamp_path)
+        logger.info("[MIGRATIONS] Schemas ready: "
+                    + ", ".join(f"{name} {db['ms']} ms" for name, db in stamp["databases"].items()))
+        return dict(stamp, ran=True)
+    finally:
+        os.close(fd)
@@ -0,0 +1,140 @@
+"""
+Request deadlines, a retry budget and jittered backoff for Ollama calls.
+
+A Deadline is created once per request, from the client's timeout header
+when it sends one or the route's default otherwise, and every attempt,
+admission wait and backoff sleep is bounded by the time it has left.
+
+The retry budget caps retries at a fraction of recent requests in this
+worker, so when Ollama is failing every request gets one attempt instead of
+each multiplying the load by MAX_RETRIES.
+"""
+import logging
+import random
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from backend.config import OllamaConfig
+from backend.services.shared_metrics import get_shared_metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Deadline:
+    """A point in (monotonic) time by which a request must be finished."""
+
+    def __init__(self, seconds: float, source: str = "default"):
+        self.seconds = seconds
+        self.source = source
+        self.expires_at = time.monotonic() + seconds
+
+    @classmethod
+    def for_route(cls, route: str) -> "Deadline":
+        """
+        The deadline for a request on this route.
+
+        Inside a Flask request the client's DEADLINE_HEADER (seconds) is used
+        when it is shorter than the route default.
+        """
+        seconds = OllamaConfig.ROUTE_DEADLINES.get(route, OllamaConfig.DEADLINE)
+        try:
+            from flask import has_request_context, request
+            if has_request_context():
+                header = request.headers.get(OllamaConfig.DEADLINE_HEADER)
+                if header and 0 < float(header) < seconds:
+                    return cls(float(header), "header")
+        except ValueError:
+            logger.warning(f"[DEADLINE] Ignoring invalid {OllamaConfig.DEADLINE_HEADER} header")
+        return cls(seconds, "route" if route in OllamaConfig.ROUTE_DEADLINES else "default")
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self, limit: float) -> float:
+        """A per-attempt timeout: limit, shortened to the time left."""
+        return min(limit, self.remaining())
+
+    def __repr__(self) -> str:
+        return f"Deadline({self.remaining():.1f}s left of {self.seconds}s, {self.source})"
+
+
+def backoff_delay(attempt: int, base: float = OllamaConfig.RETRY_DELAY,
+                  cap: float = OllamaConfig.RETRY_MAX_DELAY) -> float:
+    """Full-jitter exponential backoff before retry number ``attempt`` (1-based)."""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+class RetryBudget:
+    """Allows retries up to ratio * recent requests + minimum, per sliding window."""
+
+    def __init__(self, ratio: float = OllamaConfig.RETRY_BUDGET_RATIO,
+                 minimum: int = OllamaConfig.RETRY_BUDGET_MIN,
+                 window: float = OllamaConfig.RETRY_BUDGET_WINDOW):
+        self.ratio = ratio
+        self.minimum = minimum
+        self.window = window
+        self._requests: deque = deque()
+        self._retries: deque = deque()
+        self._lock = threading.Lock()
+
+    def _trim(self, now: float) -> None:
+        for events in (self._requests, self._retries):
+            while events and events[0] <= now - self.window:
+                events.popleft()
+
+    def record_request(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            self._requests.append(now)
+
+    def try_retry(self) -> bool:
+        """Spend one retry if the budget allows it."""
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            if len(self._retries) >= self.ratio * len(self._requests) + self.minimum:
+                return False
+            self._retries.append(now)
+            return True
+
+    def get_status(self) -> Dict:
+        with self._lock:
+            self._trim(time.monotonic())
+            requests, retries = len(self._requests), len(self._retries)
+        return {
+            "window": self.window,
+            "ratio": self.ratio,
+            "minimum": self.minimum,
+            "requests": requests,
+            "retries": retries,
+            "available": max(0, int(self.ratio * requests + self.minimum) - retries),
+        }
+
+
+def count(name: str) -> None:
+    """Bump a cross-worker reliability counter (ollama_retries, retry_budget_exhausted, deadline_misses)."""
+    try:
+        get_shared_metrics().add(name)
+    except Exception as e:
+        logger.warning(f"[DEADLINE] Could not update {name}: {e}")
+
+
+# Global budget instance
+_budget: Optional[RetryBudget] = None
+_budget_lock = threading.Lock()
+
+
+def get_retry_budget() -> RetryBudget:
+    """Get or create this worker's retry budget."""
+    global _budget
+    with _budget_lock:
+        if _budget is None:
+            _budget = RetryBudget()
+    return _budget
@@ -0,0 +1,224 @@
+"""
+Background Ollama health prober.
+
+One worker (whoever holds an flock) probes Ollama every INTERVAL seconds
+with cheap requests, /api/version and /api/ps, and publishes the result to
+the shared metrics segment. Health endpoints in every worker answer from
+that cached state and never call Ollama themselves.
+
+Reachability has hysteresis: Ollama is reported down only after
+FAIL_THRESHOLD failed probes in a row and up again after RISE_THRESHOLD
+successes, so one slow probe during a long generation does not flap the
+status. A separate one-token generation probe runs every DEEP_INTERVAL
+seconds; it only runs when the model is already loaded and a generation
+slot is free, so it never loads a model or queues behind real work.
+"""
+import fcntl
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+import requests
+
+from backend.config import HealthProbeConfig, OllamaConfig, ThermalGovernorConfig
+from backend.services.shared_metrics import get_shared_metrics
+
+logger = logging.getLogger(__name__)
+
+UNKNOWN, UP, DOWN = "unknown", "up", "down"
+
+
+class HealthProber:
+    """Hysteretic Ollama reachability plus a periodic deep generation check."""
+
+    def __init__(self, cfg=HealthProbeConfig, base_url: Optional[str] = None, lock_dir: Optional[str] = None):
+        self.cfg = cfg
+        self.base_url = (base_url or OllamaConfig.BASE_URL).rstrip("/")
+        self.state: Dict = {
+            "status": UNKNOWN,
+            "since": None,
+            "checked_at": None,
+            "latency_ms": None,
+            "version": None,
+            "loaded_models": [],
+            "failures": 0,
+            "successes": 0,
+            "error": None,
+            "transitions": 0,
+            "deep": {"ok": None, "at": None, "latency_ms": None, "model": None, "error": None, "skipped": None},
+        }
+        self._last_deep = 0.0
+        self._leader_fd: Optional[int] = None
+        self._leader_path = os.path.join(lock_dir or ThermalGovernorConfig.LOCK_DIR, ".health_prober.lock")
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    # -- probing ------------------------------------------------------------
+
+    def observe(self, ok: bool, now: Optional[float] = None) -> str:
+        """Feed one cheap probe result and return the (hysteretic) status."""
+        now = time.time() if now is None else now
+        state = self.state
+        if ok:
+            state["successes"], state["failures"] = state["successes"] + 1, 0
+            target = UP if state["status"] != DOWN or state["successes"] >= self.cfg.RISE_THRESHOLD else DOWN
+        else:
+            state["failures"], state["successes"] = state["failures"] + 1, 0
+            target = DOWN if state["status"] != UP or state["failures"] >= self.cfg.FAIL_THRESHOLD else UP
+        if target != state["status"]:
+            reason = f" ({state['error']})" if state["error"] else ""
+            logger.info(f"[HEALTH] Ollama {state['status']} -> {target}{reason}")
+            state.update(status=target, since=now, transitions=state["transitions"] + 1)
+        state["checked_at"] = now
+        return state["status"]
+
+    def probe(self) -> Dict:
+        """Run one cheap probe, the deep probe when due, and publish the state."""
+        start = time.perf_counter()
+        try:
+            response = requests.get(f"{self.base_url}/api/version", timeout=self.cfg.TIMEOUT)
+            response.raise_for_status()
+            self.state.update(version=response.json().get("version"), error=None,
+                              latency_ms=round((time.perf_counter() - start) * 1000, 1))
+            ok = True
+        except Exception as e:
+            self.state.update(error=str(e), latency_ms=None)
+            ok = False
+        if ok:
+            try:
+                response = requests.get(f"{self.base_url}/api/ps", timeout=self.cfg.TIMEOUT)
+                response.raise_for_status()
+                self.state["loaded_models"] = [m.get("name") or m.get("model") for m in response.json().get("models", [])]
+            except Exception as e:
+                logger.debug(f"[HEALTH] /api/ps failed: {e}")
+        self.observe(ok)
+        if self.cfg.DEEP_INTERVAL > 0 and time.time() - self._last_deep >= self.cfg.DEEP_INTERVAL:
+            self.deep_probe()
+        self.publish()
+        return self.state
+
+    def deep_probe(self, model: Optional[str] = None) -> Dict:
+        """Generate one token when the model is loaded and a slot is free; otherwise record why not."""
+        from backend.services.model_router import get_model_router
+        from backend.services.thermal_governor import AdmissionTimeout, BackgroundDeferred, get_thermal_governor
+
+        routing = get_model_router().resolve("health_probe", model)
+        model = routing.model
+        deep = dict(self.state["deep"], model=model, skipped=None)
+        if self.state["status"] != UP:
+            deep["skipped"] = "ollama down"
+        elif not any(m == model or m.split(":")[0] == model for m in self.state["loaded_models"]):
+            deep["skipped"] = "model not loaded"
+        else:
+            try:
+                slot = get_thermal_governor().admit(background=True, timeout=0)
+            except (AdmissionTimeout, BackgroundDeferred) as e:
+                deep["skipped"] = f"busy: {e}"
+            else:
+                with slot:
+                    start = time.perf_counter()
+                    try:
+                        response = requests.post(
+                            f"{self.base_url}/api/generate",
+                            json={"model": model, "prompt": "ping", "stream": False,
+                                  "options": dict({"num_predict": 1}, **routing.options)},
+                            timeout=self.cfg.DEEP_TIMEOUT,
+                        )
+                        response.raise_for_status()
+                        # Not recorded in the inference ledger: probes would skew its stats and last model
+                        deep.update(ok=True, error=None)
+                    except Exception as e:
+                        deep.update(ok=False, error=str(e))
+                    deep.update(at=time.time(), latency_ms=round((time.perf_counter() - start) * 1000, 1))
+                self._last_deep = time.time()
+        if deep["skipped"]:
+            logger.debug(f"[HEALTH] Deep probe skipped: {deep['skipped']}")
+        self.state["deep"] = deep
+        return deep
+
+    def publish(self) -> None:
+        try:
+            get_shared_metrics().set_json("health", dict(self.state, prober_pid=os.getpid()))
+        except Exception as e:
+            logger.warning(f"[HEALTH] Could not publish state: {e}")
+
+    # -- background thread --------------------------------------------------
+
+    def _is_leader(self) -> bool:
+        """One worker probes for all of them: whoever holds the lock."""
+        if self._leader_fd is not None:
+            return True
+        try:
+            os.makedirs(os.path.dirname(self._leader_path), exist_ok=True)
+            fd = os.open(self._leader_path, os.O_RDWR | os.O_CREAT, 0o644)
+        except OSError:
+            return False
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._leader_fd = fd
+        return True
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="health-prober", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while True:
+            # Followers keep trying so another worker takes over if the prober exits
+            if self._is_leader():
+                try:
+                    self.probe()
+                except Exception as e:
+                    logger.warning(f"[HEALTH] Probe failed: {e}")
+            if self._stop.wait(self.cfg.INTERVAL):
+                return
+
+    # -- reads --------------------------------------------------------------
+
+    def read(self) -> Dict:
+        """
+        The last published state, from any worker.
+
+        Returns:
+            dict: status (unknown/up/down), version, loaded_models, latency,
+            deep probe result, age and stale
+        """
+        try:
+            state = get_shared_metrics().get_json("health")
+        except Exception:
+            state = None
+        # Fields missing from the shared copy (e.g. a truncated blob) read as this worker's own state
+        state = dict(self.state, **state) if isinstance(state, dict) else dict(self.state)
+        checked = state.get("checked_at")
+        state["age"] = round(time.time() - checked, 1) if checked else None
+        state["stale"] = state["age"] is None or state["age"] > self.cfg.STALE_AFTER
+        return state
+
+    def is_up(self) -> bool:
+        state = self.read()
+        return state.get("status", UNKNOWN) == UP and not state["stale"]
+
+
+# Global prober instance
+_prober: Optional[HealthProber] = None
+_prober_lock = threading.Lock()
+
+
+def get_health_prober() -> HealthProber:
+    """Get or create (and start) the global health prober."""
+    global _prober
+    with _prober_lock:
+        if _prober is None:
+            _prober = HealthProber()
+            _prober.start()
+    return _prober
@@ -0,0 +1,279 @@
+"""
+Per-model, per-route ledger of real Ollama inference timings.
+
+Every generation records the counters Ollama returns in its final response
+(prompt_eval_count/duration, eval_count/duration, load_duration,
+total_duration) plus the measured time to first token for streams. Rows are
+kept in the memory database; the latest records also go to the shared
+metrics segment (one view across workers) and the telemetry history.
+"""
+import logging
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional
+
+from backend.config import InferenceLedgerConfig
+from backend.services import memory_service as mem
+from backend.services.shared_metrics import get_shared_metrics
+from backend.services.telemetry_history import record_values
+
+logger = logging.getLogger(__name__)
+
+_COUNTERS = ("prompt_eval_count", "prompt_eval_duration", "eval_count", "eval_duration",
+             "load_duration", "total_duration")
+
+_schema_ready = set()
+
+
+def _field(data: Any, key: str) -> Any:
+    """Read a key from a dict or an ollama client response object."""
+    if data is None:
+        return None
+    if isinstance(data, dict):
+        return data.get(key)
+    try:
+        return data[key]
+    except (KeyError, TypeError, IndexError):
+        return getattr(data, key, None)
+
+
+def _ms(nanoseconds: Optional[int]) -> Optional[float]:
+    return round(nanoseconds / 1e6, 2) if nanoseconds else None
+
+
+def _rate(count: Optional[int], nanoseconds: Optional[int]) -> Optional[float]:
+    if not count or not nanoseconds:
+        return None
+    return round(count / (nanoseconds / 1e9), 2)
+
+
+def _conn() -> sqlite3.Connection:
+    conn = sqlite3.connect(mem.DB_PATH, timeout=5)
+    if mem.DB_PATH not in _schema_ready:
+        conn.execute('''CREATE TABLE IF NOT EXISTS inference_ledger (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            model TEXT,
+            route TEXT,
+            stream INTEGER,
+            prompt_tokens INTEGER,
+            completion_tokens INTEGER,
+            ttft_ms REAL,
+            load_ms REAL,
+            prompt_eval_ms REAL,
+            eval_ms REAL,
+            total_ms REAL,
+            tokens_per_sec REAL,
+            prompt_tokens_per_sec REAL
+        )''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_inference_ledger_ts ON inference_ledger(ts)")
+        conn.commit()
+        _schema_ready.add(mem.DB_PATH)
+    return conn
+
+
+def build_usage(data: Any) -> Optional[Dict]:
+    """
+    OpenAI-style usage block from an Ollama final response.
+
+    Returns:
+        dict: prompt_tokens, completion_tokens, total_tokens; None without counters
+    """
+    prompt_tokens = _field(data, "prompt_eval_count")
+    completion_tokens = _field(data, "eval_count")
+    if prompt_tokens is None and completion_tokens is None:
+        return None
+    prompt_tokens, completion_tokens = prompt_tokens or 0, completion_tokens or 0
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+def inference_entry(route: str, model: Optional[str], data: Any,
+                    ttft_ms: Optional[float] = None, stream: bool = False) -> Optional[Dict]:
+    """
+    Compute the entry for one finished generation without recording it.
+
+    Args:
+        route: Caller label (e.g. "gateway", "chat", "query", "title")
+        model: Model name (defaults to the response's model field)
+        data: Final Ollama response (the done=True chunk for streams)
+        ttft_ms: Measured time to first token; derived from load and prompt
+            eval time when not given
+        stream: Whether the response was streamed
+
+    Returns:
+        dict: The entry, or None if the response carried no timings
+    """
+    counters = {key: _field(data, key) for key in _COUNTERS}
+    if not any(counters.values()):
+        return None
+    if ttft_ms is None and (counters["load_duration"] or counters["prompt_eval_duration"]):
+        ttft_ms = _ms((counters["load_duration"] or 0) + (counters["prompt_eval_duration"] or 0))
+
+    return {
+        "ts": time.time(),
+        "model": model or _field(data, "model"),
+        "route": route,
+        "stream": stream,
+        "prompt_tokens": counters["prompt_eval_count"],
+        "completion_tokens": counters["eval_count"],
+        "ttft_ms": round(ttft_ms, 2) if ttft_ms is not None else None,
+        "load_ms": _ms(counters["load_duration"]),
+        "prompt_eval_ms": _ms(counters["prompt_eval_duration"]),
+        "eval_ms": _ms(counters["eval_duration"]),
+        "total_ms": _ms(counters["total_duration"]),
+        "tokens_per_sec": _rate(counters["eval_count"], counters["eval_duration"]),
+        "prompt_tokens_per_sec": _rate(counters["prompt_eval_count"], counters["prompt_eval_duration"]),
+    }
+
+
+def record_inference(route: str, model: Optional[str], data: Any,
+                     ttft_ms: Optional[float] = None, stream: bool = False, prompt: Any = None) -> Optional[Dict]:
+    """
+    Record one finished generation.
+
+    Args:
+        route: Caller label (e.g. "gateway", "chat", "query", "title")
+        model: Model name (defaults to the response's model field)
+        data: Final Ollama response (the done=True chunk for streams)
+        ttft_ms: Measured time to first token; derived from load and prompt
+            eval time when not given
+        stream: Whether the response was streamed
+        prompt: The prompt_builder Prompt the generation was sent, for prefix-reuse accounting
+
+    Returns:
+        dict: The recorded entry, or None if the response carried no timings
+    """
+    entry = inference_entry(route, model, data, ttft_ms, stream)
+    if entry is None:
+        return None
+    try:
+        get_shared_metrics().record_inference(entry)
+    except Exception as e:
+        logger.warning(f"[LEDGER] Shared metrics update failed: {e}")
+    if prompt is not None:
+        # Prefix-cache reuse of the assembled prompt (a missing count means it was all cached)
+        from backend.services.prompt_builder import get_prompt_builder
+        get_prompt_builder().observe(prompt, entry["prompt_tokens"] or 0)
+
+    record_values({"tokens_per_sec": entry["tokens_per_sec"], "latency_ms": entry["total_ms"]})
+    logger.info(f"[LEDGER] route={route} model={entry['model']} tokens={entry['completion_tokens']} "
+                f"tok/s={entry['tokens_per_sec']} ttft={entry['ttft_ms']}ms")
+
+    if InferenceLedgerConfig.ENABLED:
+        try:
+            conn = _conn()
+            conn.execute(
+                "INSERT INTO inference_ledger (model, route, stream, prompt_tokens, completion_tokens, ttft_ms, "
+                "load_ms, prompt_eval_ms, eval_ms, total_ms, tokens_per_sec, prompt_tokens_per_sec) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (entry["model"], route, int(stream), entry["prompt_tokens"], entry["completion_tokens"],
+                 entry["ttft_ms"], entry["load_ms"], entry["prompt_eval_ms"], entry["eval_ms"],
+                 entry["total_ms"], entry["tokens_per_sec"], entry["prompt_tokens_per_sec"]),
+            )
+            conn.commit()
+            conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"[LEDGER] Write failed: {e}")
+    return entry
+
+
+def recent_entries(limit: int = 5) -> List[Dict]:
+    """The most recent entries across all workers, oldest first."""
+    return get_shared_metrics().recent(limit)
+
+
+def session_tokens() -> int:
+    """Completion tokens generated by all workers since server start."""
+    return get_shared_metrics().read(recent=0)["completion_tokens"]
+
+
+def _percentile(values: List[float], p: float) -> Optional[float]:
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None
+    return round(values[min(int(len(values) * p), len(values) - 1)], 2)
+
+
+def summarize(window_s: int = 3600, model: Optional[str] = None, route: Optional[str] = None) -> Dict:
+    """
+    Aggregate the ledger per model and route over a time window.
+
+    Args:
+        window_s: Lookback in seconds
+        model: Only this model
+        route: Only this route
+
+    Returns:
+        dict: window and a list of groups with request/token counts and
+        p50/p95 TTFT, tokens/sec and prompt tokens/sec
+    """
+    clauses, params = ["ts >= datetime('now', ?)"], [f"-{int(window_s)} seconds"]
+    if model:
+        clauses.append("model = ?")
+        params.append(model)
+    if route:
+        clauses.append("route = ?")
+        params.append(route)
+    conn = _conn()
+    rows = conn.execute(
+        "SELECT model, route, prompt_tokens, completion_tokens, ttft_ms, tokens_per_sec, "
+        f"prompt_tokens_per_sec, total_ms FROM inference_ledger WHERE {' AND '.join(clauses)}",
+        params,
+    ).fetchall()
+    conn.close()
+
+    groups: Dict = {}
+    for row in rows:
+        groups.setdefault((row[0], row[1]), []).append(row)
+    result = []
+    for (group_model, group_route), items in sorted(groups.items(), key=lambda g: (g[0][0] or "", g[0][1] or "")):
+        columns = list(zip(*items))
+        result.append({
+            "model": group_model,
+            "route": group_route,
+            "requests": len(items),
+            "prompt_tokens": sum(v or 0 for v in columns[2]),
+            "completion_tokens": sum(v or 0 for v in columns[3]),
+            "ttft_ms": {"p50": _percentile(columns[4], 0.50), "p95": _percentile(columns[4], 0.95)},
+            "tokens_per_sec": {"p50": _percentile(columns[5], 0.50), "p95": _percentile(columns[5], 0.95)},
+            "prompt_tokens_per_sec": {"p50": _percentile(columns[6], 0.50), "p95": _percentile(columns[6], 0.95)},
+            "total_ms": {"p50": _percentile(columns[7], 0.50), "p95": _percentile(columns[7], 0.95)},
+        })
+    return {"window": window_s, "groups": result}
+
+
+def window_stats(start: float, end: float) -> Dict:
+    """
+    Request count and median latency / tokens per second between two epoch times.
+
+    Returns:
+        dict: requests, total_ms_p50, tokens_per_sec_p50
+    """
+    conn = _conn()
+    rows = conn.execute(
+        "SELECT total_ms, tokens_per_sec FROM inference_ledger "
+        "WHERE ts >= datetime(?, 'unixepoch') AND ts < datetime(?, 'unixepoch')",
+        (int(start), int(end) + 1),
+    ).fetchall()
+    conn.close()
+    return {
+        "requests": len(rows),
+        "total_ms_p50": _percentile([r[0] for r in rows], 0.50),
+        "tokens_per_sec_p50": _percentile([r[1] for r in rows], 0.50),
+    }
+
+
+def expire_entries(days: int) -> int:
+    """Delete ledger rows older than days; returns the number removed."""
+    if not days or days <= 0:
+        return 0
+    conn = _conn()
+    deleted = conn.execute("DELETE FROM inference_ledger WHERE ts < datetime('now', ?)",
+                           (f"-{int(days)} days",)).rowcount
+    conn.commit()
+    conn.close()
+    return deleted
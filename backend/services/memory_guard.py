@@ -0,0 +1,366 @@
+"""
+Memory-pressure guard for Ollama and the backend sharing one RAM pool.
+
+Every telemetry sample the guard combines RAM use (psutil) with the kernel's
+pressure stall information (/proc/pressure/memory, read with pread on a
+kept-open descriptor) into a level:
+
+    ok        no action
+    high      in-process caches shrunk, generations limited to
+              HIGH_CONCURRENCY (others queue), idle models unloaded
+    critical  as high, and new generations are refused
+
+Limits are applied through the thermal governor's admission caps, so both
+controllers share the same cross-worker slots. One worker (the holder of an
+flock) unloads models and records pressure events; each event stores its
+peak readings, the actions taken, and median latency/tokens per second from
+the inference ledger before and during the episode.
+"""
+import ctypes
+import fcntl
+import gc
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Mapping, Optional
+
+import psutil
+import requests
+
+from backend.config import MemoryGuardConfig, OllamaConfig, SensorConfig, ThermalGovernorConfig
+from backend.services import memory_service as mem
+from backend.services.inference_ledger import window_stats
+from backend.services.memory_retrieval import clear_cache as clear_retrieval_cache
+from backend.services.shared_metrics import RING_SIZE, get_shared_metrics
+from backend.services.telemetry import get_telemetry_sampler
+from backend.services.thermal_governor import get_thermal_governor
+
+logger = logging.getLogger(__name__)
+
+OK, HIGH, CRITICAL = "ok", "high", "critical"
+_LEVELS = (OK, HIGH, CRITICAL)
+_PSI_RE = re.compile(r'^(some|full) avg10=([\d.]+)', re.MULTILINE)
+# Longest "before" window compared against an episode
+_BASELINE_MAX = 3600
+
+
+def _malloc_trim() -> bool:
+    """Return freed heap pages to the OS (glibc only)."""
+    try:
+        return bool(ctypes.CDLL("libc.so.6").malloc_trim(0))
+    except (OSError, AttributeError):
+        return False
+
+
+class PressureReader:
+    """Reads /proc/pressure/memory avg10 values through one kept-open descriptor."""
+
+    def __init__(self, root: str = '/'):
+        self.path = os.path.join(root, 'proc/pressure/memory')
+        try:
+            self.fd: Optional[int] = os.open(self.path, os.O_RDONLY)
+        except OSError:
+            self.fd = None
+
+    def read(self) -> Dict[str, Optional[float]]:
+        if self.fd is None:
+            return {"some": None, "full": None}
+        try:
+            text = os.pread(self.fd, 256, 0).decode()
+        except OSError:
+            return {"some": None, "full": None}
+        values = {kind: float(value) for kind, value in _PSI_RE.findall(text)}
+        return {"some": values.get("some"), "full": values.get("full")}
+
+
+class MemoryGuard:
+    """Watermark/PSI state machine that sheds memory and load under pressure."""
+
+    def __init__(self, cfg=MemoryGuardConfig, root: Optional[str] = None, lock_dir: Optional[str] = None):
+        self.cfg = cfg
+        self.level = OK
+        self.since = 0.0
+        self.reading: Dict = {}
+        self.psi = PressureReader(root or SensorConfig.ROOT)
+        self.shrinkers: Dict[str, Callable[[], object]] = {
+            "memory_retrieval_cache": clear_retrieval_cache,
+            "gc": gc.collect,
+            "malloc_trim": _malloc_trim,
+        }
+        self.events: deque = deque(maxlen=20)
+        self._episode: Optional[Dict] = None
+        self._last_unload = 0.0
+        self._unload_thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._leader_fd: Optional[int] = None
+        self._leader_path = os.path.join(lock_dir or ThermalGovernorConfig.LOCK_DIR, ".memory_guard.lock")
+        self._schema_ready = False
+
+    # -- state machine ------------------------------------------------------
+
+    def _target(self, mem_pct: float, psi_some: Optional[float], psi_full: Optional[float]) -> str:
+        cfg = self.cfg
+        if mem_pct >= cfg.CRITICAL_PCT or (psi_full or 0) >= cfg.PSI_FULL_CRITICAL:
+            return CRITICAL
+        if mem_pct >= cfg.HIGH_PCT or (psi_some or 0) >= cfg.PSI_SOME_HIGH:
+            return HIGH
+        # Recover only once clearly below the watermarks
+        if self.level != OK and (mem_pct > cfg.LOW_PCT or (psi_some or 0) >= cfg.PSI_SOME_HIGH / 2):
+            return HIGH
+        return OK
+
+    def observe(self, mem_pct: float, psi_some: Optional[float] = None, psi_full: Optional[float] = None,
+                now: Optional[float] = None, act: bool = True) -> str:
+        """
+        Feed one reading and return the resulting level.
+
+        Rising pressure takes effect immediately; relaxing steps one level at
+        a time after MIN_DWELL seconds. With act=False only the level changes
+        (used to replay synthetic traces).
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self.reading = {"mem_pct": mem_pct, "psi_some": psi_some, "psi_full": psi_full, "ts": now}
+            target = self._target(mem_pct, psi_some, psi_full)
+            current, wanted = _LEVELS.index(self.level), _LEVELS.index(target)
+            if wanted < current:
+                if now - self.since < self.cfg.MIN_DWELL:
+                    target = self.level
+                else:
+                    target = _LEVELS[current - 1]
+            previous, changed = self.level, target != self.level
+            if changed:
+                self.level, self.since = target, now
+        if self._episode is not None:
+            self._track_peak(mem_pct, psi_some, psi_full, target)
+        if changed:
+            logger.info(f"[MEMGUARD] {previous} -> {target} (mem={mem_pct}%, psi_some={psi_some}, psi_full={psi_full})")
+            if act:
+                self._on_change(previous, target, now)
+        if act and target != OK:
+            self._maybe_unload(now)
+        return target
+
+    def update(self, snapshot: Mapping) -> None:
+        """Sampler listener: RAM percent from the snapshot plus PSI."""
+        if not self.cfg.ENABLED:
+            return
+        psi = self.psi.read()
+        memory = snapshot.get("memory")
+        if memory is None:
+            memory = psutil.virtual_memory().percent
+        self.observe(memory, psi["some"], psi["full"], snapshot.get("sampled_at"))
+
+    # -- actions ------------------------------------------------------------
+
+    def _on_change(self, previous: str, level: str, now: float) -> None:
+        governor = get_thermal_governor()
+        if level == OK:
+            governor.set_cap("memory", None)
+            self._end_episode(now)
+            return
+        cap = 0 if level == CRITICAL else self.cfg.HIGH_CONCURRENCY
+        governor.set_cap("memory", cap)
+        if previous == OK:
+            self._start_episode(level, now, {"concurrency_cap": cap, "shrunk": self.shrink()})
+        elif self._episode is not None:
+            actions = self._episode["actions"]
+            actions["concurrency_cap"] = min(actions.get("concurrency_cap", cap), cap)
+
+    def shrink(self) -> List[str]:
+        """Run every registered cache shrinker; returns the ones that succeeded."""
+        done = []
+        for name, shrinker in self.shrinkers.items():
+            try:
+                shrinker()
+                done.append(name)
+            except Exception as e:
+                logger.warning(f"[MEMGUARD] Shrinker {name} failed: {e}")
+        return done
+
+    def _is_leader(self) -> bool:
+        """One worker unloads models and records events: whoever holds the lock."""
+        if self._leader_fd is not None:
+            return True
+        try:
+            os.makedirs(os.path.dirname(self._leader_path), exist_ok=True)
+            fd = os.open(self._leader_path, os.O_RDWR | os.O_CREAT, 0o644)
+        except OSError:
+            return False
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._leader_fd = fd
+        return True
+
+    def idle_models(self, now: Optional[float] = None) -> List[str]:
+        """Loaded models (Ollama /api/ps) with no generation in UNLOAD_IDLE_SECONDS."""
+        now = time.time() if now is None else now
+        base = OllamaConfig.BASE_URL.rstrip('/')
+        response = requests.get(f"{base}/api/ps", timeout=2)
+        response.raise_for_status()
+        loaded = [m.get("name") or m.get("model") for m in response.json().get("models", [])]
+        last_used: Dict[str, float] = {}
+        for entry in get_shared_metrics().recent(RING_SIZE):
+            if entry["model"]:
+                last_used[entry["model"]] = entry["ts"]
+        return [name for name in loaded
+                if name and now - last_used.get(name, 0.0) >= self.cfg.UNLOAD_IDLE_SECONDS]
+
+    def _maybe_unload(self, now: float) -> None:
+        """Start unloading idle models in the background (the sampler thread must not wait on Ollama)."""
+        if now - self._last_unload < self.cfg.UNLOAD_COOLDOWN or not self._is_leader():
+            return
+        if self._unload_thread and self._unload_thread.is_alive():
+            return
+        self._last_unload = now
+        self._unload_thread = threading.Thread(target=self._unload_idle, args=(now,),
+                                               name="memory-guard-unload", daemon=True)
+        self._unload_thread.start()
+
+    def _unload_idle(self, now: float) -> List[str]:
+        try:
+            idle = self.idle_models(now)
+        except Exception as e:
+            logger.warning(f"[MEMGUARD] Could not list loaded models: {e}")
+            return []
+        base = OllamaConfig.BASE_URL.rstrip('/')
+        unloaded = []
+        for name in idle:
+            try:
+                # keep_alive=0 asks Ollama to evict the model now
+                response = requests.post(f"{base}/api/generate", json={"model": name, "keep_alive": 0}, timeout=5)
+                response.raise_for_status()
+                unloaded.append(name)
+            except Exception as e:
+                logger.warning(f"[MEMGUARD] Unload of {name} failed: {e}")
+        if unloaded:
+            logger.info(f"[MEMGUARD] Unloaded idle models: {', '.join(unloaded)}")
+            episode = self._episode
+            if episode is not None:
+                done = episode["actions"].setdefault("unloaded", [])
+                done.extend(name for name in unloaded if name not in done)
+        return unloaded
+
+    # -- events -------------------------------------------------------------
+
+    def _start_episode(self, level: str, now: float, actions: Dict) -> None:
+        self._episode = {
+            "started_at": now,
+            "ended_at": None,
+            "peak_level": level,
+            "peak_mem_pct": self.reading.get("mem_pct"),
+            "peak_psi_some": self.reading.get("psi_some"),
+            "peak_psi_full": self.reading.get("psi_full"),
+            "actions": actions,
+        }
+
+    def _track_peak(self, mem_pct: float, psi_some: Optional[float], psi_full: Optional[float], level: str) -> None:
+        episode = self._episode
+        if _LEVELS.index(level) > _LEVELS.index(episode["peak_level"]):
+            episode["peak_level"] = level
+        for key, value in (("peak_mem_pct", mem_pct), ("peak_psi_some", psi_some), ("peak_psi_full", psi_full)):
+            if value is not None and (episode[key] is None or value > episode[key]):
+                episode[key] = value
+
+    def _end_episode(self, now: float) -> None:
+        episode, self._episode = self._episode, None
+        if episode is None:
+            return
+        episode["ended_at"] = now
+        started = episode["started_at"]
+        baseline = min(now - started, _BASELINE_MAX)
+        try:
+            episode["before"] = window_stats(started - baseline, started)
+            episode["during"] = window_stats(started, now)
+        except sqlite3.Error as e:
+            logger.warning(f"[MEMGUARD] Latency lookup failed: {e}")
+        self.events.append(episode)
+        logger.info(f"[MEMGUARD] Pressure episode over after {now - started:.0f}s "
+                    f"(peak {episode['peak_level']}, mem {episode['peak_mem_pct']}%)")
+        if self._is_leader():
+            self._persist(episode)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(mem.DB_PATH, timeout=5)
+        if not self._schema_ready:
+            conn.execute('''CREATE TABLE IF NOT EXISTS memory_pressure_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                started_at REAL,
+                ended_at REAL,
+                peak_level TEXT,
+                peak_mem_pct REAL,
+                peak_psi_some REAL,
+                peak_psi_full REAL,
+                actions TEXT,
+                before_stats TEXT,
+                during_stats TEXT
+            )''')
+            conn.commit()
+            self._schema_ready = True
+        return conn
+
+    def _persist(self, episode: Dict) -> None:
+        try:
+            conn = self._conn()
+            conn.execute(
+                "INSERT INTO memory_pressure_events (started_at, ended_at, peak_level, peak_mem_pct, "
+                "peak_psi_some, peak_psi_full, actions, before_stats, during_stats) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (episode["started_at"], episode["ended_at"], episode["peak_level"], episode["peak_mem_pct"],
+                 episode["peak_psi_some"], episode["peak_psi_full"], json.dumps(episode["actions"]),
+                 json.dumps(episode.get("before")), json.dumps(episode.get("during"))),
+            )
+            conn.commit()
+            conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"[MEMGUARD] Event write failed: {e}")
+
+    def get_events(self, limit: int = 20) -> List[Dict]:
+        """Recorded pressure episodes, newest first."""
+        conn = self._conn()
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute("SELECT * FROM memory_pressure_events ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        conn.close()
+        events = []
+        for row in rows:
+            event = dict(row)
+            for key in ("actions", "before_stats", "during_stats"):
+                event[key] = json.loads(event[key]) if event[key] else None
+            events.append(event)
+        return events
+
+    def get_status(self) -> Dict:
+        return {
+            "enabled": self.cfg.ENABLED,
+            "level": self.level,
+            "since": self.since,
+            "reading": self.reading,
+            "psi_available": self.psi.fd is not None,
+            "watermarks": {"high_pct": self.cfg.HIGH_PCT, "critical_pct": self.cfg.CRITICAL_PCT,
+                           "low_pct": self.cfg.LOW_PCT, "psi_some_high": self.cfg.PSI_SOME_HIGH,
+                           "psi_full_critical": self.cfg.PSI_FULL_CRITICAL},
+            "episode": self._episode,
+            "recent_events": list(self.events),
+        }
+
+
+# Global guard instance
+_guard: Optional[MemoryGuard] = None
+_guard_lock = threading.Lock()
+
+
+def get_memory_guard() -> MemoryGuard:
+    """Get or create the global memory guard, fed by the telemetry sampler."""
+    global _guard
+    with _guard_lock:
+        if _guard is None:
+            _guard = MemoryGuard()
+            get_telemetry_sampler().add_listener(_guard.update)
+    return _guard
@@ -0,0 +1,323 @@
+"""
+Budgeted memory retrieval for prompt augmentation.
+
+Looks up the notes most relevant to a prompt in ``notes_fts`` and prepends
+them to the prompt before generation. The lookup is bounded by a hard time
+budget (SQLite progress handler), results are cached per prompt hash, and the
+injected block is capped at a fixed token estimate so retrieval never
+dominates time-to-first-token.
+"""
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Tuple
+
+from backend.config import MemoryRetrievalConfig
+from backend.services import memory_service as mem
+
+logger = logging.getLogger(__name__)
+
+# Rough chars-per-token ratio used for the injection cap (no tokenizer here)
+CHARS_PER_TOKEN = 4
+
+# Number of SQLite VM instructions between deadline checks
+PROGRESS_STEPS = 1000
+
+_WORD_RE = re.compile(r"[A-Za-z0-9_]{3,}")
+_SPACE_RE = re.compile(r"\s+")
+_STOPWORDS = frozenset({
+    "the", "and", "for", "are", "but", "not", "you", "all", "any", "can",
+    "her", "was", "one", "our", "out", "has", "have", "had", "him", "his",
+    "how", "its", "may", "new", "now", "see", "two", "who", "did", "get",
+    "let", "say", "she", "too", "use", "that", "this", "with", "what",
+    "when", "where", "which", "will", "would", "there", "their", "them",
+    "then", "than", "from", "your", "about", "into", "just", "like", "some",
+    "could", "should", "please", "tell", "explain", "does", "make",
+})
+
+_local = threading.local()
+_cache: "OrderedDict[str, Tuple[float, List[Dict]]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+_stats = {
+    "requests": 0,
+    "cache_hits": 0,
+    "cache_misses": 0,
+    "hits": 0,
+    "empty": 0,
+    "timeouts": 0,
+    "errors": 0,
+    "notes_injected": 0,
+}
+_latencies_ms: deque = deque(maxlen=200)
+
+
+def build_fts_query(prompt: str, max_terms: int = 12) -> Optional[str]:
+    """
+    Turn free-form prompt text into a safe FTS5 MATCH expression.
+
+    Args:
+        prompt: Raw user prompt
+        max_terms: Maximum number of distinct terms to OR together
+
+    Returns:
+        str: Quoted, OR-joined terms, or None if nothing searchable remains
+    """
+    terms = []
+    seen = set()
+    for word in _WORD_RE.findall(prompt.lower()):
+        if word in _STOPWORDS or word in seen:
+            continue
+        seen.add(word)
+        terms.append(f'"{word}"')
+        if len(terms) >= max_terms:
+            break
+    return " OR ".join(terms) if terms else None
+
+
+def _get_conn() -> sqlite3.Connection:
+    """Return a per-thread read connection to the memory database."""
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "path", None) != mem.DB_PATH:
+        conn = sqlite3.connect(mem.DB_PATH)
+        _local.conn = conn
+        _local.path = mem.DB_PATH
+    return conn
+
+
+def _record(key: str, latency_ms: Optional[float] = None, amount: int = 1) -> None:
+    with _stats_lock:
+        _stats[key] += amount
+        if latency_ms is not None:
+            _latencies_ms.append(latency_ms)
+
+
+def _cache_get(key: str) -> Optional[List[Dict]]:
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is None:
+            return None
+        expires_at, notes = entry
+        if expires_at < time.monotonic():
+            del _cache[key]
+            return None
+        _cache.move_to_end(key)
+        return notes
+
+
+def _cache_put(key: str, notes: List[Dict]) -> None:
+    with _cache_lock:
+        _cache[key] = (time.monotonic() + MemoryRetrievalConfig.CACHE_TTL, notes)
+        _cache.move_to_end(key)
+        while len(_cache) > MemoryRetrievalConfig.CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def clear_cache() -> None:
+    """Drop all cached retrieval results."""
+    with _cache_lock:
+        _cache.clear()
+
+
+def retrieve_notes(prompt: str, top_k: Optional[int] = None,
+                   budget_ms: Optional[float] = None) -> List[Dict]:
+    """
+    Fetch the notes most relevant to a prompt within a strict time budget.
+
+    Args:
+        prompt: Prompt to find related notes for
+        top_k: Maximum number of notes (defaults to config)
+        budget_ms: Hard time budget for the FTS query in milliseconds
+
+    Returns:
+        list: Notes as dicts with id, kind and text; empty on timeout or error
+    """
+    top_k = top_k or MemoryRetrievalConfig.TOP_K
+    budget_ms = budget_ms if budget_ms is not None else MemoryRetrievalConfig.BUDGET_MS
+
+    start = time.perf_counter()
+    key = hashlib.sha1(f"{top_k}:{prompt}".encode("utf-8")).hexdigest()
+    _record("requests")
+
+    cached = _cache_get(key)
+    if cached is not None:
+        _record("cache_hits", (time.perf_counter() - start) * 1000)
+        return cached
+    _record("cache_misses")
+
+    match = build_fts_query(prompt)
+    if match is None:
+        _record("empty", (time.perf_counter() - start) * 1000)
+        _cache_put(key, [])
+        return []
+
+    deadline = start + budget_ms / 1000.0
+    conn = _get_conn()
+    conn.set_progress_handler(lambda: 1 if time.perf_counter() > deadline else 0, PROGRESS_STEPS)
+    try:
+        c = conn.cursor()
+        c.execute(
+            "SELECT n.id, n.kind, n.text FROM notes_fts JOIN notes n ON n.id = notes_fts.rowid "
+            "WHERE notes_fts MATCH ? ORDER BY rank LIMIT ?",
+            (match, top_k),
+        )
+        notes = [dict(zip(["id", "kind", "text"], row)) for row in c.fetchall()]
+    except sqlite3.OperationalError as e:
+        latency_ms = (time.perf_counter() - start) * 1000
+        if "interrupted" in str(e):
+            _record("timeouts", latency_ms)
+            logger.info(f"[MEMORY_RETRIEVAL] Budget of {budget_ms}ms exceeded, skipping")
+        else:
+            _record("errors", latency_ms)
+            logger.warning(f"[MEMORY_RETRIEVAL] Query failed: {e}")
+        return []
+    finally:
+        conn.set_progress_handler(None, 0)
+
+    latency_ms = (time.perf_counter() - start) * 1000
+    _record("hits" if notes else "empty", latency_ms)
+    _cache_put(key, notes)
+    return notes
+
+
+def format_context(notes: List[Dict], token_cap: Optional[int] = None) -> Tuple[str, int]:
+    """
+    Render notes into a context block that fits within the token cap.
+
+    Args:
+        notes: Notes returned by retrieve_notes
+        token_cap: Maximum estimated tokens for the whole block
+
+    Returns:
+        tuple: (context block or empty string, number of notes included)
+    """
+    token_cap = token_cap or MemoryRetrievalConfig.TOKEN_CAP
+    header = "Relevant notes from memory:\n"
+    budget = token_cap * CHARS_PER_TOKEN - len(header)
+    lines = []
+    for note in notes:
+        if budget <= 0:
+            break
+        text = _SPACE_RE.sub(" ", note.get("text") or "").strip()
+        if not text:
+            continue
+        line = f"- {text}"
+        if len(line) > budget:
+            line = line[:max(budget - 3, 0)].rstrip() + "..."
+        lines.append(line)
+        budget -= len(line) + 1
+    if not lines:
+        return "", 0
+    return header + "\n".join(lines) + "\n\n", len(lines)
+
+
+def _build_context(prompt: str, enabled: Optional[bool]) -> Tuple[str, Optional[Dict]]:
+    """Retrieve and format the memory block for a prompt, recording stats."""
+    if enabled is None:
+        enabled = MemoryRetrievalConfig.ENABLED
+    if not enabled or not prompt:
+        return "", None
+
+    start = time.perf_counter()
+    try:
+        notes = retrieve_notes(prompt)
+        context, used = format_context(notes)
+    except Exception as e:
+        _record("errors")
+        logger.warning(f"[MEMORY_RETRIEVAL] Retrieval failed: {e}")
+        context, used = "", 0
+
+    if used:
+        _record("notes_injected", amount=used)
+    info = {
+        "notes": used,
+        "retrieval_ms": round((time.perf_counter() - start) * 1000, 2),
+    }
+    return context, info
+
+
+def memory_context(query: str, enabled: Optional[bool] = None) -> Tuple[str, Optional[Dict]]:
+    """
+    The memory block for a query, for callers that place it themselves.
+
+    Returns:
+        tuple: (context block or empty string, retrieval info dict or None when disabled)
+    """
+    return _build_context(query, enabled)
+
+
+def augment_prompt(prompt: str, enabled: Optional[bool] = None) -> Tuple[str, Optional[Dict]]:
+    """
+    Prepend relevant memory notes to a prompt.
+
+    Args:
+        prompt: Original user prompt
+        enabled: Per-request override; falls back to MEMORY_RETRIEVAL_ENABLED
+
+    Returns:
+        tuple: (prompt to send, retrieval info dict or None when disabled)
+    """
+    context, info = _build_context(prompt, enabled)
+    return context + prompt, info
+
+
+def augment_messages(messages: List[Dict], enabled: Optional[bool] = None) -> Tuple[List[Dict], Optional[Dict]]:
+    """
+    Insert relevant memory notes into a chat message list.
+
+    The notes go into a system message placed directly before the latest
+    user message; the caller's list is not modified.
+
+    Args:
+        messages: Chat history in Ollama/OpenAI message format
+        enabled: Per-request override; falls back to MEMORY_RETRIEVAL_ENABLED
+
+    Returns:
+        tuple: (messages to send, retrieval info dict or None when disabled)
+    """
+    last_user = next((i for i in range(len(messages) - 1, -1, -1)
+                      if messages[i].get("role") == "user"), None)
+    if last_user is None:
+        return messages, None
+
+    context, info = _build_context(messages[last_user].get("content") or "", enabled)
+    if not context:
+        return messages, info
+
+    augmented = list(messages)
+    augmented.insert(last_user, {"role": "system", "content": context.strip()})
+    return augmented, info
+
+
+def get_retrieval_stats() -> Dict:
+    """
+    Get retrieval counters and latency percentiles.
+
+    Returns:
+        dict: Counters, p50/p95/max latency in ms and cache size
+    """
+    with _stats_lock:
+        result = dict(_stats)
+        samples = sorted(_latencies_ms)
+    with _cache_lock:
+        result["cache_size"] = len(_cache)
+
+    def pct(p: float) -> Optional[float]:
+        if not samples:
+            return None
+        return round(samples[min(int(len(samples) * p), len(samples) - 1)], 2)
+
+    result["latency_ms"] = {
+        "p50": pct(0.50),
+        "p95": pct(0.95),
+        "max": round(samples[-1], 2) if samples else None,
+        "samples": len(samples),
+    }
+    result["enabled"] = MemoryRetrievalConfig.ENABLED
+    result["budget_ms"] = MemoryRetrievalConfig.BUDGET_MS
+    return result
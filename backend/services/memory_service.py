@@ -1,17 +1,50 @@
+import codecs
 import sqlite3
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Iterable, Iterator, BinaryIO, Tuple, Union
+import json
 import os
+import re
+import threading
+import time
+
+from backend.config import MemoryDedupConfig
+from backend.services.note_fingerprint import BANDS, SimHashIndex, simhash, to_signed, to_unsigned
 
 DB_PATH = os.getenv("MEMORY_DB_PATH", "memory.db")
 
+_SPACE_RE = re.compile(r"\s*")
+_SEPARATOR_RE = re.compile(r"[\s,]*")
+
+# Rows per transaction for bulk imports
+IMPORT_CHUNK_SIZE = int(os.getenv("MEMORY_IMPORT_CHUNK_SIZE", "5000"))
+
+# FTS sync triggers dropped during large imports and recreated afterwards
+_FTS_WRITE_TRIGGERS = {
+    "notes_ai": '''CREATE TRIGGER IF NOT EXISTS notes_ai AFTER INSERT ON notes BEGIN
+        INSERT INTO notes_fts(rowid, text) VALUES (new.id, new.text);
+    END''',
+    "notes_au": '''CREATE TRIGGER IF NOT EXISTS notes_au AFTER UPDATE ON notes BEGIN
+        INSERT INTO notes_fts(notes_fts, rowid, text) VALUES ('delete', old.id, old.text);
+        INSERT INTO notes_fts(rowid, text) VALUES (new.id, new.text);
+    END''',
+}
+
+# Schema version tracked in PRAGMA user_version
+SCHEMA_VERSION = 3
+
 # Note schema for reference
 # id INTEGER PRIMARY KEY AUTOINCREMENT
 # ts TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 # kind TEXT
 # text TEXT
-# tags TEXT (nullable, comma-separated)
+# tags TEXT (nullable, comma-separated; normalised copy lives in note_tags)
+
+_NOTE_COLUMNS = ["id", "ts", "kind", "text", "tags"]
 
 def init_db():
+    error = MemoryDedupConfig.validate_config()
+    if error:
+        raise ValueError(error)
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
     # Create notes table if not exists
@@ -28,28 +61,255 @@ def init_db():
         c.execute("ALTER TABLE notes ADD COLUMN tags TEXT")
     # FTS table for search
     c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(text, content='notes', content_rowid='id')''')
-    # Triggers for FTS
-    c.execute('''CREATE TRIGGER IF NOT EXISTS notes_ai AFTER INSERT ON notes BEGIN
-        INSERT INTO notes_fts(rowid, text) VALUES (new.id, new.text);
+    # Triggers for FTS; before version 3 they removed rows by rowid, which an
+    # external-content table cannot do (it re-reads the already changed row)
+    version = c.execute("PRAGMA user_version").fetchone()[0]
+    if version < 3:
+        c.execute("DROP TRIGGER IF EXISTS notes_au")
+        c.execute("DROP TRIGGER IF EXISTS notes_ad")
+        c.execute("INSERT INTO notes_fts(notes_fts) VALUES('rebuild')")
+    for ddl in _FTS_WRITE_TRIGGERS.values():
+        c.execute(ddl)
+    c.execute('''CREATE TRIGGER IF NOT EXISTS notes_ad AFTER DELETE ON notes BEGIN
+        INSERT INTO notes_fts(notes_fts, rowid, text) VALUES ('delete', old.id, old.text);
     END''')
-    c.execute('''CREATE TRIGGER IF NOT EXISTS notes_au AFTER UPDATE ON notes BEGIN
-        UPDATE notes_fts SET text = new.text WHERE rowid = new.id;
+    # Set while a bulk import runs without the FTS triggers; left behind if it crashed
+    c.execute("CREATE TABLE IF NOT EXISTS notes_fts_dirty (since TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+    if c.execute("SELECT 1 FROM notes_fts_dirty LIMIT 1").fetchone():
+        c.execute("INSERT INTO notes_fts(notes_fts) VALUES('rebuild')")
+        c.execute("DELETE FROM notes_fts_dirty")
+    # Keyset pagination index
+    c.execute("CREATE INDEX IF NOT EXISTS idx_notes_ts_id ON notes(ts, id)")
+    # Normalised tags plus a maintained facet aggregate
+    c.execute('''CREATE TABLE IF NOT EXISTS note_tags (
+        tag TEXT NOT NULL,
+        note_id INTEGER NOT NULL,
+        PRIMARY KEY (tag, note_id)
+    ) WITHOUT ROWID''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_note_tags_note ON note_tags(note_id)")
+    c.execute('''CREATE TABLE IF NOT EXISTS tag_counts (
+        tag TEXT PRIMARY KEY,
+        count INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS note_tags_ai AFTER INSERT ON note_tags BEGIN
+        INSERT INTO tag_counts(tag, count) VALUES (new.tag, 1)
+            ON CONFLICT(tag) DO UPDATE SET count = count + 1;
     END''')
-    c.execute('''CREATE TRIGGER IF NOT EXISTS notes_ad AFTER DELETE ON notes BEGIN
-        DELETE FROM notes_fts WHERE rowid = old.id;
+    c.execute('''CREATE TRIGGER IF NOT EXISTS note_tags_ad AFTER DELETE ON note_tags BEGIN
+        UPDATE tag_counts SET count = count - 1 WHERE tag = old.tag;
+        DELETE FROM tag_counts WHERE tag = old.tag AND count <= 0;
+    END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS notes_tags_ad AFTER DELETE ON notes BEGIN
+        DELETE FROM note_tags WHERE note_id = old.id;
+    END''')
+    # Migrate comma-separated tags into note_tags
+    if version < 1:
+        c.execute("DELETE FROM note_tags")
+        c.execute("DELETE FROM tag_counts")
+        c.execute("SELECT id, tags FROM notes WHERE tags IS NOT NULL AND tags != ''")
+        pairs = [(tag, note_id) for note_id, tags in c.fetchall() for tag in parse_tags(tags)]
+        c.executemany("INSERT OR IGNORE INTO note_tags (tag, note_id) VALUES (?, ?)", pairs)
+    # Near-duplicate fingerprints (rowid order lets workers load new rows incrementally)
+    c.execute('''CREATE TABLE IF NOT EXISTS note_fingerprints (
+        note_id INTEGER NOT NULL UNIQUE,
+        simhash INTEGER NOT NULL
+    )''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS notes_fp_ad AFTER DELETE ON notes BEGIN
+        DELETE FROM note_fingerprints WHERE note_id = old.id;
     END''')
+    if version < SCHEMA_VERSION:
+        c.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
     conn.commit()
     conn.close()
 
+# In-process fingerprint index, refreshed from note_fingerprints by rowid
+_fp_index = SimHashIndex()
+_fp_rowid = 0
+_fp_lock = threading.Lock()
+_dedup_stats = {"checked": 0, "merged": 0, "skipped": 0}
+
+def _refresh_fp_index(c: sqlite3.Cursor) -> None:
+    """Load fingerprints written since the last refresh (including by other workers)."""
+    global _fp_rowid
+    c.execute("SELECT rowid, note_id, simhash FROM note_fingerprints WHERE rowid > ? ORDER BY rowid", (_fp_rowid,))
+    for rowid, note_id, fingerprint in c.fetchall():
+        _fp_index.add(note_id, to_unsigned(fingerprint))
+        _fp_rowid = rowid
+
+def _reset_fp_index() -> None:
+    global _fp_index, _fp_rowid
+    with _fp_lock:
+        _fp_index = SimHashIndex()
+        _fp_rowid = 0
+
+def _store_fingerprint(c: sqlite3.Cursor, note_id: int, fingerprint: int) -> None:
+    # The index picks the row up on its next refresh, which also advances _fp_rowid
+    c.execute("INSERT OR REPLACE INTO note_fingerprints (note_id, simhash) VALUES (?, ?)",
+              (note_id, to_signed(fingerprint)))
+
+def _find_duplicate(c: sqlite3.Cursor, kind: str, text: str) -> Tuple[Optional[int], Optional[int]]:
+    """
+    Look up a near-duplicate of a new note.
+
+    Returns:
+        tuple: (existing note id or None, fingerprint or None if kind is not deduplicated)
+    """
+    if MemoryDedupConfig.MODE == "off" or kind not in MemoryDedupConfig.KINDS:
+        return None, None
+    fingerprint = simhash(text or "")
+    with _fp_lock:
+        _refresh_fp_index(c)
+        _dedup_stats["checked"] += 1
+        while True:
+            match = _fp_index.find(fingerprint, MemoryDedupConfig.MAX_DISTANCE)
+            if match is None:
+                return None, fingerprint
+            c.execute("SELECT kind FROM notes WHERE id = ?", (match[0],))
+            row = c.fetchone()
+            if row and row[0] == kind:
+                return match[0], fingerprint
+            # Deleted (or re-kinded) since it was indexed
+            _fp_index.remove(match[0])
+
+def _insert_note(c: sqlite3.Cursor, kind: str, text: str, tags: Union[str, List[str], None],
+                 ts: Optional[str] = None) -> Tuple[int, Optional[str]]:
+    """
+    Insert a note unless it is a near-duplicate of an existing one.
+
+    Returns:
+        tuple: (note id, None for a new note or "merged"/"skipped")
+    """
+    existing, fingerprint = _find_duplicate(c, kind, text)
+    if existing is not None:
+        if MemoryDedupConfig.MODE == "merge":
+            _merge_note(c, existing, text, tags, ts, fingerprint)
+            action = "merged"
+        else:
+            action = "skipped"
+        with _fp_lock:
+            _dedup_stats[action] += 1
+        return existing, action
+    c.execute("INSERT INTO notes (ts, kind, text, tags) VALUES (COALESCE(?, CURRENT_TIMESTAMP), ?, ?, ?)",
+              (ts, kind, text, _tags_column(tags)))
+    note_id = c.lastrowid
+    _set_note_tags(c, note_id, tags)
+    if fingerprint is not None:
+        _store_fingerprint(c, note_id, fingerprint)
+    return note_id, None
+
+def _is_newer(ts: Optional[str], current_ts: Optional[str]) -> bool:
+    """Whether a note stamped ts supersedes one stamped current_ts (no ts means now)."""
+    return ts is None or current_ts is None or str(ts) >= str(current_ts)
+
+def _merge_tags(current: Union[str, List[str], None], tags: Union[str, List[str], None]) -> List[str]:
+    merged = parse_tags(current)
+    return merged + [t for t in parse_tags(tags) if t not in merged]
+
+def _merge_note(c: sqlite3.Cursor, note_id: int, text: str, tags: Union[str, List[str], None],
+                ts: Optional[str], fingerprint: int) -> None:
+    """
+    Merge a near-duplicate into an existing note (the rule dedup_notes applies too).
+
+    The tags are unioned; the newer of the two keeps its text, timestamp and
+    fingerprint, so a note never grows by repetition.
+    """
+    c.execute("SELECT text, tags, ts FROM notes WHERE id = ?", (note_id,))
+    current_text, current_tags, current_ts = c.fetchone()
+    current = parse_tags(current_tags)
+    merged = _merge_tags(current, tags)
+    if _is_newer(ts, current_ts):
+        c.execute("UPDATE notes SET ts = COALESCE(?, CURRENT_TIMESTAMP), text = ?, tags = ? WHERE id = ?",
+                  (ts, text, ",".join(merged) or None, note_id))
+        if text != current_text:
+            _store_fingerprint(c, note_id, fingerprint)
+    elif merged != current:
+        c.execute("UPDATE notes SET tags = ? WHERE id = ?", (",".join(merged) or None, note_id))
+    if merged != current:
+        _set_note_tags(c, note_id, merged)
+
+def parse_tags(tags: Union[str, List[str], None]) -> List[str]:
+    """
+    Normalise tags given as a comma-separated string or a list.
+
+    Tags are stripped and lower-cased; empty and duplicate entries are dropped
+    while the original order is kept.
+    """
+    if not tags:
+        return []
+    items = tags.split(",") if isinstance(tags, str) else tags
+    result = []
+    for item in items:
+        tag = str(item).strip().lower()
+        if tag and tag not in result:
+            result.append(tag)
+    return result
+
+def _tags_column(tags: Union[str, List[str], None]) -> Optional[str]:
+    """Comma-separated value stored in notes.tags for display and export."""
+    if tags is None or isinstance(tags, str):
+        return tags
+    return ",".join(parse_tags(tags))
+
+def _set_note_tags(c: sqlite3.Cursor, note_id: int, tags: Union[str, List[str], None]) -> None:
+    c.execute("DELETE FROM note_tags WHERE note_id = ?", (note_id,))
+    c.executemany("INSERT OR IGNORE INTO note_tags (tag, note_id) VALUES (?, ?)",
+                  [(tag, note_id) for tag in parse_tags(tags)])
+
+def encode_cursor(note: Dict) -> str:
+    """Build an opaque keyset cursor from the last note of a page."""
+    return f"{note['ts']}|{note['id']}"
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    """
+    Split a keyset cursor into (ts, id).
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    ts, _, note_id = cursor.rpartition("|")
+    if not ts:
+        raise ValueError("Invalid cursor")
+    return ts, int(note_id)
+
 # Add a note
-def add_note(kind: str, text: str, tags: Optional[str] = None) -> Dict:
+def add_note(kind: str, text: str, tags: Union[str, List[str], None] = None) -> Dict:
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
-    c.execute("INSERT INTO notes (kind, text, tags) VALUES (?, ?, ?)", (kind, text, tags))
-    note_id = c.lastrowid
+    note_id, dedup = _insert_note(c, kind, text, tags)
     conn.commit()
     conn.close()
-    return get_note(note_id)
+    note = get_note(note_id)
+    if dedup and note:
+        note["deduplicated"] = dedup
+    return note
+
+def add_notes(notes: List[Dict]) -> int:
+    """
+    Insert a batch of notes in a single transaction.
+
+    Near-duplicates are merged or skipped as for add_note.
+
+    Args:
+        notes: Dicts with kind, text and optional tags/ts
+
+    Returns:
+        int: Number of new notes written
+    """
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    written = 0
+    try:
+        for note in notes:
+            _, dedup = _insert_note(c, note["kind"], note["text"], note.get("tags"), note.get("ts"))
+            written += dedup is None
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        _reset_fp_index()  # Drop fingerprints of rolled-back rows
+        raise
+    finally:
+        conn.close()
+    return written
 
 def get_note(note_id: int) -> Optional[Dict]:
     conn = sqlite3.connect(DB_PATH)
@@ -58,11 +318,12 @@ def get_note(note_id: int) -> Optional[Dict]:
     row = c.fetchone()
     conn.close()
     if row:
-        return dict(zip(["id", "ts", "kind", "text", "tags"], row))
+        return dict(zip(_NOTE_COLUMNS, row))
     return None
 
 # Update a note
-def update_note(id: int, kind: Optional[str] = None, text: Optional[str] = None, tags: Optional[str] = None) -> Optional[Dict]:
+def update_note(id: int, kind: Optional[str] = None, text: Optional[str] = None,
+                tags: Union[str, List[str], None] = None) -> Optional[Dict]:
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
     fields = []
@@ -75,13 +336,22 @@ def update_note(id: int, kind: Optional[str] = None, text: Optional[str] = None,
         values.append(text)
     if tags is not None:
         fields.append("tags = ?")
-        values.append(tags)
+        values.append(_tags_column(tags))
     if not fields:
         conn.close()
         return None
     values.append(id)
     sql = f"UPDATE notes SET {', '.join(fields)} WHERE id = ?"
     c.execute(sql, tuple(values))
+    if tags is not None and c.rowcount:
+        _set_note_tags(c, id, tags)
+    if text is not None and c.rowcount:
+        c.execute("SELECT kind FROM notes WHERE id = ?", (id,))
+        if c.fetchone()[0] in MemoryDedupConfig.KINDS:
+            _store_fingerprint(c, id, simhash(text))
+        else:
+            c.execute("DELETE FROM note_fingerprints WHERE note_id = ?", (id,))
+            _fp_index.remove(id)
     conn.commit()
     conn.close()
     return get_note(id)
@@ -104,73 +374,447 @@ def stats() -> Dict:
     c.execute("SELECT COUNT(*) FROM notes")
     count = c.fetchone()[0]
     conn.close()
-    return {"count": count, "by_kind": by_kind}
+    with _fp_lock:
+        dedup = dict(_dedup_stats, mode=MemoryDedupConfig.MODE, indexed=len(_fp_index))
+    return {"count": count, "by_kind": by_kind, "dedup": dedup}
+
+def dedup_notes(dry_run: bool = False, vacuum: bool = False, kinds: Optional[List[str]] = None,
+                max_distance: Optional[int] = None) -> Dict:
+    """
+    One-off near-duplicate pass over existing notes.
+
+    Notes are visited oldest first; a note within max_distance of an earlier
+    note of the same kind is deleted and merged into the survivor by the
+    rule add_note uses: tags unioned, the newer text and timestamp kept.
+    Missing fingerprints (e.g. from bulk imports) are backfilled.
+
+    Args:
+        dry_run: Only report what would be removed
+        vacuum: Run VACUUM afterwards to return freed pages to the OS
+        kinds: Kinds to scan (defaults to MEMORY_DEDUP_KINDS)
+        max_distance: Hamming threshold (defaults to MEMORY_DEDUP_MAX_DISTANCE)
+
+    Returns:
+        dict: scanned, duplicates, bytes_reclaimed, db sizes before/after, elapsed_ms
+    """
+    start = time.perf_counter()
+    kinds = kinds or MemoryDedupConfig.KINDS
+    max_distance = MemoryDedupConfig.MAX_DISTANCE if max_distance is None else max_distance
+    if not isinstance(max_distance, int) or not 0 <= max_distance < BANDS:
+        raise ValueError(f"max_distance must be an integer from 0 to {BANDS - 1}")
+    db_bytes_before = os.path.getsize(DB_PATH)
+
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    placeholders = ", ".join("?" for _ in kinds)
+    c.execute(f"SELECT n.id, n.kind, n.text, n.tags, n.ts, f.simhash FROM notes n "
+              f"LEFT JOIN note_fingerprints f ON f.note_id = n.id "
+              f"WHERE n.kind IN ({placeholders}) ORDER BY n.id", tuple(kinds))
+
+    indexes: Dict[str, SimHashIndex] = {}
+    missing = []
+    duplicates = []
+    survivors: Dict[int, Dict] = {}
+    bytes_reclaimed = 0
+    scanned = 0
+    for note_id, kind, text, tags, ts, stored in c.fetchall():
+        scanned += 1
+        if stored is None:
+            fingerprint = simhash(text or "")
+            missing.append((note_id, to_signed(fingerprint)))
+        else:
+            fingerprint = to_unsigned(stored)
+        index = indexes.setdefault(kind, SimHashIndex())
+        match = index.find(fingerprint, max_distance)
+        if match is None:
+            index.add(note_id, fingerprint)
+            survivors[note_id] = {"text": text, "tags": parse_tags(tags), "ts": ts, "fingerprint": None}
+            continue
+        survivor = survivors[match[0]]
+        duplicates.append((note_id,))
+        survivor["tags"] = _merge_tags(survivor["tags"], tags)
+        survivor["changed"] = True
+        dropped = survivor["text"]
+        if _is_newer(ts, survivor["ts"]):
+            survivor.update(text=text, ts=ts, fingerprint=fingerprint)
+            index.add(match[0], fingerprint)
+        else:
+            dropped = text
+        bytes_reclaimed += len((dropped or "").encode("utf-8")) + len((tags or "").encode("utf-8"))
+
+    if not dry_run:
+        c.executemany("INSERT OR REPLACE INTO note_fingerprints (note_id, simhash) VALUES (?, ?)", missing)
+        for survivor_id, survivor in survivors.items():
+            if not survivor.get("changed"):
+                continue
+            c.execute("UPDATE notes SET text = ?, tags = ?, ts = ? WHERE id = ?",
+                      (survivor["text"], ",".join(survivor["tags"]) or None, survivor["ts"], survivor_id))
+            _set_note_tags(c, survivor_id, survivor["tags"])
+            if survivor["fingerprint"] is not None:
+                _store_fingerprint(c, survivor_id, survivor["fingerprint"])
+        c.executemany("DELETE FROM notes WHERE id = ?", duplicates)
+        conn.commit()
+        _reset_fp_index()
+        if vacuum:
+            conn.execute("VACUUM")
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    conn.close()
+
+    return {
+        "dry_run": dry_run,
+        "scanned": scanned,
+        "fingerprinted": len(missing),
+        "duplicates": len(duplicates),
+        "bytes_reclaimed": bytes_reclaimed,
+        "db_bytes_before": db_bytes_before,
+        "db_bytes_after": os.path.getsize(DB_PATH),
+        "freelist_bytes": freelist * page_size,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
+
+def _delete_in_batches(conn: sqlite3.Connection, select_sql: str, params: tuple, batch_size: int) -> int:
+    """Delete notes chosen by select_sql (ids, LIMIT ? appended) one short transaction at a time."""
+    deleted = 0
+    while True:
+        ids = [(row[0],) for row in conn.execute(f"{select_sql} LIMIT ?", params + (batch_size,))]
+        if not ids:
+            return deleted
+        conn.executemany("DELETE FROM notes WHERE id = ?", ids)
+        conn.commit()
+        deleted += len(ids)
+
+def expire_notes(ttl_days: Optional[Dict[str, int]] = None, max_per_kind: Optional[Dict[str, int]] = None,
+                 batch_size: int = 1000) -> Dict:
+    """
+    Apply per-kind retention rules.
+
+    Tags, FTS rows and fingerprints of removed notes are cleaned up by the
+    delete triggers.
+
+    Args:
+        ttl_days: Maximum age in days per kind; the '*' key covers unlisted kinds
+        max_per_kind: Maximum number of notes kept per kind (newest win)
+        batch_size: Notes deleted per transaction
+
+    Returns:
+        dict: Deleted note counts by kind ("expired" by age, "trimmed" by count)
+    """
+    ttl_days = ttl_days or {}
+    max_per_kind = max_per_kind or {}
+    conn = sqlite3.connect(DB_PATH)
+    kinds = [row[0] for row in conn.execute("SELECT DISTINCT kind FROM notes")]
+    expired: Dict[str, int] = {}
+    trimmed: Dict[str, int] = {}
+    for kind in kinds:
+        days = ttl_days.get(kind, ttl_days.get("*"))
+        if days and days > 0:
+            count = _delete_in_batches(
+                conn, "SELECT id FROM notes WHERE kind IS ? AND ts < datetime('now', ?)",
+                (kind, f"-{int(days)} days"), batch_size)
+            if count:
+                expired[kind] = count
+        limit = max_per_kind.get(kind, max_per_kind.get("*"))
+        if limit and limit > 0:
+            cutoff = conn.execute("SELECT ts, id FROM notes WHERE kind IS ? ORDER BY ts DESC, id DESC "
+                                  "LIMIT 1 OFFSET ?", (kind, int(limit) - 1)).fetchone()
+            if cutoff:
+                count = _delete_in_batches(
+                    conn, "SELECT id FROM notes WHERE kind IS ? AND (ts, id) < (?, ?)",
+                    (kind, cutoff[0], cutoff[1]), batch_size)
+                if count:
+                    trimmed[kind] = count
+    conn.close()
+    if expired or trimmed:
+        _reset_fp_index()
+    return {"expired": expired, "trimmed": trimmed}
 
 # Export notes
 def export_notes() -> List[Dict]:
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
     c.execute("SELECT id, ts, kind, text, tags FROM notes ORDER BY ts DESC")
-    notes = [dict(zip(["id", "ts", "kind", "text", "tags"], row)) for row in c.fetchall()]
+    notes = [dict(zip(_NOTE_COLUMNS, row)) for row in c.fetchall()]
     conn.close()
     return notes
 
 # Import notes (upsert by id if provided)
 def import_notes(notes: List[Dict]) -> Dict:
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    imported = 0
-    skipped = 0
-    for note in notes:
-        id_ = note.get("id")
-        kind = note.get("kind")
-        text = note.get("text")
-        tags = note.get("tags")
-        if not kind or not text:
-            skipped += 1
+    return import_notes_stream(notes)
+
+def iter_notes_payload(stream: BinaryIO, read_size: int = 1 << 16) -> Iterator[Dict]:
+    """
+    Incrementally parse notes from a JSON array or NDJSON byte stream.
+
+    Only one read buffer is held in memory, so arbitrarily large exports
+    can be restored without materialising the whole payload.
+
+    Args:
+        stream: File-like object yielding bytes (e.g. request.stream)
+        read_size: Bytes to read per chunk
+
+    Yields:
+        dict: One parsed note at a time
+
+    Raises:
+        ValueError: If the payload is not valid JSON/NDJSON
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buf = ""
+    pos = 0
+    eof = False
+    in_array = None
+
+    def fill() -> bool:
+        nonlocal buf, pos, eof
+        if eof:
+            return False
+        data = stream.read(read_size)
+        if not data:
+            eof = True
+            return False
+        # Drop the consumed prefix only when refilling to avoid quadratic copies
+        buf = buf[pos:] + (utf8.decode(data) if isinstance(data, bytes) else data)
+        pos = 0
+        return True
+
+    while True:
+        pos = _SEPARATOR_RE.match(buf, pos).end() if in_array else _SPACE_RE.match(buf, pos).end()
+        if pos >= len(buf):
+            if not fill():
+                break
+            continue
+        if in_array is None:
+            in_array = buf[pos] == "["
+            if in_array:
+                pos += 1
             continue
-        if id_:
-            c.execute("SELECT id FROM notes WHERE id = ?", (id_,))
-            if c.fetchone():
-                c.execute("UPDATE notes SET kind = ?, text = ?, tags = ? WHERE id = ?", (kind, text, tags, id_))
-            else:
-                c.execute("INSERT INTO notes (id, kind, text, tags) VALUES (?, ?, ?, ?)", (id_, kind, text, tags))
+        if in_array and buf[pos] == "]":
+            return
+        try:
+            obj, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError as e:
+            if fill():
+                continue
+            raise ValueError(f"Invalid import payload: {e.msg}") from e
+        pos = end
+        if isinstance(obj, list):
+            yield from obj
         else:
-            c.execute("INSERT INTO notes (kind, text, tags) VALUES (?, ?, ?)", (kind, text, tags))
-        imported += 1
-    conn.commit()
-    conn.close()
-    return {"imported": imported, "skipped": skipped}
+            yield obj
+
+    if in_array:
+        raise ValueError("Invalid import payload: unterminated JSON array")
+
+def iter_import_progress(notes: Iterable[Dict], chunk_size: int = IMPORT_CHUNK_SIZE) -> Iterator[Dict]:
+    """
+    Bulk upsert notes in chunked transactions, yielding progress per chunk.
+
+    Rows are written with INSERT ... ON CONFLICT(id) DO UPDATE via
+    executemany. Once an import outgrows its first chunk the FTS write
+    triggers are dropped and the index is rebuilt once at the end, instead
+    of being updated row by row. A marker row in notes_fts_dirty is written
+    with the trigger drop, so init_db rebuilds the index if the import never
+    finished.
+
+    Args:
+        notes: Iterable of note dicts (id, ts, kind, text and tags are used)
+        chunk_size: Rows per transaction
+
+    Yields:
+        dict: Progress after each chunk; the last item has done=True
+    """
+    start = time.perf_counter()
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    progress = {"imported": 0, "skipped": 0, "chunks": 0, "fts_deferred": False}
+
+    def snapshot(done: bool = False) -> Dict:
+        elapsed = time.perf_counter() - start
+        result = dict(progress)
+        result["elapsed_ms"] = round(elapsed * 1000, 1)
+        result["notes_per_sec"] = round(progress["imported"] / elapsed, 1) if elapsed > 0 else 0.0
+        result["done"] = done
+        return result
+
+    def flush(rows: List[list]) -> None:
+        # Assign ids up front so note_tags can be written in the same batch
+        c.execute("BEGIN IMMEDIATE")
+        next_id = c.execute(
+            "SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'notes'), 0), "
+            "COALESCE((SELECT MAX(id) FROM notes), 0))"
+        ).fetchone()[0]
+        for row in rows:
+            if row[0] is None:
+                next_id += 1
+                row[0] = next_id
+        c.executemany(
+            "INSERT INTO notes (id, ts, kind, text, tags) VALUES (?, COALESCE(?, CURRENT_TIMESTAMP), ?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET kind = excluded.kind, text = excluded.text, tags = excluded.tags",
+            [row[:5] for row in rows],
+        )
+        c.executemany("DELETE FROM note_tags WHERE note_id = ?", [(row[0],) for row in rows])
+        c.executemany("INSERT OR IGNORE INTO note_tags (tag, note_id) VALUES (?, ?)",
+                      [(tag, row[0]) for row in rows for tag in row[5]])
+        conn.commit()
+        progress["imported"] += len(rows)
+        progress["chunks"] += 1
+
+    try:
+        rows = []
+        for note in notes:
+            if not isinstance(note, dict) or not note.get("kind") or not note.get("text"):
+                progress["skipped"] += 1
+                continue
+            tags = note.get("tags")
+            rows.append([note.get("id") or None, note.get("ts"), note["kind"], note["text"],
+                         _tags_column(tags), parse_tags(tags)])
+            if len(rows) < chunk_size:
+                continue
+            if progress["chunks"] == 1 and not progress["fts_deferred"]:
+                # Past the first chunk: stop per-row FTS maintenance
+                c.execute("BEGIN IMMEDIATE")
+                c.execute("INSERT INTO notes_fts_dirty DEFAULT VALUES")
+                for name in _FTS_WRITE_TRIGGERS:
+                    c.execute(f"DROP TRIGGER IF EXISTS {name}")
+                conn.commit()
+                progress["fts_deferred"] = True
+            flush(rows)
+            rows = []
+            yield snapshot()
+        if rows:
+            flush(rows)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if progress["fts_deferred"]:
+            fts_start = time.perf_counter()
+            c.execute("BEGIN IMMEDIATE")
+            c.execute("INSERT INTO notes_fts(notes_fts) VALUES('rebuild')")
+            for ddl in _FTS_WRITE_TRIGGERS.values():
+                c.execute(ddl)
+            c.execute("DELETE FROM notes_fts_dirty")
+            conn.commit()
+            progress["fts_rebuild_ms"] = round((time.perf_counter() - fts_start) * 1000, 1)
+        conn.close()
+
+    yield snapshot(done=True)
+
+def import_notes_stream(notes: Iterable[Dict], chunk_size: int = IMPORT_CHUNK_SIZE) -> Dict:
+    """
+    Bulk upsert notes and return the final import summary.
+
+    Args:
+        notes: Iterable of note dicts, e.g. from iter_notes_payload
+        chunk_size: Rows per transaction
+
+    Returns:
+        dict: imported, skipped, chunks, elapsed_ms, notes_per_sec
+    """
+    result = {}
+    for result in iter_import_progress(notes, chunk_size):
+        pass
+    return result
 
 # Recent notes (pagination)
-def recent_notes(page: int = 1, page_size: int = 25) -> List[Dict]:
-    offset = (page - 1) * page_size
+def recent_notes(page: int = 1, page_size: int = 25, cursor: Optional[str] = None) -> List[Dict]:
+    """
+    List notes newest first.
+
+    Pass the cursor of the previous page (see encode_cursor) for keyset
+    pagination on (ts, id); page/OFFSET is kept for older clients.
+    """
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
-    c.execute("SELECT id, ts, kind, text, tags FROM notes ORDER BY ts DESC LIMIT ? OFFSET ?", (page_size, offset))
-    notes = [dict(zip(["id", "ts", "kind", "text", "tags"], row)) for row in c.fetchall()]
+    if cursor:
+        ts, note_id = decode_cursor(cursor)
+        c.execute("SELECT id, ts, kind, text, tags FROM notes WHERE (ts, id) < (?, ?) "
+                  "ORDER BY ts DESC, id DESC LIMIT ?", (ts, note_id, page_size))
+    else:
+        offset = (page - 1) * page_size
+        c.execute("SELECT id, ts, kind, text, tags FROM notes ORDER BY ts DESC, id DESC LIMIT ? OFFSET ?",
+                  (page_size, offset))
+    notes = [dict(zip(_NOTE_COLUMNS, row)) for row in c.fetchall()]
     conn.close()
     return notes
 
 # Search notes
-def search_notes(q: str, kind: Optional[str] = None, tags: Optional[str] = None, page: int = 1, page_size: int = 25) -> List[Dict]:
-    offset = (page - 1) * page_size
+def search_notes(q: str, kind: Optional[str] = None, tags: Union[str, List[str], None] = None,
+                 page: int = 1, page_size: int = 25, tag_mode: str = "all",
+                 cursor: Optional[str] = None) -> List[Dict]:
+    """
+    Full-text search with exact tag filters.
+
+    Args:
+        q: FTS5 query; when empty only the kind/tag filters apply
+        kind: Restrict to one note kind
+        tags: Comma-separated string or list of tags
+        page: 1-based page for OFFSET pagination
+        page_size: Notes per page
+        tag_mode: "all" requires every tag, "any" requires at least one
+        cursor: Keyset cursor from the previous page (overrides page)
+    """
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
-    sql = "SELECT n.id, n.ts, n.kind, n.text, n.tags FROM notes n JOIN notes_fts fts ON n.id = fts.rowid WHERE fts.text MATCH ?"
-    params = [q]
+    sql = "SELECT n.id, n.ts, n.kind, n.text, n.tags FROM notes n"
+    where = []
+    params = []
+    if q:
+        sql += " JOIN notes_fts fts ON n.id = fts.rowid"
+        where.append("fts.text MATCH ?")
+        params.append(q)
     if kind:
-        sql += " AND n.kind = ?"
+        where.append("n.kind = ?")
         params.append(kind)
-    if tags:
-        sql += " AND n.tags LIKE ?"
-        params.append(f"%{tags}%")
-    sql += " ORDER BY n.ts DESC LIMIT ? OFFSET ?"
-    params.extend([page_size, offset])
+    tag_list = parse_tags(tags)
+    if tag_list:
+        placeholders = ", ".join("?" for _ in tag_list)
+        if tag_mode == "any":
+            where.append(f"n.id IN (SELECT note_id FROM note_tags WHERE tag IN ({placeholders}))")
+            params.extend(tag_list)
+        else:
+            where.append(f"n.id IN (SELECT note_id FROM note_tags WHERE tag IN ({placeholders}) "
+                         f"GROUP BY note_id HAVING COUNT(*) = ?)")
+            params.extend(tag_list)
+            params.append(len(tag_list))
+    if cursor:
+        ts, note_id = decode_cursor(cursor)
+        where.append("(n.ts, n.id) < (?, ?)")
+        params.extend([ts, note_id])
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY n.ts DESC, n.id DESC LIMIT ?"
+    params.append(page_size)
+    if not cursor:
+        sql += " OFFSET ?"
+        params.append((page - 1) * page_size)
     c.execute(sql, tuple(params))
-    notes = [dict(zip(["id", "ts", "kind", "text", "tags"], row)) for row in c.fetchall()]
+    notes = [dict(zip(_NOTE_COLUMNS, row)) for row in c.fetchall()]
     conn.close()
     return notes
 
-# Call init_db on import
-init_db()
+def list_tags(limit: int = 100, prefix: Optional[str] = None) -> List[Dict]:
+    """
+    Get tag facet counts from the maintained tag_counts aggregate.
+
+    Args:
+        limit: Maximum number of tags
+        prefix: Only tags starting with this prefix
+
+    Returns:
+        list: {"tag", "count"} dicts, most used first
+    """
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    if prefix:
+        prefix = prefix.lower()
+        c.execute("SELECT tag, count FROM tag_counts WHERE substr(tag, 1, ?) = ? ORDER BY count DESC, tag LIMIT ?",
+                  (len(prefix), prefix, limit))
+    else:
+        c.execute("SELECT tag, count FROM tag_counts ORDER BY count DESC, tag LIMIT ?", (limit,))
+    tags = [{"tag": row[0], "count": row[1]} for row in c.fetchall()]
+    conn.close()
+    return tags
+
@@ -0,0 +1,268 @@
+"""
+Write-behind buffer for auto-saved memory notes.
+
+Request handlers enqueue transcripts and return immediately; a background
+thread batches queued notes into one transaction per flush. The queue is
+bounded: on overflow notes are either dropped or spilled to an NDJSON file
+that is replayed on the next flush (and on the next start). Remaining notes
+are flushed at interpreter shutdown.
+"""
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Union
+
+from backend.config import MemoryWriteBehindConfig
+from backend.services import memory_service as mem
+
+logger = logging.getLogger(__name__)
+
+SPILL_PREFIX = "memory_spill"
+
+
+def _spill_owner(path: str) -> int:
+    """PID encoded in a spill file name (memory_spill.<pid>.ndjson)."""
+    try:
+        return int(os.path.basename(path).split(".")[1])
+    except (IndexError, ValueError):
+        return 0
+
+
+def _pid_alive(pid: int) -> bool:
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class NoteWriteBehind:
+    """Bounded, batching background writer for memory notes."""
+
+    def __init__(self, max_queue: int = MemoryWriteBehindConfig.MAX_QUEUE,
+                 batch_size: int = MemoryWriteBehindConfig.BATCH_SIZE,
+                 flush_interval: float = MemoryWriteBehindConfig.FLUSH_INTERVAL,
+                 overflow: str = MemoryWriteBehindConfig.OVERFLOW,
+                 spill_dir: str = MemoryWriteBehindConfig.SPILL_DIR):
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.spill_dir = spill_dir
+        self.spill_path = os.path.join(spill_dir, f"{SPILL_PREFIX}.{os.getpid()}.ndjson")
+
+        self._queue: deque = deque()
+        self._cond = threading.Condition()
+        self._spill_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+
+        self._flush_ms: deque = deque(maxlen=100)
+        self._stats = {
+            "enqueued": 0,
+            "written": 0,
+            "flushes": 0,
+            "dropped": 0,
+            "spilled": 0,
+            "replayed": 0,
+            "errors": 0,
+            "max_depth": 0,
+        }
+
+    def start(self) -> None:
+        """Start the flush thread (idempotent)."""
+        with self._cond:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="memory-write-behind", daemon=True)
+            self._thread.start()
+        logger.info(f"[MEMORY_QUEUE] Write-behind started (max={self.max_queue}, batch={self.batch_size})")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop the flush thread and persist everything still queued."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+        # Drain in the caller's thread; anything that cannot be written is spilled
+        while self._queue:
+            self._flush_once()
+
+    def enqueue(self, kind: str, text: str, tags: Union[str, List[str], None] = None) -> bool:
+        """
+        Queue a note for the next flush.
+
+        Returns:
+            bool: False if the note was dropped because the queue was full
+        """
+        note = {
+            "kind": kind,
+            "text": text,
+            "tags": tags,
+            "ts": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        with self._cond:
+            self._stats["enqueued"] += 1
+            full = len(self._queue) >= self.max_queue
+            if not full:
+                self._queue.append(note)
+                depth = len(self._queue)
+                self._stats["max_depth"] = max(self._stats["max_depth"], depth)
+                if depth >= self.batch_size:
+                    self._cond.notify()
+        if not full:
+            return True
+        if self.overflow == "spill":
+            self._spill([note])
+            return True
+        with self._cond:
+            self._stats["dropped"] += 1
+        logger.warning("[MEMORY_QUEUE] Queue full, dropped note")
+        return False
+
+    def _run(self) -> None:
+        self._replay_spill_files(all_pids=True)
+        while True:
+            with self._cond:
+                if not self._stopping and len(self._queue) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                if self._stopping:
+                    return
+            while self._flush_once() == self.batch_size:
+                pass
+            self._replay_spill_files()
+
+    def _flush_once(self) -> int:
+        """Write one batch (spilling it on failure); returns the batch size."""
+        with self._cond:
+            batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+        if not batch:
+            return 0
+        start = time.perf_counter()
+        try:
+            mem.add_notes(batch)
+        except Exception as e:
+            with self._cond:
+                self._stats["errors"] += 1
+            logger.error(f"[MEMORY_QUEUE] Flush of {len(batch)} notes failed, spilling: {e}")
+            self._spill(batch)
+            return 0
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._cond:
+            self._stats["written"] += len(batch)
+            self._stats["flushes"] += 1
+            self._flush_ms.append(elapsed_ms)
+        return len(batch)
+
+    def _spill(self, notes: List[Dict]) -> None:
+        try:
+            with self._spill_lock, open(self.spill_path, "a", encoding="utf-8") as f:
+                for note in notes:
+                    f.write(json.dumps(note) + "\n")
+            with self._cond:
+                self._stats["spilled"] += len(notes)
+        except OSError as e:
+            with self._cond:
+                self._stats["dropped"] += len(notes)
+            logger.error(f"[MEMORY_QUEUE] Spill to {self.spill_path} failed, dropped {len(notes)} notes: {e}")
+
+    def _replay_spill_files(self, all_pids: bool = False) -> None:
+        """
+        Load spilled notes back into the database while the queue has room.
+
+        With all_pids, files left behind by processes that are no longer
+        running are picked up as well.
+        """
+        with self._cond:
+            if len(self._queue) >= self.max_queue // 2:
+                return
+        pattern = f"{SPILL_PREFIX}.*.ndjson" if all_pids else os.path.basename(self.spill_path)
+        for path in glob.glob(os.path.join(self.spill_dir, pattern)):
+            if path != self.spill_path and _pid_alive(_spill_owner(path)):
+                continue
+            claimed = f"{path}.replaying.{os.getpid()}"
+            try:
+                with self._spill_lock:
+                    os.rename(path, claimed)
+            except OSError:
+                continue  # Another worker claimed it first
+            try:
+                with open(claimed, "r", encoding="utf-8") as f:
+                    result = mem.import_notes_stream(mem.iter_notes_payload(f))
+                os.remove(claimed)
+                with self._cond:
+                    self._stats["replayed"] += result.get("imported", 0)
+                logger.info(f"[MEMORY_QUEUE] Replayed {result.get('imported', 0)} spilled notes")
+            except Exception as e:
+                failed = f"{path}.failed.{int(time.time())}"
+                os.rename(claimed, failed)
+                logger.error(f"[MEMORY_QUEUE] Replay of {path} failed, kept as {failed}: {e}")
+
+    def get_stats(self) -> Dict:
+        """Queue depth, counters and flush latency percentiles."""
+        with self._cond:
+            result = dict(self._stats)
+            result["depth"] = len(self._queue)
+            samples = sorted(self._flush_ms)
+        result["max_queue"] = self.max_queue
+        result["overflow"] = self.overflow
+        result["running"] = bool(self._thread and self._thread.is_alive())
+        result["flush_ms"] = {
+            "last": round(self._flush_ms[-1], 2) if self._flush_ms else None,
+            "p50": round(samples[len(samples) // 2], 2) if samples else None,
+            "p95": round(samples[min(int(len(samples) * 0.95), len(samples) - 1)], 2) if samples else None,
+        }
+        try:
+            result["spill_bytes"] = os.path.getsize(self.spill_path)
+        except OSError:
+            result["spill_bytes"] = 0
+        return result
+
+
+# Global writer instance
+_note_writer: Optional[NoteWriteBehind] = None
+_note_writer_lock = threading.Lock()
+
+
+def get_note_writer() -> NoteWriteBehind:
+    """Get or create (and start) the global write-behind instance."""
+    global _note_writer
+    with _note_writer_lock:
+        if _note_writer is None:
+            _note_writer = NoteWriteBehind()
+            _note_writer.start()
+            atexit.register(_note_writer.stop)
+    return _note_writer
+
+
+def enqueue_note(kind: str, text: str, tags: Union[str, List[str], None] = None) -> bool:
+    """
+    Save a note off the request path when write-behind is enabled.
+
+    Falls back to a synchronous add_note when MEMORY_WRITE_BEHIND is off.
+    """
+    if not MemoryWriteBehindConfig.ENABLED:
+        mem.add_note(kind, text, tags)
+        return True
+    return get_note_writer().enqueue(kind, text, tags)
+
+
+def get_queue_stats() -> Dict:
+    """Stats for the write-behind queue, or a disabled marker."""
+    if not MemoryWriteBehindConfig.ENABLED:
+        return {"enabled": False}
+    stats = get_note_writer().get_stats()
+    stats["enabled"] = True
+    return stats
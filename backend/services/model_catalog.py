@@ -0,0 +1,208 @@
+"""
+Cached Ollama model catalog with stale-while-revalidate.
+
+A background thread fetches /api/tags from every configured host
+(OLLAMA_HOSTS) every REFRESH_INTERVAL seconds and publishes one merged,
+immutable snapshot. Readers get the last good snapshot immediately; an old
+snapshot schedules a refresh instead of making the caller wait, and a host
+that fails keeps its last good model list (marked unreachable).
+
+Pulls, deletes and model switches call invalidate(), which bumps a
+generation counter in the shared metrics segment so every worker refreshes,
+not just the one that handled the request.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional
+
+import requests
+
+from backend.config import ModelCatalogConfig
+from backend.services.shared_metrics import get_shared_metrics
+
+logger = logging.getLogger(__name__)
+
+
+def _summarise(model: Dict) -> Dict:
+    details = model.get("details") or {}
+    return {
+        "name": model.get("name") or model.get("model", ""),
+        "family": details.get("family", ""),
+        "parameter_size": details.get("parameter_size", ""),
+        "quantization": details.get("quantization_level", ""),
+        "size": model.get("size", 0),
+        "digest": model.get("digest", ""),
+        "modified_at": model.get("modified_at", ""),
+    }
+
+
+class ModelCatalog:
+    """Merged, periodically refreshed view of the models on every Ollama host."""
+
+    def __init__(self, hosts: Optional[List[str]] = None,
+                 refresh_interval: float = ModelCatalogConfig.REFRESH_INTERVAL,
+                 timeout: float = ModelCatalogConfig.TIMEOUT):
+        self.hosts = hosts or ModelCatalogConfig.HOSTS
+        self.refresh_interval = refresh_interval
+        self.timeout = timeout
+        self._hosts: Dict[str, Dict] = {
+            host: {"base": host, "ok": False, "error": None, "models": [], "fetched_at": None, "latency_ms": None}
+            for host in self.hosts
+        }
+        self._snapshot: Mapping = MappingProxyType({"models": [], "hosts": [], "fetched_at": None,
+                                                          "refreshed_at": None})
+        self._refresh_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._generation = 0
+        self._stats = {"refreshes": 0, "failures": 0, "served": 0, "served_stale": 0, "invalidations": 0}
+
+    # -- refresh ------------------------------------------------------------
+
+    def _fetch_host(self, host: str) -> Dict:
+        state = dict(self._hosts[host])
+        start = time.perf_counter()
+        try:
+            response = requests.get(f"{host}/api/tags", timeout=self.timeout)
+            response.raise_for_status()
+            state.update(ok=True, error=None, fetched_at=time.time(),
+                         models=[_summarise(m) for m in response.json().get("models", [])])
+        except Exception as e:
+            # Keep the last good model list; only reachability changes
+            state.update(ok=False, error=str(e))
+        state["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return state
+
+    def refresh(self) -> Mapping:
+        """Fetch every host now and publish a new snapshot (one refresh at a time)."""
+        with self._refresh_lock:
+            generation = self._shared_generation()
+            if len(self.hosts) == 1:
+                results = [self._fetch_host(self.hosts[0])]
+            else:
+                with ThreadPoolExecutor(max_workers=len(self.hosts)) as pool:
+                    results = list(pool.map(self._fetch_host, self.hosts))
+            for state in results:
+                self._hosts[state["base"]] = state
+            self._stats["refreshes"] += 1
+            self._stats["failures"] += sum(1 for s in results if not s["ok"])
+            self._generation = generation
+            self._snapshot = self._merge()
+            logger.info(f"[CATALOG] Refreshed: {len(self._snapshot['models'])} models from "
+                        f"{sum(1 for s in results if s['ok'])}/{len(results)} hosts")
+        return self._snapshot
+
+    def _merge(self) -> Mapping:
+        models: Dict[str, Dict] = {}
+        for state in self._hosts.values():
+            for model in state["models"]:
+                entry = models.setdefault(model["name"], dict(model, hosts=[]))
+                entry["hosts"].append(state["base"])
+        fetched = [s["fetched_at"] for s in self._hosts.values() if s["fetched_at"]]
+        return MappingProxyType({
+            "models": sorted(models.values(), key=lambda m: m["name"]),
+            "hosts": [{k: v for k, v in s.items() if k != "models"} for s in self._hosts.values()],
+            # Age of the oldest host data that is being served
+            "fetched_at": min(fetched) if fetched else None,
+            "refreshed_at": time.time(),
+        })
+
+    def _shared_generation(self) -> int:
+        try:
+            return get_shared_metrics().read(recent=0)["catalog_generation"]
+        except Exception:
+            return self._generation
+
+    # -- background thread --------------------------------------------------
+
+    def start(self) -> None:
+        """Start the refresh thread (idempotent); the first refresh runs in it."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="model-catalog", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning(f"[CATALOG] Refresh failed: {e}")
+            self._wake.wait(self.refresh_interval)
+            self._wake.clear()
+
+    def revalidate(self) -> None:
+        """Ask the background thread to refresh now without waiting for it."""
+        self.start()
+        self._wake.set()
+
+    def invalidate(self, reason: str = "") -> None:
+        """Mark the catalog out of date in every worker (pull, delete, model switch)."""
+        self._stats["invalidations"] += 1
+        try:
+            get_shared_metrics().add("catalog_generation")
+        except Exception as e:
+            logger.warning(f"[CATALOG] Could not publish invalidation: {e}")
+        logger.info(f"[CATALOG] Invalidated{f' ({reason})' if reason else ''}")
+        self.revalidate()
+
+    # -- reads --------------------------------------------------------------
+
+    def snapshot(self, wait: float = 0.0) -> Dict:
+        """
+        The current catalog, returned without waiting on Ollama.
+
+        Schedules a background refresh when the snapshot is older than
+        REFRESH_INTERVAL or another worker invalidated it. Only before the
+        first refresh completes does the caller wait, for at most ``wait``
+        seconds.
+
+        Returns:
+            dict: models (merged, each with its hosts), hosts (reachability,
+            error, latency), fetched_at, age and stale
+        """
+        snapshot = self._snapshot
+        if snapshot["refreshed_at"] is None and wait > 0:
+            self.revalidate()
+            deadline = time.monotonic() + wait
+            while self._snapshot["refreshed_at"] is None and time.monotonic() < deadline:
+                time.sleep(0.02)
+            snapshot = self._snapshot
+        refreshed = snapshot["refreshed_at"]
+        if (refreshed is None or time.time() - refreshed >= self.refresh_interval
+                or self._shared_generation() != self._generation):
+            self.revalidate()
+        fetched = snapshot["fetched_at"]
+        age = round(time.time() - fetched, 1) if fetched else None
+        stale = age is None or age >= ModelCatalogConfig.STALE_AFTER
+        self._stats["served"] += 1
+        self._stats["served_stale"] += int(stale)
+        return dict(snapshot, age=age, stale=stale)
+
+    def model_names(self, wait: float = 0.0) -> List[str]:
+        return [m["name"] for m in self.snapshot(wait)["models"]]
+
+    def reachable(self, wait: float = 0.0) -> bool:
+        """Whether any host answered the last refresh."""
+        return any(h["ok"] for h in self.snapshot(wait)["hosts"])
+
+    def get_stats(self) -> Dict:
+        return dict(self._stats, generation=self._generation, hosts=len(self.hosts))
+
+
+# Global catalog instance
+_catalog: Optional[ModelCatalog] = None
+_catalog_lock = threading.Lock()
+
+
+def get_model_catalog() -> ModelCatalog:
+    """Get or create (and start) the global model catalog."""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = ModelCatalog()
+            _catalog.start()
+    return _catalog
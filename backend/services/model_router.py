@@ -0,0 +1,151 @@
+"""
+Task-based model routing.
+
+Every generation is tagged with a task (chat, code, title, summary,
+memory_tagging, health_probe) and the routing table picks the model and
+default options for it, so short auxiliary work like a five-word title runs
+on a small, fast model instead of queueing behind the chat model.
+
+Resolution order for the model:
+
+    request   the caller named a model explicitly
+    settings  the "model_routes" user setting (from the settings store)
+    policy    ModelRoutingConfig.ROUTES (MODEL_ROUTES env merged over the defaults)
+    default   the active model, for unknown tasks or a null model
+
+The active model is the target of the last completed model switch, or
+OLLAMA_MODEL. A routed model the catalog does not list as installed, or
+any routed model while the catalog is empty, falls back to it.
+The user's "temperature" setting, when the user has set it, is the chat
+task's default temperature. The effective table is rebuilt only when the
+settings store reloads (its generation changes), so resolving a route
+costs a few dict lookups. Decisions are counted per task
+and model for the metrics endpoint.
+"""
+import logging
+import threading
+from collections import deque
+from typing import Dict, NamedTuple, Optional
+
+from backend.config import ModelRoutingConfig, OllamaConfig
+from backend.services.model_catalog import get_model_catalog
+from backend.services.settings_store import SettingsStore, get_settings_store
+
+logger = logging.getLogger(__name__)
+
+
+class Route(NamedTuple):
+    task: str
+    model: str
+    options: Dict
+    source: str
+
+
+def task_for_route(route: Optional[str]) -> str:
+    """The task for a ledger route label (unknown labels are chat)."""
+    return ModelRoutingConfig.ROUTE_TASKS.get(route, route if route in ModelRoutingConfig.ROUTES else "chat")
+
+
+def _installed(model: str, names) -> bool:
+    return model in names or f"{model}:latest" in names
+
+
+class ModelRouter:
+    """Resolves a task to a model and options and keeps decision counts."""
+
+    def __init__(self, routes: Optional[Dict[str, Dict]] = None, store: Optional[SettingsStore] = None):
+        self.routes = routes if routes is not None else ModelRoutingConfig.ROUTES
+        self._store = store
+        self._table: Optional[Dict[str, Dict]] = None
+        self._table_generation: Optional[int] = None
+        self._lock = threading.Lock()
+        self._counts: Dict[str, Dict[str, int]] = {}
+        self._fallbacks = 0
+        self.decisions: deque = deque(maxlen=50)
+
+    @property
+    def store(self) -> SettingsStore:
+        return self._store or get_settings_store()
+
+    def overrides(self) -> Dict[str, Dict]:
+        """The "model_routes" user setting."""
+        return self.store.get("model_routes") or {}
+
+    def table(self) -> Dict[str, Dict]:
+        """The effective routing table (policy with settings overrides applied)."""
+        generation = self.store.generation
+        if self._table is not None and self._table_generation == generation:
+            return self._table
+        table = {task: dict(entry, source="policy") for task, entry in self.routes.items()}
+        # The settings default (0.7) is not a user choice; only an explicit setting changes generations
+        temperature = self.store.get("temperature") if self.store.is_set("temperature") else None
+        if "chat" in table and temperature is not None and "temperature" not in (table["chat"].get("options") or {}):
+            table["chat"]["options"] = dict(table["chat"].get("options") or {}, temperature=temperature)
+        for task, entry in self.overrides().items():
+            merged = dict(table.get(task, {"model": None, "options": {}}))
+            if entry.get("model"):
+                merged["model"] = entry["model"]
+            merged["options"] = dict(merged.get("options") or {}, **(entry.get("options") or {}))
+            merged["source"] = "settings"
+            table[task] = merged
+        self._table, self._table_generation = table, generation
+        return table
+
+    def resolve(self, task: str, model: Optional[str] = None) -> Route:
+        """
+        Pick the model and default options for a task.
+
+        Args:
+            task: Task name (see ModelRoutingConfig.ROUTES)
+            model: A model the caller asked for explicitly; it always wins
+
+        Returns:
+            Route: task, model, options (defaults the caller's options override) and source
+        """
+        entry = self.table().get(task)
+        options = dict((entry or {}).get("options") or {})
+        default = self.store.get("active_model") or OllamaConfig.MODEL
+        if model:
+            source = "request"
+        elif entry and entry.get("model"):
+            model, source = entry["model"], entry["source"]
+            names = get_model_catalog().model_names()
+            if not names or not _installed(model, names):
+                # An empty catalog (Ollama unreachable or not listed yet) cannot vouch for the routed model
+                reason = "is not installed" if names else "is unknown (empty catalog)"
+                logger.info(f"[ROUTING] {task}: {model} {reason}, using {default}")
+                model, source = default, "fallback"
+        else:
+            model, source = default, "default"
+        self._count(task, model, source)
+        return Route(task, model, options, source)
+
+    def _count(self, task: str, model: str, source: str) -> None:
+        with self._lock:
+            by_model = self._counts.setdefault(task, {})
+            by_model[model] = by_model.get(model, 0) + 1
+            self._fallbacks += int(source == "fallback")
+            self.decisions.append({"task": task, "model": model, "source": source})
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                "decisions": sum(sum(m.values()) for m in self._counts.values()),
+                "fallbacks": self._fallbacks,
+                "by_task": {task: dict(models) for task, models in self._counts.items()},
+                "recent": list(self.decisions)[-10:],
+            }
+
+
+# Global router instance
+_router: Optional[ModelRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_model_router() -> ModelRouter:
+    """Get or create the global model router."""
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = ModelRouter()
+    return _router
@@ -0,0 +1,246 @@
+"""
+Zero-downtime switch of the active model.
+
+A switch runs in the background: the new model is pulled if it is missing,
+loaded and warmed with a one-token generation using the options real chat
+requests send (a different num_gpu or num_ctx would make Ollama reload it).
+Every worker keeps serving the old model until then. Only when the new model
+has answered is the active model flipped, with one settings store write
+("active_model"), which every worker picks up on its next lookup. The
+previous model is unloaded after a grace period unless a routed task still
+uses it.
+
+One switch runs at a time across workers (an flock held by the switching
+thread). Its state and timeline are kept in a JSON file, so any worker can
+report them, and a switch whose worker exited shows as failed.
+"""
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Dict, Optional
+
+import requests
+
+from backend.config import ModelSwitchConfig, OllamaConfig, ThermalGovernorConfig
+from backend.services.model_catalog import get_model_catalog
+from backend.services.settings_store import get_settings_store
+
+logger = logging.getLogger(__name__)
+
+PENDING, PULLING, LOADING, WARMING, ACTIVE, FAILED = "pending", "pulling", "loading", "warming", "active", "failed"
+RUNNING = (PENDING, PULLING, LOADING, WARMING)
+
+
+class SwitchInProgress(Exception):
+    """Another switch is already running."""
+
+
+def get_active_model() -> str:
+    """The model every worker serves: the last completed switch, else ACTIVE_MODEL."""
+    model = get_settings_store().get("active_model")
+    if model:
+        return model
+    from flask import current_app, has_app_context
+    return current_app.config['ACTIVE_MODEL'] if has_app_context() else os.getenv('ACTIVE_MODEL', 'phi3:mini')
+
+
+class ModelSwitcher:
+    """Runs switches for this worker and reports the latest one from the shared state file."""
+
+    def __init__(self, base_url: Optional[str] = None, lock_dir: Optional[str] = None, cfg=ModelSwitchConfig):
+        self.base_url = (base_url or OllamaConfig.BASE_URL).rstrip("/")
+        self.cfg = cfg
+        directory = lock_dir or ThermalGovernorConfig.LOCK_DIR
+        self._state_path = os.path.join(directory, "model_switch.json")
+        self._lock_path = os.path.join(directory, ".model_switch.lock")
+        os.makedirs(directory, exist_ok=True)
+
+    # -- state --------------------------------------------------------------
+
+    def _read(self) -> Optional[Dict]:
+        try:
+            with open(self._state_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, switch: Dict) -> None:
+        tmp = f"{self._state_path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(switch, f)
+        os.replace(tmp, self._state_path)
+
+    def _stage(self, switch: Dict, status: str, **details) -> None:
+        """Move to a stage and record it on the timeline."""
+        now = time.time()
+        switch["status"] = status
+        switch["timeline"].append(dict(details, stage=status, at=now,
+                                       elapsed_ms=round((now - switch["started_at"]) * 1000, 1)))
+        self._write(switch)
+
+    def _try_lock(self) -> Optional[int]:
+        fd = os.open(self._lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        return fd
+
+    # -- public API ---------------------------------------------------------
+
+    def status(self) -> Dict:
+        """The active model and the latest switch (failed if its worker exited mid-switch)."""
+        switch = self._read()
+        if switch and switch["status"] in RUNNING:
+            fd = self._try_lock()
+            if fd is not None:
+                try:
+                    switch = self._read()
+                    if switch and switch["status"] in RUNNING:
+                        switch["error"] = "Worker exited during the switch"
+                        self._stage(switch, FAILED)
+                finally:
+                    os.close(fd)
+        return {"active_model": get_active_model(), "switch": switch}
+
+    def start(self, model: str) -> Dict:
+        """
+        Start switching to a model in the background.
+
+        Returns:
+            dict: The new switch, or the running one if it targets the same model
+
+        Raises:
+            SwitchInProgress: A switch to another model is running
+        """
+        fd = self._try_lock()
+        if fd is None:
+            current = self._read() or {}
+            if current.get("model") == model:
+                return dict(current, deduplicated=True)
+            raise SwitchInProgress(f"Already switching to {current.get('model')}")
+        switch = {
+            "id": uuid.uuid4().hex[:12],
+            "model": model,
+            "previous": get_active_model(),
+            "owner": os.getpid(),
+            "status": None,
+            "error": None,
+            "started_at": time.time(),
+            "finished_at": None,
+            "timeline": [],
+        }
+        try:
+            self._stage(switch, PENDING)
+        except Exception:
+            os.close(fd)
+            raise
+        logger.info(f"[SWITCH] {switch['previous']} -> {model} (switch {switch['id']})")
+        threading.Thread(target=self._run, args=(switch, fd), name="model-switch", daemon=True).start()
+        return dict(switch, deduplicated=False)
+
+    # -- runner -------------------------------------------------------------
+
+    def _run(self, switch: Dict, fd: int) -> None:
+        try:
+            self._switch(switch)
+        except Exception as e:
+            logger.error(f"[SWITCH] {switch['model']} failed: {e}")
+            switch.update(error=str(e), finished_at=time.time())
+            self._stage(switch, FAILED)
+        finally:
+            os.close(fd)
+        if switch["status"] == ACTIVE and self.cfg.UNLOAD_PREVIOUS_AFTER >= 0:
+            time.sleep(self.cfg.UNLOAD_PREVIOUS_AFTER)
+            self._unload_previous(switch)
+
+    def _switch(self, switch: Dict) -> None:
+        from backend.services.model_router import get_model_router
+        from backend.services.thermal_governor import get_thermal_governor
+
+        model = switch["model"]
+        names = get_model_catalog().model_names(wait=OllamaConfig.TIMEOUT)
+        if model not in names and f"{model}:latest" not in names:
+            self._pull(switch)
+
+        options = dict({"num_gpu": OllamaConfig.NUM_GPU}, **get_model_router().resolve("chat", model).options)
+        # Loading is background work: it waits for a slot instead of competing with live chats
+        with get_thermal_governor().admit(background=True, timeout=self.cfg.LOAD_TIMEOUT):
+            self._stage(switch, LOADING)
+            response = requests.post(f"{self.base_url}/api/generate", json={"model": model, "options": options},
+                                     timeout=self.cfg.LOAD_TIMEOUT)
+            response.raise_for_status()
+            load = response.json().get("load_duration")
+            self._stage(switch, WARMING, load_ms=round(load / 1e6, 1) if load else None)
+            start = time.perf_counter()
+            response = requests.post(f"{self.base_url}/api/generate", json={
+                "model": model, "prompt": self.cfg.WARM_PROMPT, "stream": False,
+                "options": dict(options, num_predict=1),
+            }, timeout=self.cfg.LOAD_TIMEOUT)
+            response.raise_for_status()
+            warm_ms = round((time.perf_counter() - start) * 1000, 1)
+
+        # The flip: one settings write, seen by every worker on its next lookup
+        get_settings_store().update({"active_model": model})
+        switch["finished_at"] = time.time()
+        self._stage(switch, ACTIVE, warm_ms=warm_ms)
+        get_model_catalog().invalidate(f"switch {model}")
+        logger.info(f"[SWITCH] {model} active after {switch['timeline'][-1]['elapsed_ms']} ms")
+
+    def _pull(self, switch: Dict) -> None:
+        from backend.services.pull_manager import ACTIVE as PULL_ACTIVE, get_pull_manager
+
+        if self.cfg.PULL_TIMEOUT <= 0:
+            raise RuntimeError(f"{switch['model']} is not installed")
+        job = get_pull_manager().start(switch["model"])
+        self._stage(switch, PULLING, pull_job=job["id"])
+        deadline = time.monotonic() + self.cfg.PULL_TIMEOUT
+        while job and job["status"] in PULL_ACTIVE:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Pull of {switch['model']} did not finish in {self.cfg.PULL_TIMEOUT:g}s")
+            time.sleep(1)
+            job = get_pull_manager().get(job["id"])
+        if not job or job["status"] != "done":
+            raise RuntimeError(f"Pull of {switch['model']} {job['status'] if job else 'vanished'}"
+                               + (f": {job['error']}" if job and job.get("error") else ""))
+
+    def _unload_previous(self, switch: Dict) -> None:
+        """Unload the old model unless it is active again or a routed task still uses it."""
+        from backend.services.model_router import get_model_router
+
+        previous = switch["previous"]
+        in_use = {entry.get("model") for entry in get_model_router().table().values()}
+        if not previous or previous == get_active_model() or previous in in_use:
+            return
+        try:
+            requests.post(f"{self.base_url}/api/generate", json={"model": previous, "keep_alive": 0},
+                          timeout=10).raise_for_status()
+            logger.info(f"[SWITCH] Unloaded previous model {previous}")
+        except Exception as e:
+            logger.warning(f"[SWITCH] Could not unload {previous}: {e}")
+            return
+        current = self._read()
+        if current and current["id"] == switch["id"]:
+            now = time.time()
+            current["timeline"].append({"stage": "previous_unloaded", "model": previous, "at": now,
+                                        "elapsed_ms": round((now - current["started_at"]) * 1000, 1)})
+            self._write(current)
+
+
+# Global switcher instance
+_switcher: Optional[ModelSwitcher] = None
+_switcher_lock = threading.Lock()
+
+
+def get_model_switcher() -> ModelSwitcher:
+    """Get or create the global model switcher."""
+    global _switcher
+    with _switcher_lock:
+        if _switcher is None:
+            _switcher = ModelSwitcher()
+    return _switcher
@@ -0,0 +1,130 @@
+"""
+SimHash fingerprints and a banded lookup index for near-duplicate notes.
+
+A 64-bit SimHash is built from word 3-gram shingles. Fingerprints are split
+into four 16-bit bands; two fingerprints within Hamming distance 3 always
+share at least one band exactly, so candidates are found with four dict
+lookups instead of a scan.
+"""
+import hashlib
+import re
+import threading
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+BITS = 64
+BANDS = 4
+BAND_BITS = BITS // BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+
+_WORD_RE = re.compile(r"\w+")
+
+# _BIT_TABLES[b] maps a byte to 1 if bit b is set, letting bytes.translate()
+# count set bits per column in C instead of a Python loop per shingle
+_BIT_TABLES = [bytes(1 if value & (1 << bit) else 0 for value in range(256)) for bit in range(8)]
+
+
+def simhash(text: str, shingle_size: int = 3) -> int:
+    """
+    Compute an unsigned 64-bit SimHash of a text.
+
+    Args:
+        text: Text to fingerprint
+        shingle_size: Words per shingle
+
+    Returns:
+        int: Fingerprint in [0, 2**64)
+    """
+    words = _WORD_RE.findall(text.lower())
+    if not words:
+        return 0
+    shingles = [" ".join(words[i:i + shingle_size])
+                for i in range(max(len(words) - shingle_size + 1, 1))]
+    digests = b"".join(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest() for s in shingles)
+    half = len(shingles)
+    result = 0
+    for byte_index in range(8):
+        column = digests[byte_index::8]
+        for bit in range(8):
+            if 2 * column.translate(_BIT_TABLES[bit]).count(1) > half:
+                result |= 1 << (byte_index * 8 + bit)
+    return result
+
+
+def hamming(a: int, b: int) -> int:
+    """Number of differing bits between two fingerprints."""
+    return bin(a ^ b).count("1")
+
+
+def similarity(a: int, b: int) -> float:
+    """Fingerprint similarity in [0, 1] (1 - normalised Hamming distance)."""
+    return 1.0 - hamming(a, b) / BITS
+
+
+def to_signed(value: int) -> int:
+    """Map an unsigned 64-bit fingerprint onto SQLite's signed INTEGER."""
+    return value - (1 << BITS) if value >= 1 << (BITS - 1) else value
+
+
+def to_unsigned(value: int) -> int:
+    """Inverse of to_signed."""
+    return value & ((1 << BITS) - 1)
+
+
+class SimHashIndex:
+    """In-memory, thread-safe banded index of note fingerprints."""
+
+    def __init__(self):
+        self._fingerprints: Dict[int, int] = {}
+        self._bands = [dict() for _ in range(BANDS)]
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._fingerprints)
+
+    def add(self, note_id: int, fingerprint: int) -> None:
+        with self._lock:
+            self._remove(note_id)
+            self._fingerprints[note_id] = fingerprint
+            for band, table in enumerate(self._bands):
+                table.setdefault((fingerprint >> (band * BAND_BITS)) & BAND_MASK, set()).add(note_id)
+
+    def add_many(self, items: Iterable[Tuple[int, int]]) -> None:
+        for note_id, fingerprint in items:
+            self.add(note_id, fingerprint)
+
+    def remove(self, note_id: int) -> None:
+        with self._lock:
+            self._remove(note_id)
+
+    def _remove(self, note_id: int) -> None:
+        fingerprint = self._fingerprints.pop(note_id, None)
+        if fingerprint is None:
+            return
+        for band, table in enumerate(self._bands):
+            key = (fingerprint >> (band * BAND_BITS)) & BAND_MASK
+            ids: Optional[Set[int]] = table.get(key)
+            if ids is not None:
+                ids.discard(note_id)
+                if not ids:
+                    del table[key]
+
+    def find(self, fingerprint: int, max_distance: int = 3) -> Optional[Tuple[int, int]]:
+        """
+        Find the closest indexed note within max_distance.
+
+        Distances above BANDS - 1 may be missed, since candidates come
+        from exact band matches.
+
+        Returns:
+            tuple: (note_id, distance) of the best match, or None
+        """
+        with self._lock:
+            candidates: Set[int] = set()
+            for band, table in enumerate(self._bands):
+                candidates.update(table.get((fingerprint >> (band * BAND_BITS)) & BAND_MASK, ()))
+            best = None
+            for note_id in candidates:
+                distance = hamming(fingerprint, self._fingerprints[note_id])
+                if distance <= max_distance and (best is None or distance < best[1]):
+                    best = (note_id, distance)
+            return best
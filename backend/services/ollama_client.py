@@ -1,33 +1,41 @@
-import ollama
 from flask import current_app
+from backend.config import ModelCatalogConfig
+from backend.services.model_catalog import get_model_catalog
 
 
 def is_ollama_reachable():
-    try:
-        ollama.list()
-        return True
-    except:
-        return False
+    return get_model_catalog().reachable(wait=ModelCatalogConfig.TIMEOUT)
 
 
 def get_installed_models():
-    try:
-        models = ollama.list()
-        return [model['name'] for model in models.get('models', [])]
-    except:
-        return []
+    return get_model_catalog().model_names(wait=ModelCatalogConfig.TIMEOUT)
 
 
 def pull_model(model):
+    import ollama  # deferred: the client library costs ~300 ms to import at boot
     try:
         ollama.pull(model)
         return True
     except:
         return False
+    finally:
+        get_model_catalog().invalidate(f"pull {model}")
+
+
+def delete_model(model):
+    import ollama
+    try:
+        ollama.delete(model)
+        return True
+    except:
+        return False
+    finally:
+        get_model_catalog().invalidate(f"delete {model}")
 
 
-def chat_stream(model, messages):
+def chat_stream(model, messages, options=None):
+    import ollama
     try:
-        return ollama.chat(model=model, messages=messages, stream=True)
+        return ollama.chat(model=model, messages=messages, stream=True, options=options)
     except Exception as e:
         return iter([f"Error: {str(e)}"])
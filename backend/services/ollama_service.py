@@ -3,6 +3,11 @@ import time
 import logging
 from typing import Optional, Dict, Any
 from backend.config import OllamaConfig
+from backend.services.deadline import Deadline, backoff_delay, count, get_retry_budget
+from backend.services.inference_ledger import record_inference
+from backend.services.model_router import get_model_router, task_for_route
+from backend.services.prompt_builder import Prompt
+from backend.services.thermal_governor import AdmissionTimeout, BackgroundDeferred, get_thermal_governor
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -32,14 +37,16 @@ class OllamaService:
         self.session.mount('http://', adapter)
         self.session.mount('https://', adapter)
     
-    def _build_payload(self, prompt: str, **kwargs) -> Dict[str, Any]:
-        """Build the request payload for Ollama API."""
+    def _build_payload(self, prompt: str, task: str = "chat", **kwargs) -> Dict[str, Any]:
+        """Build the request payload for Ollama API (model and default options from the task's route)."""
+        routing = get_model_router().resolve(task, kwargs.pop('model', None))
         payload = {
-            "model": OllamaConfig.MODEL,
+            "model": routing.model,
             "prompt": prompt,
             "stream": False,
             "options": {
-                "num_gpu": OllamaConfig.NUM_GPU
+                "num_gpu": OllamaConfig.NUM_GPU,
+                **routing.options
             }
         }
         # Allow override of default parameters, merging options if provided
@@ -48,7 +55,7 @@ class OllamaService:
         payload.update(kwargs)
         return payload
     
-    def _make_request(self, payload: Dict[str, Any]) -> requests.Response:
+    def _make_request(self, payload: Dict[str, Any], timeout: float = OllamaConfig.TIMEOUT) -> requests.Response:
         """Make a single request to Ollama API using the session."""
         api_url = OllamaConfig.get_api_url()
         logger.info(f"Making request to: {api_url}")
@@ -58,7 +65,7 @@ class OllamaService:
             response = self.session.post(
                 api_url,
                 json=payload,
-                timeout=OllamaConfig.TIMEOUT
+                timeout=timeout
             )
             logger.info(f"Response status code: {response.status_code}")
             return response
@@ -74,12 +81,18 @@ class OllamaService:
             logger.error(f"Unexpected response format: {response_data}")
             raise ValueError("Unexpected response format from Ollama")
     
-    def send_prompt_with_retry(self, prompt: str, **kwargs) -> str:
+    def send_prompt_with_retry(self, prompt: str, route: str = "service", deadline: Optional[Deadline] = None,
+                               task: Optional[str] = None, built: Optional[Prompt] = None, **kwargs) -> str:
         """
         Send a prompt to Ollama API with retry logic.
         
         Args:
             prompt (str): The prompt to send to the LLM
+            route (str): Caller label for the inference ledger
+            task (str): Routing task (default: derived from route, see model_router)
+            built (Prompt): The prompt_builder Prompt the text came from, for prefix-reuse accounting
+            deadline (Deadline): Bounds admission, every attempt and backoff;
+                defaults to the client's timeout header or the route default
             **kwargs: Additional parameters for the Ollama API
             
         Returns:
@@ -88,19 +101,45 @@ class OllamaService:
         if not prompt or not prompt.strip():
             return "Error: Empty prompt provided."
         
-        payload = self._build_payload(prompt, **kwargs)
+        payload = self._build_payload(prompt, task or task_for_route(route), **kwargs)
+        deadline = deadline or Deadline.for_route(route)
         
+        # Thermal governor: thread/length limits while hot, and a generation slot
+        governor = get_thermal_governor()
+        background = governor.is_background(route)
+        payload['options'] = governor.apply_options(payload.get('options'), background=background)
+        try:
+            slot = governor.admit(background=background, timeout=deadline.timeout(governor.cfg.ADMIT_TIMEOUT))
+        except (AdmissionTimeout, BackgroundDeferred) as e:
+            logger.warning(f"[THERMAL] {route} request not admitted: {e}")
+            return f"Error: {e}"
+        
+        with slot:
+            return self._send_with_retry(payload, route, deadline, built)
+    
+    def _send_with_retry(self, payload: Dict[str, Any], route: str, deadline: Deadline,
+                         built: Optional[Prompt] = None) -> str:
+        """Retry loop for send_prompt_with_retry (runs while holding a generation slot)."""
+        get_retry_budget().record_request()
         for attempt in range(1, OllamaConfig.MAX_RETRIES + 1):
+            if deadline.expired:
+                # Admission used up the whole deadline
+                count("deadline_misses")
+                logger.warning(f"[DEADLINE] {route}: deadline passed before attempt {attempt} ({deadline})")
+                return "Error: Request deadline exceeded before Ollama could respond."
+            timeout = deadline.timeout(OllamaConfig.TIMEOUT)
             try:
-                logger.info(f"Attempt {attempt}/{OllamaConfig.MAX_RETRIES}: Sending prompt to Ollama")
+                logger.info(f"Attempt {attempt}/{OllamaConfig.MAX_RETRIES}: Sending prompt to Ollama "
+                            f"(timeout {timeout:.1f}s)")
                 logger.debug(f"API URL: {OllamaConfig.get_api_url()}")
                 logger.debug(f"Model: {OllamaConfig.MODEL}")
                 
-                response = self._make_request(payload)
+                response = self._make_request(payload, timeout=timeout)
                 response.raise_for_status()
                 
                 response_data = response.json()
                 generated_text = self._extract_response(response_data)
+                record_inference(route, payload.get("model"), response_data, prompt=built)
                 
                 logger.info(f"Successfully received response from Ollama (attempt {attempt})")
                 return generated_text
@@ -108,16 +147,12 @@ class OllamaService:
             except requests.exceptions.ConnectionError as e:
                 error_msg = f"Unable to connect to Ollama at {OllamaConfig.BASE_URL}. Is Ollama running?"
                 logger.warning(f"Attempt {attempt} failed: {error_msg}")
-                if attempt == OllamaConfig.MAX_RETRIES:
-                    logger.error(f"All {OllamaConfig.MAX_RETRIES} attempts failed: Connection error")
-                    return f"Error: {error_msg}"
+                result = f"Error: {error_msg}"
                 
             except requests.exceptions.Timeout as e:
                 error_msg = "Request to Ollama timed out. The model may be processing a complex prompt."
-                logger.warning(f"Attempt {attempt} failed: Timeout after {OllamaConfig.TIMEOUT}s")
-                if attempt == OllamaConfig.MAX_RETRIES:
-                    logger.error(f"All {OllamaConfig.MAX_RETRIES} attempts failed: Timeout")
-                    return f"Error: {error_msg}"
+                logger.warning(f"Attempt {attempt} failed: Timeout after {timeout:.1f}s")
+                result = f"Error: {error_msg}"
                 
             except requests.exceptions.HTTPError as e:
                 error_msg = f"HTTP error from Ollama API: {e.response.status_code}"
@@ -125,26 +160,35 @@ class OllamaService:
                 # Don't retry on 4xx errors (client errors)
                 if 400 <= e.response.status_code < 500:
                     return f"Error: {error_msg}"
-                if attempt == OllamaConfig.MAX_RETRIES:
-                    return f"Error: {error_msg}"
+                result = f"Error: {error_msg}"
                 
             except (ValueError, KeyError) as e:
                 error_msg = "Invalid JSON response from Ollama"
                 logger.error(f"Attempt {attempt} failed: {error_msg} - {str(e)}")
-                if attempt == OllamaConfig.MAX_RETRIES:
-                    return f"Error: {error_msg}."
+                result = f"Error: {error_msg}."
                 
             except Exception as e:
                 error_msg = f"Unexpected error: {str(e)}"
                 logger.error(f"Attempt {attempt} failed: {error_msg}")
-                if attempt == OllamaConfig.MAX_RETRIES:
-                    return "Error: Unable to get response from Ollama."
+                result = "Error: Unable to get response from Ollama."
+            
+            if attempt == OllamaConfig.MAX_RETRIES:
+                logger.error(f"All {OllamaConfig.MAX_RETRIES} attempts failed")
+                return result
             
-            # Wait before retrying (except on last attempt)
-            if attempt < OllamaConfig.MAX_RETRIES:
-                wait_time = OllamaConfig.RETRY_DELAY * attempt  # Exponential backoff
-                logger.info(f"Waiting {wait_time}s before retry...")
-                time.sleep(wait_time)
+            # Retry only if the backoff ends before the deadline and the budget allows it
+            wait_time = backoff_delay(attempt)
+            if wait_time >= deadline.remaining():
+                count("deadline_misses")
+                logger.warning(f"[DEADLINE] {route}: no time left to retry after attempt {attempt} ({deadline})")
+                return result
+            if not get_retry_budget().try_retry():
+                count("retry_budget_exhausted")
+                logger.warning(f"[DEADLINE] {route}: retry budget exhausted after attempt {attempt}")
+                return result
+            count("ollama_retries")
+            logger.info(f"Waiting {wait_time:.2f}s before retry...")
+            time.sleep(wait_time)
         
         return "Error: Unable to get response from Ollama after multiple attempts."
 
@@ -161,12 +205,13 @@ def get_ollama_service() -> OllamaService:
     return _ollama_service
 
 
-def send_prompt(prompt: str, **kwargs) -> str:
+def send_prompt(prompt: str, route: str = "service", **kwargs) -> str:
     """
     Legacy function to maintain backward compatibility.
     
     Args:
         prompt (str): The prompt to send to the LLM
+        route (str): Caller label for the inference ledger
         **kwargs: Additional parameters for the Ollama API
         
     Returns:
@@ -174,7 +219,7 @@ def send_prompt(prompt: str, **kwargs) -> str:
     """
     try:
         service = get_ollama_service()
-        return service.send_prompt_with_retry(prompt, **kwargs)
+        return service.send_prompt_with_retry(prompt, route=route, **kwargs)
     except Exception as e:
         logger.error(f"Failed to initialize Ollama service: {str(e)}")
         return "Error: Service initialization failed. Check configuration."
@@ -0,0 +1,297 @@
+"""
+Prefix-stable prompt assembly.
+
+Ollama keeps the KV cache of the last prompt it evaluated and skips the
+tokens a new prompt shares with it, so two requests only benefit when they
+start with byte-identical text. Every route assembles its prompt here, in
+one canonical order:
+
+    system    PromptConfig.SYSTEM_PROMPT, then the requested presets in
+              presets.json order, compiled once per combination and
+              reused verbatim
+    history   the caller's messages as given, client system messages
+              included (a "User:"/"Assistant:" transcript for
+              single-string prompts, from a window that advances in steps)
+    volatile  memory notes, placed right before the newest user message
+    user      the newest user message
+
+Parts are joined with the same separator everywhere, so per-request
+content never shifts the stable prefix. Only text the server composes
+(system prompt, presets, memory notes) is normalised; client content is
+sent byte for byte. Single-string prompts without a
+system prompt or history have no stable prefix to reuse; conversation
+routes pass their history so each turn extends the previous one.
+
+Reuse is measured from Ollama's prompt_eval_count, which counts only the
+tokens it actually evaluated. The prompt's full size in tokens is estimated
+from its length, using a chars-per-token ratio calibrated on the part of
+each prompt that was not shared with the previous one, and the difference
+is the reused prefix. Routes pass the built Prompt to record_inference
+with the generation it was sent in, so only that generation is counted.
+Totals are kept in the shared metrics segment for all workers.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Union
+
+from backend.config import PromptConfig
+from backend.services.memory_retrieval import CHARS_PER_TOKEN, memory_context
+from backend.services.shared_metrics import get_shared_metrics
+
+logger = logging.getLogger(__name__)
+
+SEPARATOR = "\n\n"
+# Weight of the newest sample in the chars-per-token estimate
+_ALPHA = 0.2
+# Unshared text shorter than this is too noisy to calibrate on
+_MIN_SAMPLE_CHARS = 200
+
+
+def _normalize(text: str) -> str:
+    return "\n".join(line.rstrip() for line in (text or "").replace("\r\n", "\n").split("\n")).strip()
+
+
+def window_start(count: int, limit: int) -> int:
+    """Index of the first of ``count`` messages kept by a ``limit``-message window.
+
+    The start is a multiple of limit/2, so it moves once every limit/2 messages
+    and the turns in between share their transcript prefix.
+    """
+    if limit <= 0:
+        return count
+    if count <= limit:
+        return 0
+    step = max(1, limit // 2)
+    return -(-(count - limit) // step) * step
+
+
+def _window(history: List[Dict], limit: int) -> List[Dict]:
+    """The last ``limit`` messages at most, starting on a multiple of limit/2 so the start rarely moves."""
+    return history[window_start(len(history), limit):]
+
+
+def _transcript(history: List[Dict]) -> str:
+    return SEPARATOR.join(f"{(m.get('role') or 'user').capitalize()}: {m.get('content') or ''}" for m in history)
+
+
+def _common_prefix(a: str, b: str) -> int:
+    """Length of the shared prefix (binary search over slice comparisons)."""
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+class Prompt:
+    """An assembled prompt: text for /api/generate or messages for /api/chat, plus its prefix accounting."""
+
+    def __init__(self, text: Optional[str] = None, messages: Optional[List[Dict]] = None,
+                 stable_chars: int = 0, memory: Optional[Dict] = None):
+        self.text = text
+        self.messages = messages
+        self.memory = memory
+        self.rendered = text if text is not None else SEPARATOR.join(
+            m["content"] if isinstance(m.get("content"), str) else "" for m in messages)
+        self.stable_chars = stable_chars
+        self.shared_chars = 0
+
+    @property
+    def chars(self) -> int:
+        return len(self.rendered)
+
+
+class PromptBuilder:
+    """Compiles presets and system prompts once and assembles prompts in the canonical order."""
+
+    def __init__(self, presets_path: str = PromptConfig.PRESETS_PATH,
+                 system_prompt: str = PromptConfig.SYSTEM_PROMPT, sessions: int = PromptConfig.SESSIONS):
+        self.presets_path = presets_path
+        self.system_prompt = _normalize(system_prompt)
+        self._presets: List[Dict] = []
+        self._presets_mtime: Optional[float] = None
+        self._blocks: Dict[frozenset, str] = {}
+        self._last: "OrderedDict[str, str]" = OrderedDict()
+        self._previous = ""
+        self._sessions = sessions
+        self._lock = threading.Lock()
+        self.chars_per_token = float(CHARS_PER_TOKEN)
+        self._stats = {"prompts": 0, "observed": 0, "prompt_tokens": 0, "evaluated_tokens": 0,
+                       "reused_tokens": 0, "prompt_chars": 0, "shared_chars": 0}
+
+    # -- presets and the system block ---------------------------------------
+
+    def presets(self) -> List[Dict]:
+        """presets.json, re-read only when it changes."""
+        try:
+            mtime = os.stat(self.presets_path).st_mtime
+        except OSError:
+            return []
+        if mtime != self._presets_mtime:
+            try:
+                with open(self.presets_path) as f:
+                    presets = json.load(f).get("presets", [])
+            except (OSError, ValueError) as e:
+                logger.warning(f"[PROMPT] Could not read presets: {e}")
+                return self._presets
+            with self._lock:
+                self._presets, self._presets_mtime, self._blocks = presets, mtime, {}
+        return self._presets
+
+    def system_block(self, presets: Union[str, Iterable[str], None] = None) -> str:
+        """The system text for these presets (compiled once per set, any order)."""
+        names = frozenset([presets] if isinstance(presets, str) else presets or ())
+        available = self.presets()
+        block = self._blocks.get(names)
+        if block is None:
+            unknown = names - {p.get("name") for p in available}
+            if unknown:
+                logger.warning(f"[PROMPT] Unknown presets ignored: {', '.join(sorted(unknown))}")
+            parts = [self.system_prompt] + [_normalize(p.get("text")) for p in available if p.get("name") in names]
+            block = SEPARATOR.join(part for part in parts if part)
+            self._blocks[names] = block
+        return block
+
+    # -- assembly -----------------------------------------------------------
+
+    def build_prompt(self, user: str, presets: Union[str, Iterable[str], None] = None,
+                     use_memory: Optional[bool] = None, session: Optional[str] = None,
+                     history: Optional[List[Dict]] = None) -> Prompt:
+        """
+        Assemble a single-string prompt (system, history transcript, memory notes, user).
+
+        Args:
+            user: The user's message
+            presets: Preset name(s) from presets.json
+            use_memory: Per-request memory retrieval override
+            session: Conversation key for the expected shared-prefix estimate
+            history: Earlier messages of the conversation, oldest first
+                (the last PromptConfig.HISTORY_MESSAGES at most)
+
+        Returns:
+            Prompt: ``text`` to send and ``memory`` retrieval info
+        """
+        system = self.system_block(presets)
+        transcript = _transcript(_window(history, PromptConfig.HISTORY_MESSAGES)) if history else ""
+        stable = SEPARATOR.join(part for part in (system, transcript) if part)
+        context, info = memory_context(user, use_memory)
+        if history is not None:
+            # Labelled from the first turn on, so the next turn's transcript starts with this prompt
+            user = f"User: {user}"
+        text = SEPARATOR.join(part for part in (stable, _normalize(context), user) if part)
+        return self._track(Prompt(text=text, stable_chars=len(stable), memory=info), session)
+
+    def build_messages(self, messages: List[Dict], presets: Union[str, Iterable[str], None] = None,
+                       use_memory: Optional[bool] = None, session: Optional[str] = None) -> Prompt:
+        """
+        Assemble a chat message list: the server's system message, the caller's messages, memory notes
+        before the newest user message.
+
+        The caller's messages, system messages included, are sent unchanged
+        and in order; the caller's list is not modified.
+
+        Returns:
+            Prompt: ``messages`` to send and ``memory`` retrieval info
+        """
+        system = self.system_block(presets)
+        history = [dict(m) for m in messages]
+        info = None
+        last_user = next((i for i in range(len(history) - 1, -1, -1) if history[i].get("role") == "user"), None)
+        if last_user is not None:
+            content = history[last_user].get("content")
+            context, info = memory_context(content if isinstance(content, str) else "", use_memory)
+            if context:
+                history.insert(last_user, {"role": "system", "content": _normalize(context)})
+        out = ([{"role": "system", "content": system}] if system else []) + history
+        return self._track(Prompt(messages=out, stable_chars=len(system), memory=info), session)
+
+    # -- reuse accounting ---------------------------------------------------
+
+    def _track(self, prompt: Prompt, session: Optional[str]) -> Prompt:
+        """Compare with the session's and the worker's previous prompt and remember this one."""
+        key = session or hashlib.sha1(prompt.rendered[:prompt.stable_chars].encode("utf-8")).hexdigest()
+        with self._lock:
+            previous = self._last.pop(key, None)
+            self._last[key] = prompt.rendered
+            while len(self._last) > self._sessions:
+                self._last.popitem(last=False)
+            prompt.shared_chars = max(_common_prefix(previous, prompt.rendered) if previous else 0,
+                                      _common_prefix(self._previous, prompt.rendered))
+            self._previous = prompt.rendered
+            self._stats["prompts"] += 1
+        return prompt
+
+    def observe(self, prompt: Prompt, prompt_eval_count: int) -> Dict:
+        """
+        Account the generation of a built prompt (called by the inference ledger).
+
+        Args:
+            prompt: The prompt the generation was sent, as returned by build_prompt/build_messages
+            prompt_eval_count: Tokens Ollama evaluated (0 when it reported none)
+
+        Returns:
+            dict: estimated prompt tokens, evaluated and reused tokens
+        """
+        with self._lock:
+            novel = prompt.chars - prompt.shared_chars
+            if novel >= _MIN_SAMPLE_CHARS and prompt_eval_count > 0:
+                # Ollama evaluated the part not shared with the previous prompt: calibrate the estimate
+                self.chars_per_token += _ALPHA * (novel / prompt_eval_count - self.chars_per_token)
+            estimated = max(int(round(prompt.chars / self.chars_per_token)), prompt_eval_count)
+            reused = estimated - prompt_eval_count
+            for key, value in (("observed", 1), ("prompt_tokens", estimated), ("evaluated_tokens", prompt_eval_count),
+                               ("reused_tokens", reused), ("prompt_chars", prompt.chars),
+                               ("shared_chars", prompt.shared_chars)):
+                self._stats[key] += value
+        try:
+            metrics = get_shared_metrics()
+            metrics.add("prefix_prompt_tokens", estimated)
+            metrics.add("prefix_reused_tokens", reused)
+        except Exception as e:
+            logger.warning(f"[PROMPT] Shared metrics update failed: {e}")
+        return {"prompt_tokens": estimated, "evaluated_tokens": prompt_eval_count, "reused_tokens": reused}
+
+    def get_stats(self) -> Dict:
+        """
+        Prefix reuse for this worker and, under "all_workers", for the whole server.
+
+        Returns:
+            dict: counters, reuse_rate (reused / estimated prompt tokens),
+            expected_reuse_rate (shared prefix chars / prompt chars) and the
+            calibrated chars_per_token
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats["reuse_rate"] = round(stats["reused_tokens"] / stats["prompt_tokens"], 3) if stats["prompt_tokens"] else None
+        stats["expected_reuse_rate"] = (round(stats["shared_chars"] / stats["prompt_chars"], 3)
+                                        if stats["prompt_chars"] else None)
+        stats["chars_per_token"] = round(self.chars_per_token, 2)
+        try:
+            shared = get_shared_metrics().read(recent=0)
+            total, reused = shared["prefix_prompt_tokens"], shared["prefix_reused_tokens"]
+            stats["all_workers"] = {"prompt_tokens": total, "reused_tokens": reused,
+                                    "reuse_rate": round(reused / total, 3) if total else None}
+        except Exception:
+            stats["all_workers"] = None
+        return stats
+
+
+# Global builder instance
+_builder: Optional[PromptBuilder] = None
+_builder_lock = threading.Lock()
+
+
+def get_prompt_builder() -> PromptBuilder:
+    """Get or create the global prompt builder."""
+    global _builder
+    with _builder_lock:
+        if _builder is None:
+            _builder = PromptBuilder()
+    return _builder
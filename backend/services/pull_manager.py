@@ -0,0 +1,309 @@
+"""
+Background model pulls with progress, deduplication, cancel and resume.
+
+A pull is a job keyed by (host, model). The job's state lives in a small
+JSON file in ModelPullConfig.DIR, so any gunicorn worker can report or
+stream progress and a second request for the same model joins the running
+job instead of starting another download. Each host runs one pull at a time
+across all workers (an flock per host); further jobs wait queued.
+
+Cancelling writes a marker file the running worker checks between progress
+lines. Ollama keeps the layers it already downloaded, so resuming a
+cancelled or failed job continues from there. A finished pull invalidates
+the model catalog.
+"""
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+import requests
+
+from backend.config import ModelCatalogConfig, ModelPullConfig
+from backend.services.model_catalog import get_model_catalog
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+ACTIVE = (QUEUED, RUNNING)
+_POLL = 0.25
+
+
+class PullError(Exception):
+    """A pull request that cannot be accepted (unknown host or job)."""
+
+
+def _job_id(host: str, model: str) -> str:
+    return hashlib.sha1(f"{host}|{model}".encode("utf-8")).hexdigest()[:12]
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class PullManager:
+    """Runs pull jobs for this worker and reads every worker's jobs from the shared directory."""
+
+    def __init__(self, directory: str = ModelPullConfig.DIR, hosts: Optional[List[str]] = None):
+        self.dir = directory
+        self.hosts = hosts or ModelCatalogConfig.HOSTS
+        self._queues: Dict[str, queue.Queue] = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.dir, exist_ok=True)
+
+    # -- job files ----------------------------------------------------------
+
+    def _path(self, job_id: str, suffix: str = ".json") -> str:
+        return os.path.join(self.dir, f"{job_id}{suffix}")
+
+    def _read(self, job_id: str) -> Optional[Dict]:
+        try:
+            with open(self._path(job_id)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, job: Dict) -> None:
+        tmp = self._path(job["id"], f".json.{os.getpid()}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(job, f)
+        os.replace(tmp, self._path(job["id"]))
+
+    def _cancel_requested(self, job_id: str) -> bool:
+        return os.path.exists(self._path(job_id, ".cancel"))
+
+    def _checked(self, job: Optional[Dict]) -> Optional[Dict]:
+        """Fail an active job whose worker exited without finishing it."""
+        if job and job["status"] in ACTIVE and not _alive(job["owner"]):
+            job.update(status=FAILED, error="Worker exited during the pull", finished_at=time.time())
+            self._write(job)
+        return job
+
+    # -- public API ---------------------------------------------------------
+
+    def start(self, model: str, host: Optional[str] = None) -> Dict:
+        """
+        Queue a pull, or join the one already running for this model.
+
+        Returns:
+            dict: The job; ``deduplicated`` is True when an existing job was returned
+
+        Raises:
+            PullError: The host is not one of OLLAMA_HOSTS
+        """
+        host = (host or self.hosts[0]).rstrip("/")
+        if host not in self.hosts:
+            raise PullError(f"Unknown Ollama host: {host}")
+        job_id = _job_id(host, model)
+        index = os.open(os.path.join(self.dir, ".index.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(index, fcntl.LOCK_EX)
+            current = self._checked(self._read(job_id))
+            if current and current["status"] in ACTIVE:
+                return dict(current, deduplicated=True)
+            try:
+                os.remove(self._path(job_id, ".cancel"))
+            except FileNotFoundError:
+                pass
+            job = {
+                "id": job_id,
+                "model": model,
+                "host": host,
+                "run": (current or {}).get("run", 0) + 1,
+                "owner": os.getpid(),
+                "status": QUEUED,
+                "detail": "queued",
+                "layers": {},
+                "completed": 0,
+                "total": 0,
+                "percent": None,
+                "error": None,
+                "created_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+            }
+            self._write(job)
+        finally:
+            os.close(index)
+        self._enqueue(job)
+        logger.info(f"[PULL] Queued {model} on {host} (job {job_id}, run {job['run']})")
+        return dict(job, deduplicated=False)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        return self._checked(self._read(job_id))
+
+    def list(self) -> List[Dict]:
+        """Every job, newest first; finished jobs older than KEEP_SECONDS are removed."""
+        jobs = []
+        cutoff = time.time() - ModelPullConfig.KEEP_SECONDS
+        for name in os.listdir(self.dir):
+            if not name.endswith(".json"):
+                continue
+            job = self.get(name[:-5])
+            if not job:
+                continue
+            if job["status"] not in ACTIVE and (job["finished_at"] or 0) < cutoff:
+                for suffix in (".json", ".cancel"):
+                    try:
+                        os.remove(self._path(job["id"], suffix))
+                    except FileNotFoundError:
+                        pass
+                continue
+            jobs.append(job)
+        return sorted(jobs, key=lambda j: j["created_at"], reverse=True)
+
+    def cancel(self, job_id: str) -> Dict:
+        """Ask the worker running the job to stop; returns the job."""
+        job = self.get(job_id)
+        if not job:
+            raise PullError(f"Unknown pull job: {job_id}")
+        if job["status"] in ACTIVE:
+            with open(self._path(job_id, ".cancel"), "w"):
+                pass
+            logger.info(f"[PULL] Cancel requested for {job['model']} (job {job_id})")
+        return job
+
+    def resume(self, job_id: str) -> Dict:
+        """Restart a cancelled or failed job; Ollama skips the layers it already has."""
+        job = self.get(job_id)
+        if not job:
+            raise PullError(f"Unknown pull job: {job_id}")
+        return self.start(job["model"], job["host"])
+
+    def events(self, job_id: str, heartbeat: float = ModelPullConfig.STREAM_HEARTBEAT) -> Iterator[str]:
+        """
+        Yield SSE frames for a job: "progress" on every change, then one
+        final event named after the outcome (done, failed or cancelled).
+        """
+        yield "retry: 2000\n\n"
+        last, sent, idle_since = None, 0, time.monotonic()
+        while True:
+            job = self.get(job_id)
+            if job is None:
+                yield 'event: error\ndata: {"error":"unknown job"}\n\n'
+                return
+            if job != last:
+                last, idle_since = job, time.monotonic()
+                sent += 1
+                event = job["status"] if job["status"] not in ACTIVE else "progress"
+                yield f"event: {event}\nid: {sent}\ndata: {json.dumps(job, separators=(',', ':'))}\n\n"
+                if job["status"] not in ACTIVE:
+                    return
+            elif time.monotonic() - idle_since >= heartbeat:
+                idle_since = time.monotonic()
+                yield ": ping\n\n"
+            time.sleep(_POLL)
+
+    # -- runner -------------------------------------------------------------
+
+    def _enqueue(self, job: Dict) -> None:
+        with self._lock:
+            jobs = self._queues.get(job["host"])
+            if jobs is None:
+                jobs = self._queues[job["host"]] = queue.Queue()
+                threading.Thread(target=self._run_host, args=(job["host"], jobs),
+                                 name="model-pull", daemon=True).start()
+        jobs.put(job["id"])
+
+    def _run_host(self, host: str, jobs: queue.Queue) -> None:
+        lock_path = os.path.join(self.dir, f"host-{hashlib.sha1(host.encode('utf-8')).hexdigest()[:12]}.lock")
+        while True:
+            job_id = jobs.get()
+            # Nothing may end this thread: later jobs for the host would stay queued for good
+            try:
+                self._run_job(job_id, lock_path)
+            except Exception as e:
+                logger.error(f"[PULL] Job {job_id} crashed: {e}")
+
+    def _run_job(self, job_id: str, lock_path: str) -> None:
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # One pull per host across workers; a queued job can still be cancelled
+            while True:
+                job = self._read(job_id)
+                if job is None:
+                    logger.warning(f"[PULL] Job {job_id} was removed before it ran")
+                    return
+                if self._cancel_requested(job_id):
+                    return self._finish(job, CANCELLED)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    time.sleep(_POLL)
+                    continue
+                try:
+                    self._pull(job)
+                except Exception as e:
+                    logger.error(f"[PULL] Job {job_id} crashed: {e}")
+                    self._finish(job, FAILED, str(e))
+                return
+        finally:
+            os.close(fd)
+
+    def _finish(self, job: Dict, status: str, error: Optional[str] = None) -> None:
+        job.update(status=status, detail=status, error=error, finished_at=time.time())
+        self._write(job)
+        logger.info(f"[PULL] {job['model']} on {job['host']}: {status}{f' ({error})' if error else ''}")
+        if status == DONE:
+            get_model_catalog().invalidate(f"pull {job['model']}")
+
+    def _pull(self, job: Dict) -> None:
+        job.update(status=RUNNING, detail="starting", started_at=time.time())
+        self._write(job)
+        written = time.monotonic()
+        response = requests.post(f"{job['host']}/api/pull",
+                                 json={"model": job["model"], "name": job["model"], "stream": True},
+                                 stream=True, timeout=(5, ModelPullConfig.READ_TIMEOUT))
+        try:
+            if response.status_code != 200:
+                return self._finish(job, FAILED, f"HTTP {response.status_code}: {response.text[:200]}")
+            for line in response.iter_lines():
+                if self._cancel_requested(job["id"]):
+                    return self._finish(job, CANCELLED)
+                if not line:
+                    continue
+                update = json.loads(line)
+                if update.get("error"):
+                    return self._finish(job, FAILED, update["error"])
+                job["detail"] = update.get("status", job["detail"])
+                digest = update.get("digest")
+                if digest and update.get("total"):
+                    job["layers"][digest] = {"total": update["total"], "completed": update.get("completed", 0)}
+                    job["total"] = sum(layer["total"] for layer in job["layers"].values())
+                    job["completed"] = sum(layer["completed"] for layer in job["layers"].values())
+                    job["percent"] = round(100 * job["completed"] / job["total"], 1)
+                if job["detail"] == "success":
+                    return self._finish(job, DONE)
+                if time.monotonic() - written >= ModelPullConfig.PROGRESS_INTERVAL:
+                    self._write(job)
+                    written = time.monotonic()
+            self._finish(job, FAILED, "Ollama closed the stream before the pull finished")
+        except requests.RequestException as e:
+            self._finish(job, FAILED, str(e))
+        finally:
+            response.close()
+
+
+# Global manager instance
+_manager: Optional[PullManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_pull_manager() -> PullManager:
+    """Get or create the global pull manager."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = PullManager()
+    return _manager
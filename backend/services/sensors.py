@@ -0,0 +1,289 @@
+"""
+Hardware sensor discovery and cached sysfs reads.
+
+Sensors are discovered once (thermal zones and their types, GPU load and
+devfreq, fan PWM, power rails, throttle counters) into a SensorMap that
+keeps one open descriptor per file. Reads use os.pread at offset 0, which
+re-reads the live sysfs value without reopening or globbing.
+
+All paths are resolved under a root directory (SENSORS_ROOT, default "/"),
+so the map can be built against a fake sysfs tree.
+"""
+import glob
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import psutil
+
+from backend.config import SensorConfig, TelemetryConfig
+
+logger = logging.getLogger(__name__)
+
+# Candidate locations relative to the root, in priority order
+GPU_TEMP_PATHS = [
+    'sys/devices/virtual/thermal/thermal_zone0/temp',
+    'sys/devices/gpu.0/temp',
+    'sys/class/thermal/thermal_zone0/temp',
+]
+GPU_LOAD_PATHS = ['sys/devices/gpu.0/load']
+GPU_DEVFREQ_PATTERN = 'sys/devices/gpu.0/devfreq/*'
+GPU_PSTATE_PATHS = ['sys/devices/gpu.0/pstate']
+FAN_PWM_PATTERNS = [
+    'sys/devices/gpu.0/fan_pwm_target',
+    'sys/devices/platform/pwm-fan/hwmon/hwmon*/pwm1',
+    'sys/devices/platform/7000d000.pwm-fan/target_pwm',
+    'sys/devices/pwm-fan/target_pwm',
+    'sys/devices/platform/pwm-fan/target_pwm',
+    'sys/class/hwmon/hwmon*/pwm1',
+]
+POWER_PATTERNS = [
+    'sys/class/hwmon/hwmon*/power*_input',
+    'sys/bus/i2c/drivers/ina3221x/*/iio_device/in_power*_input',
+    'sys/devices/*/power/power*_input',
+]
+THROTTLE_PATHS = [
+    'sys/devices/gpu.0/throttle_count',
+    'sys/kernel/debug/bpmp/debug/clk/gpu/throttle_count',
+]
+
+
+class Sensor:
+    """A sysfs attribute kept open for repeated pread() calls."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.fd = os.open(path, os.O_RDONLY)
+
+    def read_int(self) -> Optional[int]:
+        try:
+            return int(os.pread(self.fd, 64, 0).split()[0])
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def close(self) -> None:
+        try:
+            os.close(self.fd)
+        except OSError:
+            pass
+
+
+def _open(path: str) -> Optional[Sensor]:
+    try:
+        return Sensor(path)
+    except OSError:
+        return None
+
+
+def _valid_temp(millidegrees: Optional[int]) -> Optional[float]:
+    if millidegrees is None:
+        return None
+    temp = millidegrees / 1000.0
+    return temp if 0 < temp < 150 else None
+
+
+class SensorMap:
+    """Sensors discovered under one root, with kept-open descriptors."""
+
+    def __init__(self, root: str = '/'):
+        self.root = root
+        self.thermal_zones: Dict[str, Sensor] = {}
+        self.cpu_zones: List[Sensor] = []
+        self.gpu_temp: Optional[Sensor] = None
+        self.gpu_load: Optional[Sensor] = None
+        self.gpu_freq: Optional[Sensor] = None
+        self.gpu_max_freq: Optional[Sensor] = None
+        self.gpu_pstate: Optional[Sensor] = None
+        self.fan: Optional[Sensor] = None
+        self.power: List[Sensor] = []
+        self.throttle: Optional[Sensor] = None
+        self.discover()
+
+    def _path(self, relative: str) -> str:
+        return os.path.join(self.root, relative)
+
+    def _first(self, patterns: List[str]) -> Optional[Sensor]:
+        for pattern in patterns:
+            for path in sorted(glob.glob(self._path(pattern))):
+                sensor = _open(path)
+                if sensor and sensor.read_int() is not None:
+                    return sensor
+                if sensor:
+                    sensor.close()
+        return None
+
+    def discover(self) -> None:
+        """Probe the root once and open every sensor that is present and readable."""
+        for zone in sorted(glob.glob(self._path('sys/class/thermal/thermal_zone*'))):
+            try:
+                with open(os.path.join(zone, 'type')) as f:
+                    zone_type = f.read().strip()
+            except OSError:
+                continue
+            sensor = _open(os.path.join(zone, 'temp'))
+            if sensor is None:
+                continue
+            if zone_type in self.thermal_zones:
+                zone_type = f"{zone_type}.{os.path.basename(zone)}"
+            self.thermal_zones[zone_type] = sensor
+            # CPU-specific zones (cpu-thermal, MCPU, BCPU, etc.)
+            if 'cpu' in zone_type.lower():
+                self.cpu_zones.append(sensor)
+
+        gpu_zone = next((s for t, s in self.thermal_zones.items() if 'gpu' in t.lower()), None)
+        self.gpu_temp = gpu_zone or self._first(GPU_TEMP_PATHS)
+        self.gpu_load = self._first(GPU_LOAD_PATHS)
+        for devfreq in sorted(glob.glob(self._path(GPU_DEVFREQ_PATTERN))):
+            cur, top = _open(os.path.join(devfreq, 'cur_freq')), _open(os.path.join(devfreq, 'max_freq'))
+            if cur and top:
+                self.gpu_freq, self.gpu_max_freq = cur, top
+                break
+            for sensor in (cur, top):
+                if sensor:
+                    sensor.close()
+        self.gpu_pstate = self._first(GPU_PSTATE_PATHS)
+        self.fan = self._first(FAN_PWM_PATTERNS)
+        for pattern in POWER_PATTERNS:
+            for path in sorted(glob.glob(self._path(pattern))):
+                sensor = _open(path)
+                if sensor:
+                    self.power.append(sensor)
+        self.throttle = self._first(THROTTLE_PATHS)
+        logger.info(f"[SENSORS] Discovered under {self.root}: {self.describe()}")
+
+    def close(self) -> None:
+        sensors = list(self.thermal_zones.values()) + self.power + [
+            self.gpu_temp, self.gpu_load, self.gpu_freq, self.gpu_max_freq,
+            self.gpu_pstate, self.fan, self.throttle,
+        ]
+        for sensor in {id(s): s for s in sensors if s is not None}.values():
+            sensor.close()
+
+    def describe(self) -> Dict:
+        """Paths of the discovered sensors (None where absent)."""
+        def path(sensor):
+            return sensor.path if sensor else None
+        return {
+            "root": self.root,
+            "thermal_zones": {t: s.path for t, s in self.thermal_zones.items()},
+            "cpu_zones": [s.path for s in self.cpu_zones],
+            "gpu_temp": path(self.gpu_temp),
+            "gpu_load": path(self.gpu_load),
+            "gpu_freq": path(self.gpu_freq),
+            "gpu_pstate": path(self.gpu_pstate),
+            "fan": path(self.fan),
+            "power": [s.path for s in self.power],
+            "throttle": path(self.throttle),
+        }
+
+    def cpu_temperature(self) -> Optional[float]:
+        """Average CPU zone temperature in Celsius, falling back to psutil sensors."""
+        temps = [t for t in (_valid_temp(s.read_int()) for s in self.cpu_zones) if t is not None]
+        if not temps and self.root == '/':
+            try:
+                for name, entries in (psutil.sensors_temperatures() or {}).items():
+                    if 'cpu' in name.lower() or 'coretemp' in name.lower():
+                        temps.extend(e.current for e in entries if 0 < e.current < 150)
+            except (AttributeError, Exception):
+                pass
+        return sum(temps) / len(temps) if temps else None
+
+    def gpu_temperature(self) -> Optional[float]:
+        return _valid_temp(self.gpu_temp.read_int()) if self.gpu_temp else None
+
+    def temps(self) -> Dict[str, float]:
+        """Temperature of every thermal zone by zone type."""
+        result = {}
+        for zone_type, sensor in self.thermal_zones.items():
+            temp = _valid_temp(sensor.read_int())
+            if temp is not None:
+                result[zone_type] = temp
+        return result
+
+    def gpu_load_percent(self) -> Optional[float]:
+        """GPU load from gpu.0/load (0-1000 scale)."""
+        value = self.gpu_load.read_int() if self.gpu_load else None
+        return value / 10 if value is not None else None
+
+    def gpu_devfreq_usage(self) -> Optional[float]:
+        """Estimate GPU usage from current vs maximum devfreq frequency."""
+        if not (self.gpu_freq and self.gpu_max_freq):
+            return None
+        cur_freq, max_freq = self.gpu_freq.read_int(), self.gpu_max_freq.read_int()
+        if cur_freq is None or not max_freq:
+            return None
+        return (cur_freq / max_freq) * 100
+
+    def gpu_pstate_value(self) -> Optional[int]:
+        return self.gpu_pstate.read_int() if self.gpu_pstate else None
+
+    def fan_speed(self) -> Optional[float]:
+        """Fan speed in percent (0-255 PWM scaled)."""
+        value = self.fan.read_int() if self.fan else None
+        return (value / 255.0) * 100 if value is not None else None
+
+    def power_draw(self) -> Optional[float]:
+        """Sum of power rails in Watts (inputs are in µW)."""
+        total, found = 0.0, False
+        for sensor in self.power:
+            value = sensor.read_int()
+            if value is not None and 0 < value / 1e6 < 100:
+                total += value / 1e6
+                found = True
+        return total if found else None
+
+    def throttle_count(self) -> Optional[int]:
+        return self.throttle.read_int() if self.throttle else None
+
+
+# Global sensor map
+_sensor_map: Optional[SensorMap] = None
+_sensor_lock = threading.Lock()
+# Maps replaced by a rescan, with the time they were replaced; closed once no reader can still hold them
+_retired: List[Tuple[float, SensorMap]] = []
+
+
+def _retire_grace() -> float:
+    # Long enough for the sampler's next tick (and any request already reading) to finish
+    return 2 * TelemetryConfig.SAMPLE_INTERVAL + 1.0
+
+
+def _close_retired(now: Optional[float] = None) -> None:
+    """Close the descriptors of retired maps older than the grace period (caller holds _sensor_lock)."""
+    now = time.monotonic() if now is None else now
+    while _retired and now - _retired[0][0] >= _retire_grace():
+        _retired.pop(0)[1].close()
+
+
+def get_sensor_map() -> SensorMap:
+    """Get the global sensor map, discovering sensors on first use."""
+    global _sensor_map
+    with _sensor_lock:
+        if _sensor_map is None:
+            _sensor_map = SensorMap(SensorConfig.ROOT)
+        if _retired:
+            _close_retired()
+    return _sensor_map
+
+
+def rescan_sensors(root: Optional[str] = None) -> SensorMap:
+    """
+    Rediscover sensors (e.g. after a fan or power monitor appears).
+
+    Args:
+        root: Alternative root to scan (defaults to SENSORS_ROOT)
+
+    Returns:
+        SensorMap: The new map. The previous one stays open until the sampler's
+        next tick has passed: closing it at once would let a reader that still
+        holds it pread a reused descriptor number, i.e. another sensor's file.
+    """
+    global _sensor_map
+    new_map = SensorMap(root or SensorConfig.ROOT)
+    with _sensor_lock:
+        old_map, _sensor_map = _sensor_map, new_map
+        if old_map is not None:
+            _retired.append((time.monotonic(), old_map))
+    return new_map
@@ -0,0 +1,199 @@
+"""
+In-memory user settings with atomic persistence and cross-worker invalidation.
+
+The parsed settings live in memory as a read-only snapshot, so a lookup on
+the generation path is a dict access. Every write replaces settings.json
+atomically (temp file, fsync, rename) under an flock and bumps the shared
+"settings_version" counter; each read compares that counter (an 8-byte load
+from the shared metrics segment) with the version it loaded, so the other
+workers pick up a change on their next read. Edits made to the file by hand
+are noticed by an mtime check every CHECK_INTERVAL seconds.
+
+Only the keys present in the file are persisted; the rest come from the
+defaults, and is_set() tells the two apart. Every load bumps a per-process
+generation, so caches derived from the settings key on it rather than on
+the shared version, which a hand edit does not change.
+"""
+import copy
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional
+
+from backend.config import SettingsConfig, ThermalGovernorConfig
+from backend.services.shared_metrics import get_shared_metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    "model": "qwen2.5:7b-instruct",
+    "temperature": 0.7,
+    "auto_save": True,
+    "theme": "dark",
+    "memory_limit": 10,
+    "last_active_conversation_id": None,
+    # Task -> {"model", "options"} overrides for the model routing table
+    "model_routes": {},
+    # Set by a completed model switch (services/model_switch.py); None serves ACTIVE_MODEL
+    "active_model": None
+}
+
+
+def _freeze(settings: Dict) -> Mapping:
+    return MappingProxyType(copy.deepcopy(settings))
+
+
+class SettingsStore:
+    """The parsed settings file, shared by every worker through the file and a version counter."""
+
+    def __init__(self, path: str = SettingsConfig.PATH, defaults: Optional[Dict] = None,
+                 check_interval: float = SettingsConfig.CHECK_INTERVAL, lock_dir: Optional[str] = None):
+        self.path = path
+        self.defaults = defaults if defaults is not None else DEFAULT_SETTINGS
+        self.check_interval = check_interval
+        self._lock_path = os.path.join(lock_dir or ThermalGovernorConfig.LOCK_DIR, ".settings.lock")
+        self._lock = threading.Lock()
+        self._snapshot: Mapping = _freeze(self.defaults)
+        self._file: Mapping = _freeze({})
+        self._generation = 0
+        self._mtime: Optional[int] = None
+        self._version = -1
+        self._checked_at = 0.0
+        self._stats = {"loads": 0, "writes": 0, "external_changes": 0}
+        try:
+            self._metrics = get_shared_metrics()
+        except Exception as e:
+            logger.warning(f"[USER_SETTINGS] No shared metrics, other workers' changes are seen by mtime only: {e}")
+            self._metrics = None
+        self._load()
+
+    # -- loading ------------------------------------------------------------
+
+    def _shared_version(self) -> int:
+        return self._metrics.counter("settings_version") if self._metrics else 0
+
+    def _stat(self) -> Optional[int]:
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _load(self) -> None:
+        """Re-read the file (defaults for missing keys); a broken file keeps the last good snapshot."""
+        with self._lock:
+            version, mtime = self._shared_version(), self._stat()
+            settings, stored = dict(self.defaults), {}
+            if mtime is not None:
+                try:
+                    with open(self.path) as f:
+                        stored = json.load(f)
+                    if not isinstance(stored, dict):
+                        raise ValueError("settings file is not a JSON object")
+                    settings.update(stored)
+                except (OSError, ValueError) as e:
+                    logger.error(f"[USER_SETTINGS] Error loading settings: {e}")
+                    settings, stored = dict(self._snapshot), dict(self._file)
+            self._snapshot, self._file = _freeze(settings), _freeze(stored)
+            self._generation += 1
+            self._version, self._mtime, self._checked_at = version, mtime, time.monotonic()
+            self._stats["loads"] += 1
+        logger.info(f"[USER_SETTINGS] Loaded settings ({'file' if mtime is not None else 'defaults'}, version {version})")
+
+    def _revalidate(self) -> None:
+        if self._shared_version() != self._version:
+            self._load()
+        elif time.monotonic() - self._checked_at >= self.check_interval:
+            self._checked_at = time.monotonic()
+            if self._stat() != self._mtime:
+                self._stats["external_changes"] += 1
+                self._load()
+
+    # -- reads --------------------------------------------------------------
+
+    def snapshot(self) -> Mapping:
+        """The current settings, read-only; keep it for the duration of one request."""
+        self._revalidate()
+        return self._snapshot
+
+    def get(self, key: str, default: Any = None) -> Any:
+        self._revalidate()
+        return self._snapshot.get(key, default)
+
+    def all(self) -> Dict:
+        """A mutable copy of the current settings."""
+        return copy.deepcopy(dict(self.snapshot()))
+
+    def is_set(self, key: str) -> bool:
+        """Whether the key is in the settings file (set by the user) rather than a default."""
+        self._revalidate()
+        return key in self._file
+
+    @property
+    def version(self) -> int:
+        self._revalidate()
+        return self._version
+
+    @property
+    def generation(self) -> int:
+        """Bumped on every load in this process, including hand edits the shared version misses."""
+        self._revalidate()
+        return self._generation
+
+    # -- writes -------------------------------------------------------------
+
+    def _write(self, apply) -> Dict:
+        """Apply a change to the latest settings on disk, persist atomically and notify the other workers."""
+        os.makedirs(os.path.dirname(self._lock_path), exist_ok=True)
+        fd = os.open(self._lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            self._load()
+            settings = apply(copy.deepcopy(dict(self._file)))
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(settings, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            if self._metrics:
+                self._metrics.add("settings_version")
+            self._stats["writes"] += 1
+            self._load()
+        finally:
+            os.close(fd)
+        logger.info("[USER_SETTINGS] Saved settings to file")
+        return self.all()
+
+    def update(self, updates: Dict) -> Dict:
+        """Merge known keys from updates into the stored settings; returns the new settings."""
+        def apply(settings):
+            for key, value in updates.items():
+                if key in self.defaults:
+                    settings[key] = value
+            return settings
+        return self._write(apply)
+
+    def replace(self, settings: Dict) -> Dict:
+        """Replace the stored settings wholesale (missing keys fall back to defaults); returns the new settings."""
+        return self._write(lambda _: copy.deepcopy(dict(settings)))
+
+    def get_stats(self) -> Dict:
+        return dict(self._stats, version=self._version, generation=self._generation, path=self.path)
+
+
+# Global store instance
+_store: Optional[SettingsStore] = None
+_store_lock = threading.Lock()
+
+
+def get_settings_store() -> SettingsStore:
+    """Get or create the global settings store."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SettingsStore()
+    return _store
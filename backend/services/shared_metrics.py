@@ -0,0 +1,289 @@
+"""
+Cross-worker metrics segment in a memory-mapped file.
+
+Every gunicorn worker maps the same fixed-layout file (MAP_SHARED), so
+counters, gauges, the last-model/last-request fields and the ring of recent
+generations are one view no matter which worker answers. Writers serialise
+with flock and bump a sequence number around each update (odd while
+writing); readers copy the segment without locking and retry if the
+sequence changed, so reads never wait on writers.
+
+The segment is reset when its owner changes: the gunicorn master for
+workers, otherwise the process itself, so "session" numbers start at zero
+on every server start but survive worker restarts. A segment whose owner is
+still running is never reset (other processes attach to it, or refuse if
+its layout differs); command-line tools map a private segment instead.
+"""
+import fcntl
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from backend.config import TelemetryConfig
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = ("requests", "prompt_tokens", "completion_tokens", "catalog_generation",
+            "ollama_retries", "retry_budget_exhausted", "deadline_misses", "settings_version",
+            "prefix_prompt_tokens", "prefix_reused_tokens")
+GAUGES = ("last_response_time",)
+# Fixed-size UTF-8 fields: name -> bytes
+TEXTS = {"last_model": 64}
+# Fixed-size JSON fields: name -> bytes
+BLOBS = {"last_request_body": 8192, "last_resolved": 512, "health": 2048, "telemetry": 1024}
+RING_SIZE = 100
+
+_MAGIC = b"JSM1"
+_VERSION = 7
+# magic, version, owner pid, started_at, sequence
+_HEADER = struct.Struct("<4sIqdQ")
+_SEQ_OFFSET = 24
+# ts, tokens_per_sec, total_ms, ttft_ms, prompt_tokens, completion_tokens, model, route
+_SLOT = struct.Struct("<ddddqq48s16s")
+_NAN = float("nan")
+_READ_RETRIES = 100
+
+
+def owner_pid() -> int:
+    """The process whose lifetime defines a session."""
+    if "gunicorn" in os.environ.get("SERVER_SOFTWARE", "").lower():
+        return os.getppid()
+    return os.getpid()
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return pid > 0
+
+
+def _num(value) -> Optional[float]:
+    return None if value != value else value
+
+
+class SharedMetrics:
+    """Fixed-layout counters, gauges, text fields and a ring buffer shared by all workers."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+        offset = _HEADER.size
+        self._counters = {}
+        for name in COUNTERS:
+            self._counters[name] = offset
+            offset += 8
+        self._gauges = {}
+        for name in GAUGES:
+            self._gauges[name] = offset
+            offset += 8
+        self._texts = {}
+        for name, size in {**TEXTS, **BLOBS}.items():
+            self._texts[name] = (offset, size)
+            offset += 4 + size
+        self._ring_head = offset
+        self._ring = offset + 8
+        self.size = self._ring + RING_SIZE * _SLOT.size
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        owner = owner_pid()
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            header = os.pread(self._fd, _HEADER.size, 0)
+            current = _HEADER.unpack(header) if len(header) == _HEADER.size else None
+            matches = (current is not None and current[0] == _MAGIC and current[1] == _VERSION
+                       and os.fstat(self._fd).st_size == self.size)
+            if current is not None and current[0] == _MAGIC and current[2] != owner and _alive(current[2]):
+                # Another live server owns it: truncating would wipe its counters and fault its mappings
+                if not matches:
+                    raise RuntimeError(f"Shared metrics {path} is in use by pid {current[2]} with another layout")
+                logger.info(f"[METRICS] Attaching to shared metrics {path} owned by live pid {current[2]}")
+            elif not matches or current[2] != owner:
+                logger.info(f"[METRICS] Initialising shared metrics {path} for owner {owner}")
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, self.size)
+                os.pwrite(self._fd, _HEADER.pack(_MAGIC, _VERSION, owner, time.time(), 0), 0)
+                for name in GAUGES:
+                    os.pwrite(self._fd, struct.pack("<d", _NAN), self._gauges[name])
+            self._mm = mmap.mmap(self._fd, self.size)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def close(self) -> None:
+        self._mm.close()
+        os.close(self._fd)
+
+    # -- writes -------------------------------------------------------------
+
+    def _write(self, apply) -> None:
+        """Run apply() under the cross-process lock with the sequence odd."""
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                seq = struct.unpack_from("<Q", self._mm, _SEQ_OFFSET)[0] | 1
+                struct.pack_into("<Q", self._mm, _SEQ_OFFSET, seq)
+                try:
+                    apply()
+                finally:
+                    struct.pack_into("<Q", self._mm, _SEQ_OFFSET, seq + 1)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _add(self, name: str, amount: int) -> None:
+        offset = self._counters[name]
+        struct.pack_into("<q", self._mm, offset, struct.unpack_from("<q", self._mm, offset)[0] + amount)
+
+    def _set_text(self, name: str, value: str) -> None:
+        offset, size = self._texts[name]
+        data = value.encode("utf-8")[:size]
+        struct.pack_into(f"<I{size}s", self._mm, offset, len(data), data)
+
+    def add(self, name: str, amount: int = 1) -> None:
+        """Increment a counter."""
+        self._write(lambda: self._add(name, amount))
+
+    def set_gauge(self, name: str, value: float) -> None:
+        self._write(lambda: struct.pack_into("<d", self._mm, self._gauges[name], float(value)))
+
+    def set_text(self, name: str, value: str) -> None:
+        """Set a text field (truncated to its fixed size)."""
+        self._write(lambda: self._set_text(name, value))
+
+    def set_json(self, name: str, value: Any) -> None:
+        """Set a JSON field; values too large for the field are replaced by a marker."""
+        data = json.dumps(value, separators=(",", ":"), default=str)
+        if len(data.encode("utf-8")) > self._texts[name][1]:
+            data = json.dumps({"truncated": True, "bytes": len(data.encode("utf-8"))})
+        self.set_text(name, data)
+
+    def record_inference(self, entry: Dict) -> None:
+        """Count one generation and push it onto the ring, as a single update."""
+        def apply():
+            self._add("requests", 1)
+            self._add("prompt_tokens", entry.get("prompt_tokens") or 0)
+            self._add("completion_tokens", entry.get("completion_tokens") or 0)
+            if entry.get("model"):
+                self._set_text("last_model", entry["model"])
+            head = struct.unpack_from("<Q", self._mm, self._ring_head)[0]
+            _SLOT.pack_into(
+                self._mm, self._ring + (head % RING_SIZE) * _SLOT.size,
+                entry.get("ts") or time.time(),
+                *(_NAN if entry.get(k) is None else float(entry[k])
+                  for k in ("tokens_per_sec", "total_ms", "ttft_ms")),
+                entry.get("prompt_tokens") or 0, entry.get("completion_tokens") or 0,
+                (entry.get("model") or "").encode("utf-8")[:48], (entry.get("route") or "").encode("utf-8")[:16],
+            )
+            struct.pack_into("<Q", self._mm, self._ring_head, head + 1)
+        self._write(apply)
+
+    # -- reads --------------------------------------------------------------
+
+    def _copy(self) -> bytes:
+        """A consistent copy of the segment (seqlock read)."""
+        for _ in range(_READ_RETRIES):
+            data = self._mm[:]
+            seq = struct.unpack_from("<Q", data, _SEQ_OFFSET)[0]
+            if not seq & 1 and struct.unpack_from("<Q", self._mm, _SEQ_OFFSET)[0] == seq:
+                return data
+            time.sleep(0)
+        # A writer died mid-update; a possibly torn read beats blocking forever
+        return self._mm[:]
+
+    def _text(self, data: bytes, name: str) -> str:
+        offset, size = self._texts[name]
+        length, raw = struct.unpack_from(f"<I{size}s", data, offset)
+        return raw[:min(length, size)].decode("utf-8", errors="ignore")
+
+    @staticmethod
+    def _slot(data: bytes, offset: int) -> Dict:
+        ts, tokens_per_sec, total_ms, ttft_ms, prompt, completion, model, route = _SLOT.unpack_from(data, offset)
+        return {
+            "ts": ts,
+            "model": model.rstrip(b"\0").decode("utf-8", errors="ignore") or None,
+            "route": route.rstrip(b"\0").decode("utf-8", errors="ignore") or None,
+            "prompt_tokens": prompt,
+            "completion_tokens": completion,
+            "tokens_per_sec": _num(tokens_per_sec),
+            "total_ms": _num(total_ms),
+            "ttft_ms": _num(ttft_ms),
+        }
+
+    def _recent(self, data: bytes, limit: int) -> List[Dict]:
+        head = struct.unpack_from("<Q", data, self._ring_head)[0]
+        count = min(limit, head, RING_SIZE)
+        return [self._slot(data, self._ring + (i % RING_SIZE) * _SLOT.size)
+                for i in range(head - count, head)]
+
+    def recent(self, limit: int = 5) -> List[Dict]:
+        """The most recent generations across all workers, oldest first."""
+        return self._recent(self._copy(), limit)
+
+    def counter(self, name: str) -> int:
+        """One counter, read in place without copying the segment (an aligned 8-byte load)."""
+        return struct.unpack_from("<q", self._mm, self._counters[name])[0]
+
+    def get_json(self, name: str) -> Any:
+        text = self._text(self._copy(), name)
+        return json.loads(text) if text else None
+
+    def read(self, recent: int = 5) -> Dict:
+        """One consistent view of every counter, gauge, text field and the recent ring."""
+        data = self._copy()
+        _, _, owner, started_at, seq = _HEADER.unpack_from(data, 0)
+        result = {
+            "owner_pid": owner,
+            "started_at": started_at,
+            "updates": seq // 2,
+        }
+        for name, offset in self._counters.items():
+            result[name] = struct.unpack_from("<q", data, offset)[0]
+        for name, offset in self._gauges.items():
+            result[name] = _num(struct.unpack_from("<d", data, offset)[0])
+        for name in TEXTS:
+            result[name] = self._text(data, name) or None
+        result["recent"] = self._recent(data, recent)
+        return result
+
+
+# Global segment
+_metrics: Optional[SharedMetrics] = None
+_metrics_lock = threading.Lock()
+
+
+def get_shared_metrics() -> SharedMetrics:
+    """Get or map the global shared metrics segment."""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = SharedMetrics(TelemetryConfig.METRICS_PATH)
+    return _metrics
+
+
+def use_private_segment() -> SharedMetrics:
+    """
+    Map a throwaway segment for this process instead of the server's.
+
+    For command-line tools, which must not write the live counters; call it
+    before anything records metrics.
+    """
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None or _metrics.path == TelemetryConfig.METRICS_PATH:
+            fd, path = tempfile.mkstemp(prefix="joeyai-metrics-", suffix=".bin")
+            os.close(fd)
+            try:
+                _metrics = SharedMetrics(path)
+            finally:
+                os.unlink(path)
+    return _metrics
@@ -0,0 +1,124 @@
+"""
+Startup-time benchmark: how long a fresh process takes to answer its first 200.
+
+Each run starts a new interpreter that imports backend.app, calls
+create_app() and requests a path (default /api/health) through the test
+client. The time to the first 200 is measured from just before the process
+is spawned, so it includes interpreter start, imports, migrations, blueprint
+registration and background service start-up; the child also reports each
+stage and the per-blueprint times from app.config['STARTUP'].
+
+The child never touches a running server's state: its metrics segment,
+telemetry history, lock directory and pull jobs live in a temporary
+directory, and the memory guard and storage maintenance start but do not
+act (they would unload models or vacuum the live database).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Runs in the child; prints one JSON line and exits without waiting on background threads
+_PROBE = """
+import json, os, sys, time
+started = time.perf_counter()
+from backend.app import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+response = app.test_client().get(sys.argv[1])
+answered = time.time()
+print(json.dumps({
+    "status": response.status_code,
+    "answered_at": answered,
+    "import_ms": round((imported - started) * 1000, 1),
+    "create_app_ms": round((created - imported) * 1000, 1),
+    "request_ms": round((time.perf_counter() - created) * 1000, 1),
+    "startup": app.config["STARTUP"],
+}))
+sys.stdout.flush()
+os._exit(0)
+"""
+
+
+def _isolated_env(scratch: str) -> Dict[str, str]:
+    """Environment that points the child's shared state at ``scratch``."""
+    return {
+        "TELEMETRY_METRICS_PATH": os.path.join(scratch, "shared_metrics.bin"),
+        "TELEMETRY_HISTORY_PATH": os.path.join(scratch, "telemetry_history.bin"),
+        "THERMAL_LOCK_DIR": scratch,
+        "MODEL_PULL_DIR": os.path.join(scratch, "pulls"),
+        "MEMORY_GUARD_ENABLED": "False",
+        "STORAGE_MAINTENANCE_ENABLED": "False",
+    }
+
+
+def measure(path: str = "/api/health", background_services: bool = True) -> Dict:
+    """
+    Start one fresh process and time its first response on ``path``.
+
+    Returns:
+        dict: status, first_ok_ms (spawn to response), import/create_app/request ms, startup stages
+    """
+    with tempfile.TemporaryDirectory(prefix="joeyai-startup-") as scratch:
+        env = dict(os.environ, FLASK_BACKGROUND_SERVICES=str(background_services),
+                   **_isolated_env(scratch))
+        spawned = time.time()
+        result = subprocess.run([sys.executable, "-c", _PROBE, path], cwd=PROJECT_ROOT, env=env,
+                                capture_output=True, text=True, timeout=300)
+    lines = [line for line in result.stdout.splitlines() if line.startswith("{")]
+    if result.returncode != 0 or not lines:
+        raise RuntimeError(f"Startup probe failed: {result.stderr.strip()[-500:]}")
+    run = json.loads(lines[-1])
+    run["first_ok_ms"] = round((run.pop("answered_at") - spawned) * 1000, 1)
+    return run
+
+
+def summarize(runs: List[Dict]) -> Dict:
+    """Median and min of each timing over several runs, plus the median per-blueprint import cost."""
+    summary = {"runs": len(runs), "status": sorted({run["status"] for run in runs})}
+    for key in ("first_ok_ms", "import_ms", "create_app_ms", "request_ms"):
+        values = [run[key] for run in runs]
+        summary[key] = {"median": round(statistics.median(values), 1), "min": min(values)}
+    summary["migrations_ms"] = round(statistics.median(run["startup"]["migrations"]["ms"] for run in runs), 1)
+    services = [run["startup"]["services"] for run in runs if run["startup"]["services"] is not None]
+    summary["services_ms"] = round(statistics.median(services), 1) if services else None
+    summary["blueprints_ms"] = {
+        name: round(statistics.median(run["startup"]["blueprints"][name] for run in runs), 1)
+        for name in runs[0]["startup"]["blueprints"]
+    }
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure time from process start to the first 200 OK.")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh processes to start (default: 5)")
+    parser.add_argument("--path", default="/api/health", help="Path to request (default: /api/health)")
+    parser.add_argument("--no-services", action="store_true", help="Do not start the background services")
+    parser.add_argument("--json", action="store_true", help="Print JSON instead of a summary")
+    args = parser.parse_args(argv)
+
+    runs = [measure(args.path, not args.no_services) for _ in range(args.runs)]
+    summary = summarize(runs)
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return 0 if summary["status"] == [200] else 1
+    print(f"{summary['runs']} runs of {args.path}, status {summary['status']}")
+    for key in ("first_ok_ms", "import_ms", "create_app_ms", "request_ms"):
+        print(f"  {key:<14} median {summary[key]['median']:>8} ms   min {summary[key]['min']:>8} ms")
+    print(f"  migrations     median {summary['migrations_ms']:>8} ms")
+    print(f"  services       median {summary['services_ms']} ms")
+    print("  blueprints     " + ", ".join(f"{name} {ms}" for name, ms in
+                                        sorted(summary["blueprints_ms"].items(), key=lambda item: -item[1])))
+    return 0 if summary["status"] == [200] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
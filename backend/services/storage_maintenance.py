@@ -0,0 +1,420 @@
+"""
+Retention and idle-time maintenance for the SQLite databases.
+
+Covers the memory notes database (memory_service.DB_PATH) and the
+conversation database (storage/memory.db). A background thread checks every
+CHECK_INTERVAL seconds, records database/WAL/FTS sizes, and - when the
+process is idle and the last run is older than MIN_INTERVAL - applies the
+retention rules, then merges or optimizes the FTS5 indexes, runs a bounded
+ANALYZE, releases free pages with incremental vacuum and truncates the WAL.
+
+Runs are serialised across gunicorn workers with a file lock, and the last
+run time is read from the shared history table, so only one worker does the
+work per interval.
+"""
+import fcntl
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+from backend.config import InferenceLedgerConfig, StorageMaintenanceConfig
+from backend.services import conversation_service, inference_ledger
+from backend.services import memory_service as mem
+from backend.services.thermal_governor import get_thermal_governor
+
+logger = logging.getLogger(__name__)
+
+TASKS = ("retention", "fts", "analyze", "vacuum", "checkpoint")
+
+# auto_vacuum pragma values
+_AUTO_VACUUM_INCREMENTAL = 2
+
+_activity_lock = threading.Lock()
+_last_activity = time.monotonic()
+_inflight = 0
+
+
+def request_started() -> None:
+    """Record the start of a request (wired to Flask before_request)."""
+    global _last_activity, _inflight
+    with _activity_lock:
+        _inflight += 1
+        _last_activity = time.monotonic()
+
+
+def request_finished() -> None:
+    """Record the end of a request (wired to Flask teardown_request)."""
+    global _last_activity, _inflight
+    with _activity_lock:
+        _inflight = max(_inflight - 1, 0)
+        _last_activity = time.monotonic()
+
+
+def idle_state() -> Dict:
+    """
+    Describe whether this is a good moment for maintenance.
+
+    Returns:
+        dict: idle flag, seconds since the last request, in-flight requests
+        and 1-minute load average per CPU
+    """
+    with _activity_lock:
+        quiet_for = time.monotonic() - _last_activity
+        inflight = _inflight
+    try:
+        load = os.getloadavg()[0] / (os.cpu_count() or 1)
+    except OSError:
+        load = 0.0
+    idle = (inflight == 0 and quiet_for >= StorageMaintenanceConfig.IDLE_SECONDS
+            and load < StorageMaintenanceConfig.IDLE_LOAD)
+    return {
+        "idle": idle,
+        "quiet_seconds": round(quiet_for, 1),
+        "inflight": inflight,
+        "load_per_cpu": round(load, 2),
+    }
+
+
+def _databases() -> List[Dict]:
+    """Maintained databases with their FTS5 tables (paths resolved per call)."""
+    return [
+        {"name": "memory", "path": mem.DB_PATH, "fts": ["notes_fts"]},
+        {"name": "conversations", "path": conversation_service.DB_PATH, "fts": ["messages_fts"]},
+    ]
+
+
+def _history_conn() -> sqlite3.Connection:
+    conn = sqlite3.connect(mem.DB_PATH, timeout=5)
+    conn.execute('''CREATE TABLE IF NOT EXISTS storage_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ts TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        db TEXT NOT NULL,
+        event TEXT NOT NULL,
+        db_bytes INTEGER,
+        wal_bytes INTEGER,
+        fts_bytes INTEGER,
+        freelist_bytes INTEGER,
+        elapsed_ms REAL,
+        detail TEXT
+    )''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_storage_history_event ON storage_history(event, id)")
+    return conn
+
+
+def measure(db: Dict) -> Dict:
+    """
+    Current on-disk footprint of one database.
+
+    Returns:
+        dict: db_bytes, wal_bytes, fts_bytes (FTS5 segment data) and freelist_bytes
+    """
+    path = db["path"]
+    sizes = {"db_bytes": 0, "wal_bytes": 0, "fts_bytes": 0, "freelist_bytes": 0}
+    if not os.path.exists(path):
+        return sizes
+    sizes["db_bytes"] = os.path.getsize(path)
+    try:
+        sizes["wal_bytes"] = os.path.getsize(f"{path}-wal")
+    except OSError:
+        pass
+    conn = sqlite3.connect(path, timeout=5)
+    try:
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        sizes["freelist_bytes"] = conn.execute("PRAGMA freelist_count").fetchone()[0] * page_size
+        for table in db["fts"]:
+            try:
+                sizes["fts_bytes"] += conn.execute(
+                    f"SELECT COALESCE(SUM(length(block)), 0) FROM {table}_data").fetchone()[0]
+            except sqlite3.OperationalError:
+                pass  # FTS table not created yet
+    finally:
+        conn.close()
+    return sizes
+
+
+def _record(conn: sqlite3.Connection, name: str, event: str, sizes: Dict,
+            elapsed_ms: Optional[float] = None, detail: Optional[Dict] = None) -> None:
+    conn.execute(
+        "INSERT INTO storage_history (db, event, db_bytes, wal_bytes, fts_bytes, freelist_bytes, elapsed_ms, detail) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (name, event, sizes["db_bytes"], sizes["wal_bytes"], sizes["fts_bytes"], sizes["freelist_bytes"],
+         elapsed_ms, json.dumps(detail) if detail is not None else None),
+    )
+
+
+def _trim_history(conn: sqlite3.Connection) -> None:
+    conn.execute("DELETE FROM storage_history WHERE id <= "
+                 "(SELECT MAX(id) FROM storage_history) - ?", (StorageMaintenanceConfig.HISTORY_MAX_ROWS,))
+
+
+def _seconds_since(conn: sqlite3.Connection, event: str, db: Optional[str] = None) -> Optional[float]:
+    """Seconds since the latest history row of an event, or None if there is none."""
+    sql = "SELECT (julianday('now') - julianday(MAX(ts))) * 86400 FROM storage_history WHERE event = ?"
+    params: tuple = (event,)
+    if db is not None:
+        sql += " AND db = ?"
+        params += (db,)
+    return conn.execute(sql, params).fetchone()[0]
+
+
+def record_sizes() -> List[Dict]:
+    """Sample the size of every database into the history table."""
+    conn = _history_conn()
+    samples = []
+    try:
+        for db in _databases():
+            sizes = measure(db)
+            _record(conn, db["name"], "sample", sizes)
+            samples.append(dict(sizes, db=db["name"]))
+        _trim_history(conn)
+        conn.commit()
+    finally:
+        conn.close()
+    return samples
+
+
+def apply_retention() -> Dict:
+    """Apply the configured note and conversation retention rules."""
+    cfg = StorageMaintenanceConfig
+    return {
+        "memory": mem.expire_notes(cfg.NOTE_TTL_DAYS, cfg.NOTE_MAX_PER_KIND, cfg.DELETE_BATCH),
+        "conversations": conversation_service.expire_conversations(
+            cfg.ARCHIVED_CONVERSATION_TTL_DAYS, cfg.DELETE_BATCH),
+        "inference_ledger": inference_ledger.expire_entries(InferenceLedgerConfig.RETENTION_DAYS),
+    }
+
+
+def _maintain_db(db: Dict, tasks: List[str], full_optimize: bool) -> Dict:
+    """Run the physical maintenance tasks against one database."""
+    cfg = StorageMaintenanceConfig
+    detail: Dict = {}
+    conn = sqlite3.connect(db["path"], timeout=30, isolation_level=None)
+    try:
+        if "fts" in tasks:
+            for table in db["fts"]:
+                start = time.perf_counter()
+                if full_optimize:
+                    conn.execute(f"INSERT INTO {table}({table}) VALUES('optimize')")
+                else:
+                    conn.execute(f"INSERT INTO {table}({table}, rank) VALUES('merge', ?)", (cfg.FTS_MERGE_PAGES,))
+                detail[f"{table}_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            detail["fts"] = "optimize" if full_optimize else "merge"
+
+        if "analyze" in tasks:
+            start = time.perf_counter()
+            conn.execute(f"PRAGMA analysis_limit={cfg.ANALYSIS_LIMIT}")
+            conn.execute("ANALYZE")
+            detail["analyze_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+        if "vacuum" in tasks:
+            mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+            if mode != _AUTO_VACUUM_INCREMENTAL and cfg.VACUUM_CONVERT:
+                # Takes effect only after a full VACUUM; done once per database
+                conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                conn.execute("VACUUM")
+                detail["vacuum"] = "converted"
+            elif mode == _AUTO_VACUUM_INCREMENTAL:
+                before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                conn.execute(f"PRAGMA incremental_vacuum({cfg.VACUUM_PAGES})").fetchall()
+                detail["vacuum_pages"] = before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+        if "checkpoint" in tasks and conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal":
+            busy, log_frames, checkpointed = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+            detail["checkpoint"] = {"busy": bool(busy), "log_frames": log_frames, "checkpointed": checkpointed}
+    finally:
+        conn.close()
+    return detail
+
+
+def run_maintenance(tasks: Optional[List[str]] = None, force: bool = False) -> Dict:
+    """
+    Run retention and maintenance now.
+
+    Args:
+        tasks: Subset of TASKS to run (defaults to all)
+        force: Run even if another run happened within MIN_INTERVAL
+
+    Returns:
+        dict: Per-database sizes before/after and task details, or a
+        "skipped" reason when another worker holds the lock or a run is not due
+    """
+    tasks = [t for t in (tasks or TASKS) if t in TASKS]
+    lock_path = os.path.join(os.path.dirname(os.path.abspath(mem.DB_PATH)), ".storage_maintenance.lock")
+    with open(lock_path, "a") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return {"skipped": "locked"}
+        try:
+            return _run_locked(tasks, force)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _run_locked(tasks: List[str], force: bool) -> Dict:
+    cfg = StorageMaintenanceConfig
+    start = time.perf_counter()
+    history = _history_conn()
+    try:
+        since = _seconds_since(history, "maintenance")
+        if not force and since is not None and since < cfg.MIN_INTERVAL:
+            return {"skipped": "not_due", "seconds_since_last": round(since)}
+
+        result: Dict = {"tasks": tasks, "databases": {}}
+        if "retention" in tasks:
+            result["retention"] = apply_retention()
+
+        for db in _databases():
+            if not os.path.exists(db["path"]):
+                continue
+            since_optimize = _seconds_since(history, "optimize", db["name"])
+            full_optimize = since_optimize is None or since_optimize >= cfg.FTS_OPTIMIZE_INTERVAL
+            db_start = time.perf_counter()
+            before = measure(db)
+            try:
+                detail = _maintain_db(db, tasks, full_optimize)
+            except sqlite3.Error as e:
+                logger.warning(f"[STORAGE] Maintenance of {db['name']} failed: {e}")
+                detail = {"error": str(e)}
+            after = measure(db)
+            elapsed_ms = round((time.perf_counter() - db_start) * 1000, 1)
+            event = "optimize" if detail.get("fts") == "optimize" else "maintenance"
+            _record(history, db["name"], event, after, elapsed_ms, detail)
+            result["databases"][db["name"]] = {"before": before, "after": after,
+                                               "elapsed_ms": elapsed_ms, "detail": detail}
+
+        # Marker row read by every worker to decide whether a run is due
+        _record(history, "*", "maintenance", {"db_bytes": None, "wal_bytes": None, "fts_bytes": None,
+                                              "freelist_bytes": None},
+                round((time.perf_counter() - start) * 1000, 1), {"tasks": tasks})
+        _trim_history(history)
+        history.commit()
+    finally:
+        history.close()
+
+    result["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    logger.info(f"[STORAGE] Maintenance finished in {result['elapsed_ms']}ms")
+    return result
+
+
+def get_history(db: Optional[str] = None, event: Optional[str] = None, limit: int = 288) -> List[Dict]:
+    """
+    Size history, newest first.
+
+    Args:
+        db: Filter by database name ("memory" or "conversations")
+        event: Filter by event ("sample", "maintenance" or "optimize")
+        limit: Maximum rows
+
+    Returns:
+        list: History rows as dicts
+    """
+    clauses, params = [], []
+    if db:
+        clauses.append("db = ?")
+        params.append(db)
+    if event:
+        clauses.append("event = ?")
+        params.append(event)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    conn = _history_conn()
+    conn.row_factory = sqlite3.Row
+    try:
+        rows = conn.execute(f"SELECT * FROM storage_history {where} ORDER BY id DESC LIMIT ?",
+                            params + [limit]).fetchall()
+    finally:
+        conn.close()
+    result = []
+    for row in rows:
+        item = dict(row)
+        item["detail"] = json.loads(item["detail"]) if item["detail"] else None
+        result.append(item)
+    return result
+
+
+class MaintenanceScheduler:
+    """Background thread that samples sizes and runs maintenance in idle windows."""
+
+    def __init__(self, check_interval: float = StorageMaintenanceConfig.CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_result: Optional[Dict] = None
+        self._last_check: Optional[float] = None
+
+    def start(self) -> None:
+        """Start the scheduler thread (idempotent)."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="storage-maintenance", daemon=True)
+        self._thread.start()
+        logger.info(f"[STORAGE] Maintenance scheduler started (check every {self.check_interval}s)")
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.check_interval):
+            try:
+                self.tick()
+            except Exception as e:
+                logger.error(f"[STORAGE] Maintenance check failed: {e}")
+
+    def tick(self) -> Optional[Dict]:
+        """One scheduler check: sample sizes if due, then maintain if idle."""
+        self._last_check = time.time()
+        history = _history_conn()
+        try:
+            since_sample = _seconds_since(history, "sample")
+        finally:
+            history.close()
+        # Workers share the table, so only sample when no one else did recently
+        if since_sample is None or since_sample >= self.check_interval * 0.9:
+            record_sizes()
+        if not idle_state()["idle"]:
+            return None
+        if get_thermal_governor().defer_background():
+            logger.info("[STORAGE] Maintenance deferred: device is hot")
+            return None
+        result = run_maintenance()
+        if "skipped" not in result:
+            self._last_result = result
+        return result
+
+    def get_status(self) -> Dict:
+        """Scheduler state, idle state and the result of this worker's last run."""
+        return {
+            "enabled": StorageMaintenanceConfig.ENABLED,
+            "running": bool(self._thread and self._thread.is_alive()),
+            "check_interval": self.check_interval,
+            "min_interval": StorageMaintenanceConfig.MIN_INTERVAL,
+            "last_check": self._last_check,
+            "last_result": self._last_result,
+            "idle": idle_state(),
+            "retention": {
+                "note_ttl_days": StorageMaintenanceConfig.NOTE_TTL_DAYS,
+                "note_max_per_kind": StorageMaintenanceConfig.NOTE_MAX_PER_KIND,
+                "archived_conversation_ttl_days": StorageMaintenanceConfig.ARCHIVED_CONVERSATION_TTL_DAYS,
+            },
+        }
+
+
+# Global scheduler instance
+_scheduler: Optional[MaintenanceScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_maintenance_scheduler() -> MaintenanceScheduler:
+    """Get or create the global scheduler; started when maintenance is enabled."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = MaintenanceScheduler()
+            if StorageMaintenanceConfig.ENABLED:
+                _scheduler.start()
+    return _scheduler
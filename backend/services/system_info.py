@@ -2,8 +2,18 @@ import psutil
 import os
 import subprocess
 
+from backend.services.sensors import get_sensor_map
+
 
 def get_cpu_load():
+    # Reuse the background sampler instead of blocking 100ms per poll
+    try:
+        from backend.services.telemetry import get_snapshot
+        cpu = get_snapshot().get('cpu')
+        if cpu is not None:
+            return cpu
+    except Exception:
+        pass
     try:
         return psutil.cpu_percent(interval=0.1)
     except:
@@ -22,66 +32,46 @@ def get_ram_info():
 
 
 def get_gpu_load():
-    try:
-        with open('/sys/devices/gpu.0/load', 'r') as f:
-            load = int(f.read().strip()) / 10  # Assuming scale 0-1000
+    load = get_sensor_map().gpu_load_percent()
+    if load is not None:
         return load
-    except:
-        try:
-            # Fallback to tegrastats parsing
-            result = subprocess.run(['tegrastats', '--one-shot'], capture_output=True, text=True, timeout=5)
-            # Parse for GPU load, e.g. "GR3D_FREQ 0%@[320]"
-            # This is simplified; real parsing needed
-            lines = result.stdout.split('\n')
-            for line in lines:
-                if 'GR3D_FREQ' in line:
-                    # Extract percentage, rough
-                    if '%' in line:
-                        return float(line.split('%')[0].split()[-1])
-        except:
-            pass
+    # Fallback to the background sampler's tegrastats stream
+    try:
+        from backend.services.telemetry import get_snapshot
+        return get_snapshot().get('gpu')
+    except Exception:
         return None
 
 
 def get_gpu_mode():
-    try:
-        with open('/sys/devices/gpu.0/pstate', 'r') as f:
-            pstate = int(f.read().strip())
-        # Mapping pstate to mode, approximate
-        modes = {
-            0: "MaxN",
-            1: "5W",
-            2: "10W",
-            3: "15W"
-        }
-        return modes.get(pstate, str(pstate))
-    except:
+    pstate = get_sensor_map().gpu_pstate_value()
+    if pstate is None:
         return None
+    # Mapping pstate to mode, approximate
+    modes = {
+        0: "MaxN",
+        1: "5W",
+        2: "10W",
+        3: "15W"
+    }
+    return modes.get(pstate, str(pstate))
 
 
 def get_temps():
+    sensors = get_sensor_map()
     temps = {}
-    try:
-        # CPU thermal
-        with open('/sys/class/thermal/thermal_zone0/temp', 'r') as f:
-            temps['CPU'] = int(f.read().strip()) / 1000
-        # GPU thermal
-        try:
-            with open('/sys/devices/virtual/thermal/thermal_zone1/temp', 'r') as f:
-                temps['GPU'] = int(f.read().strip()) / 1000
-        except:
-            pass
-    except:
-        pass
+    cpu = sensors.cpu_temperature()
+    if cpu is not None:
+        temps['CPU'] = cpu
+    gpu = sensors.gpu_temperature()
+    if gpu is not None:
+        temps['GPU'] = gpu
     return temps
 
 
 def get_power_mode():
-    try:
-        with open('/sys/devices/gpu.0/pstate', 'r') as f:
-            return int(f.read().strip())
-    except:
-        return 0
+    pstate = get_sensor_map().gpu_pstate_value()
+    return pstate if pstate is not None else 0
 
 
 def set_power_mode(mode):
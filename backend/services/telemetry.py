@@ -0,0 +1,360 @@
+"""
+Background hardware telemetry sampler.
+
+One worker (whoever holds an flock) samples for all of them: it keeps a
+single ``tegrastats --interval`` (Jetson) or ``nvidia-smi -lms`` (discrete
+GPU) process open and parses its output line by line with precompiled
+patterns, polls psutil and the discovered sysfs sensors
+(services/sensors.py) every SAMPLE_INTERVAL seconds, records the history
+and publishes an immutable snapshot to the shared metrics segment. The
+other workers pick that snapshot up on the same interval and hand it to
+their own listeners (SSE, thermal governor, memory guard), so request
+handlers read telemetry without spawning processes or blocking, and a
+follower takes over if the sampling worker exits.
+"""
+import fcntl
+import logging
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+from types import MappingProxyType
+from typing import Callable, Dict, List, Mapping, Optional, Tuple
+
+import psutil
+
+from backend.config import TelemetryConfig, ThermalGovernorConfig
+from backend.services.health_prober import get_health_prober
+from backend.services.sensors import get_sensor_map
+from backend.services.shared_metrics import get_shared_metrics
+from backend.services.telemetry_history import record_values
+from backend.services.telemetry_stream import get_telemetry_broadcaster
+
+logger = logging.getLogger(__name__)
+
+# tegrastats line patterns, e.g.
+# RAM 2220/7620MB ... CPU [0%@729,3%@729] ... GR3D_FREQ 13%@[305] ... gpu@51.5C ... VDD_IN 4816mW/4816mW
+_RAM_RE = re.compile(r'RAM\s+(\d+)/(\d+)(?:MB|MiB)')
+_CPU_RE = re.compile(r'CPU \[(.*?)\]')
+_CPU_FREQ_RE = re.compile(r'@(\d+)')
+_GR3D_RE = re.compile(r'GR3D(?:_FREQ)?\s+(\d+(?:\.\d+)?)%')
+_GPU_TEMP_RE = re.compile(r'gpu@(-?[\d.]+)C', re.IGNORECASE)
+# In priority order; POM_* rails are reported as current/average
+_POWER_RES = [
+    re.compile(r'VDD_GPU_CV\s+(\d+)mW'),
+    re.compile(r'VDD_IN\s+(\d+)mW'),
+    re.compile(r'POM_5V_GPU\s+(\d+)/\d+'),
+    re.compile(r'POM_5V_IN\s+(\d+)/\d+'),
+    re.compile(r'VDD_CPU_GPU_CV\s+(\d+)mW'),
+]
+
+
+def parse_tegrastats_line(line: str) -> Dict:
+    """
+    Parse one tegrastats output line.
+
+    Returns:
+        dict: Any of gpu_usage, gpu_temp, power_w, ram_used_mb, ram_total_mb,
+        cpu_freq_mhz that were present in the line
+    """
+    result: Dict = {}
+    match = _RAM_RE.search(line)
+    if match:
+        result['ram_used_mb'] = int(match.group(1))
+        result['ram_total_mb'] = int(match.group(2))
+    match = _CPU_RE.search(line)
+    if match:
+        freqs = [int(f) for f in _CPU_FREQ_RE.findall(match.group(1))]
+        if freqs:
+            result['cpu_freq_mhz'] = sum(freqs) / len(freqs)
+    match = _GR3D_RE.search(line)
+    if match:
+        result['gpu_usage'] = float(match.group(1))
+    match = _GPU_TEMP_RE.search(line)
+    if match:
+        result['gpu_temp'] = float(match.group(1))
+    for pattern in _POWER_RES:
+        match = pattern.search(line)
+        if match:
+            result['power_w'] = float(match.group(1)) / 1000.0
+            break
+    return result
+
+
+def parse_nvidia_smi_line(line: str) -> Dict:
+    """Parse one 'utilization.gpu, temperature.gpu, power.draw' CSV line."""
+    parts = [p.strip() for p in line.split(',')]
+    if len(parts) < 3:
+        return {}
+    result: Dict = {}
+    for key, value in zip(('gpu_usage', 'gpu_temp', 'power_w'), parts):
+        try:
+            result[key] = float(value)
+        except ValueError:
+            continue
+    return result
+
+
+class StreamReader:
+    """Keeps one telemetry process open and holds its latest parsed line."""
+
+    def __init__(self, name: str, command: List[str], parse: Callable[[str], Dict]):
+        self.name = name
+        self.command = command
+        self.parse = parse
+        self.available = True
+        self.restarts = 0
+        self._latest: Dict = {}
+        self._updated = 0.0
+        self._process: Optional[subprocess.Popen] = None
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name=f"telemetry-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopping = True
+        process = self._process
+        if process and process.poll() is None:
+            process.terminate()
+
+    def latest(self, max_age: float) -> Dict:
+        """Latest parsed reading, or {} if it is older than max_age seconds."""
+        if time.monotonic() - self._updated > max_age:
+            return {}
+        return self._latest
+
+    def _run(self) -> None:
+        backoff = 1.0
+        while not self._stopping:
+            try:
+                self._process = subprocess.Popen(
+                    self.command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                    text=True, bufsize=1,
+                )
+            except (FileNotFoundError, PermissionError) as e:
+                self.available = False
+                logger.info(f"[TELEMETRY] {self.name} unavailable: {e}")
+                return
+            logger.info(f"[TELEMETRY] {self.name} stream started (pid {self._process.pid})")
+            for line in self._process.stdout:
+                parsed = self.parse(line)
+                if parsed:
+                    # Replace, never mutate: readers may hold the previous dict
+                    self._latest = parsed
+                    self._updated = time.monotonic()
+                    backoff = 1.0
+            self._process.wait()
+            if self._stopping:
+                return
+            self.restarts += 1
+            logger.warning(f"[TELEMETRY] {self.name} exited with {self._process.returncode}, "
+                           f"restarting in {backoff:.0f}s")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 60.0)
+
+
+class TelemetrySampler:
+    """Periodically publishes an immutable telemetry snapshot, sampled by one worker for all."""
+
+    def __init__(self, interval: float = TelemetryConfig.SAMPLE_INTERVAL, lock_dir: Optional[str] = None):
+        self.interval = interval
+        self.stream: Optional[StreamReader] = None
+        self._snapshot: Mapping = MappingProxyType({})
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._listeners: List[Tuple[Callable[[Mapping], None], bool]] = []
+        self._leader_fd: Optional[int] = None
+        self._leader_path = os.path.join(lock_dir or ThermalGovernorConfig.LOCK_DIR, ".telemetry_sampler.lock")
+        self._throttle_count: Optional[int] = None
+
+    def add_listener(self, listener: Callable[[Mapping], None], leader_only: bool = False) -> None:
+        """
+        Call listener(snapshot) from the sampler thread for every new snapshot.
+
+        Args:
+            listener: Callback taking the read-only snapshot
+            leader_only: Only call it in the worker that samples (e.g. writers of shared state)
+        """
+        self._listeners.append((listener, leader_only))
+
+    @property
+    def is_leader(self) -> bool:
+        return self._leader_fd is not None
+
+    def _is_leader(self) -> bool:
+        """One worker samples for all of them: whoever holds the lock."""
+        if self._leader_fd is not None:
+            return True
+        try:
+            os.makedirs(os.path.dirname(self._leader_path), exist_ok=True)
+            fd = os.open(self._leader_path, os.O_RDWR | os.O_CREAT, 0o644)
+        except OSError:
+            return False
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._leader_fd = fd
+        # Only the leader runs tegrastats / nvidia-smi
+        if TelemetryConfig.STREAM_ENABLED and self.stream is None:
+            self.stream = self._create_stream()
+        if self.stream:
+            self.stream.start()
+        logger.info(f"[TELEMETRY] Sampling for all workers (pid {os.getpid()}, "
+                    f"stream: {self.stream.name if self.stream else 'none'})")
+        return True
+
+    def start(self) -> None:
+        """Start the sampling thread (idempotent)."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self.tick()
+        self._thread = threading.Thread(target=self._run, name="telemetry-sampler", daemon=True)
+        self._thread.start()
+        logger.info(f"[TELEMETRY] Sampler started (every {self.interval}s, "
+                    f"{'leader' if self.is_leader else 'following the shared snapshot'})")
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self.stream:
+            self.stream.stop()
+
+    @staticmethod
+    def _create_stream() -> Optional[StreamReader]:
+        interval_ms = TelemetryConfig.STREAM_INTERVAL_MS
+        # tegrastats first: recent Jetson images also ship an nvidia-smi that reports N/A
+        if shutil.which('tegrastats'):
+            return StreamReader('tegrastats', ['tegrastats', '--interval', str(interval_ms)],
+                                parse_tegrastats_line)
+        if shutil.which('nvidia-smi'):
+            return StreamReader('nvidia-smi', [
+                'nvidia-smi', '--query-gpu=utilization.gpu,temperature.gpu,power.draw',
+                '--format=csv,noheader,nounits', f'-lms={interval_ms}',
+            ], parse_nvidia_smi_line)
+        return None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.tick()
+            except Exception as e:
+                logger.warning(f"[TELEMETRY] Sample failed: {e}")
+
+    def tick(self) -> Mapping:
+        """Sample if this worker is the leader (followers keep trying), otherwise adopt the leader's snapshot."""
+        if self._is_leader():
+            return self.sample()
+        return self.follow()
+
+    def follow(self) -> Mapping:
+        """Adopt the leader's latest snapshot from the shared segment, if it is new."""
+        try:
+            shared = get_shared_metrics().get_json("telemetry")
+        except Exception as e:
+            logger.debug(f"[TELEMETRY] Could not read the shared snapshot: {e}")
+            shared = None
+        if shared and shared.get("sampled_at") and shared["sampled_at"] != self._snapshot.get("sampled_at"):
+            self._snapshot = MappingProxyType(shared)
+            self._notify(leader=False)
+        return self._snapshot
+
+    def _notify(self, leader: bool) -> None:
+        for listener, leader_only in self._listeners:
+            if leader_only and not leader:
+                continue
+            try:
+                listener(self._snapshot)
+            except Exception as e:
+                logger.warning(f"[TELEMETRY] Listener {listener} failed: {e}")
+
+    def _probe_status(self) -> str:
+        # Reachability comes from the background health prober's cached state
+        return "online" if get_health_prober().is_up() else "offline"
+
+    def sample(self) -> Mapping:
+        """Take one sample and publish it as the current snapshot, here and in the shared segment."""
+        start = time.perf_counter()
+        stream = self.stream.latest(TelemetryConfig.STALE_AFTER) if self.stream else {}
+        sensors = get_sensor_map()
+
+        gpu_usage = stream.get('gpu_usage')
+        if gpu_usage is None:
+            gpu_usage = sensors.gpu_devfreq_usage()
+        gpu_temp = sensors.gpu_temperature()
+        if gpu_temp is None:
+            gpu_temp = stream.get('gpu_temp')
+        power = stream.get('power_w')
+        if power is None:
+            power = sensors.power_draw()
+        vram_used = stream.get('ram_used_mb')
+        memory = psutil.virtual_memory()
+        if vram_used is None:
+            vram_used = round(memory.used / 1e6)
+        # The counter is cumulative: only an increase since the previous sample means throttling now
+        # (an idle Jetson clocks down to ~729 MHz, so a low CPU frequency says nothing)
+        throttle_count = sensors.throttle_count()
+        throttled = (throttle_count is not None and self._throttle_count is not None
+                     and throttle_count > self._throttle_count)
+        self._throttle_count = throttle_count
+
+        snapshot = {
+            "cpu": psutil.cpu_percent(interval=None),
+            "memory": memory.percent,
+            "gpu": gpu_usage,
+            "cpu_temp": sensors.cpu_temperature(),
+            "gpu_temp": gpu_temp,
+            "power_draw": power,
+            "vram_used_mb": vram_used,
+            "fan_speed_pct": sensors.fan_speed(),
+            "thermal_throttled": throttled,
+            "throttle_count": throttle_count,
+            "status": self._probe_status(),
+            "stream": self.stream.name if self.stream and self.stream.available else None,
+            "sampled_at": time.time(),
+            "sample_ms": round((time.perf_counter() - start) * 1000, 2),
+            "sampler_pid": os.getpid(),
+        }
+        self._snapshot = MappingProxyType(snapshot)
+        try:
+            get_shared_metrics().set_json("telemetry", snapshot)
+        except Exception as e:
+            logger.warning(f"[TELEMETRY] Could not publish snapshot: {e}")
+        self._notify(leader=True)
+        return self._snapshot
+
+    def snapshot(self) -> Mapping:
+        """The latest snapshot (read-only; replaced, never modified)."""
+        return self._snapshot
+
+
+# Global sampler instance
+_sampler: Optional[TelemetrySampler] = None
+_sampler_lock = threading.Lock()
+
+
+def get_telemetry_sampler() -> TelemetrySampler:
+    """Get or create (and start) the global telemetry sampler."""
+    global _sampler
+    with _sampler_lock:
+        if _sampler is None:
+            _sampler = TelemetrySampler()
+            # The history is shared too, so only the sampling worker writes it
+            _sampler.add_listener(lambda snapshot: record_values(snapshot, snapshot["sampled_at"]), leader_only=True)
+            _sampler.add_listener(get_telemetry_broadcaster().publish)
+            _sampler.start()
+    return _sampler
+
+
+def get_snapshot() -> Mapping:
+    """Latest telemetry snapshot, starting the sampler on first use."""
+    return get_telemetry_sampler().snapshot()
@@ -0,0 +1,275 @@
+"""
+Multi-resolution telemetry history in a memory-mapped ring buffer file.
+
+Each tier is a preallocated ring of fixed-step slots (by default 1 s for
+10 minutes, 10 s for 24 hours and 1 min for 30 days). A slot stores the
+bucket number it holds plus one float64 per metric, laid out column-major so
+a metric's history is one contiguous block. Coarser tiers are filled when a
+bucket closes by averaging the finished slots of the tier below, so rollups
+cost O(1) per sample and are idempotent across writers.
+
+The file is mapped MAP_SHARED: every gunicorn worker can record and read,
+writes are serialised with flock, and history survives restarts without a
+database.
+"""
+import fcntl
+import logging
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+from backend.config import TelemetryConfig
+
+logger = logging.getLogger(__name__)
+
+METRICS = (
+    "cpu", "memory", "gpu", "cpu_temp", "gpu_temp",
+    "power_draw", "fan_speed_pct", "tokens_per_sec", "latency_ms",
+)
+
+# (step seconds, slots): 1 s x 10 min, 10 s x 24 h, 60 s x 30 days
+DEFAULT_TIERS = ((1, 600), (10, 8640), (60, 43200))
+
+_MAGIC = b"JTH1"
+_VERSION = 1
+_HEADER = struct.Struct("<4sIII")
+_TIER = struct.Struct("<II")
+_NAN = float("nan")
+
+# Cap on points returned when no step is given
+MAX_POINTS = 600
+
+
+def parse_duration(value: str) -> int:
+    """
+    Parse '90', '10m', '24h' or '30d' into seconds.
+
+    Raises:
+        ValueError: If the value is not a positive duration
+    """
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    value = value.strip().lower()
+    multiplier = units.get(value[-1:], None)
+    number = float(value[:-1] if multiplier else value) * (multiplier or 1)
+    # float() accepts 'inf', 'nan' and '1e400' (inf), which int() cannot convert
+    if not math.isfinite(number) or int(number) <= 0:
+        raise ValueError(f"Invalid duration: {value}")
+    return int(number)
+
+
+class _Tier:
+    """Views over one tier's bucket and metric columns inside the mapping."""
+
+    def __init__(self, mm: mmap.mmap, offset: int, step: int, slots: int, n_metrics: int):
+        self.step = step
+        self.slots = slots
+        view = memoryview(mm)
+        self.buckets = view[offset:offset + slots * 8].cast("q")
+        offset += slots * 8
+        self.columns = []
+        for _ in range(n_metrics):
+            self.columns.append(view[offset:offset + slots * 8].cast("d"))
+            offset += slots * 8
+        self.end = offset
+
+    def release(self) -> None:
+        self.buckets.release()
+        for column in self.columns:
+            column.release()
+
+    def claim(self, bucket: int) -> int:
+        """Point the bucket's slot at it, clearing stale values; returns the slot."""
+        slot = bucket % self.slots
+        if self.buckets[slot] != bucket:
+            for column in self.columns:
+                column[slot] = _NAN
+            self.buckets[slot] = bucket
+        return slot
+
+    def has(self, bucket: int) -> bool:
+        return self.buckets[bucket % self.slots] == bucket
+
+    def read(self, metric: int, first: int, last: int) -> Tuple[List[float], List[bool]]:
+        """Values and validity for buckets first..last inclusive (at most one ring)."""
+        count = last - first + 1
+        start = first % self.slots
+        stop = start + count
+        column, buckets = self.columns[metric], self.buckets
+        if stop <= self.slots:
+            values = column[start:stop].tolist()
+            stored = buckets[start:stop].tolist()
+        else:
+            values = column[start:].tolist() + column[:stop - self.slots].tolist()
+            stored = buckets[start:].tolist() + buckets[:stop - self.slots].tolist()
+        return values, [s == first + i for i, s in enumerate(stored)]
+
+
+def _mean(values: Sequence[float]) -> float:
+    good = [v for v in values if v == v]
+    return math.fsum(good) / len(good) if good else _NAN
+
+
+class TelemetryHistory:
+    """Memory-mapped, tiered ring buffers of telemetry samples."""
+
+    def __init__(self, path: str, metrics: Sequence[str] = METRICS,
+                 tiers: Sequence[Tuple[int, int]] = DEFAULT_TIERS):
+        self.path = path
+        self.metrics = tuple(metrics)
+        self._index = {name: i for i, name in enumerate(self.metrics)}
+        self.tier_spec = tuple(tuple(t) for t in tiers)
+        self._lock = threading.Lock()
+
+        header_size = _HEADER.size + _TIER.size * len(self.tier_spec)
+        size = header_size + sum(slots * 8 * (1 + len(self.metrics)) for _, slots in self.tier_spec)
+        header = _HEADER.pack(_MAGIC, _VERSION, len(self.metrics), len(self.tier_spec)) + b"".join(
+            _TIER.pack(step, slots) for step, slots in self.tier_spec)
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.pread(self._fd, len(header), 0) != header or os.fstat(self._fd).st_size != size:
+                # New file or a different layout: start empty
+                logger.info(f"[TELEMETRY] Initialising history file {path} ({size} bytes)")
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, size)
+                os.pwrite(self._fd, header, 0)
+                self._mm = mmap.mmap(self._fd, size)
+                self._build_tiers(header_size)
+                for tier in self.tiers:
+                    tier.buckets[:] = memoryview(b"\xff" * (tier.slots * 8)).cast("q")
+                self._mm.flush()
+            else:
+                self._mm = mmap.mmap(self._fd, size)
+                self._build_tiers(header_size)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _build_tiers(self, offset: int) -> None:
+        self.tiers: List[_Tier] = []
+        for step, slots in self.tier_spec:
+            tier = _Tier(self._mm, offset, step, slots, len(self.metrics))
+            self.tiers.append(tier)
+            offset = tier.end
+
+    def close(self) -> None:
+        for tier in self.tiers:
+            tier.release()
+        self._mm.close()
+        os.close(self._fd)
+
+    def record(self, values: Mapping, ts: Optional[float] = None) -> None:
+        """
+        Record metric values at a timestamp.
+
+        Missing or None values leave whatever another writer stored for the
+        same second untouched. Crossing into a new bucket of a coarser tier
+        rolls the finished bucket up from the tier below.
+        """
+        ts = time.time() if ts is None else ts
+        row = [(self._index[name], float(value)) for name, value in values.items()
+               if name in self._index and value is not None]
+        if not row:
+            return
+        base = self.tiers[0]
+        bucket = int(ts // base.step)
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                slot = base.claim(bucket)
+                for metric, value in row:
+                    base.columns[metric][slot] = value
+                for finer, coarser in zip(self.tiers, self.tiers[1:]):
+                    done = int(ts // coarser.step) - 1
+                    if not coarser.has(done):
+                        self._rollup(finer, coarser, done)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _rollup(self, finer: _Tier, coarser: _Tier, bucket: int) -> None:
+        ratio = coarser.step // finer.step
+        first = bucket * ratio
+        slot = coarser.claim(bucket)
+        for metric in range(len(self.metrics)):
+            values, valid = finer.read(metric, first, first + ratio - 1)
+            coarser.columns[metric][slot] = _mean([v for v, ok in zip(values, valid) if ok])
+
+    def query(self, metric: str, range_s: int, step_s: Optional[int] = None,
+              end: Optional[float] = None) -> Dict:
+        """
+        Read a metric's history.
+
+        Uses the finest tier that covers the range, averaged into step_s
+        buckets (rounded up to a multiple of the tier step).
+
+        Args:
+            metric: One of METRICS
+            range_s: How far back to read, in seconds
+            step_s: Output resolution in seconds (default: at most MAX_POINTS points)
+            end: End timestamp (default: now)
+
+        Returns:
+            dict: metric, step, tier_step, timestamps and values (None where missing)
+
+        Raises:
+            KeyError: If the metric is unknown
+        """
+        index = self._index[metric]
+        end = time.time() if end is None else end
+        tier = next((t for t in self.tiers if t.step * t.slots >= range_s), self.tiers[-1])
+        range_s = min(range_s, tier.step * tier.slots)
+        if step_s is None:
+            step_s = range_s / MAX_POINTS
+        ratio = max(1, math.ceil(step_s / tier.step))
+        step_s = ratio * tier.step
+
+        last = int(end // tier.step)
+        first = last - (range_s // tier.step) + 1
+        first -= first % ratio  # Align output buckets to the step
+        if last - first + 1 > tier.slots:
+            first += ratio
+        values, valid = tier.read(index, first, last)
+
+        timestamps, series = [], []
+        for i in range(0, len(values), ratio):
+            mean = _mean([v for v, ok in zip(values[i:i + ratio], valid[i:i + ratio]) if ok])
+            timestamps.append((first + i) * tier.step)
+            series.append(round(mean, 2) if mean == mean else None)
+        return {
+            "metric": metric,
+            "range": range_s,
+            "step": step_s,
+            "tier_step": tier.step,
+            "timestamps": timestamps,
+            "values": series,
+        }
+
+
+# Global history instance
+_history: Optional[TelemetryHistory] = None
+_history_lock = threading.Lock()
+
+
+def get_telemetry_history() -> TelemetryHistory:
+    """Get or open the global history file."""
+    global _history
+    with _history_lock:
+        if _history is None:
+            _history = TelemetryHistory(TelemetryConfig.HISTORY_PATH)
+    return _history
+
+
+def record_values(values: Mapping, ts: Optional[float] = None) -> None:
+    """Record values into the global history, logging instead of raising."""
+    if not TelemetryConfig.HISTORY_ENABLED:
+        return
+    try:
+        get_telemetry_history().record(values, ts)
+    except Exception as e:
+        logger.warning(f"[TELEMETRY] History write failed: {e}")
@@ -0,0 +1,164 @@
+"""
+Server-sent telemetry stream fed by the shared sampler.
+
+The broadcaster is a sampler listener in every worker: each snapshot is
+taken once, by the sampling worker, and reaches the other workers through
+the shared metrics segment, so every subscriber on every worker sees the
+same samples without a sampler (or tegrastats) of its own. Each worker's
+broadcaster fans the snapshot out to its subscribers. Subscribers choose their own rate (clamped
+to STREAM_MIN_INTERVAL) and optional field list, and receive a full
+"snapshot" event first and then "delta" events carrying only the fields
+that changed (after rounding), so an idle dashboard costs a heartbeat
+comment every STREAM_HEARTBEAT seconds. A subscriber whose queue fills up
+is dropped instead of buffering without bound.
+"""
+import json
+import logging
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterator, List, Mapping, Optional
+
+from backend.config import TelemetryConfig
+
+logger = logging.getLogger(__name__)
+
+# Snapshot keys that are not streamed
+_INTERNAL_FIELDS = frozenset({"sample_ms", "sampler_pid"})
+
+
+def _round(value):
+    return round(value, 1) if isinstance(value, float) else value
+
+
+class Subscriber:
+    """One SSE client: rate limit, field filter, last sent state and a bounded queue."""
+
+    def __init__(self, interval: float, fields: Optional[List[str]] = None,
+                 max_queue: int = TelemetryConfig.STREAM_QUEUE_SIZE):
+        self.interval = interval
+        self.fields = frozenset(fields) if fields else None
+        self.max_queue = max_queue
+        self.dropped = False
+        self.sent = 0
+        self._state: Dict = {}
+        self._next_due = 0.0
+        self._queue: deque = deque()
+        self._cond = threading.Condition()
+
+    def offer(self, snapshot: Mapping, now: float) -> None:
+        """Queue an event for this snapshot if the subscriber is due (sampler thread)."""
+        if now < self._next_due:
+            return
+        self._next_due = now + self.interval
+        values = {k: _round(v) for k, v in snapshot.items()
+                  if k not in _INTERNAL_FIELDS and (self.fields is None or k in self.fields or k == "sampled_at")}
+        if not self._state:
+            event, payload = "snapshot", values
+        else:
+            changed = {k: v for k, v in values.items() if k != "sampled_at" and self._state.get(k) != v}
+            if not changed:
+                return
+            event, payload = "delta", dict(changed, sampled_at=values.get("sampled_at"))
+        self._state = values
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                self.dropped = True
+            else:
+                self._queue.append((event, payload))
+            self._cond.notify()
+
+    def get(self, timeout: float) -> Optional[tuple]:
+        """Next (event, payload), or None on timeout or when dropped."""
+        with self._cond:
+            if not self._queue and not self.dropped:
+                self._cond.wait(timeout)
+            return self._queue.popleft() if self._queue else None
+
+
+class TelemetryBroadcaster:
+    """Fans sampler snapshots out to SSE subscribers."""
+
+    def __init__(self, max_subscribers: int = TelemetryConfig.STREAM_MAX_SUBSCRIBERS):
+        self.max_subscribers = max_subscribers
+        self._subscribers: List[Subscriber] = []
+        self._lock = threading.Lock()
+        self._stats = {"subscribed": 0, "dropped": 0, "rejected": 0, "events": 0}
+
+    def subscribe(self, interval: float, fields: Optional[List[str]] = None) -> Optional[Subscriber]:
+        """Register a subscriber, or return None when the limit is reached."""
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                self._stats["rejected"] += 1
+                return None
+            subscriber = Subscriber(max(interval, TelemetryConfig.STREAM_MIN_INTERVAL), fields)
+            self._subscribers.append(subscriber)
+            self._stats["subscribed"] += 1
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+
+    def publish(self, snapshot: Mapping) -> None:
+        """Sampler listener: offer the snapshot to every subscriber."""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        if not subscribers:
+            return
+        now = time.monotonic()
+        for subscriber in subscribers:
+            subscriber.offer(snapshot, now)
+            if subscriber.dropped:
+                self.unsubscribe(subscriber)
+                with self._lock:
+                    self._stats["dropped"] += 1
+                logger.info("[TELEMETRY] Dropped slow stream subscriber")
+
+    def stream(self, subscriber: Subscriber, max_duration: float = TelemetryConfig.STREAM_MAX_DURATION) -> Iterator[str]:
+        """
+        Yield SSE frames for a subscriber until it is dropped or max_duration passes.
+
+        The subscriber is unregistered when the generator is closed.
+        """
+        deadline = time.monotonic() + max_duration
+        heartbeat = TelemetryConfig.STREAM_HEARTBEAT
+        try:
+            yield f"retry: {int(TelemetryConfig.STREAM_RETRY_MS)}\n\n"
+            while time.monotonic() < deadline:
+                item = subscriber.get(heartbeat)
+                if item is None:
+                    if subscriber.dropped:
+                        yield "event: dropped\ndata: {}\n\n"
+                        return
+                    yield ": ping\n\n"
+                    continue
+                event, payload = item
+                subscriber.sent += 1
+                with self._lock:
+                    self._stats["events"] += 1
+                yield f"event: {event}\nid: {subscriber.sent}\ndata: {json.dumps(payload, separators=(',', ':'))}\n\n"
+        finally:
+            self.unsubscribe(subscriber)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            result = dict(self._stats)
+            result["active"] = len(self._subscribers)
+        result["max_subscribers"] = self.max_subscribers
+        return result
+
+
+# Global broadcaster instance
+_broadcaster: Optional[TelemetryBroadcaster] = None
+_broadcaster_lock = threading.Lock()
+
+
+def get_telemetry_broadcaster() -> TelemetryBroadcaster:
+    """Get or create the global broadcaster."""
+    global _broadcaster
+    with _broadcaster_lock:
+        if _broadcaster is None:
+            _broadcaster = TelemetryBroadcaster()
+    return _broadcaster
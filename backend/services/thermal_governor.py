@@ -0,0 +1,340 @@
+"""
+Thermal-aware inference governor.
+
+The governor follows the sampled CPU/GPU temperature and new throttle
+events (an increase of the cumulative throttle counter between snapshots)
+and moves between three states with hysteresis and a minimum dwell time:
+
+    normal    full concurrency, Ollama's default thread count
+    hot       fewer concurrent generations, fewer threads, background
+              generations capped to BACKGROUND_NUM_PREDICT, queued
+              background jobs (storage maintenance) deferred
+    critical  one generation at a time, minimum threads, background
+              generations refused
+
+Admission is shared by all gunicorn workers: a generation holds an flock on
+one of N slot files, and only the first ``max_concurrency`` slots are
+offered in the current state. Other controllers can lower the limit
+further with set_cap (a cap of 0 refuses new generations). Every transition is logged and kept in a
+short decision log; ``simulate`` replays a synthetic temperature trace
+through the same state machine.
+"""
+import fcntl
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+from backend.config import ThermalGovernorConfig
+from backend.services.telemetry import get_telemetry_sampler
+
+logger = logging.getLogger(__name__)
+
+NORMAL, HOT, CRITICAL = "normal", "hot", "critical"
+_LEVELS = (NORMAL, HOT, CRITICAL)
+_POLL = 0.05
+
+
+class AdmissionTimeout(Exception):
+    """No generation slot became free within the admission timeout."""
+
+
+class AdmissionRefused(AdmissionTimeout):
+    """Another controller (e.g. the memory guard) has closed admission."""
+
+
+class BackgroundDeferred(Exception):
+    """Background generation refused while the device is critical."""
+
+
+class Slot:
+    """A held generation slot; release() (or leaving the with-block) frees it."""
+
+    def __init__(self, fd: Optional[int], index: Optional[int]):
+        self.fd = fd
+        self.index = index
+
+    def release(self) -> None:
+        if self.fd is not None:
+            fd, self.fd = self.fd, None
+            try:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            finally:
+                os.close(fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def __del__(self):
+        # A stream that is never iterated must not leak its slot
+        self.release()
+
+
+class ThermalGovernor:
+    """Hysteretic thermal state machine plus cross-worker admission control."""
+
+    def __init__(self, cfg=ThermalGovernorConfig, lock_dir: Optional[str] = None):
+        self.cfg = cfg
+        self.lock_dir = lock_dir or cfg.LOCK_DIR
+        self.state = NORMAL
+        self.since = 0.0
+        self.temperature: Optional[float] = None
+        self.throttled = False
+        self._throttle_count: Optional[int] = None
+        self.decisions: deque = deque(maxlen=50)
+        self.caps: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._stats = {"admitted": 0, "waited": 0, "timeouts": 0, "refused": 0, "deferred": 0, "capped": 0}
+
+    # -- state machine ------------------------------------------------------
+
+    def _target(self, temperature: Optional[float], throttled: bool) -> str:
+        """The state the current reading asks for, before dwell time is applied."""
+        cfg = self.cfg
+        temp = temperature if temperature is not None else float("-inf")
+        if temp >= cfg.CRITICAL_C:
+            return CRITICAL
+        # Stay critical until clearly below the critical threshold
+        if self.state == CRITICAL and temp > cfg.CRITICAL_C - cfg.HYSTERESIS_C:
+            return CRITICAL
+        if temp >= cfg.HOT_C or throttled:
+            return HOT
+        if self.state != NORMAL and temp > cfg.HOT_C - cfg.HYSTERESIS_C:
+            return HOT
+        return NORMAL
+
+    def observe(self, temperature: Optional[float], throttled: bool = False,
+                now: Optional[float] = None) -> str:
+        """
+        Feed one reading and return the resulting state.
+
+        Heating up takes effect immediately; cooling down steps one level at
+        a time and only after MIN_DWELL seconds in the current state.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self.temperature, self.throttled = temperature, throttled
+            target = self._target(temperature, throttled)
+            current = _LEVELS.index(self.state)
+            wanted = _LEVELS.index(target)
+            if wanted < current:
+                if now - self.since < self.cfg.MIN_DWELL:
+                    return self.state
+                target = _LEVELS[current - 1]
+            if target != self.state:
+                decision = {
+                    "ts": now,
+                    "from": self.state,
+                    "to": target,
+                    "temperature": temperature,
+                    "throttled": throttled,
+                    "policy": self._policy(target),
+                }
+                self.decisions.append(decision)
+                logger.info(f"[THERMAL] {self.state} -> {target} (temp={temperature}, "
+                            f"throttled={throttled}, concurrency={decision['policy']['max_concurrency']})")
+                self.state, self.since = target, now
+            return self.state
+
+    def update(self, snapshot: Mapping) -> None:
+        """Sampler listener: observe the hottest of CPU and GPU temperature and new throttle events."""
+        temps = [t for t in (snapshot.get("cpu_temp"), snapshot.get("gpu_temp")) if t is not None]
+        count = snapshot.get("throttle_count")
+        if count is None:
+            throttled = bool(snapshot.get("thermal_throttled"))
+        else:
+            # Compared with the last snapshot this governor saw, so skipped snapshots lose no events
+            throttled = self._throttle_count is not None and count > self._throttle_count
+            self._throttle_count = count
+        self.observe(max(temps) if temps else None, throttled, snapshot.get("sampled_at"))
+
+    # -- policy -------------------------------------------------------------
+
+    def _policy(self, state: str) -> Dict:
+        cfg = self.cfg
+        return {
+            NORMAL: {"max_concurrency": cfg.MAX_CONCURRENCY, "num_thread": None,
+                     "background_num_predict": None, "defer_background": False},
+            HOT: {"max_concurrency": cfg.HOT_CONCURRENCY, "num_thread": cfg.HOT_NUM_THREAD or None,
+                  "background_num_predict": cfg.BACKGROUND_NUM_PREDICT, "defer_background": True},
+            CRITICAL: {"max_concurrency": cfg.CRITICAL_CONCURRENCY, "num_thread": cfg.CRITICAL_NUM_THREAD or None,
+                       "background_num_predict": cfg.BACKGROUND_NUM_PREDICT, "defer_background": True},
+        }[state]
+
+    def policy(self) -> Dict:
+        """Limits for the current state."""
+        return dict(self._policy(self.state), state=self.state)
+
+    def set_cap(self, source: str, limit: Optional[int]) -> None:
+        """Cap concurrency on behalf of another controller (None removes the cap)."""
+        with self._lock:
+            if limit is None:
+                self.caps.pop(source, None)
+            else:
+                self.caps[source] = limit
+
+    def max_concurrency(self) -> int:
+        """Admitted generations: the state's limit lowered by any caps."""
+        limit = self._policy(self.state if self.cfg.ENABLED else NORMAL)["max_concurrency"]
+        return min([limit] + list(self.caps.values()))
+
+    def defer_background(self) -> bool:
+        """Whether queued background jobs should wait for the device to cool."""
+        return self.cfg.ENABLED and self._policy(self.state)["defer_background"]
+
+    def is_background(self, route: Optional[str]) -> bool:
+        return route in self.cfg.BACKGROUND_ROUTES
+
+    def apply_options(self, options: Optional[Dict], background: bool = False) -> Dict:
+        """
+        Return Ollama options adjusted for the current state.
+
+        Sets num_thread when the state limits it and caps num_predict for
+        background work; options the caller set more strictly are kept.
+        """
+        options = dict(options or {})
+        if not self.cfg.ENABLED:
+            return options
+        policy = self._policy(self.state)
+        if policy["num_thread"]:
+            options["num_thread"] = min(options.get("num_thread") or policy["num_thread"], policy["num_thread"])
+        cap = policy["background_num_predict"]
+        if background and cap:
+            requested = options.get("num_predict")
+            if requested is None or requested < 0 or requested > cap:
+                options["num_predict"] = cap
+                with self._lock:
+                    self._stats["capped"] += 1
+        return options
+
+    # -- admission ----------------------------------------------------------
+
+    def _slot_path(self, index: int) -> str:
+        return os.path.join(self.lock_dir, f".inference_slot.{index}.lock")
+
+    def _try_slots(self) -> Optional[Slot]:
+        for index in range(self.max_concurrency()):
+            fd = os.open(self._slot_path(index), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return Slot(fd, index)
+            except BlockingIOError:
+                os.close(fd)
+        return None
+
+    def admit(self, background: bool = False, timeout: Optional[float] = None) -> Slot:
+        """
+        Wait for a generation slot.
+
+        Args:
+            background: Background work is refused outright while critical
+            timeout: Seconds to wait (default ADMIT_TIMEOUT)
+
+        Returns:
+            Slot: Release it (or use it as a context manager) when the
+            generation finishes
+
+        Raises:
+            BackgroundDeferred: Background work while critical
+            AdmissionTimeout: No slot freed up in time
+        """
+        if not self.cfg.ENABLED and not self.caps:
+            return Slot(None, None)
+        if self.max_concurrency() <= 0:
+            with self._lock:
+                self._stats["refused"] += 1
+            raise AdmissionRefused(f"New generations refused ({', '.join(sorted(self.caps))})")
+        if background and self.state == CRITICAL:
+            with self._lock:
+                self._stats["deferred"] += 1
+            raise BackgroundDeferred("Background generation deferred: device is critical")
+        os.makedirs(self.lock_dir, exist_ok=True)
+        deadline = time.monotonic() + (self.cfg.ADMIT_TIMEOUT if timeout is None else timeout)
+        waited = False
+        while True:
+            slot = self._try_slots()
+            if slot:
+                with self._lock:
+                    self._stats["admitted"] += 1
+                    self._stats["waited"] += int(waited)
+                return slot
+            if time.monotonic() >= deadline:
+                with self._lock:
+                    self._stats["timeouts"] += 1
+                raise AdmissionTimeout(f"No generation slot free (state={self.state})")
+            waited = True
+            time.sleep(_POLL)
+
+    def busy_slots(self) -> int:
+        """Slots currently held by any worker (probe, non-blocking)."""
+        busy = 0
+        for index in range(max(self.cfg.MAX_CONCURRENCY, self.cfg.HOT_CONCURRENCY, self.cfg.CRITICAL_CONCURRENCY)):
+            path = self._slot_path(index)
+            if not os.path.exists(path):
+                continue
+            fd = os.open(path, os.O_RDWR)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            except BlockingIOError:
+                busy += 1
+            finally:
+                os.close(fd)
+        return busy
+
+    def get_status(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            decisions = list(self.decisions)
+        return {
+            "enabled": self.cfg.ENABLED,
+            "state": self.state,
+            "since": self.since,
+            "temperature": self.temperature,
+            "throttled": self.throttled,
+            "policy": self.policy(),
+            "caps": dict(self.caps),
+            "max_concurrency": self.max_concurrency(),
+            "busy_slots": self.busy_slots(),
+            "thresholds": {"hot_c": self.cfg.HOT_C, "critical_c": self.cfg.CRITICAL_C,
+                           "hysteresis_c": self.cfg.HYSTERESIS_C, "min_dwell": self.cfg.MIN_DWELL},
+            "stats": stats,
+            "decisions": decisions,
+        }
+
+    @classmethod
+    def simulate(cls, trace: Iterable[Tuple[float, Optional[float], bool]], cfg=ThermalGovernorConfig) -> List[Dict]:
+        """
+        Replay a synthetic trace of (timestamp, temperature, throttled), where
+        throttled means new throttle events since the previous reading.
+
+        Returns:
+            list: One {ts, temperature, state, max_concurrency} per reading
+        """
+        governor = cls(cfg, lock_dir=os.devnull)
+        result = []
+        for ts, temperature, throttled in trace:
+            state = governor.observe(temperature, throttled, ts)
+            result.append({"ts": ts, "temperature": temperature, "state": state,
+                           "max_concurrency": governor._policy(state)["max_concurrency"]})
+        return result
+
+
+# Global governor instance
+_governor: Optional[ThermalGovernor] = None
+_governor_lock = threading.Lock()
+
+
+def get_thermal_governor() -> ThermalGovernor:
+    """Get or create the global governor, fed by the telemetry sampler."""
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            _governor = ThermalGovernor()
+            get_telemetry_sampler().add_listener(_governor.update)
+    return _governor
@@ -0,0 +1,17 @@
+"""
+Gunicorn settings for scripts/start_production.sh.
+
+Worker count, threads and bind address stay on the command line; this file
+only adds the master-side hooks.
+"""
+import os
+
+
+def on_starting(server):
+    """Create or migrate the database schemas once, in the master, before any worker forks."""
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    from backend.services.db_migrations import run_migrations
+    result = run_migrations(owner=os.getpid())
+    server.log.info(f"[MIGRATIONS] {'Ran' if result['ran'] else 'Already current'} in the master")
@@ -7,4 +7,6 @@ if [ -f .env ]; then
 fi
 
 # Start with gunicorn for production
-exec gunicorn -w 4 -b 0.0.0.0:${PORT:-5000} backend.app:app
+# Schema migrations run once in the master (gunicorn.conf.py) before workers fork.
+# Threaded workers so long-lived telemetry streams (SSE) do not pin a whole worker each
+exec gunicorn -c gunicorn.conf.py -w 4 --threads ${GUNICORN_THREADS:-8} -b 0.0.0.0:${PORT:-5000} backend.app:app
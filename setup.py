@@ -47,6 +47,8 @@ setup(
     entry_points={
         "console_scripts": [
             "joeyai=backend.app:main",
+            "joeyai-benchmark=backend.services.benchmark:main",
+            "joeyai-startup-benchmark=backend.services.startup_benchmark:main",
         ],
     },
     classifiers=[
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""Near-duplicate merging of memory notes on write and in the dedup pass (run with pytest)"""
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add project root to path
+project_root = Path(__file__).resolve().parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from backend.services import memory_service as mem
+from backend.services.note_fingerprint import hamming, simhash, to_unsigned
+
+# Repeated IDE prompts: a long shared preamble with a small varying tail
+BASE = ("You are an expert Python assistant working in the joey project. Follow PEP 8, prefer small pure "
+        "functions, write docstrings for public functions and keep answers short. Use type hints everywhere, "
+        "avoid global state, log with the module logger and the bracketed tag prefix, and read configuration "
+        "from the config classes. Tests live at the repository root and run with pytest. The user is asking about ")
+
+
+def _prompt(i: int) -> str:
+    return BASE + f"the sensors module, revision {i}."
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(mem, "DB_PATH", str(tmp_path / "memory.db"))
+    monkeypatch.setattr(mem.MemoryDedupConfig, "MODE", "merge")
+    monkeypatch.setattr(mem.MemoryDedupConfig, "KINDS", ["prompt"])
+    monkeypatch.setattr(mem.MemoryDedupConfig, "MAX_DISTANCE", 3)
+    mem._reset_fp_index()
+    mem.init_db()
+    yield str(tmp_path / "memory.db")
+    mem._reset_fp_index()
+
+
+def _rows(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        notes = conn.execute("SELECT id, text, tags FROM notes ORDER BY id").fetchall()
+        fingerprints = dict(conn.execute("SELECT note_id, simhash FROM note_fingerprints").fetchall())
+        # Raises "database disk image is malformed" if the FTS index no longer matches the notes;
+        # rank = 1 makes the check compare the index with the external content table
+        conn.execute("INSERT INTO notes_fts(notes_fts, rank) VALUES ('integrity-check', 1)")
+        return notes, fingerprints
+    finally:
+        conn.close()
+
+
+def _assert_near(a: str, b: str) -> None:
+    assert hamming(simhash(a), simhash(b)) <= 3, "fixture texts are not near-duplicates"
+
+
+def test_add_note_merges_without_growing(db):
+    for i in range(1, 7):
+        _assert_near(_prompt(i), _prompt(i + 1))
+    first = mem.add_note("prompt", _prompt(1), "python")
+    for i in range(2, 8):
+        merged = mem.add_note("prompt", _prompt(i), ["sensors"] if i == 2 else None)
+        assert merged["id"] == first["id"] and merged["deduplicated"] == "merged"
+
+    notes, fingerprints = _rows(db)
+    # One note holding the newest text only, the union of the tags and the newest text's fingerprint
+    assert notes == [(first["id"], _prompt(7), "python,sensors")]
+    assert to_unsigned(fingerprints[first["id"]]) == simhash(_prompt(7))
+    assert [n["id"] for n in mem.search_notes("revision")] == [first["id"]]
+
+
+def test_dedup_pass_uses_the_same_merge_rule(db, monkeypatch):
+    # Written with dedup off, as by an old version or a bulk import
+    monkeypatch.setattr(mem.MemoryDedupConfig, "MODE", "off")
+    ids = [mem.add_note("prompt", _prompt(i), tag)["id"] for i, tag in ((1, "python"), (2, "sensors"), (3, None))]
+    other = mem.add_note("prompt", "Something else entirely: how do I reset the Jetson fan curve?")["id"]
+
+    report = mem.dedup_notes(dry_run=True)
+    assert report["duplicates"] == 2 and len(_rows(db)[0]) == 4
+
+    report = mem.dedup_notes()
+    assert report["duplicates"] == 2 and report["bytes_reclaimed"] > 0
+    notes, fingerprints = _rows(db)
+    assert notes[0] == (ids[0], _prompt(3), "python,sensors") and notes[1][0] == other and len(notes) == 2
+    assert to_unsigned(fingerprints[ids[0]]) == simhash(_prompt(3))
+
+    # A later write merges into the survivor instead of adding a row
+    monkeypatch.setattr(mem.MemoryDedupConfig, "MODE", "merge")
+    assert mem.add_note("prompt", _prompt(4))["deduplicated"] == "merged"
+    assert [text for _, text, _ in _rows(db)[0]] == [_prompt(4), notes[1][1]]
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""Stable conversation prefixes from the prompt builder's history window (run with pytest)"""
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add project root to path
+project_root = Path(__file__).resolve().parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from flask import Flask
+
+from backend.routes import chat_routes
+from backend.services import conversation_service as conversations
+from backend.services import prompt_builder as pb
+
+
+@pytest.fixture
+def builder(tmp_path):
+    return pb.PromptBuilder(presets_path=str(tmp_path / "presets.json"), system_prompt="You are Joey.")
+
+
+def test_window_start_moves_in_half_window_steps():
+    limit, step = 20, 10
+    history = [{"role": "user", "content": str(i)} for i in range(100)]
+    previous = 0
+    for count in range(len(history) + 1):
+        start = pb.window_start(count, limit)
+        assert start % step == 0 and 0 <= count - start <= limit
+        # Never moves back, and by one half-window at a time
+        assert start - previous in (0, step)
+        previous = start
+        assert pb._window(history[:count], limit) == history[start:count]
+    assert pb._window(history, 0) == []
+
+
+def test_consecutive_turns_share_a_byte_identical_prefix(builder, monkeypatch):
+    monkeypatch.setattr(pb.PromptConfig, "HISTORY_MESSAGES", 6)
+    history, previous, kept = [], None, 0
+    for turn in range(12):
+        content = f"question {turn}"
+        built = builder.build_prompt(content, use_memory=False, session="conversation:1", history=history)
+        assert built.text.startswith("You are Joey.\n\n")
+        if previous is not None and pb.window_start(len(history), 6) == pb.window_start(len(history) - 2, 6):
+            # Same window start: this turn's prompt extends the previous one byte for byte
+            assert built.text.startswith(previous)
+            assert built.shared_chars == len(previous)
+            kept += 1
+        previous = built.text
+        history += [{"role": "user", "content": content}, {"role": "assistant", "content": f"answer {turn}"}]
+    # Six-message window, three-message steps: the start stays put on at least every other turn
+    assert kept >= 5
+
+
+def test_post_message_reads_only_the_window_tail(tmp_path, builder, monkeypatch):
+    monkeypatch.setattr(conversations, "STORAGE_DIR", str(tmp_path))
+    monkeypatch.setattr(conversations, "DB_PATH", str(tmp_path / "conversations.db"))
+    monkeypatch.setattr(pb.PromptConfig, "HISTORY_MESSAGES", 20)
+    conversations.init_db()
+    conv_id = conversations.create_conversation("long")["id"]
+    for i in range(1105):
+        conversations.add_message(conv_id, "user" if i % 2 == 0 else "assistant", f"message {i}")
+
+    sent = []
+    monkeypatch.setattr(chat_routes, "get_prompt_builder", lambda: builder)
+    monkeypatch.setattr(chat_routes, "send_prompt", lambda text, **kwargs: sent.append(text) or "ok")
+    app = Flask(__name__)
+    app.register_blueprint(chat_routes.chat_bp, url_prefix="/api")
+    response = app.test_client().post(f"/api/conversations/{conv_id}/message", json={"content": "newest", "use_memory": False})
+    assert response.get_json() == {"reply": "ok"}
+
+    # 1105 messages before the turn: the window starts at 1090, past the oldest 1000 rows
+    full = conversations.get_messages(conv_id, limit=2000)[:1105]
+    expected = builder.build_prompt("newest", use_memory=False, history=full)
+    assert sent == [expected.text]
+    assert "message 1104" in sent[0] and "message 1089" not in sent[0]
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+"""Model pull jobs against a stub Ollama server (run with pytest)"""
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+# Add project root to path
+project_root = Path(__file__).resolve().parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from backend.services import pull_manager
+from backend.services.pull_manager import CANCELLED, DONE, FAILED, QUEUED, RUNNING, PullError, PullManager
+
+# Pulls wait on these until the test lets them finish
+GATES = {}
+
+
+class StubOllama(BaseHTTPRequestHandler):
+    """/api/pull behaviour by model name: ok*, slow*, err*, http500*."""
+
+    protocol_version = "HTTP/1.0"
+
+    def log_message(self, *args):
+        pass
+
+    def _line(self, obj) -> None:
+        self.wfile.write(json.dumps(obj).encode() + b"\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        model = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["model"]
+        if model.startswith("http500"):
+            self.send_response(500)
+            self.end_headers()
+            self.wfile.write(b"boom")
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        try:
+            self._line({"status": "pulling manifest"})
+            if model.startswith("err"):
+                self._line({"error": "pull model manifest: file does not exist"})
+                return
+            self._line({"status": "pulling abc", "digest": "sha256:abc", "total": 1000, "completed": 500})
+            gate = GATES.get(model)
+            while gate is not None and not gate.wait(0.05):
+                # Keep the stream alive so the client sees progress and can cancel between lines
+                self._line({"status": "pulling abc", "digest": "sha256:abc", "total": 1000, "completed": 500})
+            self._line({"status": "pulling abc", "digest": "sha256:abc", "total": 1000, "completed": 1000})
+            self._line({"status": "success"})
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class StubCatalog:
+    def __init__(self):
+        self.invalidated = []
+
+    def invalidate(self, reason):
+        self.invalidated.append(reason)
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubOllama)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host = f"http://127.0.0.1:{server.server_address[1]}"
+    catalog = StubCatalog()
+    monkeypatch.setattr(pull_manager, "get_model_catalog", lambda: catalog)
+    monkeypatch.setattr(pull_manager.ModelPullConfig, "PROGRESS_INTERVAL", 0.0)
+    monkeypatch.setattr(pull_manager, "_POLL", 0.02)
+    GATES.clear()
+    manager = PullManager(directory=str(tmp_path), hosts=[host])
+    manager.catalog = catalog
+    yield manager
+    for gate in GATES.values():
+        gate.set()
+    server.shutdown()
+    server.server_close()
+
+
+def _wait(manager, job_id, statuses, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = manager.get(job_id)
+        if job and job["status"] in statuses:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} never reached {statuses}: {manager.get(job_id)}")
+
+
+def test_pull_reports_progress_and_finishes(manager):
+    GATES["ok-a"] = threading.Event()
+    job = manager.start("ok-a")
+    assert job["status"] == QUEUED and not job["deduplicated"]
+
+    running = _wait(manager, job["id"], (RUNNING,))
+    deadline = time.monotonic() + 5
+    while running["percent"] is None and time.monotonic() < deadline:
+        time.sleep(0.02)
+        running = manager.get(job["id"])
+    assert running["percent"] == 50.0 and running["total"] == 1000
+
+    # A second request joins the running job
+    assert manager.start("ok-a")["deduplicated"] is True
+
+    GATES["ok-a"].set()
+    done = _wait(manager, job["id"], (DONE,))
+    assert done["percent"] == 100.0 and done["error"] is None
+    assert manager.catalog.invalidated == ["pull ok-a"]
+
+
+def test_one_pull_per_host_others_queue(manager):
+    GATES["ok-first"] = threading.Event()
+    first = manager.start("ok-first")
+    _wait(manager, first["id"], (RUNNING,))
+    second = manager.start("ok-second")
+    time.sleep(0.2)
+    assert manager.get(second["id"])["status"] == QUEUED
+
+    GATES["ok-first"].set()
+    _wait(manager, first["id"], (DONE,))
+    _wait(manager, second["id"], (DONE,))
+
+
+def test_cancel_running_and_queued_jobs(manager):
+    GATES["slow-a"] = threading.Event()
+    running = manager.start("slow-a")
+    _wait(manager, running["id"], (RUNNING,))
+    queued = manager.start("ok-b")
+
+    manager.cancel(queued["id"])
+    manager.cancel(running["id"])
+    assert _wait(manager, running["id"], (CANCELLED,))["status"] == CANCELLED
+    assert _wait(manager, queued["id"], (CANCELLED,))["status"] == CANCELLED
+
+    # Resuming starts a new run of the same job
+    GATES["slow-a"].set()
+    resumed = manager.resume(running["id"])
+    assert resumed["id"] == running["id"] and resumed["run"] == 2
+    _wait(manager, running["id"], (DONE,))
+
+    with pytest.raises(PullError):
+        manager.cancel("missing")
+
+
+def test_failures_are_reported(manager):
+    error = manager.start("err-a")
+    http = manager.start("http500-a")
+    assert "file does not exist" in _wait(manager, error["id"], (FAILED,))["error"]
+    assert _wait(manager, http["id"], (FAILED,))["error"].startswith("HTTP 500")
+    assert manager.catalog.invalidated == []
+    with pytest.raises(PullError):
+        manager.start("ok-a", host="http://elsewhere:11434")
+
+
+def test_removed_job_does_not_stall_the_host(manager):
+    GATES["ok-blocker"] = threading.Event()
+    blocker = manager.start("ok-blocker")
+    _wait(manager, blocker["id"], (RUNNING,))
+    doomed = manager.start("ok-doomed")
+    later = manager.start("ok-later")
+    Path(manager._path(doomed["id"])).unlink()  # e.g. pruned while queued
+
+    GATES["ok-blocker"].set()
+    _wait(manager, blocker["id"], (DONE,))
+    assert _wait(manager, later["id"], (DONE,))["status"] == DONE
+    assert manager.get(doomed["id"]) is None
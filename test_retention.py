@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""Conversation retention keeps the messages FTS index consistent (run with pytest)"""
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add project root to path
+project_root = Path(__file__).resolve().parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from backend.services import conversation_service as conversations
+from backend.services import memory_service as mem
+from backend.services import storage_maintenance
+
+OLD_TRIGGERS = [
+    '''CREATE TRIGGER messages_au AFTER UPDATE ON messages BEGIN
+        UPDATE messages_fts SET content = new.content WHERE rowid = new.id;
+    END''',
+    '''CREATE TRIGGER messages_ad AFTER DELETE ON messages BEGIN
+        DELETE FROM messages_fts WHERE rowid = old.id;
+    END''',
+]
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(conversations, "STORAGE_DIR", str(tmp_path))
+    monkeypatch.setattr(conversations, "DB_PATH", str(tmp_path / "conversations.db"))
+    monkeypatch.setattr(mem, "DB_PATH", str(tmp_path / "memory.db"))
+    monkeypatch.setattr(storage_maintenance.StorageMaintenanceConfig, "ARCHIVED_CONVERSATION_TTL_DAYS", 30)
+    mem.init_db()
+    conversations.init_db()
+    return str(tmp_path / "conversations.db")
+
+
+def _conversation(db_path, title, archived_days_ago=None):
+    conv = conversations.create_conversation(title)
+    for i in range(3):
+        conversations.add_message(conv["id"], "user", f"{title} zebra message {i}")
+    if archived_days_ago is not None:
+        conn = sqlite3.connect(db_path)
+        conn.execute("UPDATE conversations SET archived = 1, updated_at = datetime('now', ?) WHERE id = ?",
+                     (f"-{archived_days_ago} days", conv["id"]))
+        conn.commit()
+        conn.close()
+    return conv["id"]
+
+
+def _integrity_check(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        # rank = 1 also compares the index with the messages table (external content)
+        conn.execute("INSERT INTO messages_fts(messages_fts, rank) VALUES ('integrity-check', 1)")
+    finally:
+        conn.close()
+
+
+def test_retention_keeps_messages_fts_consistent(db):
+    expired = _conversation(db, "expired", archived_days_ago=90)
+    kept = _conversation(db, "kept", archived_days_ago=1)
+    active = _conversation(db, "active")
+
+    result = storage_maintenance.apply_retention()
+    assert result["conversations"] == {"conversations": 1, "orphaned_messages": 0}
+
+    _integrity_check(db)
+    found = {hit["conversation_id"] for hit in conversations.search_messages("zebra")}
+    assert found == {kept, active} and expired not in found
+
+    # Edits go through the same 'delete' command
+    conn = sqlite3.connect(db)
+    conn.execute("UPDATE messages SET content = 'giraffe' WHERE conversation_id = ?", (active,))
+    conn.commit()
+    conn.close()
+    _integrity_check(db)
+    assert {hit["conversation_id"] for hit in conversations.search_messages("zebra")} == {kept}
+
+
+def test_upgrade_replaces_old_triggers_and_rebuilds(db):
+    conn = sqlite3.connect(db)
+    conn.execute("DROP TRIGGER messages_au")
+    conn.execute("DROP TRIGGER messages_ad")
+    for trigger in OLD_TRIGGERS:
+        conn.execute(trigger)
+    conn.execute("DELETE FROM conversation_schema")
+    conn.commit()
+    conn.close()
+    _conversation(db, "expired", archived_days_ago=90)
+    storage_maintenance.apply_retention()
+    with pytest.raises(sqlite3.DatabaseError):
+        _integrity_check(db)
+
+    conversations.init_db()
+    _integrity_check(db)
+    assert conversations.search_messages("zebra") == []
+    conn = sqlite3.connect(db)
+    assert conn.execute("SELECT version FROM conversation_schema").fetchone()[0] == conversations.SCHEMA_VERSION
+    conn.close()
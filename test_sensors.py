@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""Sensor discovery and reads against a fake sysfs tree (run with pytest)"""
+import os
+import sys
+import time
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).resolve().parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from backend.services import sensors
+from backend.services.sensors import SensorMap
+
+
+def _write(root: Path, relative: str, value) -> None:
+    path = root / relative
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(f"{value}\n")
+
+
+def _fake_jetson(root: Path) -> Path:
+    """A Jetson-like tree: CPU/GPU thermal zones, GPU load and devfreq, fan, power rail, throttle counter."""
+    _write(root, 'sys/class/thermal/thermal_zone0/type', 'CPU-therm')
+    _write(root, 'sys/class/thermal/thermal_zone0/temp', 45500)
+    _write(root, 'sys/class/thermal/thermal_zone1/type', 'GPU-therm')
+    _write(root, 'sys/class/thermal/thermal_zone1/temp', 51000)
+    _write(root, 'sys/devices/gpu.0/load', 250)
+    _write(root, 'sys/devices/gpu.0/devfreq/57000000.gpu/cur_freq', 460800000)
+    _write(root, 'sys/devices/gpu.0/devfreq/57000000.gpu/max_freq', 921600000)
+    _write(root, 'sys/devices/gpu.0/throttle_count', 0)
+    _write(root, 'sys/devices/pwm-fan/target_pwm', 128)
+    _write(root, 'sys/class/hwmon/hwmon0/power1_input', 4816000)
+    return root
+
+
+def test_discovery_and_live_reads(tmp_path):
+    sensor_map = SensorMap(str(_fake_jetson(tmp_path)))
+    try:
+        assert set(sensor_map.thermal_zones) == {'CPU-therm', 'GPU-therm'}
+        assert sensor_map.cpu_temperature() == 45.5
+        assert sensor_map.gpu_temperature() == 51.0
+        assert sensor_map.gpu_load_percent() == 25.0
+        assert sensor_map.gpu_devfreq_usage() == 50.0
+        assert round(sensor_map.fan_speed(), 1) == 50.2
+        assert round(sensor_map.power_draw(), 3) == 4.816
+        assert sensor_map.throttle_count() == 0
+
+        # Kept-open descriptors re-read the current value
+        _write(tmp_path, 'sys/class/thermal/thermal_zone0/temp', 71000)
+        _write(tmp_path, 'sys/devices/gpu.0/throttle_count', 3)
+        assert sensor_map.cpu_temperature() == 71.0
+        assert sensor_map.throttle_count() == 3
+    finally:
+        sensor_map.close()
+
+
+def test_missing_and_invalid_sensors(tmp_path):
+    _write(tmp_path, 'sys/class/thermal/thermal_zone0/type', 'cpu-thermal')
+    _write(tmp_path, 'sys/class/thermal/thermal_zone0/temp', 'garbage')
+    sensor_map = SensorMap(str(tmp_path))
+    try:
+        assert sensor_map.cpu_temperature() is None
+        assert sensor_map.gpu_temperature() is None
+        assert sensor_map.fan_speed() is None
+        assert sensor_map.power_draw() is None
+        assert sensor_map.describe()['fan'] is None
+    finally:
+        sensor_map.close()
+
+
+def test_rescan_keeps_old_descriptors_open_until_grace(tmp_path, monkeypatch):
+    monkeypatch.setattr(sensors.SensorConfig, 'ROOT', str(_fake_jetson(tmp_path)))
+    monkeypatch.setattr(sensors, '_sensor_map', None)
+    monkeypatch.setattr(sensors, '_retired', [])
+
+    old_map = sensors.get_sensor_map()
+    old_fd = old_map.throttle.fd
+    _write(tmp_path, 'sys/devices/pwm-fan/target_pwm', 255)
+    new_map = sensors.rescan_sensors()
+    assert new_map is not old_map and sensors.get_sensor_map() is new_map
+
+    # A reader still holding the old map (the sampler mid-tick) reads its own files
+    os.fstat(old_fd)
+    assert old_map.throttle_count() == 0
+    assert old_map.fan_speed() == 100.0
+
+    with sensors._sensor_lock:
+        sensors._close_retired(time.monotonic() + sensors._retire_grace())
+    assert sensors._retired == []
+    # Closed once the grace period has passed; the new map is unaffected
+    try:
+        os.fstat(old_fd)
+        closed = False
+    except OSError:
+        closed = True
+    assert closed
+    assert new_map.fan_speed() == 100.0
+    new_map.close()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""Thermal governor state machine driven by synthetic temperature traces (run with pytest)"""
+import sys
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).resolve().parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from backend.config import ThermalGovernorConfig
+from backend.services.thermal_governor import CRITICAL, HOT, NORMAL, ThermalGovernor
+
+
+class Cfg(ThermalGovernorConfig):
+    ENABLED = True
+    HOT_C = 80.0
+    CRITICAL_C = 90.0
+    HYSTERESIS_C = 5.0
+    MIN_DWELL = 10.0
+    MAX_CONCURRENCY = 4
+    HOT_CONCURRENCY = 2
+    CRITICAL_CONCURRENCY = 1
+
+
+def _states(trace):
+    return [step["state"] for step in ThermalGovernor.simulate(trace, cfg=Cfg)]
+
+
+def test_warm_hot_cool_with_hysteresis():
+    trace = [
+        (0, 60.0, False),    # warm
+        (5, 79.0, False),    # just below HOT_C
+        (10, 81.0, False),   # hot
+        (15, 77.0, False),   # within hysteresis: stays hot
+        (40, 76.0, False),   # past the dwell, still above HOT_C - HYSTERESIS_C
+        (45, 74.0, False),   # clearly below: back to normal
+    ]
+    assert _states(trace) == [NORMAL, NORMAL, HOT, HOT, HOT, NORMAL]
+
+
+def test_cooling_waits_for_dwell_and_steps_one_level():
+    trace = [
+        (0, 95.0, False),    # straight to critical
+        (5, 60.0, False),    # cool, but inside the dwell time
+        (11, 60.0, False),   # one level down only
+        (15, 60.0, False),   # inside the new dwell time
+        (22, 60.0, False),   # normal
+    ]
+    assert _states(trace) == [CRITICAL, CRITICAL, HOT, HOT, NORMAL]
+    steps = ThermalGovernor.simulate(trace, cfg=Cfg)
+    assert [s["max_concurrency"] for s in steps] == [1, 1, 2, 2, 4]
+
+
+def test_critical_hysteresis():
+    trace = [
+        (0, 91.0, False),
+        (20, 87.0, False),   # within CRITICAL_C - HYSTERESIS_C: stays critical
+        (40, 84.0, False),   # below it: hot (still above HOT_C)
+    ]
+    assert _states(trace) == [CRITICAL, CRITICAL, HOT]
+
+
+def test_throttle_events_heat_up_and_clear():
+    trace = [(0, 60.0, True), (5, 60.0, False), (11, 60.0, False)]
+    assert _states(trace) == [HOT, HOT, NORMAL]
+
+
+def _snapshot(ts, temp, throttle_count=None, throttled=False):
+    return {"sampled_at": ts, "cpu_temp": temp, "gpu_temp": None,
+            "throttle_count": throttle_count, "thermal_throttled": throttled}
+
+
+def test_update_ignores_a_constant_throttle_count(tmp_path):
+    # An idle Jetson with a non-zero lifetime counter is not throttling
+    governor = ThermalGovernor(Cfg, lock_dir=str(tmp_path))
+    for ts in range(0, 60, 5):
+        governor.update(_snapshot(ts, 45.0, throttle_count=17))
+    assert governor.state == NORMAL
+    assert governor.defer_background() is False
+
+
+def test_update_follows_throttle_count_changes(tmp_path):
+    governor = ThermalGovernor(Cfg, lock_dir=str(tmp_path))
+    governor.update(_snapshot(0, 50.0, throttle_count=3))
+    governor.update(_snapshot(5, 50.0, throttle_count=5))      # new events
+    assert governor.state == HOT and governor.throttled
+    governor.update(_snapshot(10, 50.0, throttle_count=5))     # none since, but inside the dwell
+    assert governor.state == HOT
+    governor.update(_snapshot(16, 50.0, throttle_count=5))
+    assert governor.state == NORMAL
+    governor.update(_snapshot(20, 50.0, throttle_count=0))     # counter reset (driver reload)
+    assert governor.state == NORMAL
+
+
+def test_update_warm_hot_cool(tmp_path):
+    governor = ThermalGovernor(Cfg, lock_dir=str(tmp_path))
+    states = []
+    for ts, temp in [(0, 55.0), (5, 83.0), (10, 78.0), (20, 78.0), (25, 70.0)]:
+        governor.update(_snapshot(ts, temp))
+        states.append(governor.state)
+    assert states == [NORMAL, HOT, HOT, HOT, NORMAL]
+    assert [d["to"] for d in governor.decisions] == [HOT, NORMAL]